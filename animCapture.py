@@ -0,0 +1,431 @@
+'''
+captures and writes animation curve data for lots of attributes at once.  AnimClip.generate used to throw around ten
+keyframe/keyTangent queries at every attribute - the batched capture here does a single key count query per
+attribute and then grabs each column of key data for every animated attribute in one query.  similarly
+createCurve writes a whole curve with a handful of setAttr calls instead of setting keys one at a time.
+
+the functions take the cmds module as an argument so they can be run (and benchmarked) against a fake cmds
+module outside of maya
+'''
+
+from array import array
+from bisect import bisect_left
+
+import time
+import random
+import re
+
+
+class CurveData(object):
+	'''
+	the key data for a single curve stored as columns
+	'''
+	def __init__( self, weighted=False, times=(), values=(), itts=(), otts=(), ixs=(), iys=(), oxs=(), oys=(), locks=(), weightLocks=() ):
+		self.weighted = weighted
+		self.times = array( 'd', times )
+		self.values = array( 'd', values )
+		self.itts = list( itts )
+		self.otts = list( otts )
+		self.ixs = array( 'd', ixs )
+		self.iys = array( 'd', iys )
+		self.oxs = array( 'd', oxs )
+		self.oys = array( 'd', oys )
+		self.locks = array( 'b', [ bool( l ) for l in locks ] )
+		self.weightLocks = array( 'b', [ bool( l ) for l in weightLocks ] )
+	def __len__( self ):
+		return len( self.times )
+	def toKeyList( self, timeOffset=0 ):
+		'''
+		returns the list of (time, value, itt, ott, ix, iy, ox, oy, isLocked, isWeightLocked) tuples that
+		animLib.AnimClip stores - times have timeOffset subtracted
+		'''
+		return zip( [ t - timeOffset for t in self.times ], self.values, self.itts, self.otts,
+		            self.ixs, self.iys, self.oxs, self.oys, map( bool, self.locks ), map( bool, self.weightLocks ) )
+
+
+def _queryCurvePerAttr( attrpath, timeRange, weighted, times, cmds ):
+	'''
+	queries the key data for a single attribute one column at a time
+	'''
+	return CurveData( weighted, times,
+	                  cmds.keyframe( attrpath, q=True, t=timeRange, vc=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, itt=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, ott=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, ix=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, iy=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, ox=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, oy=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, lock=True ),
+	                  cmds.keyTangent( attrpath, q=True, t=timeRange, weightLock=True ) )
+
+
+def _queryWeighted( attrpath, defaultWeighted, cmds ):
+	#if there is an animCurve this will return its "weighted tangent" state - otherwise it will return None and a TypeError will be raised
+	try: return bool( cmds.keyTangent( attrpath, q=True, weightedTangents=True )[ 0 ] )
+	except TypeError: return defaultWeighted
+
+
+def captureCurvesPerAttr( attrpaths, timeRange, defaultWeighted=False, cmds=None ):
+	'''
+	returns a dict of CurveData instances keyed by attrpath for the attrpaths with keys in the given time range,
+	querying each attribute separately.  this is what the batched capture falls back to
+	'''
+	if cmds is None:
+		import maya.cmds as cmds
+
+	curves = {}
+	for attrpath in attrpaths:
+		times = cmds.keyframe( attrpath, q=True, t=timeRange )
+		if times is None:
+			continue
+
+		weighted = _queryWeighted( attrpath, defaultWeighted, cmds )
+		curves[ attrpath ] = _queryCurvePerAttr( attrpath, timeRange, weighted, times, cmds )
+
+	return curves
+
+
+#the columns grabbed by the batched capture - each entry is (cmdName, queryFlags)
+BATCHED_COLUMNS = ( ('keyframe', {}),
+                    ('keyframe', { 'vc': True }),
+                    ('keyTangent', { 'itt': True }),
+                    ('keyTangent', { 'ott': True }),
+                    ('keyTangent', { 'ix': True }),
+                    ('keyTangent', { 'iy': True }),
+                    ('keyTangent', { 'ox': True }),
+                    ('keyTangent', { 'oy': True }),
+                    ('keyTangent', { 'lock': True }),
+                    ('keyTangent', { 'weightLock': True }) )
+
+
+def captureCurves( attrpaths, timeRange, defaultWeighted=False, cmds=None ):
+	'''
+	returns a dict of CurveData instances keyed by attrpath for the attrpaths with keys in the given time range.
+
+	each attribute gets a single key count query, then each column of key data is queried for all animated
+	attributes at once.  maya returns the results of a multi attribute query concatenated in the order the
+	attributes were given, so the per attribute key counts are used to split them back up.  if the sizes of
+	the results don't add up the per attribute capture is used instead
+	'''
+	if cmds is None:
+		import maya.cmds as cmds
+
+	timeRange = tuple( timeRange )
+	counts = []
+	animated = []
+	for attrpath in attrpaths:
+		count = cmds.keyframe( attrpath, q=True, t=timeRange, kc=True )
+		if count:
+			animated.append( attrpath )
+			counts.append( count )
+
+	if not animated:
+		return {}
+
+	total = sum( counts )
+	columns = []
+	for cmdName, flags in BATCHED_COLUMNS:
+		column = getattr( cmds, cmdName )( animated, q=True, t=timeRange, **flags ) or []
+		if len( column ) != total:
+			return captureCurvesPerAttr( animated, timeRange, defaultWeighted, cmds )
+
+		columns.append( column )
+
+	#the weighted state is per curve rather than per key
+	weightedStates = cmds.keyTangent( animated, q=True, weightedTangents=True ) or []
+	if len( weightedStates ) != len( animated ):
+		weightedStates = [ _queryWeighted( attrpath, defaultWeighted, cmds ) for attrpath in animated ]
+
+	curves = {}
+	start = 0
+	for attrpath, count, weighted in zip( animated, counts, weightedStates ):
+		end = start + count
+		curves[ attrpath ] = CurveData( bool( weighted ), *[ column[ start:end ] for column in columns ] )
+		start = end
+
+	return curves
+
+
+#maps tangent type names to the values of the keyTanInType/keyTanOutType attributes on animCurve nodes
+CURVE_TANGENT_CODES = { 'fixed': 1, 'linear': 2, 'flat': 3, 'spline': 4, 'step': 5, 'slow': 6, 'fast': 7,
+                        'clamped': 8, 'plateau': 9, 'stepnext': 10, 'auto': 11 }
+
+#maps attribute types to the type of animCurve node that drives them - anything else gets an animCurveTU
+ATTR_TYPE_CURVE_TYPES = { 'doubleLinear': 'animCurveTL', 'doubleAngle': 'animCurveTA', 'time': 'animCurveTT' }
+
+#the animCurve multi attributes createCurve writes, and the key list columns they get their values from
+CURVE_KEY_COLUMNS = ( ('kix', 4), ('kiy', 5), ('kox', 6), ('koy', 7) )
+
+
+def setKeysPerKey( attrpath, weighted, keyList, cmds=None ):
+	'''
+	sets the keys in keyList on attrpath one key at a time - this merges the keys into any existing animation
+	on the attribute.  keyList is a list of (time, value, itt, ott, ix, iy, ox, oy, isLocked, isWeightLocked)
+	tuples - the form animLib.AnimClip stores keys in
+	'''
+	if cmds is None:
+		import maya.cmds as cmds
+
+	for time, value, itt, ott, ix, iy, ox, oy, isLocked, isWeightLocked in keyList:
+		cmds.setKeyframe( attrpath, t=(time,), v=value )
+		if weighted:
+			#this needs to be done as two separate commands - because setting the tangent types in the same cmd as setting tangent weights can result
+			#in the tangent types being ignored (for the case of stepped mainly, but subtle weirdness with flat happens too)
+			cmds.keyTangent( attrpath, t=(time,), ix=ix, iy=iy, ox=ox, oy=oy, l=isLocked, wl=isWeightLocked )
+			cmds.keyTangent( attrpath, t=(time,), itt=itt, ott=ott )
+		else:
+			cmds.keyTangent( attrpath, t=(time,), ix=ix, iy=iy, ox=ox, oy=oy )
+
+
+def getCurveName( attrpath ):
+	'''
+	returns the name maya would give the animCurve driving attrpath - ie nodeLeafName_attrName.  DAG path
+	separators, namespaces and any other characters that aren't valid in node names are stripped
+	'''
+	node, attr = attrpath.split( '.', 1 )
+	leafName = node.split( '|' )[ -1 ].split( ':' )[ -1 ]
+
+	return re.sub( '[^a-zA-Z0-9_]', '_', '%s_%s' % (leafName, attr) )
+
+
+def createCurve( attrpath, weighted, keyList, cmds=None ):
+	'''
+	creates a new animCurve holding all the keys in keyList and connects it to attrpath.  instead of a
+	setKeyframe and a keyTangent call or two per key, each column of key data is written with a single multi
+	index setAttr - the same way maya ascii files store curves.  so the number of commands issued doesn't
+	depend on the number of keys.  keyList must be sorted by time and the attribute shouldn't already be
+	animated.  returns the curve node, or None if the curve couldn't be created or connected - in which case
+	the keys should be set using setKeysPerKey
+	'''
+	if cmds is None:
+		import maya.cmds as cmds
+
+	count = len( keyList )
+	curveType = ATTR_TYPE_CURVE_TYPES.get( cmds.getAttr( attrpath, type=True ), 'animCurveTU' )
+	try:
+		curve = cmds.createNode( curveType, n=getCurveName( attrpath ) )
+	except RuntimeError:
+		return None
+
+	indices = '[0:%d]' % (count - 1)
+
+	#the weighted state needs to be set before the tangents are
+	cmds.setAttr( '%s.wgt' % curve, bool( weighted ) )
+
+	timeValues = []
+	for key in keyList:
+		timeValues += key[ :2 ]
+
+	cmds.setAttr( '%s.ktv%s' % (curve, indices), *timeValues, size=count )
+	cmds.setAttr( '%s.kit%s' % (curve, indices), *[ CURVE_TANGENT_CODES.get( key[ 2 ], 1 ) for key in keyList ], size=count )
+	cmds.setAttr( '%s.kot%s' % (curve, indices), *[ CURVE_TANGENT_CODES.get( key[ 3 ], 1 ) for key in keyList ], size=count )
+	for attrName, column in CURVE_KEY_COLUMNS:
+		cmds.setAttr( '%s.%s%s' % (curve, attrName, indices), *[ key[ column ] for key in keyList ], size=count )
+
+	cmds.setAttr( '%s.ktl%s' % (curve, indices), *[ bool( key[ 8 ] ) for key in keyList ], size=count )
+	if weighted:
+		cmds.setAttr( '%s.kwl%s' % (curve, indices), *[ bool( key[ 9 ] ) for key in keyList ], size=count )
+
+	try:
+		cmds.connectAttr( '%s.output' % curve, attrpath )
+	except RuntimeError:
+		cmds.delete( curve )
+		return None
+
+	return curve
+
+
+class FakeCurveCmds(object):
+	'''
+	a stand in for the parts of maya.cmds the capture and curve writing functions use.  it holds a dict of
+	CurveData instances keyed by attrpath and counts the number of commands called
+	'''
+	_COLUMN_FLAGS = { 'vc': 'values', 'itt': 'itts', 'ott': 'otts', 'ix': 'ixs', 'iy': 'iys', 'ox': 'oxs', 'oy': 'oys',
+	                  'lock': 'locks', 'weightLock': 'weightLocks' }
+
+	_COLUMNS = ('times', 'values', 'itts', 'otts', 'ixs', 'iys', 'oxs', 'oys', 'locks', 'weightLocks')
+
+	def __init__( self, curves, poseValues=None ):
+		self.curves = curves
+		self.poseValues = poseValues or {}
+		self.nodes = {}
+		self.callCount = 0
+	def _query( self, attrpaths, t=None, **kw ):
+		self.callCount += 1
+		if isinstance( attrpaths, basestring ):
+			attrpaths = [ attrpaths ]
+
+		if kw.pop( 'weightedTangents', False ):
+			states = [ self.curves[ a ].weighted for a in attrpaths if a in self.curves ]
+			return states or None
+
+		column = 'times'
+		for flag in kw:
+			column = self._COLUMN_FLAGS.get( flag, column )
+
+		results = []
+		for attrpath in attrpaths:
+			curve = self.curves.get( attrpath )
+			if curve is None:
+				continue
+
+			for n, keyTime in enumerate( curve.times ):
+				if t is None or t[ 0 ] <= keyTime <= t[ 1 ]:
+					value = getattr( curve, column )[ n ]
+					results.append( bool( value ) if column in ('locks', 'weightLocks') else value )
+
+		if kw.get( 'kc' ):
+			return len( results )
+
+		return results or None
+	def _findKey( self, attrpath, keyTime ):
+		curve = self.curves[ attrpath ]
+		n = bisect_left( curve.times, keyTime )
+
+		return curve, n, n < len( curve ) and curve.times[ n ] == keyTime
+	def keyframe( self, attrpaths=None, q=False, t=None, **kw ):
+		return self._query( attrpaths, t, **kw )
+	def keyTangent( self, attrpaths=None, q=False, t=None, **kw ):
+		if q:
+			return self._query( attrpaths, t, **kw )
+
+		self.callCount += 1
+		curve, n, exists = self._findKey( attrpaths, t[ 0 ] )
+		for flag, column in self._COLUMN_FLAGS.iteritems():
+			if flag in kw:
+				getattr( curve, column )[ n ] = kw[ flag ]
+
+		#the short names of the lock flags
+		if 'l' in kw: curve.locks[ n ] = kw[ 'l' ]
+		if 'wl' in kw: curve.weightLocks[ n ] = kw[ 'wl' ]
+	def setKeyframe( self, attrpath, t, v ):
+		self.callCount += 1
+		self.curves.setdefault( attrpath, CurveData() )
+		curve, n, exists = self._findKey( attrpath, t[ 0 ] )
+		if exists:
+			curve.values[ n ] = v
+			return
+
+		for column, default in ( ('times', t[ 0 ]), ('values', v), ('itts', 'spline'), ('otts', 'spline'), ('ixs', 1.0), ('iys', 0.0),
+		                         ('oxs', 1.0), ('oys', 0.0), ('locks', True), ('weightLocks', False) ):
+			getattr( curve, column ).insert( n, default )
+	def cutKey( self, attrpath, t, cl=True ):
+		self.callCount += 1
+		curve = self.curves.get( attrpath )
+		if curve is None:
+			return
+
+		kept = [ n for n, keyTime in enumerate( curve.times ) if not t[ 0 ] <= keyTime <= t[ 1 ] ]
+		if kept:
+			self.curves[ attrpath ] = CurveData( curve.weighted, *[ [ getattr( curve, column )[ n ] for n in kept ] for column in self._COLUMNS ] )
+		else:
+			del self.curves[ attrpath ]
+	def createNode( self, nodeType, n=None ):
+		self.callCount += 1
+		if n is not None and re.search( '[^a-zA-Z0-9_]', n ):
+			raise RuntimeError( "invalid node name: %s" % n )
+
+		name = n or nodeType
+		while name in self.nodes:
+			name += '1'
+
+		self.nodes[ name ] = { 'nodeType': nodeType }
+
+		return name
+	def delete( self, node ):
+		self.callCount += 1
+		del self.nodes[ node ]
+	def setAttr( self, attrpath, *values, **kw ):
+		self.callCount += 1
+		node, attr = attrpath.split( '.', 1 )
+		if node in self.nodes:
+			self.nodes[ node ][ attr.split( '[' )[ 0 ] ] = values
+		else:
+			self.poseValues[ attrpath ] = values[ 0 ]
+	def connectAttr( self, src, dst ):
+		self.callCount += 1
+		if dst in self.curves:
+			raise RuntimeError( "%s is already connected" % dst )
+
+		node = self.nodes[ src.split( '.' )[ 0 ] ]
+		tangentTypes = dict( (code, name) for name, code in CURVE_TANGENT_CODES.iteritems() )
+		count = len( node[ 'ktv' ] ) / 2
+		self.curves[ dst ] = CurveData( node[ 'wgt' ][ 0 ], node[ 'ktv' ][ ::2 ], node[ 'ktv' ][ 1::2 ],
+		                                [ tangentTypes[ code ] for code in node[ 'kit' ] ], [ tangentTypes[ code ] for code in node[ 'kot' ] ],
+		                                node[ 'kix' ], node[ 'kiy' ], node[ 'kox' ], node[ 'koy' ], node[ 'ktl' ], node.get( 'kwl', [ False ] * count ) )
+	def getAttr( self, attrpath, settable=False, type=False ):
+		self.callCount += 1
+		if settable:
+			return True
+		if type:
+			return 'doubleLinear'
+
+		return self.poseValues.get( attrpath, 0 )
+
+
+def buildFakeRig( controlCount=80, attrCount=10, frameCount=200, seed=0 ):
+	'''
+	returns a FakeCurveCmds instance with a fully keyed rig and the list of attrpaths on it
+	'''
+	rand = random.Random( seed )
+	curves = {}
+	attrpaths = []
+	for n in xrange( controlCount ):
+		for a in xrange( attrCount ):
+			attrpath = 'control%d.attr%d' % (n, a)
+			attrpaths.append( attrpath )
+			keyTimes = sorted( rand.sample( xrange( frameCount ), rand.randint( 1, frameCount / 4 ) ) )
+			count = len( keyTimes )
+			curves[ attrpath ] = CurveData( rand.random() > 0.5, keyTimes, [ rand.uniform( -10, 10 ) for t in keyTimes ],
+			                                [ 'spline' ] * count, [ 'linear' ] * count,
+			                                [ 1.0 ] * count, [ rand.random() for t in keyTimes ], [ 1.0 ] * count, [ rand.random() for t in keyTimes ],
+			                                [ True ] * count, [ False ] * count )
+
+	return FakeCurveCmds( curves ), attrpaths
+
+
+def benchmark( controlCount=80, attrCount=10, frameCount=200, seed=0 ):
+	'''
+	counts the commands issued capturing a fake rig with the per attribute capture and the batched capture, and
+	writing the captured curves back out key by key and with createCurve
+	'''
+	cmds, attrpaths = buildFakeRig( controlCount, attrCount, frameCount, seed )
+	timeRange = 0, frameCount
+
+	start = time.clock()
+	perAttr = captureCurvesPerAttr( attrpaths, timeRange, cmds=cmds )
+	perAttrTime, perAttrCalls = time.clock() - start, cmds.callCount
+
+	cmds.callCount = 0
+	start = time.clock()
+	batched = captureCurves( attrpaths, timeRange, cmds=cmds )
+	batchedTime, batchedCalls = time.clock() - start, cmds.callCount
+
+	assert sorted( perAttr ) == sorted( batched )
+	print 'capture %d attributes: per attribute %d calls (%0.3fs), batched %d calls (%0.3fs) - %0.1fx fewer calls' % (len( attrpaths ), perAttrCalls, perAttrTime, batchedCalls, batchedTime, perAttrCalls / float( batchedCalls ))
+
+	#now write the captured curves back out to an empty rig both ways
+	keyLists = [ (attrpath, curve.weighted, curve.toKeyList()) for attrpath, curve in batched.iteritems() ]
+	keyCount = sum( [ len( keyList ) for attrpath, weighted, keyList in keyLists ] )
+
+	perKeyCmds = FakeCurveCmds( {} )
+	start = time.clock()
+	for attrpath, weighted, keyList in keyLists:
+		setKeysPerKey( attrpath, weighted, keyList, perKeyCmds )
+	perKeyTime = time.clock() - start
+
+	bulkCmds = FakeCurveCmds( {} )
+	start = time.clock()
+	for attrpath, weighted, keyList in keyLists:
+		createCurve( attrpath, weighted, keyList, bulkCmds )
+	bulkTime = time.clock() - start
+
+	assert sorted( perKeyCmds.curves ) == sorted( bulkCmds.curves )
+	print 'apply %d keys: per key %d calls (%0.3fs), bulk %d calls (%0.3fs) - %0.1fx fewer calls' % (keyCount, perKeyCmds.callCount, perKeyTime, bulkCmds.callCount, bulkTime, perKeyCmds.callCount / float( bulkCmds.callCount ))
+
+
+if __name__ == '__main__':
+	benchmark()
+
+
+#end
@@ -0,0 +1,428 @@
+'''
+evaluates animation curves without maya.  the interpolation follows the maya animCurve evaluation rules:
+	- keys are joined by cubic segments.  segments on unweighted curves are hermite curves defined by the
+	  tangent slopes, segments on weighted curves are bezier curves whose inner control points are a third of
+	  the tangent vectors away from the keys
+	- a step out tangent holds the key value until the next key, stepnext jumps to the next key value
+	- before the first key and after the last key the curve is constant
+
+tangents are (x, y) vectors with x in the same units as the key times (frames).  keys can be given explicit
+tangents or the tangents can be derived from the tangent types - see computeSlope for the rules used.
+
+NOTE: maya measures tangents against a time axis in seconds - the x of ix/ox tangent queries is in seconds, and
+tangent angles are the angle of the tangent in value per second.  so tangents coming from or going back to maya
+need converting using the scene frame rate - see fromMayaTangent, toMayaTangent, fromMayaAngle and toMayaAngle
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+from math import atan2, cos, sin, radians, degrees, hypot
+
+
+#segment kinds
+kHERMITE, kBEZIER, kSTEP, kSTEP_NEXT = range( 4 )
+
+#values closer than this are considered equal when working out clamped tangents
+CLAMPED_TOLERANCE = 1e-5
+
+#the number of newton iterations used to find the bezier parameter for a time on weighted segments
+BEZIER_ITERATIONS = 8
+BEZIER_TOLERANCE = 1e-10
+
+
+def computeSlope( tangentType, times, values, n, isInTangent ):
+	'''
+	returns the slope of the in or out tangent of key n given its tangent type.  the rules are:
+		linear - the slope of the line to the previous key for in tangents, or the next key for out tangents
+		flat, step, stepnext - zero
+		spline - the slope of the line between the previous and next keys
+		clamped - spline, unless the key value is the same as an adjacent key in which case the tangent points
+		          straight at that key
+		plateau - spline, but flat for the first and last keys and for keys that are a local min or max, and
+		          limited so the curve never overshoots the adjacent key values
+	fast is treated as spline, slow and auto as plateau and fixed as clamped.  the first and last keys use the
+	slope of their only segment for spline and clamped tangents
+	'''
+	count = len( times )
+	value = values[ n ]
+	prevSlope = nextSlope = None
+	if n > 0:
+		prevSlope = (value - values[ n-1 ]) / float( times[ n ] - times[ n-1 ] )
+	if n < count - 1:
+		nextSlope = (values[ n+1 ] - value) / float( times[ n+1 ] - times[ n ] )
+
+	if prevSlope is None and nextSlope is None:
+		return 0.0
+
+	if tangentType in ('flat', 'step', 'stepnext'):
+		return 0.0
+
+	if tangentType == 'linear':
+		if isInTangent:
+			return nextSlope if prevSlope is None else prevSlope
+
+		return prevSlope if nextSlope is None else nextSlope
+
+	if prevSlope is None or nextSlope is None:
+		if tangentType in ('plateau', 'auto'):
+			return 0.0
+
+		return nextSlope if prevSlope is None else prevSlope
+
+	splineSlope = (values[ n+1 ] - values[ n-1 ]) / float( times[ n+1 ] - times[ n-1 ] )
+	if tangentType in ('clamped', 'fixed'):
+		if abs( value - values[ n-1 ] ) < CLAMPED_TOLERANCE:
+			return prevSlope
+		if abs( values[ n+1 ] - value ) < CLAMPED_TOLERANCE:
+			return nextSlope
+
+		return splineSlope
+
+	if tangentType in ('plateau', 'slow'):
+		#local extrema are flat
+		if prevSlope * nextSlope <= 0:
+			return 0.0
+
+		#otherwise limit the slope so the bezier control points never pass the neighbouring values
+		limit = 3 * min( abs( prevSlope ), abs( nextSlope ) )
+		return max( -limit, min( limit, splineSlope ) )
+
+	return splineSlope
+
+
+def fromMayaTangent( x, y, fps ):
+	'''
+	converts a tangent as maya reports it for ix/iy or ox/oy queries (x in seconds) to a tangent with x in frames
+	'''
+	return x * fps, y
+
+
+def toMayaTangent( x, y, fps ):
+	'''
+	converts a tangent with x in frames to the (x, y) maya expects for ix/iy or ox/oy - x in seconds
+	'''
+	return x / float( fps ), y
+
+
+def fromMayaAngle( angle, weight, fps ):
+	'''
+	converts a maya tangent angle (in degrees) and weight to a tangent with x in frames
+	'''
+	angle = radians( angle )
+	return fromMayaTangent( weight * cos( angle ), weight * sin( angle ), fps )
+
+
+def toMayaAngle( x, y, fps ):
+	'''
+	returns the maya (angle, weight) for a tangent with x in frames - the angle is in degrees
+	'''
+	x, y = toMayaTangent( x, y, fps )
+	return degrees( atan2( y, x ) ), hypot( x, y )
+
+
+class AnimKey(object):
+	'''
+	a single key on an AnimCurve.  tangents that are None get derived from the tangent type
+	'''
+	def __init__( self, time, value, ix=None, iy=None, ox=None, oy=None, itt='spline', ott='spline' ):
+		self.m_flTime = time
+		self.m_flValue = value
+		self.m_flInTanX, self.m_flInTanY = ix, iy
+		self.m_flOutTanX, self.m_flOutTanY = ox, oy
+		self.m_inTangentType, self.m_outTangentType = itt, ott
+	def __repr__( self ):
+		return 'AnimKey( %s, %s )' % (self.m_flTime, self.m_flValue)
+	def hasInTangent( self ):
+		return self.m_flInTanX is not None and self.m_flInTanY is not None
+	def hasOutTangent( self ):
+		return self.m_flOutTanX is not None and self.m_flOutTanY is not None
+
+
+class AnimCurve(object):
+	'''
+	a curve is a dict of AnimKey instances keyed by time.  the curve is compiled into flat arrays of segment
+	coefficients the first time its evaluated after being changed, so evaluating lots of times is cheap
+	'''
+	def __init__( self, weighted=False ):
+		self.m_keys = {}
+		self.m_bWeighted = weighted
+		self._compiled = None
+	@classmethod
+	def FromKeys( cls, times, values, itts=None, otts=None, weighted=False ):
+		'''
+		builds a curve from lists of times and values with tangents derived from the given tangent types - if
+		the tangent type lists aren't given, spline is assumed
+		'''
+		new = cls( weighted )
+		count = len( times )
+		itts = itts or ['spline'] * count
+		otts = otts or ['spline'] * count
+		for time, value, itt, ott in zip( times, values, itts, otts ):
+			new.AddKey( time, value, itt=itt, ott=ott )
+
+		return new
+	@classmethod
+	def FromKeyArrays( cls, keyArrays, fps, weighted=False, explicitTangents=True ):
+		'''
+		builds a curve from a keyArrays.KeyArrays instance.  if explicitTangents is True the tangent weights and
+		angles are used, otherwise the tangents are derived from the tangent types.  the angles are maya tangent
+		angles - fps is the frame rate they were queried at
+		'''
+		from keyArrays import TANGENT_TYPES
+
+		new = cls( weighted )
+		for time, value, iw, ow, ia, oa, itt, ott in zip( keyArrays.times, keyArrays.values, keyArrays.iws, keyArrays.ows,
+		                                                   keyArrays.ias, keyArrays.oas, keyArrays.itts, keyArrays.otts ):
+			itt, ott = TANGENT_TYPES[ itt ], TANGENT_TYPES[ ott ]
+			if explicitTangents:
+				ix, iy = fromMayaAngle( ia, iw, fps )
+				ox, oy = fromMayaAngle( oa, ow, fps )
+				new.AddKey( time, value, ix, iy, ox, oy, itt, ott )
+			else:
+				new.AddKey( time, value, itt=itt, ott=ott )
+
+		return new
+	def __len__( self ):
+		return len( self.m_keys )
+	def AddKey( self, time, value, ix=None, iy=None, ox=None, oy=None, itt='spline', ott='spline' ):
+		'''
+		adds a key, replacing any existing key at the same time
+		'''
+		self.m_keys[ time ] = key = AnimKey( time, value, ix, iy, ox, oy, itt, ott )
+		self._compiled = None
+
+		return key
+	def InsertKey( self, time ):
+		'''
+		adds a key on the curve at the given time without changing the curve value there.  the new key gets
+		tangents matching the curve slope, so the shape of unweighted curves is preserved exactly.  nothing
+		happens if there is already a key at the given time
+		'''
+		if time in self.m_keys:
+			return self.m_keys[ time ]
+
+		#derived tangents depend on the neighbouring keys, so bake them before adding the new key otherwise the
+		#shape of the surrounding segments would change
+		self.bakeTangents()
+
+		value, slope = self.evaluate( time ), self.evaluateSlope( time )
+		inLength = outLength = 1.0
+		if self.m_bWeighted:
+			#size the tangents so the control points are a third of the way to the neighbouring keys
+			times = self._compile()[ 0 ]
+			idx = bisect_left( times, time )
+			if 0 < idx < len( times ):
+				inLength, outLength = time - times[ idx-1 ], times[ idx ] - time
+
+		return self.AddKey( time, value, inLength, slope * inLength, outLength, slope * outLength, 'fixed', 'fixed' )
+	def getTimes( self ):
+		return sorted( self.m_keys )
+	def bakeTangents( self ):
+		'''
+		replaces any tangents derived from tangent types with explicit tangents
+		'''
+		keys = [ self.m_keys[ t ] for t in sorted( self.m_keys ) ]
+		times, values = self._compile()[ :2 ]
+		for key, ix, iy, ox, oy in zip( keys, *self._getTangents( times, values, keys ) ):
+			key.m_flInTanX, key.m_flInTanY = ix, iy
+			key.m_flOutTanX, key.m_flOutTanY = ox, oy
+	def _getTangents( self, times, values, keys ):
+		'''
+		returns the (inX, inY, outX, outY) lists of tangents for the given sorted keys - deriving any that
+		weren't specified from the tangent types
+		'''
+		count = len( keys )
+		inX, inY, outX, outY = [0.0] * count, [0.0] * count, [0.0] * count, [0.0] * count
+		for n, key in enumerate( keys ):
+			prevSpan = times[ n ] - times[ n-1 ] if n > 0 else None
+			nextSpan = times[ n+1 ] - times[ n ] if n < count - 1 else None
+			if key.hasInTangent():
+				inX[ n ], inY[ n ] = key.m_flInTanX, key.m_flInTanY
+			else:
+				span = prevSpan or nextSpan or 1.0
+				inX[ n ], inY[ n ] = span, span * computeSlope( key.m_inTangentType, times, values, n, True )
+
+			if key.hasOutTangent():
+				outX[ n ], outY[ n ] = key.m_flOutTanX, key.m_flOutTanY
+			else:
+				span = nextSpan or prevSpan or 1.0
+				outX[ n ], outY[ n ] = span, span * computeSlope( key.m_outTangentType, times, values, n, False )
+
+		return inX, inY, outX, outY
+	def _compile( self ):
+		'''
+		builds the flat arrays used for evaluation.  each segment gets a kind and four coefficients:
+			hermite - the polynomial coefficients in the normalized segment parameter
+			bezier - the x control points (the y control points are in a parallel array)
+			step/stepnext - unused
+		'''
+		if self._compiled is not None:
+			return self._compiled
+
+		keys = [ self.m_keys[ t ] for t in sorted( self.m_keys ) ]
+		times = array( 'd', [ k.m_flTime for k in keys ] )
+		values = array( 'd', [ k.m_flValue for k in keys ] )
+		inX, inY, outX, outY = self._getTangents( times, values, keys )
+
+		kinds = array( 'b' )
+		xCoeffs = array( 'd' )
+		yCoeffs = array( 'd' )
+		weighted = self.m_bWeighted
+		for n in xrange( len( keys ) - 1 ):
+			t0, t1 = times[ n ], times[ n+1 ]
+			v0, v1 = values[ n ], values[ n+1 ]
+			span = t1 - t0
+			ott = keys[ n ].m_outTangentType
+			if ott == 'step':
+				kinds.append( kSTEP )
+				xCoeffs.extend( (0, 0, 0, 0) )
+				yCoeffs.extend( (0, 0, 0, 0) )
+			elif ott == 'stepnext':
+				kinds.append( kSTEP_NEXT )
+				xCoeffs.extend( (0, 0, 0, 0) )
+				yCoeffs.extend( (0, 0, 0, 0) )
+			elif weighted:
+				#clamp the inner control points to the segment so time stays monotonic
+				x1 = t0 + max( 0, min( span, outX[ n ] / 3.0 ) )
+				x2 = t1 - max( 0, min( span, inX[ n+1 ] / 3.0 ) )
+				y1 = v0 + (outY[ n ] / 3.0 if outX[ n ] / 3.0 <= span else outY[ n ] * span / outX[ n ])
+				y2 = v1 - (inY[ n+1 ] / 3.0 if inX[ n+1 ] / 3.0 <= span else inY[ n+1 ] * span / inX[ n+1 ])
+				kinds.append( kBEZIER )
+				xCoeffs.extend( (t0, x1, x2, t1) )
+				yCoeffs.extend( (v0, y1, y2, v1) )
+			else:
+				#unweighted tangents only contribute their slope - vertical tangents are treated as flat
+				m0 = outY[ n ] / outX[ n ] if outX[ n ] else 0.0
+				m1 = inY[ n+1 ] / inX[ n+1 ] if inX[ n+1 ] else 0.0
+				m0 *= span
+				m1 *= span
+				kinds.append( kHERMITE )
+				xCoeffs.extend( (0, 0, 0, 0) )
+				yCoeffs.extend( (v0, m0, -3*v0 - 2*m0 + 3*v1 - m1, 2*v0 + m0 - 2*v1 + m1) )
+
+		self._compiled = times, values, kinds, xCoeffs, yCoeffs
+
+		return self._compiled
+	def evaluate( self, time ):
+		'''
+		returns the value of the curve at the given time
+		'''
+		return self.evaluateTimes( (time,) )[ 0 ]
+	def evaluateTimes( self, times ):
+		'''
+		returns an array of curve values - one for each of the given times
+		'''
+		keyTimes, keyValues, kinds, xCoeffs, yCoeffs = self._compile()
+		results = array( 'd' )
+		if not keyTimes:
+			results.extend( [ 0.0 ] * len( times ) )
+			return results
+
+		first, last = keyTimes[ 0 ], keyTimes[ -1 ]
+		firstValue, lastValue = keyValues[ 0 ], keyValues[ -1 ]
+		for time in times:
+			if time <= first:
+				results.append( firstValue )
+				continue
+			if time >= last:
+				results.append( lastValue )
+				continue
+
+			n = bisect_right( keyTimes, time ) - 1
+			t0 = keyTimes[ n ]
+			if time == t0:
+				results.append( keyValues[ n ] )
+				continue
+
+			kind = kinds[ n ]
+			c = 4 * n
+			if kind == kHERMITE:
+				s = (time - t0) / (keyTimes[ n+1 ] - t0)
+				results.append( ((yCoeffs[ c+3 ]*s + yCoeffs[ c+2 ])*s + yCoeffs[ c+1 ])*s + yCoeffs[ c ] )
+			elif kind == kBEZIER:
+				u = _solveBezier( xCoeffs[ c ], xCoeffs[ c+1 ], xCoeffs[ c+2 ], xCoeffs[ c+3 ], time )
+				results.append( _bezier( yCoeffs[ c ], yCoeffs[ c+1 ], yCoeffs[ c+2 ], yCoeffs[ c+3 ], u ) )
+			elif kind == kSTEP:
+				results.append( keyValues[ n ] )
+			else:
+				results.append( keyValues[ n+1 ] )
+
+		return results
+	def evaluateSlope( self, time ):
+		'''
+		returns the slope of the curve at the given time - at a key the slope of the out side is returned
+		'''
+		keyTimes, keyValues, kinds, xCoeffs, yCoeffs = self._compile()
+		if len( keyTimes ) < 2 or time < keyTimes[ 0 ] or time >= keyTimes[ -1 ]:
+			return 0.0
+
+		n = bisect_right( keyTimes, time ) - 1
+		kind = kinds[ n ]
+		c = 4 * n
+		if kind == kHERMITE:
+			t0 = keyTimes[ n ]
+			span = keyTimes[ n+1 ] - t0
+			s = (time - t0) / span
+			return (3*yCoeffs[ c+3 ]*s*s + 2*yCoeffs[ c+2 ]*s + yCoeffs[ c+1 ]) / span
+		elif kind == kBEZIER:
+			u = _solveBezier( xCoeffs[ c ], xCoeffs[ c+1 ], xCoeffs[ c+2 ], xCoeffs[ c+3 ], time )
+			dx = _bezierDerivative( xCoeffs[ c ], xCoeffs[ c+1 ], xCoeffs[ c+2 ], xCoeffs[ c+3 ], u )
+			dy = _bezierDerivative( yCoeffs[ c ], yCoeffs[ c+1 ], yCoeffs[ c+2 ], yCoeffs[ c+3 ], u )
+			return dy / dx if dx else 0.0
+
+		return 0.0
+	def getTangentAngles( self, fps ):
+		'''
+		returns a list of (inAngle, inWeight, outAngle, outWeight) tuples for each key in time order as maya tangent
+		angles and weights at the given frame rate - this is the form keyUtils.Key stores tangents in
+		'''
+		keys = [ self.m_keys[ t ] for t in sorted( self.m_keys ) ]
+		times, values = self._compile()[ :2 ]
+		inX, inY, outX, outY = self._getTangents( times, values, keys )
+		angles = []
+		for ix, iy, ox, oy in zip( inX, inY, outX, outY ):
+			angles.append( toMayaAngle( ix, iy, fps ) + toMayaAngle( ox, oy, fps ) )
+
+		return angles
+
+
+def _bezier( p0, p1, p2, p3, u ):
+	v = 1 - u
+	return v*v*v*p0 + 3*v*v*u*p1 + 3*v*u*u*p2 + u*u*u*p3
+
+
+def _bezierDerivative( p0, p1, p2, p3, u ):
+	v = 1 - u
+	return 3*v*v*(p1 - p0) + 6*v*u*(p2 - p1) + 3*u*u*(p3 - p2)
+
+
+def _solveBezier( x0, x1, x2, x3, x ):
+	'''
+	returns the bezier parameter u in [0, 1] where the bezier with the given x control points equals x.  the
+	control points are assumed to be monotonic - newton's method is used with bisection as a fallback
+	'''
+	lo, hi = 0.0, 1.0
+	u = (x - x0) / (x3 - x0)
+	for i in xrange( BEZIER_ITERATIONS ):
+		error = _bezier( x0, x1, x2, x3, u ) - x
+		if abs( error ) < BEZIER_TOLERANCE:
+			return u
+
+		if error > 0: hi = u
+		else: lo = u
+
+		slope = _bezierDerivative( x0, x1, x2, x3, u )
+		u = u - error / slope if slope else -1
+		if not lo < u < hi:
+			u = (lo + hi) / 2.0
+
+	#if newton didn't converge finish off with bisection
+	while hi - lo > BEZIER_TOLERANCE:
+		u = (lo + hi) / 2.0
+		if _bezier( x0, x1, x2, x3, u ) > x: hi = u
+		else: lo = u
+
+	return (lo + hi) / 2.0
+
+
+#end
@@ -7,6 +7,9 @@ import maya.cmds as cmd
 import names
 import api
 import apiExtensions
+import keyReduction
+import animCapture
+import clipBlending
 
 
 __author__ = 'mel@macaronikazoo.com'
@@ -101,15 +104,25 @@ def generateIcon( preset ):
 	return icon
 
 
+def isSettable( attrpath ):
+	try:
+		return bool( cmd.getAttr( attrpath, settable=True ) )
+	except TypeError: return False
+
+
 class BaseBlender(object):
 	'''
 	a blender object is simply a callable object that when called with a percentage arg (0-1) will
 	apply said percentage of the given clips to the given mapping
+
+	the clip data for the mapping is gathered into a blend object the first time the blender is called - and
+	again whenever the mapping or the attributes change.  subclasses implement _buildBlend to create it
 	'''
 	def __init__( self, clipA, clipB, mapping=None, attributes=None ):
 		self.clipA = clipA
 		self.clipB = clipB
 		self.__mapping = mapping
+		self._blend = None
 
 		if attributes:
 			attributes = set( attributes )
@@ -117,8 +130,29 @@ class BaseBlender(object):
 		self.attributes = attributes
 	def setMapping( self, mapping ):
 		self.__mapping = mapping
+		self._blend = None
 	def getMapping( self ):
 		return self.__mapping
+	def setAttributes( self, attributes ):
+		if attributes:
+			attributes = set( attributes )
+
+		if attributes != self.attributes:
+			self.attributes = attributes
+			self._blend = None
+	def _buildBlend( self, mappingDict ):
+		raise NotImplementedError
+	def getBlend( self ):
+		if self._blend is None:
+			mapping = self.getMapping()
+			try:
+				mappingDict = mapping.asDict()
+			except AttributeError:
+				mappingDict = mapping
+
+			self._blend = self._buildBlend( mappingDict )
+
+		return self._blend
 	def __call__( self, pct, mapping=None ):
 		if mapping is not None:
 			self.setMapping( mapping )
@@ -126,117 +160,44 @@ class BaseBlender(object):
 
 
 class PoseBlender(BaseBlender):
+	def _buildBlend( self, mappingDict ):
+		return clipBlending.PoseBlend( self.clipA, self.clipB, mappingDict, self.attributes, isSettable )
 	def __call__( self, pct, mapping=None, attributes=None ):
 		BaseBlender.__call__(self, pct, mapping)
-		cmdQueue = api.CmdQueue()
-
-		if mapping is None:
-			mapping = self.getMapping()
-
-		if attributes is None:
-			attributes = self.attributes
-
-		mappingDict = mapping.asDict()
-		for clipAObj, attrDictA in self.clipA.iteritems():
-
-			#if the object isn't in the mapping dict, skip it
-			if clipAObj not in mappingDict:
-				continue
+		if attributes is not None:
+			self.setAttributes( attributes )
 
-			clipBObjs = mapping[ clipAObj ]
-			for a, valueA in attrDictA.iteritems():
-				if attributes:
-					if a not in attributes:
-						continue
-
-				if not clipAObj:
-					continue
-
-				attrpath = '%s.%s' % (clipAObj, a)
-				if not cmd.getAttr( attrpath, settable=True ):
-					continue
-
-				for clipBObj in clipBObjs:
-					try:
-						attrDictB = self.clipB[ clipBObj ]
-					except KeyError: continue
+		#only the attributes whose blended value has changed since the last call need to be set
+		changed = self.getBlend().getChanged( pct )
+		if not changed:
+			return
 
-					try:
-						valueB = attrDictB[ a ]
-						blendedValue = (valueA * (1-pct)) + (valueB * pct)
-						cmdQueue.append( 'setAttr -clamp %s %f' % (attrpath, blendedValue) )
-					except KeyError:
-						cmdQueue.append( 'setAttr -clamp %s %f' % (attrpath, valueA) )
-					except: pass
+		cmdQueue = api.CmdQueue()
+		for attrpath, blendedValue in changed:
+			cmdQueue.append( 'setAttr -clamp %s %f' % (attrpath, blendedValue) )
 
 		cmdQueue()
 
 
 class AnimBlender(BaseBlender):
-	def __init__( self, clipA, clipB, mapping=None ):
-		BaseBlender.__init__(self, clipA, clipB, mapping)
-
-		#so now we need to generate a dict to represent the curves for both of the clips
-		animCurveDictA = self.animCurveDictA = {}
-		animCurveDictB = self.animCurveDictB = {}
-
-		#the curvePairs attribute contains a dict - indexed by attrpath - containing a tuple of (curveA, curveB)
-		self.curvePairs = {}
-
-		for clip, curveDict in zip([self.clipA, self.clipB], [animCurveDictA, animCurveDictB]):
-			for o, attrDict in clip.iteritems():
-				curveDict[o] = {}
-				for a, keyData in attrDict.iteritems():
-					curve = curveDict[o][a] = animCurve.AnimCurve()
-
-					#unpack the key data
-					weightedTangents, keyList = keyData
-
-					#generate the curves
-					for time, value, itt, ott, ix, iy, ox, oy, isLocked, isWeighted in keyList:
-						curve.m_bWeighted = weightedTangents
-						curve.AddKey( time, value, ix, iy, ox, oy )
-
-					attrPath = '%s.%s' % (o, a)
-					try: self.curvePairs[attrPath].append( curve )
-					except KeyError: self.curvePairs[attrPath] = [ curve ]
-
-		#now iterate over each curve pair and make sure they both have keys on the same frames...
-		for attrPath, curves in self.curvePairs.iteritems():
-			try:
-				curveA, curveB = curves
-			except ValueError: continue
-
-			curveTimes = set( curveA.m_keys.keys() + curveB.m_keys.keys() )
-			for t in curveTimes:
-				curveA.InsertKey( t )
-				curveB.InsertKey( t )
-			print 'keys on', attrPath, 'at times', curveTimes
+	def _buildBlend( self, mappingDict ):
+		#the blend inserts keys into the curves of both clips so they have keys on the same frames
+		return clipBlending.AnimBlend( self.clipA, self.clipB, mappingDict, api.getFps(), self.attributes, isSettable )
 	def __call__( self, pct, mapping=None ):
 		BaseBlender.__call__(self, pct, mapping)
+		blend = self.getBlend()
+
 		cmdQueue = api.CmdQueue()
+		for attrPath, blendedValue in blend.poses.getChanged( pct ):
+			cmdQueue.append( 'setAttr -clamp %s %f' % (attrPath, blendedValue) )
 
-		if pct == 0:
-			self.clipA.apply( self.getMapping() )
-		elif pct == 1:
-			self.clipB.apply( self.getMapping() )
-		else:
-			for attrPath, curves in self.curvePairs.iteritems():
-				try:
-					curveA, curveB = curves
-				except ValueError: continue
-
-				#because we know both curves have the same timings (ie if curveA has a key at time x, curveB is guaranteed to also have a key
-				#at time x) then we just need to iterate over the keys of one curve, and blend them with the values of the other
-				for time, keyA in curveA.m_keys.iteritems():
-					keyB = curveB.m_keys[ time ]
-					blendedValue = (keyA.m_flValue * (1-pct)) + (keyB.m_flValue * pct)
-					blendedIX = (keyA.m_flInTanX * (1-pct)) + (keyB.m_flInTanX * pct)
-					blendedIY = (keyA.m_flInTanY * (1-pct)) + (keyB.m_flInTanY * pct)
-					blendedOX = (keyA.m_flOutTanX * (1-pct)) + (keyB.m_flOutTanX * pct)
-					blendedOY = (keyA.m_flOutTanY * (1-pct)) + (keyB.m_flOutTanY * pct)
-					cmdQueue.append( 'setKeyframe -t %s -v %s %s' % (time, blendedValue, attrPath) )
-					cmdQueue.append( 'keyTangent -e -t %s -ix %s -iy %s -ox %s -oy %s %s' % (time, blendedIX, blendedIY, blendedOX, blendedOY, attrPath) )
+		for attrPath, keys in blend.getChanged( pct ):
+			for time, blendedValue, blendedIX, blendedIY, blendedOX, blendedOY in keys:
+				cmdQueue.append( 'setKeyframe -t %s -v %s %s' % (time, blendedValue, attrPath) )
+				cmdQueue.append( 'keyTangent -e -t %s -ix %s -iy %s -ox %s -oy %s %s' % (time, blendedIX, blendedIY, blendedOX, blendedOY, attrPath) )
+
+		if cmdQueue:
+			cmdQueue()
 
 
 class BaseClip(dict):
@@ -435,6 +396,8 @@ class AnimClip(BaseClip):
 		self.offset = offset = allKeys[ 0 ]
 		self.__range = allKeys[ -1 ] - offset
 
+		#gather the attrpaths for all objects so the key data can be captured in one go
+		objAttrpaths = []
 		for obj in objects:
 			objAttrs = set( cmd.listAttr( obj, keyable=True, visible=True, scalar=True ) or [] )
 			if attrs:
@@ -443,39 +406,20 @@ class AnimClip(BaseClip):
 			if not objAttrs:
 				continue
 
-			objDict = {}
-			self[ obj ] = objDict
-			for attr in objAttrs:
-				timeTuple = startFrame, endFrame
-
-				#so the attr value dict contains a big fat list containing tuples of the form:
-				#(time, value, itt, ott, ita, ota, iw, ow, isLockedTangents, isWeightLock)
-				attrpath = '%s.%s' % (obj, attr)
-				times = cmd.keyframe( attrpath, q=True, t=timeTuple )
-				weightedTangents = defaultWeightedTangentOpt
-
-				#if there is an animCurve this will return its "weighted tangent" state - otherwise it will return None and a TypeError will be raised
-				try: weightedTangents = bool(cmd.keyTangent(attrpath, q=True, weightedTangents=True)[0])
-				except TypeError: pass
+			self[ obj ] = {}
+			objAttrpaths += [ (obj, attr, '%s.%s' % (obj, attr)) for attr in objAttrs ]
 
-				if times is None:
-					#in this case the attr has no animation, so simply record the pose for this attr
-					objDict[attr] = (False, [(None, cmd.getAttr(attrpath), None, None, None, None, None, None, None, None)])
-					continue
-				else:
-					times = [ t-offset for t in times ]
-
-				values = cmd.keyframe(attrpath, q=True, t=timeTuple, vc=True)
-				itts = cmd.keyTangent(attrpath, q=True, t=timeTuple, itt=True)
-				otts = cmd.keyTangent(attrpath, q=True, t=timeTuple, ott=True)
-				ixs = cmd.keyTangent(attrpath, q=True, t=timeTuple, ix=True)
-				iys = cmd.keyTangent(attrpath, q=True, t=timeTuple, iy=True)
-				oxs = cmd.keyTangent(attrpath, q=True, t=timeTuple, ox=True)
-				oys = cmd.keyTangent(attrpath, q=True, t=timeTuple, oy=True)
-				isLocked = cmd.keyTangent(attrpath, q=True, t=timeTuple, weightLock=True)
-				isWeighted = cmd.keyTangent(attrpath, q=True, t=timeTuple, weightLock=True)
+		curves = animCapture.captureCurves( [ attrpath for obj, attr, attrpath in objAttrpaths ], (startFrame, endFrame), defaultWeightedTangentOpt, cmd )
+		for obj, attr, attrpath in objAttrpaths:
+			curve = curves.get( attrpath )
+			if curve is None:
+				#in this case the attr has no animation, so simply record the pose for this attr
+				self[ obj ][ attr ] = (False, [(None, cmd.getAttr(attrpath), None, None, None, None, None, None, None, None)])
+				continue
 
-				objDict[ attr ] = weightedTangents, zip(times, values, itts, otts, ixs, iys, oxs, oys, isLocked, isWeighted)
+			#so the attr value dict contains a big fat list containing tuples of the form:
+			#(time, value, itt, ott, ix, iy, ox, oy, isLockedTangents, isWeightLock)
+			self[ obj ][ attr ] = curve.weighted, curve.toKeyList( offset )
 
 		return True
 	@d_unifyUndo
@@ -511,6 +455,8 @@ class AnimClip(BaseClip):
 		if attributes:
 			attributes = set( attributes )
 
+		#resolve the mapping and the attribute list up front into a list of the attributes to write
+		toApply = []
 		for obj, tgtObj in mapping.iteritems():
 			if not tgtObj:
 				continue
@@ -519,59 +465,52 @@ class AnimClip(BaseClip):
 				attrDict = self[ obj ]
 			except KeyError: continue
 
+			#if the control has space switching setup, see if its value is set to "world" - if its not, we're don't treat the control's animation as additive
+			isWorld = True
+			if worldAdditive:
+				try: isWorld = cmd.getAttr('%s.parent' % obj, asString=True) == 'world'
+				except TypeError: pass
+
 			for attr, (weightedTangents, keyList) in attrDict.iteritems():
 				if attributes:
 					if attr not in attributes:
 						continue
 
-				attrpath = '%s.%s' % (tgtObj, attr)
-				try:
-					if not cmd.getAttr(attrpath, settable=True):
-						continue
-				except TypeError: continue
-				except RuntimeError:
-					print obj, tgtObj, attrpath
-					raise
-
-				#do the clear...  maya doesn't complain if we try to do a cutKey on an attrpath with no
-				#animation - and this is good to do before we determine whether the attrpath has a curve or not...
-				if clear:
-					cmd.cutKey( attrpath, t=(clearStart, clearEnd), cl=True )
-
-				#is there an anim curve on the target attrpath already?
-				curveExists = cmd.keyframe(attrpath, index=(0,), q=True) is not None
-
-				preValue = 0
-				if additive:
-					if worldAdditive:
-						isWorld = True
-
-						#if the control has space switching setup, see if its value is set to "world" - if its not, we're don't treat the control's animation as additive
-						try: isWorld = cmd.getAttr('%s.parent' % obj, asString=True) == 'world'
-						except TypeError: pass
-
-						#only treat translation as additive
-						if isWorld and attr.startswith('translate'):
-							preValue = cmd.getAttr(attrpath)
-					else:
-						preValue = cmd.getAttr(attrpath)
-
-				for time, value, itt, ott, ix, iy, ox, oy, isLocked, isWeighted in keyList:
-					value *= mult
-					value += preValue
-					if time is None:
-						#in this case the attr value was just a pose...
-						cmd.setAttr( attrpath, value )
-					else:
-						time += timeOffset
-						cmd.setKeyframe( attrpath, t=(time,), v=value )
-						if weightedTangents:
-							#this needs to be done as two separate commands - because setting the tangent types in the same cmd as setting tangent weights can result
-							#in the tangent types being ignored (for the case of stepped mainly, but subtle weirdness with flat happens too)
-							cmd.keyTangent( attrpath, t=(time,), ix=ix, iy=iy, ox=ox, oy=oy, l=isLocked, wl=isWeighted )
-							cmd.keyTangent( attrpath, t=(time,), itt=itt, ott=ott )
-						else:
-							cmd.keyTangent( attrpath, t=(time,), ix=ix, iy=iy, ox=ox, oy=oy )
+				toApply.append( (obj, tgtObj, attr, weightedTangents, keyList, isWorld) )
+
+		for obj, tgtObj, attr, weightedTangents, keyList, isWorld in toApply:
+			attrpath = '%s.%s' % (tgtObj, attr)
+			try:
+				if not cmd.getAttr(attrpath, settable=True):
+					continue
+			except TypeError: continue
+			except RuntimeError:
+				print obj, tgtObj, attrpath
+				raise
+
+			#do the clear...  maya doesn't complain if we try to do a cutKey on an attrpath with no
+			#animation - and this is good to do before we determine whether the attrpath has a curve or not...
+			if clear:
+				cmd.cutKey( attrpath, t=(clearStart, clearEnd), cl=True )
+
+			preValue = 0
+			if additive:
+				#only treat translation as additive
+				if not worldAdditive or (isWorld and attr.startswith('translate')):
+					preValue = cmd.getAttr(attrpath)
+
+			if keyList[0][0] is None:
+				#in this case the attr value was just a pose...
+				cmd.setAttr( attrpath, keyList[0][1] * mult + preValue )
+				continue
+
+			keyList = [ (k[0] + timeOffset, k[1] * mult + preValue) + tuple( k[2:] ) for k in keyList ]
+
+			#if there is no anim curve on the target attrpath the whole curve can be created in one go, otherwise
+			#the keys need to be merged into the existing curve one at a time
+			curveExists = cmd.keyframe(attrpath, index=(0,), q=True) is not None
+			if curveExists or animCapture.createCurve( attrpath, weightedTangents, keyList, cmd ) is None:
+				animCapture.setKeysPerKey( attrpath, weightedTangents, keyList, cmd )
 
 		#cmd.keyTangent( e=True, g=True, wt=beginningWeightedTanState )
 	def getKeyTimes( self ):
@@ -591,6 +530,32 @@ class AnimClip(BaseClip):
 		keyTimes.sort()
 
 		return keyTimes
+	def reduce( self, tolerance=keyReduction.DEFAULT_TOLERANCE, processes=None ):
+		'''
+		reduces the keys on every animated attribute in place - the reduced curves stay within tolerance of every
+		original key value.  this is meant for densely keyed clips (ie baked mocap) as the original keys are
+		treated as samples and their tangents are ignored.  returns a dict of keyReduction.KeyReduction
+		instances keyed by (obj, attr)
+		'''
+		toReduce = []
+		for obj, attrDict in self.iteritems():
+			for attr, (weightedTangents, keyList) in attrDict.iteritems():
+				if keyList[0][0] is None or len( keyList ) < 3:
+					continue
+
+				toReduce.append( (obj, attr, weightedTangents, keyList) )
+
+		sampleLists = [ ([ k[0] for k in keyList ], [ k[1] for k in keyList ]) for obj, attr, weightedTangents, keyList in toReduce ]
+		reductions = keyReduction.reduceSamplesParallel( sampleLists, tolerance, processes )
+
+		#the reduced tangents go back to maya, so they need the scene frame rate
+		fps = api.getFps()
+		results = {}
+		for (obj, attr, weightedTangents, keyList), reduction in zip( toReduce, reductions ):
+			self[ obj ][ attr ] = weightedTangents, reduction.toKeyList( fps, weightedTangents )
+			results[ (obj, attr) ] = reduction
+
+		return results
 	def getRange( self ):
 		'''
 		returns a tuple of (start, end)
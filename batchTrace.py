@@ -0,0 +1,245 @@
+'''
+the transform math for tracing animation from one set of nodes onto another (see xferAnim.Tracer) done for all
+frames at once.  the tracer samples the source world matrices for every frame in a single pass, this module
+solves the translate and rotate values that put each target on its source, and the tracer writes the results
+out as curves.  the frames of a trace are independent of each other, so they can be split into chunks and
+solved in parallel using a pool of processes.
+
+the solve does what the parentConstraint the serial trace uses does - the target's rotate pivot is put on the
+source's rotate pivot and the target's world orientation is matched to the source's.  it assumes the target's
+scale pivot is at its rotate pivot, and that nothing above the target has non uniform scale (which would shear
+the target so its orientation can't match).
+
+nothing in here needs maya - matrices are flat arrays (see vectorArrays) so it can be tested with synthetic data
+'''
+
+from array import array
+from bisect import bisect_left
+
+from filesystem import mapInProcessPool
+from vectorArrays import VectorArray, MatrixArray
+
+import time
+import random
+
+
+#euler orders indexed by the value of the rotateOrder attribute
+ROTATE_ORDERS = 'XYZ', 'YZX', 'ZXY', 'XZY', 'YXZ', 'ZYX'
+
+DEFAULT_CHUNK_SIZE = 250  #the number of frames solved by each process at a time
+
+
+def _constantVectors( vector, count ):
+	return VectorArray( array( 'd', vector ) * count )
+
+
+def _eulerInverse( angles, order ):
+	'''
+	returns the inverse of the rotation matrix for the given euler angles (in degrees) as a single item
+	MatrixArray - or None if the angles are all zero
+	'''
+	if not any( angles ):
+		return None
+
+	return MatrixArray.FromEuler( VectorArray( angles ), order, True ).transpose()
+
+
+class TraceTarget(object):
+	'''
+	the static data about a target needed to solve its transform attributes.  parentIndex is the index of
+	another target in the trace that is this target's parent - its solved world matrices are used as this
+	target's parent matrices.  targets must come after their parents in the list passed to solveTargets
+	'''
+	def __init__( self, rotateOrder=0, rotatePivot=(0, 0, 0), rotatePivotTranslate=(0, 0, 0), scale=(1, 1, 1),
+	              rotateAxis=(0, 0, 0), jointOrient=(0, 0, 0), srcRotatePivot=(0, 0, 0), parentIndex=None ):
+		self.rotateOrder = rotateOrder
+		self.rotatePivot = tuple( rotatePivot )
+		self.rotatePivotTranslate = tuple( rotatePivotTranslate )
+		self.scale = tuple( scale )
+		self.rotateAxis = tuple( rotateAxis )
+		self.jointOrient = tuple( jointOrient )
+		self.srcRotatePivot = tuple( srcRotatePivot )
+		self.parentIndex = parentIndex
+	def __repr__( self ):
+		return 'TraceTarget( ro=%s, parent=%s )' % (ROTATE_ORDERS[ self.rotateOrder ], self.parentIndex)
+	def solve( self, srcWorlds, parentWorlds, computeWorlds=False ):
+		'''
+		returns a (translations, rotations, worlds) 3-tuple.  translations and rotations are VectorArrays of the
+		translate and rotate (in degrees) values for each frame.  worlds is a MatrixArray of the target's world
+		matrices once the values are applied if computeWorlds is True, otherwise None
+
+		srcWorlds is a MatrixArray of the source's world matrix for each frame, parentWorlds is a MatrixArray of
+		the target's parent world matrix for each frame - or a single matrix if the parent doesn't move
+		'''
+		count = len( srcWorlds )
+		parentInverses = parentWorlds.inverse()
+
+		#the world orientation of the source in the target's parent space
+		localRotations = srcWorlds.multiply( parentInverses ).decompose()[ 1 ]
+
+		#the rotate attributes sit between the rotate axis and the joint orient - so take them out
+		rotations = localRotations
+		rotateAxisInverse = _eulerInverse( self.rotateAxis, 'XYZ' )
+		if rotateAxisInverse is not None:
+			rotations = MatrixArray( rotateAxisInverse.values * count ).multiply( rotations )
+
+		jointOrientInverse = _eulerInverse( self.jointOrient, 'XYZ' )
+		if jointOrientInverse is not None:
+			rotations = rotations.multiply( jointOrientInverse )
+
+		angles = rotations.toEuler( ROTATE_ORDERS[ self.rotateOrder ], True )
+
+		#the translation puts the target's rotate pivot on the source's rotate pivot
+		pivots = _constantVectors( self.srcRotatePivot, count ).transformPoints( srcWorlds ).transformPoints( parentInverses )
+		rp, rpt = self.rotatePivot, self.rotatePivotTranslate
+		translations = pivots - (rp[ 0 ] + rpt[ 0 ], rp[ 1 ] + rpt[ 1 ], rp[ 2 ] + rpt[ 2 ])
+
+		worlds = None
+		if computeWorlds:
+			#the local matrix is the scaled rotation about the rotate pivot, moved to the pivot position
+			scales = _constantVectors( self.scale, count )
+			scaledRotations = MatrixArray.FromTransforms( VectorArray.Zero( count ), localRotations, scales )
+			origins = pivots - _constantVectors( rp, count ).transformVectors( scaledRotations )
+			worlds = MatrixArray.FromTransforms( origins, localRotations, scales ).multiply( parentWorlds )
+
+		return translations, angles, worlds
+
+
+def _takeMatrices( matrices, indices ):
+	values = matrices.values
+	new = array( 'd' )
+	for n in indices:
+		new.extend( values[ n*16:n*16+16 ] )
+
+	return MatrixArray( new )
+
+
+def solveTargets( targets, srcWorlds, parentWorlds, times=None ):
+	'''
+	solves the transform attributes of each target for every frame.  srcWorlds is a list containing a MatrixArray
+	of source world matrices for each target.  parentWorlds is a list containing a MatrixArray of parent world
+	matrices (see TraceTarget.solve) for each target - the entry is ignored for targets with a parentIndex.
+
+	times is an optional list containing the sorted times each target is solved at - the matrices for each target
+	are then for those times.  a target's times must all be in its parent's times (see traceSchedule.FrameSchedule).
+	if times isn't given every target is solved at the same frames
+
+	returns a list of (translations, rotations) tuples - one for each target
+	'''
+	parentIndices = set( [ target.parentIndex for target in targets ] )
+	worlds = {}
+	results = []
+	for n, target in enumerate( targets ):
+		parentIndex = target.parentIndex
+		if parentIndex is None:
+			parentWorld = parentWorlds[ n ]
+		else:
+			parentWorld = worlds[ parentIndex ]
+			if times is not None and times[ n ] != times[ parentIndex ]:
+				parentTimeIndices = dict( (t, i) for i, t in enumerate( times[ parentIndex ] ) )
+				parentWorld = _takeMatrices( parentWorld, [ parentTimeIndices[ t ] for t in times[ n ] ] )
+
+		translations, rotations, worlds[ n ] = target.solve( srcWorlds[ n ], parentWorld, n in parentIndices )
+		results.append( (translations, rotations) )
+
+	return results
+
+
+def _sliceMatrices( matrices, start, end ):
+	if matrices is None or len( matrices ) == 1:
+		return matrices
+
+	return MatrixArray( matrices.values[ start*16:end*16 ] )
+
+
+def _solveTargetsArgs( args ):
+	return solveTargets( *args )
+
+
+def solveTargetsParallel( targets, srcWorlds, parentWorlds, times=None, processes=None, chunkSize=DEFAULT_CHUNK_SIZE ):
+	'''
+	does the same as solveTargets but splits the time range into chunks of chunkSize times and solves the chunks
+	using a pool of processes - see filesystem.mapInProcessPool for details on processes
+	'''
+	if times is None:
+		frameCount = len( srcWorlds[ 0 ] ) if srcWorlds else 0
+		times = [ range( frameCount ) ] * len( targets )
+
+	#chunk the union of all the times so the frames a target shares with its parent end up in the same chunk
+	allTimes = sorted( set( [ t for targetTimes in times for t in targetTimes ] ) )
+	boundaries = allTimes[ ::chunkSize ][ 1: ]
+	args = []
+	for start, end in zip( [ None ] + boundaries, boundaries + [ None ] ):
+		rowRanges = []
+		for targetTimes in times:
+			startRow = 0 if start is None else bisect_left( targetTimes, start )
+			endRow = len( targetTimes ) if end is None else bisect_left( targetTimes, end )
+			rowRanges.append( (startRow, endRow) )
+
+		args.append( (targets,
+		              [ _sliceMatrices( m, s, e ) for m, (s, e) in zip( srcWorlds, rowRanges ) ],
+		              [ _sliceMatrices( m, s, e ) for m, (s, e) in zip( parentWorlds, rowRanges ) ],
+		              [ targetTimes[ s:e ] for targetTimes, (s, e) in zip( times, rowRanges ) ]) )
+
+	chunkResults = mapInProcessPool( _solveTargetsArgs, args, processes )
+
+	#stitch the chunks back together
+	results = [ (VectorArray(), VectorArray()) for target in targets ]
+	for chunkResult in chunkResults:
+		for (translations, rotations), (chunkTranslations, chunkRotations) in zip( results, chunkResult ):
+			translations.values.extend( chunkTranslations.values )
+			rotations.values.extend( chunkRotations.values )
+
+	return results
+
+
+def buildSyntheticTrace( targetCount=80, frameCount=5000, seed=0 ):
+	'''
+	returns a (targets, srcWorlds, parentWorlds) tuple of random animation - apart from every fourth target, each
+	target is parented to the target before it
+	'''
+	rand = random.Random( seed )
+	targets, srcWorlds, parentWorlds = [], [], []
+	for n in xrange( targetCount ):
+		parentIndex = n - 1 if n % 4 else None
+		targets.append( TraceTarget( rand.randint( 0, 5 ), [ rand.uniform( -1, 1 ) for i in xrange( 3 ) ], parentIndex=parentIndex ) )
+
+		#the source moves along a few sine waves
+		phases = [ rand.uniform( 0, 6 ) for i in xrange( 6 ) ]
+		translations, angles = array( 'd' ), array( 'd' )
+		for f in xrange( frameCount ):
+			translations.extend( [ 10 * rand.random() + phase * f / 100.0 for phase in phases[ :3 ] ] )
+			angles.extend( [ 90 * phase * f / frameCount for phase in phases[ 3: ] ] )
+
+		srcWorlds.append( MatrixArray.FromTransforms( VectorArray( translations ), MatrixArray.FromEuler( VectorArray( angles ), 'XYZ', True ) ) )
+		parentWorlds.append( MatrixArray.FromTransforms( VectorArray( [ rand.uniform( -5, 5 ) for i in xrange( 3 ) ] ),
+		                                                 MatrixArray.FromEuler( VectorArray( [ rand.uniform( -180, 180 ) for i in xrange( 3 ) ] ), 'XYZ', True ) ) )
+
+	return targets, srcWorlds, parentWorlds
+
+
+def benchmark( targetCount=80, frameCount=1000, processes=None, seed=0 ):
+	'''
+	solves a synthetic trace in this process and using a pool of processes
+	'''
+	targets, srcWorlds, parentWorlds = buildSyntheticTrace( targetCount, frameCount, seed )
+
+	start = time.clock()
+	serial = solveTargets( targets, srcWorlds, parentWorlds )
+	serialTime = time.clock() - start
+
+	start = time.time()
+	parallel = solveTargetsParallel( targets, srcWorlds, parentWorlds, processes=processes )
+	parallelTime = time.time() - start
+
+	assert all( [ a[ 1 ].values == b[ 1 ].values for a, b in zip( serial, parallel ) ] )
+	print '%d targets x %d frames:' % (targetCount, frameCount)
+	print '  serial: %0.3fs' % serialTime
+	print '  parallel: %0.3fs' % parallelTime
+
+
+if __name__ == '__main__':
+	benchmark()
+
+
+#end
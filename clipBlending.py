@@ -0,0 +1,337 @@
+'''
+blending for animLib clips.  the animLib blenders used to walk both clip dicts - looking up the mapping for every
+attribute - each time the blend slider moved.  here the values of both clips are gathered into aligned arrays once
+for a given mapping, so a blend is a single pass over a pair of arrays, and only the attributes whose blended
+values have changed since the last blend need to be pushed to the scene.
+
+nothing in here needs maya, so the blend math can be tested and benchmarked outside of it
+'''
+
+from array import array
+from itertools import izip
+
+import animCurve
+import time
+import random
+
+
+#attributes whose values in the two clips are closer than this are considered the same, so don't change as the blend changes
+CHANGE_TOLERANCE = 1e-6
+
+
+def lerpArrays( arrayA, arrayB, pct ):
+	'''
+	returns an array containing arrayA * (1 - pct) + arrayB * pct
+	'''
+	inv = 1.0 - pct
+
+	return array( 'd', [ a*inv + b*pct for a, b in izip( arrayA, arrayB ) ] )
+
+
+def iterMappedAttrs( clipA, clipB, mapping, attributes=None ):
+	'''
+	yields (objA, attr, dataA, dataB) tuples for the attributes in clipA that have a counterpart in clipB.  mapping
+	is a dict mapping clipA objects to a list of clipB objects - ie what names.Mapping.asDict returns.  if several
+	of the clipB objects are in clipB the last one wins, and if the clipB object doesn't have the attribute
+	clipA's data is used for both
+	'''
+	for objA, attrDictA in clipA.iteritems():
+		if not objA:
+			continue
+
+		objsB = mapping.get( objA, () )
+		if isinstance( objsB, basestring ):
+			objsB = [ objsB ]
+
+		objsB = [ objB for objB in objsB if objB in clipB ]
+		if not objsB:
+			continue
+
+		for attr, dataA in attrDictA.iteritems():
+			if attributes and attr not in attributes:
+				continue
+
+			dataB = dataA
+			for objB in objsB:
+				dataB = clipB[ objB ].get( attr, dataA )
+
+			yield objA, attr, dataA, dataB
+
+
+def _takeRows( columnArray, rows ):
+	return array( 'd', [ columnArray[ n ] for n in rows ] )
+
+
+class PoseBlend(object):
+	'''
+	the values of two pose clips for every mapped attribute stored in aligned arrays - value n of valuesA and
+	valuesB are the values for attrpaths[ n ].  only attributes whose values differ between the clips change as
+	the blend changes, so they're also gathered into a second, smaller pair of arrays
+
+	attrFilter is an optional callable that gets passed each attrpath - if it returns False the attribute is
+	skipped.  animLib uses this to skip attributes that can't be set
+	'''
+	def __init__( self, clipA, clipB, mapping, attributes=None, attrFilter=None, tolerance=CHANGE_TOLERANCE ):
+		self.attrpaths = attrpaths = []
+		self.valuesA = valuesA = array( 'd' )
+		self.valuesB = valuesB = array( 'd' )
+		for objA, attr, valueA, valueB in iterMappedAttrs( clipA, clipB, mapping, attributes ):
+			attrpath = '%s.%s' % (objA, attr)
+			if attrFilter is not None and not attrFilter( attrpath ):
+				continue
+
+			#non numeric attributes can't be blended
+			try:
+				valueA, valueB = float( valueA ), float( valueB )
+			except (TypeError, ValueError): continue
+
+			attrpaths.append( attrpath )
+			valuesA.append( valueA )
+			valuesB.append( valueB )
+
+		self._varying = varying = [ n for n, (a, b) in enumerate( izip( valuesA, valuesB ) ) if abs( a - b ) > tolerance ]
+		self._varyingAttrpaths = [ attrpaths[ n ] for n in varying ]
+		self._varyingA = _takeRows( valuesA, varying )
+		self._varyingB = _takeRows( valuesB, varying )
+		self._lastPct = None
+	def __len__( self ):
+		return len( self.attrpaths )
+	def blend( self, pct ):
+		'''
+		returns an array of the blended values
+		'''
+		return lerpArrays( self.valuesA, self.valuesB, pct )
+	def getChanged( self, pct ):
+		'''
+		returns a list of (attrpath, blendedValue) tuples for the attributes whose blended value has changed since
+		the last call - the first call (or the first call after a reset) returns all attributes
+		'''
+		lastPct, self._lastPct = self._lastPct, pct
+		if lastPct is None:
+			return zip( self.attrpaths, self.blend( pct ) )
+
+		if pct == lastPct:
+			return []
+
+		return zip( self._varyingAttrpaths, lerpArrays( self._varyingA, self._varyingB, pct ) )
+	def reset( self ):
+		'''
+		forgets the last blend - so the next call to getChanged returns everything
+		'''
+		self._lastPct = None
+
+
+def _buildCurve( weighted, keyList, fps, times=None ):
+	'''
+	builds an animCurve.AnimCurve from a clip key list.  a pose (a key list whose time is None) becomes a flat curve
+	with a single key at the first of the given times.  the key list tangents are as maya reports them - fps is
+	the frame rate they were captured at
+	'''
+	curve = animCurve.AnimCurve( weighted )
+	fromMayaTangent = animCurve.fromMayaTangent
+	if keyList[ 0 ][ 0 ] is None:
+		curve.AddKey( times[ 0 ], keyList[ 0 ][ 1 ], 1.0, 0.0, 1.0, 0.0, 'flat', 'flat' )
+	else:
+		for keyTime, value, itt, ott, ix, iy, ox, oy, isLocked, isWeightLocked in keyList:
+			ix, iy = fromMayaTangent( ix, iy, fps )
+			ox, oy = fromMayaTangent( ox, oy, fps )
+			curve.AddKey( keyTime, value, ix, iy, ox, oy, itt, ott )
+
+	return curve
+
+
+class AnimBlend(object):
+	'''
+	the keys of two anim clips for every mapped attribute stored as flat columns.  keys are inserted into both
+	curves so they have keys at the same times - the keys for attrpaths[ n ] are rows offsets[ n ] up to
+	offsets[ n+1 ] of the times array and of each column in columnsA and columnsB.
+
+	attributes that are just poses in both clips are blended by the poses PoseBlend instance instead.  fps is the
+	scene frame rate - the tangent columns hold tangents the way maya reports them (x in seconds)
+	'''
+	COLUMNS = ('values', 'ixs', 'iys', 'oxs', 'oys')
+
+	def __init__( self, clipA, clipB, mapping, fps, attributes=None, attrFilter=None, tolerance=CHANGE_TOLERANCE ):
+		self.attrpaths = attrpaths = []
+		self.offsets = offsets = array( 'i', [ 0 ] )
+		self.times = times = array( 'd' )
+		self.columnsA = [ array( 'd' ) for column in self.COLUMNS ]
+		self.columnsB = [ array( 'd' ) for column in self.COLUMNS ]
+
+		posesA, posesB = {}, {}
+		for objA, attr, (weightedA, keyListA), (weightedB, keyListB) in iterMappedAttrs( clipA, clipB, mapping, attributes ):
+			attrpath = '%s.%s' % (objA, attr)
+			if attrFilter is not None and not attrFilter( attrpath ):
+				continue
+
+			timesA = [ key[ 0 ] for key in keyListA ]
+			timesB = [ key[ 0 ] for key in keyListB ]
+			if timesA[ 0 ] is None and timesB[ 0 ] is None:
+				posesA.setdefault( objA, {} )[ attr ] = keyListA[ 0 ][ 1 ]
+				posesB.setdefault( objA, {} )[ attr ] = keyListB[ 0 ][ 1 ]
+				continue
+
+			curveA = _buildCurve( weightedA, keyListA, fps, timesB )
+			curveB = _buildCurve( weightedB, keyListB, fps, timesA )
+			curveTimes = sorted( set( curveA.getTimes() + curveB.getTimes() ) )
+			for curve in (curveA, curveB):
+				for keyTime in curveTimes:
+					curve.InsertKey( keyTime )
+
+				curve.bakeTangents()
+
+			for curve, columns in ((curveA, self.columnsA), (curveB, self.columnsB)):
+				values, ixs, iys, oxs, oys = columns
+				for keyTime in curveTimes:
+					key = curve.m_keys[ keyTime ]
+					ix, iy = animCurve.toMayaTangent( key.m_flInTanX, key.m_flInTanY, fps )
+					ox, oy = animCurve.toMayaTangent( key.m_flOutTanX, key.m_flOutTanY, fps )
+					values.append( key.m_flValue )
+					ixs.append( ix )
+					iys.append( iy )
+					oxs.append( ox )
+					oys.append( oy )
+
+			attrpaths.append( attrpath )
+			times.extend( curveTimes )
+			offsets.append( len( times ) )
+
+		self.poses = PoseBlend( posesA, posesB, dict( (obj, [ obj ]) for obj in posesA ), tolerance=tolerance )
+
+		#gather the rows of the attributes whose keys differ between the clips
+		self._varying = varying = []
+		rows = []
+		self._varyingOffsets = varyingOffsets = array( 'i', [ 0 ] )
+		for n in xrange( len( attrpaths ) ):
+			attrRows = xrange( offsets[ n ], offsets[ n+1 ] )
+			for columnA, columnB in zip( self.columnsA, self.columnsB ):
+				if any( abs( columnA[ r ] - columnB[ r ] ) > tolerance for r in attrRows ):
+					varying.append( n )
+					rows += attrRows
+					varyingOffsets.append( len( rows ) )
+					break
+
+		self._varyingTimes = _takeRows( times, rows )
+		self._varyingColumnsA = [ _takeRows( column, rows ) for column in self.columnsA ]
+		self._varyingColumnsB = [ _takeRows( column, rows ) for column in self.columnsB ]
+		self._lastPct = None
+	def __len__( self ):
+		return len( self.attrpaths )
+	def blend( self, pct ):
+		'''
+		returns a list of blended arrays - one for each of the columns
+		'''
+		return [ lerpArrays( columnA, columnB, pct ) for columnA, columnB in zip( self.columnsA, self.columnsB ) ]
+	def getChanged( self, pct ):
+		'''
+		returns a list of (attrpath, keys) tuples for the attributes whose blended keys have changed since the last
+		call - the first call (or the first call after a reset) returns all attributes.  keys is a list of
+		(time, value, ix, iy, ox, oy) tuples
+		'''
+		lastPct, self._lastPct = self._lastPct, pct
+		if lastPct is None:
+			attrIndices, times, offsets = xrange( len( self.attrpaths ) ), self.times, self.offsets
+			columns = self.blend( pct )
+		elif pct == lastPct:
+			return []
+		else:
+			attrIndices, times, offsets = self._varying, self._varyingTimes, self._varyingOffsets
+			columns = [ lerpArrays( columnA, columnB, pct ) for columnA, columnB in zip( self._varyingColumnsA, self._varyingColumnsB ) ]
+
+		attrpaths = self.attrpaths
+		changed = []
+		for i, n in enumerate( attrIndices ):
+			start, end = offsets[ i ], offsets[ i+1 ]
+			changed.append( (attrpaths[ n ], zip( times[ start:end ], *[ column[ start:end ] for column in columns ] )) )
+
+		return changed
+	def reset( self ):
+		self._lastPct = None
+		self.poses.reset()
+
+
+def blendPosesPerAttr( clipA, clipB, mapping, pct, attributes=None ):
+	'''
+	blends two pose clips by walking the clip dicts - this is what the pose blender used to do every time the
+	slider moved, and is kept around for benchmarking.  returns a list of (attrpath, blendedValue) tuples
+	'''
+	blended = []
+	for objA, attrDictA in clipA.iteritems():
+		if objA not in mapping:
+			continue
+
+		for attr, valueA in attrDictA.iteritems():
+			if attributes and attr not in attributes:
+				continue
+
+			attrpath = '%s.%s' % (objA, attr)
+			for objB in mapping[ objA ]:
+				try:
+					attrDictB = clipB[ objB ]
+				except KeyError: continue
+
+				try:
+					blended.append( (attrpath, (valueA * (1-pct)) + (attrDictB[ attr ] * pct)) )
+				except KeyError:
+					blended.append( (attrpath, valueA) )
+
+	return blended
+
+
+def buildPoseClips( controlCount=200, attrCount=10, changedFraction=0.3, seed=0 ):
+	'''
+	returns a (clipA, clipB, mapping) tuple of random pose clips with a one to one mapping between their objects.
+	changedFraction is the fraction of attributes whose values differ between the clips - poses usually only
+	touch some of the controls on a rig
+	'''
+	rand = random.Random( seed )
+	clipA, clipB, mapping = {}, {}, {}
+	for n in xrange( controlCount ):
+		objA, objB = 'scene:control%d' % n, 'control%d' % n
+		clipA[ objA ] = attrDictA = {}
+		clipB[ objB ] = attrDictB = {}
+		for a in xrange( attrCount ):
+			attr = 'attr%d' % a
+			attrDictA[ attr ] = attrDictB[ attr ] = rand.uniform( -10, 10 )
+			if rand.random() < changedFraction:
+				attrDictB[ attr ] = rand.uniform( -10, 10 )
+
+		mapping[ objA ] = [ objB ]
+
+	return clipA, clipB, mapping
+
+
+def benchmark( controlCount=200, attrCount=10, ticks=100, changedFraction=0.3, seed=0 ):
+	'''
+	times a slider drag - blending two pose clips at a number of slider positions - walking the clip dicts and
+	using a PoseBlend instance.  the PoseBlend timing includes building it.  the number of values pushed to the
+	scene is reported too - the walk sets every attribute on every tick
+	'''
+	clipA, clipB, mapping = buildPoseClips( controlCount, attrCount, changedFraction, seed )
+	pcts = [ n / float( ticks - 1 ) for n in xrange( ticks ) ]
+
+	start = time.clock()
+	perAttrPushed = 0
+	for pct in pcts:
+		perAttr = blendPosesPerAttr( clipA, clipB, mapping, pct )
+		perAttrPushed += len( perAttr )
+	perAttrTime = time.clock() - start
+
+	start = time.clock()
+	blendPushed = 0
+	poseBlend = PoseBlend( clipA, clipB, mapping )
+	for pct in pcts:
+		blendPushed += len( poseBlend.getChanged( pct ) )
+	blendTime = time.clock() - start
+
+	assert sorted( perAttr ) == sorted( zip( poseBlend.attrpaths, poseBlend.blend( pcts[ -1 ] ) ) )
+	print '%d attributes x %d ticks:' % (len( poseBlend ), ticks)
+	print '  per attribute: %0.3fs, %d values pushed' % (perAttrTime, perAttrPushed)
+	print '  PoseBlend: %0.3fs, %d values pushed - %0.1fx faster' % (blendTime, blendPushed, perAttrTime / blendTime)
+
+
+if __name__ == '__main__':
+	benchmark()
+
+
+#end
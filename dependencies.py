@@ -2,19 +2,21 @@
 import subprocess
 import marshal
 import inspect
+import ast
 import pickle
 import time
 import imp
 import sys
 import os
 import gc
+import random
 
 from zlib import crc32
 from modulefinder import ModuleFinder
 
 import filesystem
 
-from filesystem import Path, removeDupes
+from filesystem import Path, removeDupes, mapInProcessPool
 
 _MODULE_TYPE = type( os )
 
@@ -78,13 +80,16 @@ def isScriptInSuperiorBranch( scriptPath ):
 	if not isinstance( scriptPath, Path ):
 		scriptPath = Path( scriptPath )
 
+	#skip empty entries (ie the current directory) - they can't be made relative to
+	searchPaths = [ p for p in sys.path if p ]
+
 	originalPath = scriptPath
-	for p in sys.path:
+	for p in searchPaths:
 		if scriptPath.isUnder( p ):
 			scriptPath = scriptPath - p
 			break
 
-	for p in sys.path:
+	for p in searchPaths:
 		possibleSuperiorPath = p / scriptPath
 		if possibleSuperiorPath.exists():
 			if possibleSuperiorPath == originalPath:
@@ -201,10 +206,451 @@ def generateFileCRC( filePath ):
 		return crc32( f.read() )
 
 
+def scanImports( source ):
+	'''
+	returns a list of (level, moduleName, names) tuples for every import statement in the given source - names is
+	None for plain import statements, and the list of names imported for from-imports.  the source is parsed, not
+	executed, so there are no side effects
+	'''
+	imports = []
+	for node in ast.walk( ast.parse( source ) ):
+		if isinstance( node, ast.Import ):
+			for alias in node.names:
+				imports.append( (0, alias.name, None) )
+		elif isinstance( node, ast.ImportFrom ):
+			if node.module == '__future__':
+				continue
+
+			imports.append( (node.level or 0, node.module or '', [ alias.name for alias in node.names ]) )
+
+	return imports
+
+
+class ImportResolver(object):
+	'''
+	resolves module names to the files that get loaded when they're imported (including the __init__ scripts of the
+	packages they're in) by looking for them on disk - sys.path isn't touched.  only python source files are resolved,
+	so builtins and binary modules are ignored.  lookups against the search paths are cached, so a single resolver
+	should be used for many scripts
+	'''
+	def __init__( self, searchPaths ):
+		self._searchPaths = map( str, searchPaths )
+		self._cache = {}
+	def _findUnder( self, rootDir, parts ):
+		'''
+		returns the list of files loaded when importing the module with the given name parts from rootDir - or None
+		if it can't be found there
+		'''
+		files = []
+		curDir = rootDir
+		for n, part in enumerate( parts ):
+			pkgInit = os.path.join( curDir, part, '__init__.py' )
+			if os.path.isfile( pkgInit ):
+				files.append( pkgInit )
+				curDir = os.path.join( curDir, part )
+				continue
+
+			if n == len( parts ) - 1:
+				moduleFile = os.path.join( curDir, part + '.py' )
+				if os.path.isfile( moduleFile ):
+					files.append( moduleFile )
+					return files
+
+			return None
+
+		return files
+	def findModule( self, moduleName, scriptDir=None ):
+		'''
+		returns a 2-tuple containing the files loaded when importing the given module, and the directory the module
+		was found under.  like an implicit relative import, the directory of the importing script is searched first
+		'''
+		parts = moduleName.split( '.' )
+		if scriptDir is not None:
+			files = self._findUnder( scriptDir, parts )
+			if files is not None:
+				return files, scriptDir
+
+		try:
+			return self._cache[ moduleName ]
+		except KeyError:
+			found = [], None
+			for searchPath in self._searchPaths:
+				files = self._findUnder( searchPath, parts )
+				if files is not None:
+					found = files, searchPath
+					break
+
+			self._cache[ moduleName ] = found
+
+			return found
+	def resolve( self, imports, scriptPath ):
+		'''
+		returns the sorted list of files the given imports (as returned by scanImports) load for the given script
+		'''
+		scriptDir = os.path.dirname( str( scriptPath ) )
+		deps = set()
+		for level, moduleName, names in imports:
+			parts = moduleName.split( '.' ) if moduleName else []
+			if level:
+				rootDir = scriptDir
+				for n in xrange( level - 1 ):
+					rootDir = os.path.dirname( rootDir )
+
+				files = (self._findUnder( rootDir, parts ) if parts else []) or []
+
+				#the package being imported from gets loaded too
+				pkgInit = os.path.join( rootDir, '__init__.py' )
+				if os.path.isfile( pkgInit ):
+					deps.add( pkgInit )
+			else:
+				files, rootDir = self.findModule( moduleName, scriptDir )
+
+			deps.update( files )
+
+			#from-imports can import sub modules of a package
+			if names and rootDir is not None and (not files or files[ -1 ].endswith( '__init__.py' )):
+				for name in names:
+					deps.update( self._findUnder( rootDir, parts + [ name ] ) or [] )
+
+		deps.discard( str( scriptPath ) )
+
+		return sorted( deps )
+
+
+def scanScript( scriptPath, resolver, cachedCrc=None ):
+	'''
+	returns a (crc, dependencies) tuple for the given script.  if the crc matches cachedCrc the script isn't parsed
+	and dependencies is None.  scripts that can't be parsed have no dependencies
+	'''
+	with file( scriptPath, 'rb' ) as f:
+		source = f.read()
+
+	crc = crc32( source )
+	if crc == cachedCrc:
+		return crc, None
+
+	#the first line of a python cmd script is the batch command that runs python on it
+	if str( scriptPath ).lower().endswith( '.cmd' ):
+		source = source[ source.find( '\n' ) + 1: ]
+
+	try:
+		imports = scanImports( source.replace( '\r\n', '\n' ) )
+	except (SyntaxError, TypeError):
+		return crc, []
+
+	return crc, resolver.resolve( imports, scriptPath )
+
+
+def _scanScripts( args ):
+	'''
+	scans a chunk of (scriptPath, cachedCrc) tuples - this is what gets run by the worker processes
+	'''
+	scripts, searchPaths = args
+	resolver = ImportResolver( searchPaths )
+
+	return [ (scriptPath,) + scanScript( scriptPath, resolver, cachedCrc ) for scriptPath, cachedCrc in scripts ]
+
+
+def scanScripts( scripts, searchPaths, processes=None ):
+	'''
+	scans a list of (scriptPath, cachedCrc) tuples using a pool of processes.  returns a list of
+	(scriptPath, crc, dependencies) tuples - see scanScript for details.  see filesystem.mapInProcessPool for
+	details on processes
+
+	the scripts are handed to the workers in chunks so each worker process can re-use its import resolver.  if
+	there are only a few scripts they're all put in a single chunk and scanned in this process
+	'''
+	scripts = [ (str( scriptPath ), cachedCrc) for scriptPath, cachedCrc in scripts ]
+	searchPaths = map( str, searchPaths )
+	if processes == 1 or len( scripts ) < 64:
+		chunkSize = max( 1, len( scripts ) )
+	else:
+		chunkSize = max( 16, len( scripts ) / 32 )
+
+	chunks = [ (scripts[ n:n+chunkSize ], searchPaths) for n in xrange( 0, len( scripts ), chunkSize ) ]
+	results = []
+	for chunkResults in mapInProcessPool( _scanScripts, chunks, processes ):
+		results += chunkResults
+
+	return results
+
+
+class DependencyCache(object):
+	'''
+	the on disk cache for a DependencyTree.  the file is a header followed by a log of marshalled records - a record is
+	a (scriptPath, mtime, crc, dependencies) tuple, with None for mtime when the script has been removed.  later
+	records replace earlier ones, so updating the cache only means appending the records that changed.  once the log
+	gets much longer than the number of scripts it contains it gets rewritten
+	'''
+	VERSION = 1
+	MAGIC = 'zooDependencyCache'
+
+	def __init__( self, filepath ):
+		self._filepath = Path( filepath )
+		self._recordCount = 0
+		self._isValid = False  #whether the file on disk is known to be a cache of the current version
+	def load( self ):
+		'''
+		returns a dict keyed by script path containing (mtime, crc, dependencies) tuples.  if the cache doesn't exist,
+		is an old version or is garbage, an empty dict is returned
+		'''
+		entries = {}
+		self._recordCount = 0
+		if not self._filepath.exists():
+			return entries
+
+		with file( self._filepath, 'rb' ) as f:
+			try:
+				if marshal.load( f ) != (self.MAGIC, self.VERSION):
+					logWarning( 'VERSION UPDATE: forcing rebuild' )
+					return entries
+
+				self._isValid = True
+				while True:
+					scriptPath, mtime, crc, deps = marshal.load( f )
+					self._recordCount += 1
+					if mtime is None:
+						entries.pop( scriptPath, None )
+					else:
+						entries[ scriptPath ] = mtime, crc, deps
+
+			#a truncated record at the end (ie from a crash while writing) just means the records before it are all there is
+			except EOFError: pass
+			except (ValueError, TypeError):
+				if not self._recordCount:
+					return {}
+
+		return entries
+	def needsCompacting( self, entryCount ):
+		return self._recordCount > 2 * entryCount + 100
+	def append( self, records ):
+		'''
+		appends the given records to the cache - if the cache wasn't loaded successfully it is started afresh
+		'''
+		if not records:
+			return
+
+		if not self._isValid:
+			self.write( [] )
+
+		with file( self._filepath, 'ab' ) as f:
+			for record in records:
+				marshal.dump( record, f )
+
+		self._recordCount += len( records )
+	def write( self, records ):
+		'''
+		rewrites the cache with the given records
+		'''
+		with file( self._filepath, 'wb' ) as f:
+			marshal.dump( (self.MAGIC, self.VERSION), f )
+			for record in records:
+				marshal.dump( record, f )
+
+		self._recordCount = len( records )
+		self._isValid = True
+
+
+def findStronglyConnected( nodes, getSuccessors ):
+	'''
+	returns the strongly connected components of a graph as a list of lists of nodes.  a component always comes after
+	the components it has edges to.  this is tarjan's algorithm - done iteratively so deep graphs don't hit the
+	recursion limit
+	'''
+	indices = {}
+	lowLinks = {}
+	stack = []
+	onStack = set()
+	components = []
+	for root in nodes:
+		if root in indices:
+			continue
+
+		indices[ root ] = lowLinks[ root ] = len( indices )
+		stack.append( root )
+		onStack.add( root )
+		work = [ (root, iter( getSuccessors( root ) )) ]
+		while work:
+			node, successors = work[ -1 ]
+			for successor in successors:
+				if successor not in indices:
+					indices[ successor ] = lowLinks[ successor ] = len( indices )
+					stack.append( successor )
+					onStack.add( successor )
+					work.append( (successor, iter( getSuccessors( successor ) )) )
+					break
+				elif successor in onStack:
+					lowLinks[ node ] = min( lowLinks[ node ], indices[ successor ] )
+
+			#all the successors have been visited - if the node is the root of a component pop the component off the stack
+			else:
+				work.pop()
+				if work:
+					parent = work[ -1 ][ 0 ]
+					lowLinks[ parent ] = min( lowLinks[ parent ], lowLinks[ node ] )
+
+				if lowLinks[ node ] == indices[ node ]:
+					component = []
+					while True:
+						member = stack.pop()
+						onStack.discard( member )
+						component.append( member )
+						if member is node:
+							break
+
+					components.append( component )
+
+	return components
+
+
+class DependencyIndex(object):
+	'''
+	forward and reverse adjacency for a dependency graph, along with the transitive closures in both directions.  the
+	closures are worked out on the graph of strongly connected components (so import cycles are fine) and stored as
+	bitmasks over the components - so memory is linear in the number of components for each component.  they're
+	computed when first needed for each direction
+
+	the adjacency is updated in place as scripts change - the closures only get thrown away if the dependencies of a
+	script actually changed
+	'''
+	def __init__( self, scriptDeps=() ):
+		self._forward = {}
+		self._reverse = {}
+		self._condensed = None
+		for script, deps in scriptDeps:
+			self._setDependencies( script, deps )
+	def __len__( self ):
+		return len( self._forward )
+	def __contains__( self, script ):
+		return script in self._forward
+	def _setDependencies( self, script, deps ):
+		'''
+		sets the direct dependencies of the script - returns whether they changed
+		'''
+		deps = set( deps )
+		previousDeps = self._forward.get( script )
+		if previousDeps == deps:
+			return False
+
+		previousDeps = previousDeps or set()
+		for dep in previousDeps - deps:
+			self._reverse[ dep ].discard( script )
+
+		for dep in deps - previousDeps:
+			self._reverse.setdefault( dep, set() ).add( script )
+
+		self._forward[ script ] = deps
+
+		return True
+	def update( self, script, deps ):
+		'''
+		sets the direct dependencies of the given script
+		'''
+		if self._setDependencies( script, deps ):
+			self._condensed = None
+	def remove( self, script ):
+		'''
+		removes the given script.  scripts that depend on it still do
+		'''
+		deps = self._forward.pop( script, None )
+		if deps is None:
+			return
+
+		for dep in deps:
+			self._reverse[ dep ].discard( script )
+
+		self._condensed = None
+	def getDirectDependencies( self, script ):
+		return set( self._forward.get( script, () ) )
+	def getDirectDependents( self, script ):
+		return set( self._reverse.get( script, () ) )
+	def _getCondensed( self ):
+		'''
+		returns the condensed graph - a dict containing the components, the component index of each script and the
+		closures computed so far
+		'''
+		if self._condensed is None:
+			forward = self._forward
+			nodes = set( forward ).union( self._reverse )
+			components = findStronglyConnected( nodes, lambda node: forward.get( node, () ) )
+			componentIndices = {}
+			for n, component in enumerate( components ):
+				for script in component:
+					componentIndices[ script ] = n
+
+			self._condensed = { 'components': components, 'indices': componentIndices }
+
+		return self._condensed
+	def _computeClosures( self, adjacency, order ):
+		'''
+		returns a list containing the closure bitmask of each component.  order must visit each component after all the
+		components it has edges to in the given adjacency
+		'''
+		condensed = self._getCondensed()
+		components, componentIndices = condensed[ 'components' ], condensed[ 'indices' ]
+		closures = [ 0 ] * len( components )
+		for n in order:
+			closure = 0
+			isCyclic = len( components[ n ] ) > 1
+			for script in components[ n ]:
+				for other in adjacency.get( script, () ):
+					otherIdx = componentIndices[ other ]
+					if otherIdx == n:
+						isCyclic = True  #a script that imports itself
+					else:
+						closure |= closures[ otherIdx ] | (1 << otherIdx)
+
+			#scripts in a cycle depend on themselves
+			if isCyclic:
+				closure |= 1 << n
+
+			closures[ n ] = closure
+
+		return closures
+	def _getClosure( self, script, direction ):
+		condensed = self._getCondensed()
+		components = condensed[ 'components' ]
+		if direction not in condensed:
+			#components come after the components they depend on, so forward closures are computed in order and reverse closures in reverse order
+			if direction == 'dependencies':
+				condensed[ direction ] = self._computeClosures( self._forward, xrange( len( components ) ) )
+			else:
+				condensed[ direction ] = self._computeClosures( self._reverse, xrange( len( components ) - 1, -1, -1 ) )
+
+		try:
+			closure = condensed[ direction ][ condensed[ 'indices' ][ script ] ]
+		except KeyError:
+			return set()
+
+		scripts = set()
+		bits = bin( closure )[ :1:-1 ]
+		n = bits.find( '1' )
+		while n != -1:
+			scripts.update( components[ n ] )
+			n = bits.find( '1', n + 1 )
+
+		return scripts
+	def getDependencies( self, script ):
+		'''
+		returns the set of all scripts the given script depends on, directly or otherwise.  the script is only included
+		if it is part of an import cycle
+		'''
+		return self._getClosure( script, 'dependencies' )
+	def getDependents( self, script ):
+		'''
+		returns the set of all scripts that depend on the given script, directly or otherwise.  the script is only
+		included if it is part of an import cycle
+		'''
+		return self._getClosure( script, 'dependents' )
+
+
 class DependencyTree(DependencyNode):
-	_VERSION = 0
+	_VERSION = DependencyCache.VERSION
 	_CACHE_PATH = Path( '~/_py_dep_cache' )
 
+	#the phases of building the tree that get timed - see getTimings
+	TIMING_PHASES = 'load', 'walk', 'stat', 'scan', 'write'
+
 	@classmethod
 	def _convertDictDataTo( cls, theDict, keyCastMethod ):
 		def convToDict( theDict ):
@@ -226,10 +672,10 @@ class DependencyTree(DependencyNode):
 	def FromSimpleDict( cls, theDict ):
 		cls._convertDictDataTo( theDict, Path )
 
-	def __new__( cls, dirsToWalk=(), dirsToExclude=(), extraSearchPaths=(), rebuildCache=False, skipLib=True ):
+	def __new__( cls, dirsToWalk=(), dirsToExclude=(), extraSearchPaths=(), rebuildCache=False, skipLib=True, processes=None ):
 		'''
-		constructs a new dependencyTree dictionary or loads an existing one from a disk cache, and
-		strips out files that no longer exist
+		constructs a new dependencyTree dictionary, loading what it can from the disk cache, and freshens it.  scripts
+		are scanned for dependencies using a pool of processes - processes is the number of workers, see scanScripts
 		'''
 		if not dirsToWalk:
 			dirsToWalk = sys.path[:]
@@ -239,40 +685,42 @@ class DependencyTree(DependencyNode):
 		if skipLib:
 			dirsToExclude += _LIB_PATHS
 
-		cache = Path( cls._CACHE_PATH )
+		self = dict.__new__( cls )
+		self._crcs = {}
+		self._stats = {}
+		self._timings = {}
+		self._index = None
+		self._cache = DependencyCache( cls._CACHE_PATH )
+		if rebuildCache:
+			self._cache.write( [] )
+		else:
+			start = time.time()
+
+			#lots of scripts share dependencies so only construct a Path instance once for each
+			paths = {}
+			def toPath( p ):
+				try:
+					return paths[ p ]
+				except KeyError:
+					path = paths[ p ] = Path( p )
+					return path
 
-		self = None
-		if cache.exists() and not rebuildCache:
-			try:
-				with file( cache, 'r' ) as f:
-					version, self = pickle.load( f )
-			except: pass
-			else:
-				if version == cls._VERSION:
-					cls.FromSimpleDict( self )  #keys are converted to strings before pickling - so convert them back to Path instances
-					cls.FromSimpleDict( self._crcs )
-					cls.FromSimpleDict( self._stats )
-
-					#remove any files from the cache that don't exist
-					for f in self.keys():
-						if not f.exists():
-							self.pop( f )
-				else:
-					self = None
-					logWarning( 'VERSION UPDATE: forcing rebuild' )
+			for scriptPath, (mtime, crc, deps) in self._cache.load().iteritems():
+				scriptPath = toPath( scriptPath )
+				self[ scriptPath ] = DependencyNode( [ (toPath( dep ), DependencyNode()) for dep in deps ] )
+				self._stats[ scriptPath ] = mtime
+				self._crcs[ scriptPath ] = crc
 
-		if self is None:
-			self = dict.__new__( cls )
-			self._crcs = {}
-			self._stats = {}
+			self._timings[ 'load' ] = time.time() - start
 
 		self._dirs = dirsToWalk
 		self._dirsExclude = dirsToExclude
 		self._extraPaths = extraSearchPaths
+		self._processes = processes
 		self.freshenDependencies()
 
 		return self
-	def __init__( self, dirsToWalk=(), dirsToExclude=(), extraSearchPaths=(), rebuildCache=False, skipLib=True ):
+	def __init__( self, dirsToWalk=(), dirsToExclude=(), extraSearchPaths=(), rebuildCache=False, skipLib=True, processes=None ):
 		dict.__init__( self )
 	def getFiles( self ):
 		files = []
@@ -313,46 +761,97 @@ class DependencyTree(DependencyNode):
 		return files
 	def freshenDependencies( self ):
 		'''
-		freshens the dependency tree with new files - deleted files are cleaned out of
-		the cache at load time, see the __new__ method for details
+		freshens the dependency tree with new and changed files, and removes deleted files.  only the scripts whose
+		mod time has changed are read - and only those whose crc has changed are scanned for dependencies.  the
+		changes are appended to the disk cache.  returns the list of scripts that were scanned
 		'''
 		padding = 15
+		timings = self._timings
 
-		start = time.clock()
+		start = time.time()
 		files = self.getFiles()
+		timings[ 'walk' ] = time.time() - start
 
-		extraSearchPaths = self._extraPaths
+		#figure out which scripts have a different mod time to the cached one, and which scripts no longer exist
+		start = time.time()
 		stats = self._stats
 		crcs = self._crcs
+		toScan = {}
 		for f in files:
-
-			#do we need to re-parse dependencies?  first we check the data in the file stat
-			checkCrc = False
 			currentStat = os.stat( f ).st_mtime
-			cachedStat = stats.get( f, None )
-			if cachedStat == currentStat:
-				continue
-
-			#store the mod time
+			if stats.get( f, None ) != currentStat:
+				toScan[ str( f ) ] = f, currentStat
+
+		walked = set( files )
+		removed = [ f for f in self.keys() if f not in walked and not f.exists() ]
+		timings[ 'stat' ] = time.time() - start
+
+		#now scan the scripts that have changed
+		start = time.time()
+		scanned = []
+		records = []
+		searchPaths = list( self._extraPaths ) + sys.path
+		for scriptPath, crc, deps in scanScripts( [ (f, crcs.get( f, 0 )) for f, currentStat in toScan.itervalues() ], searchPaths, self._processes ):
+			f, currentStat = toScan[ scriptPath ]
 			stats[ f ] = currentStat
 
-			#if they don't match, check the crc
-			currentCrc = generateFileCRC( f )
-			cachedCrc = crcs.get( f, 0 )
-			if cachedCrc == currentCrc:
-				continue
-			elif cachedCrc == 0:
-				logMessage( 'new file:'.ljust( padding ), f )
+			#if the crc hasn't changed, the mod time still needs to be recorded but the dependencies are the same
+			if deps is None:
+				deps = map( str, self.get( f, () ) )
 			else:
-				logMessage( 'stale file:'.ljust( padding ), f )
+				if crcs.get( f, 0 ) == 0:
+					logMessage( 'new file:'.ljust( padding ), f )
+				else:
+					logMessage( 'stale file:'.ljust( padding ), f )
+
+				self[ f ] = DependencyNode( [ (Path( dep ), DependencyNode()) for dep in deps ] )
+				crcs[ f ] = crc
+				scanned.append( f )
+				if self._index is not None:
+					self._index.update( f, self[ f ] )
+
+			records.append( (str( f ), currentStat, crc, deps) )
+
+		for f in removed:
+			self.pop( f )
+			stats.pop( f, None )
+			crcs.pop( f, None )
+			if self._index is not None:
+				self._index.remove( f )
+			records.append( (str( f ), None, None, None) )
 
-			finder = DepFinder( f, extraSearchPaths )
-			self[ f ] = finder.getDependencyNode()
-			crcs[ f ] = currentCrc
+		timings[ 'scan' ] = time.time() - start
 
-		self.writeCache()
-		logMessage( 'Time to update cache: %0.2g' % (time.clock()-start) )
+		#write the changes to the cache - the whole cache is only written when the log has grown too long
+		start = time.time()
+		if self._cache.needsCompacting( len( self ) ):
+			self.writeCache()
+		else:
+			self._cache.append( records )
+
+		timings[ 'write' ] = time.time() - start
+
+		logMessage( 'Time to update cache: %s - %d of %d scripts scanned' % (self.getTimingsStr(), len( scanned ), len( files )) )
 		logMessage()
+
+		return scanned
+	def getTimings( self ):
+		'''
+		returns a dict containing the number of seconds spent in each phase of the last freshen - the phases are
+		load (reading the cache), walk (listing the scripts), stat, scan and write (updating the cache)
+		'''
+		return dict( self._timings )
+	def getIndex( self ):
+		'''
+		returns the DependencyIndex for the tree - it is built when first needed and kept up to date when the tree is
+		freshened
+		'''
+		if self._index is None:
+			self._index = DependencyIndex( self.iteritems() )
+
+		return self._index
+	def getTimingsStr( self ):
+		return ', '.join( [ '%s %0.2fs' % (phase, self._timings[ phase ]) for phase in self.TIMING_PHASES if phase in self._timings ] )
 	def findDependents( self, changedScriptPath ):
 		'''
 		returns a 2-tuple of scripts that immediately rely on changedScriptPath.  ie: the scripts that directly
@@ -374,41 +873,11 @@ class DependencyTree(DependencyNode):
 			logWarning( 'WARNING - a superior script was found: %s.  Using it for dependency query instead!' % hasSuperior )
 			changedScriptPath = hasSuperior
 
-		primaryAffected = set()
-		secondaryAffected = set()
-
-		#add the primary affected dependencies
-		for script, depNode in self.iteritems():
-			if script == changedScriptPath:
-				continue
-
-			#if the changedScript is in this dependency node, add the script to the list of affected
-			if changedScriptPath in depNode:
-				primaryAffected.add( script )
-
-		#don't even start looking for secondary deps if there are no primary deps...
-		if primaryAffected:
-			#returns whether it has found any new dependencies
-			def gatherSecondaryDependencies( theDepNode ):
-				stillAdding = False
-				for script, depNode in theDepNode.iteritems():
-					if script == changedScriptPath:
-						continue
-
-					if script in primaryAffected or script in secondaryAffected:
-						continue
-
-					#if its not, we had better recurse and see if it is somewhere deeper in the dependency tree for this script
-					else:
-						for sub_script in depNode.iterkeys():
-							if sub_script in primaryAffected or sub_script in secondaryAffected:
-								secondaryAffected.add( script )
-								stillAdding = True
-
-				return stillAdding
-
-			#keep calling gatherSecondaryDependencies until it returns False
-			while gatherSecondaryDependencies( self ): pass
+		index = self.getIndex()
+		primaryAffected = index.getDirectDependents( changedScriptPath )
+		secondaryAffected = index.getDependents( changedScriptPath ) - primaryAffected
+		primaryAffected.discard( changedScriptPath )
+		secondaryAffected.discard( changedScriptPath )
 
 		return primaryAffected, secondaryAffected
 	def findDependencies( self, scriptPath, depth=None, includeFilesFromExcludedDirs=True ):
@@ -423,22 +892,26 @@ class DependencyTree(DependencyNode):
 			logWarning( 'WARNING - a superior script was found: %s.  Using it for dependency query instead!' % hasSuperior )
 			scriptPath = hasSuperior
 
-		deps = set()
+		#the full set of dependencies comes straight from the index - only walk the tree if the depth is limited
+		if depth is None:
+			deps = self.getIndex().getDependencies( scriptPath )
+		else:
+			deps = set()
 
-		maxDepth = depth
-		def getDeps( script, depth=0 ):
-			if maxDepth is not None and depth >= maxDepth:
-				return
+			maxDepth = depth
+			def getDeps( script, depth=0 ):
+				if maxDepth is not None and depth >= maxDepth:
+					return
 
-			if script in self:
-				for ss in self[ script ]:
-					if ss in deps:
-						continue
+				if script in self:
+					for ss in self[ script ]:
+						if ss in deps:
+							continue
 
-					deps.add( ss )
-					getDeps( ss, depth+1 )
+						deps.add( ss )
+						getDeps( ss, depth+1 )
 
-		getDeps( scriptPath )
+			getDeps( scriptPath )
 
 		#if we're not including files from excluded directories, go through the list of deps and remove files that are under any of the exlude dirs
 		if not includeFilesFromExcludedDirs:
@@ -457,16 +930,11 @@ class DependencyTree(DependencyNode):
 
 		return list( sorted( deps ) )
 	def writeCache( self ):
-		self.ToSimpleDict( self )
-		self.ToSimpleDict( self._crcs )
-		self.ToSimpleDict( self._stats )
-
-		with open( self._CACHE_PATH, 'w' ) as f:
-			pickle.dump( (self._VERSION, self), f )
-
-		self.FromSimpleDict( self )
-		self.FromSimpleDict( self._crcs )
-		self.FromSimpleDict( self._stats )
+		'''
+		rewrites the entire disk cache
+		'''
+		stats, crcs = self._stats, self._crcs
+		self._cache.write( [ (str( f ), stats[ f ], crcs[ f ], map( str, depNode )) for f, depNode in self.iteritems() ] )
 	def moduleNameToScript( self, moduleName ):
 		for scriptPath in self:
 			if scriptPath.name() == moduleName or moduleName in scriptPath:
@@ -590,18 +1058,124 @@ def getScriptTests( scriptFilepath, depTree=None ):
 	if depTree is None:
 		depTree = generateDepTree()
 
-	testDependencyDict = {}
-	for script in depTree:
-		if script.name().startswith( 'devTest_' ):
-			testDependencyDict[ script ] = depTree.findDependencies( script )
+	#the tests for the script are the test scripts that depend on it
+	return [ script for script in depTree.getIndex().getDependents( scriptFilepath ) if script.name().startswith( 'devTest_' ) ]
+
+
+def buildSyntheticGraph( moduleCount=3000, importCount=6, cycleCount=30, testCount=150, seed=0 ):
+	'''
+	returns a list of (script, dependencies) tuples that look roughly like a big tools tree - scripts mostly import
+	the core scripts near the bottom of the stack, there are a few import cycles, and there are devTest_ scripts
+	that import a handful of scripts each
+	'''
+	rand = random.Random( seed )
+	scripts = [ 'module%05d' % n for n in xrange( moduleCount ) ]
+	deps = [ set() for script in scripts ]
+	for n in xrange( 1, moduleCount ):
+		for i in xrange( importCount ):
+			deps[ n ].add( scripts[ int( n * rand.random() ** 2 ) ] )
+
+	#add some imports back up the stack to make cycles
+	for i in xrange( cycleCount ):
+		a, b = sorted( rand.sample( xrange( moduleCount ), 2 ) )
+		deps[ a ].add( scripts[ b ] )
+
+	graph = zip( scripts, deps )
+	for n in xrange( testCount ):
+		graph.append( ('devTest_%05d' % n, set( rand.sample( scripts, importCount ) )) )
+
+	return graph
 
-	scriptTestCandidates = []
 
-	for test, testDependencies in testDependencyDict.iteritems():
-		if scriptFilepath in testDependencies:
-			scriptTestCandidates.append( test )
+def _findDependentsByWalking( forward, changed ):
+	'''
+	finds dependents the way DependencyTree.findDependents used to - by scanning the whole forward graph until no new
+	dependents turn up.  this is only used as a baseline by benchmark
+	'''
+	primary = set( [ script for script, deps in forward.iteritems() if script != changed and changed in deps ] )
+	secondary = set()
+	stillAdding = bool( primary )
+	while stillAdding:
+		stillAdding = False
+		for script, deps in forward.iteritems():
+			if script == changed or script in primary or script in secondary:
+				continue
+
+			for dep in deps:
+				if dep in primary or dep in secondary:
+					secondary.add( script )
+					stillAdding = True
+					break
 
-	return scriptTestCandidates
+	return primary, secondary
+
+
+def _getScriptTestsByWalking( forward, changed ):
+	'''
+	finds the tests for a script the way getScriptTests used to - by walking the dependencies of every test
+	'''
+	tests = []
+	for test in forward:
+		if not test.startswith( 'devTest_' ):
+			continue
+
+		deps = set()
+		toWalk = [ test ]
+		while toWalk:
+			for dep in forward.get( toWalk.pop(), () ):
+				if dep not in deps:
+					deps.add( dep )
+					toWalk.append( dep )
+
+		if changed in deps:
+			tests.append( test )
+
+	return tests
+
+
+def benchmark( moduleCount=3000, queryCount=10, seed=0 ):
+	'''
+	compares finding dependents and tests by walking the forward graph against using a DependencyIndex, on a
+	generated graph
+	'''
+	graph = buildSyntheticGraph( moduleCount, seed=seed )
+	forward = dict( graph )
+	rand = random.Random( seed )
+	queries = rand.sample( [ script for script, deps in graph if not script.startswith( 'devTest_' ) ], queryCount )
+
+	start = time.time()
+	walked = [ _findDependentsByWalking( forward, script ) for script in queries ]
+	walkedTests = [ sorted( _getScriptTestsByWalking( forward, script ) ) for script in queries ]
+	walkTime = time.time() - start
+
+	start = time.time()
+	index = DependencyIndex( graph )
+	buildTime = time.time() - start
+
+	start = time.time()
+	indexed = [ index.getDependents( script ) for script in queries ]
+	firstQueryTime = time.time() - start
+
+	start = time.time()
+	indexed = [ index.getDependents( script ) for script in queries ]
+	indexedTests = [ sorted( [ s for s in dependents if s.startswith( 'devTest_' ) ] ) for dependents in indexed ]
+	queryTime = time.time() - start
+
+	#change the imports of a script and query again - the closures have to be recomputed
+	start = time.time()
+	index.update( queries[ 0 ], forward[ queries[ 0 ] ] | set( [ queries[ 1 ] ] ) )
+	index.getDependents( queries[ 0 ] )
+	updateTime = time.time() - start
+
+	for (primary, secondary), dependents, script in zip( walked, indexed, queries ):
+		assert primary | secondary == dependents - set( [ script ] )
+
+	assert walkedTests == indexedTests
+
+	print '%d scripts, %d dependents and test queries' % (len( graph ), queryCount)
+	print '  walking the graph: %0.3fs' % walkTime
+	print '  index: build %0.3fs, first queries (computing closures) %0.3fs, queries %0.4fs' % (buildTime, firstQueryTime, queryTime)
+	print '  update and query: %0.3fs' % updateTime
 
 
 def flush( dirsNeverToFlush=() ):
@@ -660,4 +1234,8 @@ def flush( dirsNeverToFlush=() ):
 	gc.collect()
 
 
+if __name__ == '__main__':
+	benchmark()
+
+
 #end
@@ -0,0 +1,115 @@
+
+from unittest import TestCase
+from animCapture import *
+
+__all__ = [ 'TestAnimCapture' ]
+
+
+class BrokenBatchCmds(FakeCurveCmds):
+	'''
+	returns nothing for multi attribute queries - so the batched capture has to fall back to querying per attribute
+	'''
+	def keyTangent( self, attrpaths, q=True, t=None, **kw ):
+		if not isinstance( attrpaths, basestring ) and kw.get( 'ix' ):
+			self.callCount += 1
+			return None
+
+		return FakeCurveCmds.keyTangent( self, attrpaths, q, t, **kw )
+
+
+class NoCreateNodeCmds(FakeCurveCmds):
+	'''
+	fails to create any nodes - like maya does when a node type can't be created
+	'''
+	def createNode( self, nodeType, n=None ):
+		self.callCount += 1
+		raise RuntimeError( "can't create a %s" % nodeType )
+
+
+class TestAnimCapture(TestCase):
+	def runTest( self ):
+		self.testBatched()
+		self.testFallback()
+		self.testCreateCurve()
+		self.testCreateCurveNames()
+	def assertCurvesEqual( self, curvesA, curvesB ):
+		self.assertEqual( sorted( curvesA ), sorted( curvesB ) )
+		for attrpath, curve in curvesA.iteritems():
+			self.assertEqual( curve.toKeyList(), curvesB[ attrpath ].toKeyList() )
+			self.assertEqual( curve.weighted, curvesB[ attrpath ].weighted )
+	def testBatched( self ):
+		cmds, attrpaths = buildFakeRig( 10, 5, 100, 1 )
+		attrpaths.append( 'control0.notAnimated' )
+		timeRange = 20, 60
+
+		perAttr = captureCurvesPerAttr( attrpaths, timeRange, cmds=cmds )
+		perAttrCalls = cmds.callCount
+		cmds.callCount = 0
+		batched = captureCurves( attrpaths, timeRange, cmds=cmds )
+
+		self.assertCurvesEqual( perAttr, batched )
+		self.assertTrue( 'control0.notAnimated' not in batched )
+		self.assertEqual( cmds.callCount, len( attrpaths ) + len( BATCHED_COLUMNS ) + 1 )
+		self.assertTrue( cmds.callCount * 5 < perAttrCalls )
+
+		#check the captured data against the source curves, and that the time offset gets applied
+		for attrpath, curve in batched.iteritems():
+			source = cmds.curves[ attrpath ]
+			self.assertTrue( all( 20 <= t <= 60 for t in curve.times ) )
+			self.assertEqual( len( curve ), len( [ t for t in source.times if 20 <= t <= 60 ] ) )
+			self.assertEqual( [ k[ 0 ] for k in curve.toKeyList( 20 ) ], [ t - 20 for t in curve.times ] )
+
+		self.assertEqual( captureCurves( [ 'control0.notAnimated' ], timeRange, cmds=cmds ), {} )
+	def testFallback( self ):
+		cmds, attrpaths = buildFakeRig( 5, 4, 50, 2 )
+		expected = captureCurvesPerAttr( attrpaths, (0, 50), cmds=cmds )
+		brokenCmds = BrokenBatchCmds( cmds.curves )
+		self.assertCurvesEqual( captureCurves( attrpaths, (0, 50), cmds=brokenCmds ), expected )
+	def testCreateCurve( self ):
+		cmds, attrpaths = buildFakeRig( 10, 5, 100, 3 )
+		perKeyCmds, bulkCmds = FakeCurveCmds( {} ), FakeCurveCmds( {} )
+		for attrpath in attrpaths:
+			curve = cmds.curves[ attrpath ]
+			keyList = curve.toKeyList()
+			setKeysPerKey( attrpath, curve.weighted, keyList, perKeyCmds )
+
+			callCount = bulkCmds.callCount
+			self.assertTrue( createCurve( attrpath, curve.weighted, keyList, bulkCmds ) is not None )
+
+			#the number of commands used to create a curve shouldn't depend on the number of keys
+			self.assertTrue( bulkCmds.callCount - callCount <= 13 )
+
+			#setting keys one at a time doesn't set the tangent types on unweighted curves, so only compare them for weighted curves
+			perKeyList, bulkList = perKeyCmds.curves[ attrpath ].toKeyList(), bulkCmds.curves[ attrpath ].toKeyList()
+			self.assertEqual( bulkList, keyList )
+			if curve.weighted:
+				self.assertEqual( perKeyList, keyList )
+			else:
+				self.assertEqual( [ k[ :2 ] + k[ 4:8 ] for k in perKeyList ], [ k[ :2 ] + k[ 4:8 ] for k in keyList ] )
+
+		#creating a curve on an attribute that is already animated should fail and clean up after itself
+		self.assertEqual( createCurve( attrpaths[ 0 ], False, keyList, bulkCmds ), None )
+		self.assertEqual( len( bulkCmds.nodes ), len( attrpaths ) )
+	def testCreateCurveNames( self ):
+		keyList = [ (0, 0.0, 'spline', 'spline', 1.0, 0.0, 1.0, 0.0, True, False),
+		            (10, 5.0, 'linear', 'linear', 1.0, 0.5, 1.0, 0.5, True, False) ]
+
+		#namespaces and DAG paths can't go in the curve name
+		cmds = FakeCurveCmds( {} )
+		for attrpath, curveName in (('rig:grp|rig:ctrl.translateX', 'ctrl_translateX'),
+		                            ('|world|arm:hand.blend[2]', 'hand_blend_2_'),
+		                            ('plain.rotateY', 'plain_rotateY')):
+			self.assertEqual( getCurveName( attrpath ), curveName )
+			self.assertEqual( createCurve( attrpath, False, keyList, cmds ), curveName )
+			self.assertEqual( cmds.curves[ attrpath ].toKeyList(), keyList )
+
+		#when the curve can't be created, None is returned so the caller can fall back to setting keys one at a time
+		failCmds = NoCreateNodeCmds( {} )
+		attrpath = 'rig:grp|rig:ctrl.translateX'
+		self.assertEqual( createCurve( attrpath, False, keyList, failCmds ), None )
+		self.assertEqual( failCmds.nodes, {} )
+		setKeysPerKey( attrpath, False, keyList, failCmds )
+		self.assertEqual( [ k[ :2 ] for k in failCmds.curves[ attrpath ].toKeyList() ], [ k[ :2 ] for k in keyList ] )
+
+
+#end
@@ -0,0 +1,138 @@
+
+from unittest import TestCase
+from animCurve import *
+from keyArrays import KeyArrays
+
+__all__ = [ 'TestAnimCurve' ]
+
+
+#reference samples worked out by hand for each tangent type.  each entry is (times, values, itts, otts, samples)
+#where samples is a list of (time, expectedValue) tuples
+REFERENCE_SAMPLES = (
+	#linear tangents make a straight line between keys
+	([0, 10, 20], [0, 10, 0], 'linear', 'linear', [(-5, 0), (5, 5), (10, 10), (12.5, 7.5), (20, 0), (25, 0)]),
+
+	#flat tangents give the smoothstep curve 3s^2 - 2s^3
+	([0, 10], [0, 1], 'flat', 'flat', [(2.5, 0.15625), (5, 0.5), (7.5, 0.84375)]),
+
+	#spline tangents use the slope between the neighbouring keys - the end keys use the slope of their segment
+	([0, 10, 20, 30], [0, 5, 2, 8], 'spline', 'spline', [(2.5, 1.4375), (5, 3.0), (15, 3.4375), (25, 4.4375)]),
+
+	#step holds the value until the next key, stepnext jumps to the next value straight away
+	([0, 10, 20], [0, 4, 2], 'linear', 'step', [(0, 0), (9.99, 0), (10, 4), (15, 4), (20, 2)]),
+	([0, 10, 20], [0, 4, 2], 'linear', 'stepnext', [(0, 0), (0.01, 4), (10, 4), (15, 2), (20, 2)]),
+
+	#clamped tangents go flat when adjacent keys have the same value
+	([0, 10, 20, 30], [0, 5, 5, 8], 'clamped', 'clamped', [(12.5, 5), (15, 5), (17.5, 5), (5, 3.125), (25, 6.125)]),
+
+	#plateau tangents are flat at the ends and at local extrema
+	([0, 10, 20], [0, 10, 0], 'plateau', 'plateau', [(2.5, 1.5625), (5, 5), (15, 5), (17.5, 1.5625)]),
+	)
+
+
+#tangents in maya's units at 24fps - the angles and weights keyTangent reports are measured against a time axis
+#in seconds.  each entry is (weighted, times, values, (ia, iw, oa, ow) for each key, samples)
+MAYA_REFERENCE_SAMPLES = (
+	#a linear ramp of 10 units over 24 frames is 10 units per second - maya reports its tangents as 84.29 degrees
+	(False, [0, 24], [0, 10], [(84.2894068625, 1, 84.2894068625, 1)] * 2, [(6, 2.5), (12, 5), (18, 7.5)]),
+
+	#45 degrees is 1 unit per second, so the hermite tangents span 1 unit over the 24 frame segment: y = s - s^2
+	(False, [0, 24], [0, 0], [(45, 1, 45, 1), (-45, 1, -45, 1)], [(6, 0.1875), (12, 0.25), (18, 0.1875)]),
+
+	#a weighted segment whose tangents are (0.5s, 3) and (0.5s, -3) - the bezier control points are (4, 1) and (20, 1)
+	(True, [0, 24], [0, 0], [(80.5376777920, 3.0413812651, 80.5376777920, 3.0413812651),
+	                         (-80.5376777920, 3.0413812651, -80.5376777920, 3.0413812651)], [(12, 0.75)]),
+	)
+
+
+class TestAnimCurve(TestCase):
+	def runTest( self ):
+		self.testReferenceSamples()
+		self.testWeighted()
+		self.testPlateau()
+		self.testInsertKey()
+		self.testKeyArrays()
+		self.testMayaReferenceSamples()
+	def testReferenceSamples( self ):
+		for times, values, itt, ott, samples in REFERENCE_SAMPLES:
+			count = len( times )
+			for weighted in (False, True):
+				curve = AnimCurve.FromKeys( times, values, [ itt ] * count, [ ott ] * count, weighted )
+				results = curve.evaluateTimes( [ t for t, v in samples ] )
+				self.assertEqual( len( results ), len( samples ) )
+				for result, (time, value) in zip( results, samples ):
+					self.assertAlmostEqual( result, value, 9, '%s/%s curve at %s: %s != %s' % (itt, ott, time, result, value) )
+	def testWeighted( self ):
+		#a weighted curve with explicit tangents - the bezier control points are (0,0) (5,10) (5,10) (10,10)
+		curve = AnimCurve( True )
+		curve.AddKey( 0, 0, 1, 0, 15, 30 )
+		curve.AddKey( 10, 10, 15, 0, 1, 0 )
+		self.assertAlmostEqual( curve.evaluate( 5 ), 8.75 )
+		self.assertAlmostEqual( curve.evaluate( 2.96875 ), 5.78125 )
+		self.assertAlmostEqual( curve.evaluate( 10 ), 10 )
+
+		#the same tangents on an unweighted curve only contribute their slope
+		curve.m_bWeighted = False
+		curve._compiled = None
+		self.assertAlmostEqual( curve.evaluate( 5 ), 7.5 )
+	def testPlateau( self ):
+		times, values = [0, 10, 20, 30], [0, 10, 10.5, 0]
+		samples = [ n / 10.0 for n in xrange( 301 ) ]
+		plateau = AnimCurve.FromKeys( times, values, ['plateau'] * 4, ['plateau'] * 4 ).evaluateTimes( samples )
+		spline = AnimCurve.FromKeys( times, values ).evaluateTimes( samples )
+		self.assertTrue( max( spline ) > 10.5 )
+		self.assertAlmostEqual( max( plateau ), 10.5 )
+		self.assertTrue( min( plateau ) >= 0 )
+	def testInsertKey( self ):
+		curve = AnimCurve.FromKeys( [0, 10, 20, 30], [0, 5, 2, 8], ['spline', 'flat', 'clamped', 'linear'], ['linear', 'flat', 'spline', 'plateau'] )
+		samples = [ n / 4.0 for n in xrange( 121 ) ]
+		before = curve.evaluateTimes( samples )
+		for time in (3.3, 12, 27.5):
+			curve.InsertKey( time )
+
+		self.assertEqual( len( curve ), 7 )
+		for a, b in zip( before, curve.evaluateTimes( samples ) ):
+			self.assertAlmostEqual( a, b, 9 )
+	def testKeyArrays( self ):
+		#45 degrees at 1fps is a slope of 1 per frame
+		keyArrays = KeyArrays()
+		keyArrays.append( 0, 0, ia=45, oa=45 )
+		keyArrays.append( 10, 10, ia=45, oa=45 )
+		curve = AnimCurve.FromKeyArrays( keyArrays, 1 )
+		for time in (2, 5, 7):
+			self.assertAlmostEqual( curve.evaluate( time ), time )
+
+		angles = curve.getTangentAngles( 1 )
+		self.assertAlmostEqual( angles[ 0 ][ 2 ], 45 )
+
+		#the same curve is 30 units per second at 30fps
+		self.assertAlmostEqual( curve.getTangentAngles( 30 )[ 0 ][ 2 ], degrees( atan2( 30, 1 ) ) )
+
+		flatCurve = AnimCurve.FromKeyArrays( keyArrays, 24, explicitTangents=False )
+		self.assertAlmostEqual( flatCurve.evaluate( 5 ), 5 )
+		self.assertAlmostEqual( len( AnimCurve().evaluateTimes( [ 1, 2 ] ) ), 2 )
+	def testMayaReferenceSamples( self ):
+		self.assertEqual( fromMayaTangent( 0.5, 3, 24 ), (12, 3) )
+		self.assertEqual( toMayaTangent( 12, 3, 24 ), (0.5, 3) )
+		for weighted, times, values, tangents, samples in MAYA_REFERENCE_SAMPLES:
+			keyArrays = KeyArrays()
+			for time, value, (ia, iw, oa, ow) in zip( times, values, tangents ):
+				keyArrays.append( time, value, iw, ow, ia, oa, 'fixed', 'fixed' )
+
+			curve = AnimCurve.FromKeyArrays( keyArrays, 24, weighted )
+			for time, value in samples:
+				self.assertAlmostEqual( curve.evaluate( time ), value, 7 )
+
+			#the angles (and the weights of weighted curves) should survive the trip back to maya's units
+			for angles, expected in zip( curve.getTangentAngles( 24 ), tangents ):
+				self.assertAlmostEqual( angles[ 0 ], expected[ 0 ], 7 )
+				self.assertAlmostEqual( angles[ 2 ], expected[ 2 ], 7 )
+				if weighted:
+					self.assertAlmostEqual( angles[ 1 ], expected[ 1 ], 7 )
+					self.assertAlmostEqual( angles[ 3 ], expected[ 3 ], 7 )
+
+		#slopes are per frame - the last curve leaves its first key heading for the control point at (4, 1)
+		self.assertAlmostEqual( curve.evaluateSlope( 0 ), 0.25 )
+
+
+#end
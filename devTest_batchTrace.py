@@ -0,0 +1,65 @@
+
+from unittest import TestCase
+from batchTrace import *
+from vectorArrays import VectorArray, MatrixArray
+
+__all__ = [ 'TestBatchTrace' ]
+
+
+def translation( vector ):
+	return MatrixArray.FromTransforms( VectorArray( vector ), MatrixArray.Identity( 1 ) )
+
+
+def composeLocal( target, translate, rotate ):
+	'''
+	builds the local matrix of a transform the way maya does - the scale and rotation happen about the rotate
+	pivot, and the rotation is the rotate axis, then the rotate attributes, then the joint orient
+	'''
+	matrix = translation( [ -v for v in target.rotatePivot ] )
+	for m in (MatrixArray.FromTransforms( VectorArray.Zero( 1 ), MatrixArray.Identity( 1 ), VectorArray( target.scale ) ),
+	          MatrixArray.FromEuler( VectorArray( target.rotateAxis ), 'XYZ', True ),
+	          MatrixArray.FromEuler( VectorArray( rotate ), ROTATE_ORDERS[ target.rotateOrder ], True ),
+	          MatrixArray.FromEuler( VectorArray( target.jointOrient ), 'XYZ', True ),
+	          translation( target.rotatePivot ), translation( target.rotatePivotTranslate ), translation( translate )):
+		matrix = matrix * m
+
+	return matrix
+
+
+class TestBatchTrace(TestCase):
+	def runTest( self ):
+		self.testSolve()
+		self.testChunks()
+	def assertMatched( self, target, srcWorld, world ):
+		#the rotate pivots should be in the same place and the orientations should match
+		srcPivot = VectorArray( target.srcRotatePivot ).transformPoints( srcWorld ).values
+		pivot = VectorArray( target.rotatePivot ).transformPoints( world ).values
+		for a, b in zip( srcPivot, pivot ):
+			self.assertAlmostEqual( a, b, 6 )
+
+		for a, b in zip( srcWorld.decompose()[ 1 ].values, world.decompose()[ 1 ].values ):
+			self.assertAlmostEqual( a, b, 6 )
+	def testSolve( self ):
+		parent = TraceTarget( 4, (0.5, 0, -1), (0, 0.2, 0), (2, 2, 2), (10, 0, 30), (0, 45, 0), (0.1, 0.2, 0.3) )
+		child = TraceTarget( 2, (0, 1, 0), srcRotatePivot=(1, 0, 0), parentIndex=0 )
+		targets, srcWorlds, parentWorlds = buildSyntheticTrace( 2, 20, 1 )
+		targets = [ parent, child ]
+
+		results = solveTargets( targets, srcWorlds, parentWorlds )
+		self.assertEqual( [ len( translations ) for translations, rotations in results ], [ 20, 20 ] )
+		for f in xrange( 20 ):
+			frame = slice( f*3, f*3 + 3 )
+			parentWorld = composeLocal( parent, results[ 0 ][ 0 ].values[ frame ], results[ 0 ][ 1 ].values[ frame ] ) * parentWorlds[ 0 ]
+			childWorld = composeLocal( child, results[ 1 ][ 0 ].values[ frame ], results[ 1 ][ 1 ].values[ frame ] ) * parentWorld
+			self.assertMatched( parent, MatrixArray( srcWorlds[ 0 ].values[ f*16:f*16 + 16 ] ), parentWorld )
+			self.assertMatched( child, MatrixArray( srcWorlds[ 1 ].values[ f*16:f*16 + 16 ] ), childWorld )
+	def testChunks( self ):
+		targets, srcWorlds, parentWorlds = buildSyntheticTrace( 6, 50, 2 )
+		expected = solveTargets( targets, srcWorlds, parentWorlds )
+		chunked = solveTargetsParallel( targets, srcWorlds, parentWorlds, processes=1, chunkSize=7 )
+		for (translations, rotations), (chunkTranslations, chunkRotations) in zip( expected, chunked ):
+			self.assertEqual( translations.values, chunkTranslations.values )
+			self.assertEqual( rotations.values, chunkRotations.values )
+
+
+#end
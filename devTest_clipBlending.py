@@ -0,0 +1,81 @@
+
+from unittest import TestCase
+from clipBlending import *
+
+__all__ = [ 'TestClipBlending' ]
+
+
+def keyList( times, values, tangentType='linear' ):
+	return [ (t, v, tangentType, tangentType, 1.0, 0.0, 1.0, 0.0, True, False) for t, v in zip( times, values ) ]
+
+
+class TestClipBlending(TestCase):
+	def runTest( self ):
+		self.testPoseBlend()
+		self.testAnimBlend()
+		self.testAnimBlendTangentUnits()
+	def testPoseBlend( self ):
+		clipA, clipB, mapping = buildPoseClips( 20, 5, 0.3, 1 )
+
+		#add an object that isn't mapped, and a mapped object missing from clipB
+		clipA[ 'scene:unmapped' ] = { 'tx': 1 }
+		clipA[ 'scene:missing' ] = { 'tx': 1 }
+		mapping[ 'scene:missing' ] = [ 'notInClipB' ]
+
+		poseBlend = PoseBlend( clipA, clipB, mapping, attrFilter=lambda attrpath: not attrpath.endswith( 'attr4' ) )
+		self.assertEqual( len( poseBlend ), 20 * 4 )
+
+		expected = dict( (attrpath, value) for attrpath, value in blendPosesPerAttr( clipA, clipB, mapping, 0.25 ) if not attrpath.endswith( 'attr4' ) )
+		changed = dict( poseBlend.getChanged( 0.25 ) )
+		self.assertEqual( sorted( changed ), sorted( expected ) )
+		for attrpath, value in changed.iteritems():
+			self.assertAlmostEqual( value, expected[ attrpath ] )
+
+		#only the attributes that differ between the clips should change from here on, and nothing changes if the blend doesn't
+		self.assertEqual( poseBlend.getChanged( 0.25 ), [] )
+		changed = dict( poseBlend.getChanged( 1 ) )
+		self.assertTrue( 0 < len( changed ) < len( poseBlend ) )
+		for attrpath, value in changed.iteritems():
+			obj, attr = attrpath.split( '.' )
+			self.assertNotEqual( clipA[ obj ][ attr ], value )
+			self.assertEqual( clipB[ obj.split( ':' )[ 1 ] ][ attr ], value )
+
+		poseBlend.reset()
+		self.assertEqual( len( poseBlend.getChanged( 1 ) ), len( poseBlend ) )
+	def testAnimBlend( self ):
+		clipA = { 'a:ctrl': { 'tx': (False, keyList( [ 0, 10 ], [ 0, 10 ] )),
+		                      'ty': (False, keyList( [ 0, 10 ], [ 5, 5 ] )),
+		                      'tz': (False, keyList( [ None ], [ 2 ] )) } }
+		clipB = { 'ctrl': { 'tx': (False, keyList( [ 0, 5, 10 ], [ 10, 10, 0 ] )),
+		                    'ty': (False, keyList( [ 0, 10 ], [ 5, 5 ] )),
+		                    'tz': (False, keyList( [ None ], [ 4 ] )) } }
+		animBlend = AnimBlend( clipA, clipB, { 'a:ctrl': [ 'ctrl' ] }, 24 )
+		self.assertEqual( sorted( animBlend.attrpaths ), [ 'a:ctrl.tx', 'a:ctrl.ty' ] )
+
+		changed = dict( animBlend.getChanged( 0.5 ) )
+		self.assertEqual( sorted( changed ), [ 'a:ctrl.tx', 'a:ctrl.ty' ] )
+
+		#both curves get keys on the same frames - clipA's key inserted at frame 5 is on its line so the blended value is 7.5
+		self.assertEqual( [ key[ :2 ] for key in changed[ 'a:ctrl.tx' ] ], [ (0, 5), (5, 7.5), (10, 5) ] )
+		self.assertEqual( [ key[ :2 ] for key in changed[ 'a:ctrl.ty' ] ], [ (0, 5), (10, 5) ] )
+		self.assertEqual( animBlend.poses.getChanged( 0.5 ), [ ('a:ctrl.tz', 3) ] )
+
+		#ty is the same in both clips so only tx changes as the blend changes
+		self.assertEqual( [ attrpath for attrpath, keys in animBlend.getChanged( 1 ) ], [ 'a:ctrl.tx' ] )
+		self.assertEqual( animBlend.getChanged( 1 ), [] )
+	def testAnimBlendTangentUnits( self ):
+		#clip tangents are captured from maya so their x is in seconds - this ramp rises 10 units per second
+		ramp = [ (t, v, 'fixed', 'fixed', 1.0, 10.0, 1.0, 10.0, True, False) for t, v in ((0, 0), (24, 10)) ]
+		clipA = { 'a:ctrl': { 'tx': (False, ramp) } }
+		clipB = { 'ctrl': { 'tx': (False, keyList( [ 0, 12, 24 ], [ 0, 0, 0 ] )) } }
+		animBlend = AnimBlend( clipA, clipB, { 'a:ctrl': [ 'ctrl' ] }, 24 )
+
+		#at 24fps the ramp is halfway up at frame 12, and the blended tangents go back to maya in its units
+		keys = dict( animBlend.getChanged( 0 ) )[ 'a:ctrl.tx' ]
+		self.assertAlmostEqual( keys[ 1 ][ 1 ], 5 )
+		for time, value, ix, iy, ox, oy in keys:
+			self.assertAlmostEqual( iy / ix, 10 )
+			self.assertAlmostEqual( oy / ox, 10 )
+
+
+#end
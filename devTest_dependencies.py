@@ -0,0 +1,107 @@
+from __future__ import with_statement
+
+from unittest import TestCase
+from dependencies import *
+from dependencies import _findDependentsByWalking, _getScriptTestsByWalking
+
+import os
+import shutil
+import tempfile
+
+__all__ = [ 'TestDependencyTree', 'TestDependencyIndex' ]
+
+
+SCRIPTS = { 'pkg/__init__.py': 'import helper\n',
+            'pkg/helper.py': 'import os\nthing = 1\n',
+            'pkg/sub.py': 'from . import helper\nfrom .helper import thing\n',
+            'main.py': 'import pkg.sub\nfrom pkg import helper, notAModule\nimport missingModule\n\ndef f():\n\timport broken\n',
+            'broken.py': 'def (:\n',
+            'tool.cmd': '@setlocal & python -x %~f0 %* & goto :EOF\nimport main\n' }
+
+
+class TestDependencyTree(TestCase):
+	def runTest( self ):
+		root = tempfile.mkdtemp()
+		try:
+			os.mkdir( os.path.join( root, 'pkg' ) )
+			for name, source in SCRIPTS.iteritems():
+				with open( os.path.join( root, name ), 'w' ) as f:
+					f.write( source )
+
+			toPath = lambda name: Path( os.path.join( root, name ) )
+			self.assertEqual( scanImports( SCRIPTS[ 'pkg/sub.py' ] ), [ (1, '', [ 'helper' ]), (1, 'helper', [ 'thing' ]) ] )
+
+			class TestTree(DependencyTree):
+				_CACHE_PATH = toPath( 'cache' )
+
+			tree = TestTree( [ root ], processes=1 )
+			self.assertEqual( set( tree ), set( map( toPath, SCRIPTS ) ) )
+			self.assertEqual( set( tree[ toPath( 'main.py' ) ] ), set( map( toPath, [ 'pkg/__init__.py', 'pkg/sub.py', 'pkg/helper.py', 'broken.py' ] ) ) )
+			self.assertEqual( set( tree[ toPath( 'pkg/sub.py' ) ] ), set( map( toPath, [ 'pkg/__init__.py', 'pkg/helper.py' ] ) ) )
+			self.assertEqual( set( tree[ toPath( 'pkg/__init__.py' ) ] ), set( [ toPath( 'pkg/helper.py' ) ] ) )
+			self.assertEqual( list( tree[ toPath( 'tool.cmd' ) ] ), [ toPath( 'main.py' ) ] )
+			self.assertEqual( list( tree[ toPath( 'broken.py' ) ] ), [] )
+			self.assertEqual( tree.freshenDependencies(), [] )
+
+			#loading from the cache shouldn't need to touch the cache file
+			with open( TestTree._CACHE_PATH, 'rb' ) as f:
+				cacheContents = f.read()
+
+			loaded = TestTree( [ root ], processes=1 )
+			self.assertEqual( loaded, tree )
+			self.assertTrue( 'load' in loaded.getTimings() )
+			with open( TestTree._CACHE_PATH, 'rb' ) as f:
+				self.assertEqual( f.read(), cacheContents )
+
+			#changes should only be appended to the cache
+			with open( toPath( 'pkg/sub.py' ), 'w' ) as f:
+				f.write( 'import os\n' )
+
+			os.utime( toPath( 'pkg/sub.py' ), (0, 0) )
+			os.remove( toPath( 'broken.py' ) )
+			loaded = TestTree( [ root ], processes=1 )
+			self.assertFalse( toPath( 'broken.py' ) in loaded )
+			self.assertFalse( toPath( 'pkg/helper.py' ) in loaded[ toPath( 'pkg/sub.py' ) ] )
+			with open( TestTree._CACHE_PATH, 'rb' ) as f:
+				self.assertTrue( f.read().startswith( cacheContents ) )
+
+			self.assertEqual( TestTree( [ root ], processes=1 ), loaded )
+
+			#the tree's index should answer dependent queries
+			self.assertEqual( loaded.findDependents( toPath( 'pkg/helper.py' ) ), (set( map( toPath, [ 'pkg/__init__.py', 'main.py' ] ) ), set( [ toPath( 'tool.cmd' ) ] )) )
+
+			#scanning in parallel should give the same results
+			scripts = [ (toPath( name ), None) for name in SCRIPTS if name != 'broken.py' ] * 20
+			self.assertEqual( scanScripts( scripts, sys.path, 2 ), scanScripts( scripts, sys.path, 1 ) )
+		finally:
+			shutil.rmtree( root )
+
+
+class TestDependencyIndex(TestCase):
+	def runTest( self ):
+
+		#c and d import each other
+		index = DependencyIndex( [ ('a', [ 'b' ]), ('b', [ 'c' ]), ('c', [ 'd' ]), ('d', [ 'c', 'e' ]), ('devTest_a', [ 'a' ]) ] )
+		self.assertEqual( index.getDependents( 'e' ), set( [ 'a', 'b', 'c', 'd', 'devTest_a' ] ) )
+		self.assertEqual( index.getDependents( 'c' ), set( [ 'a', 'b', 'c', 'd', 'devTest_a' ] ) )
+		self.assertEqual( index.getDependencies( 'a' ), set( [ 'b', 'c', 'd', 'e' ] ) )
+		self.assertEqual( index.getDirectDependents( 'c' ), set( [ 'b', 'd' ] ) )
+		self.assertEqual( index.getDependents( 'unknown' ), set() )
+
+		#breaking the cycle and removing scripts should update the closures
+		index.update( 'd', [ 'e' ] )
+		self.assertEqual( index.getDependents( 'c' ), set( [ 'a', 'b', 'devTest_a' ] ) )
+		index.remove( 'a' )
+		self.assertEqual( index.getDependents( 'e' ), set( [ 'b', 'c', 'd' ] ) )
+
+		#compare against walking a generated graph
+		graph = buildSyntheticGraph( 300, testCount=20 )
+		forward = dict( graph )
+		index = DependencyIndex( graph )
+		for script in [ 'module00000', 'module00007', 'module00150', 'module00299' ]:
+			primary, secondary = _findDependentsByWalking( forward, script )
+			self.assertEqual( primary | secondary, index.getDependents( script ) - set( [ script ] ) )
+			self.assertEqual( sorted( _getScriptTestsByWalking( forward, script ) ), sorted( [ s for s in index.getDependents( script ) if s.startswith( 'devTest_' ) ] ) )
+
+
+#end
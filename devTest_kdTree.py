@@ -0,0 +1,60 @@
+from unittest import TestCase
+from kdTree import *
+
+import random
+
+__all__ = [ 'TestKdTree' ]
+
+
+def sqDist( a, b ):
+	return sum( [ (x - y)**2 for x, y in zip( a[ :3 ], b[ :3 ] ) ] )
+
+
+class TestKdTree(TestCase):
+	def runTest( self ):
+		rand = random.Random( 0 )
+		points = [ (rand.random(), rand.random(), rand.random()) for n in xrange( 500 ) ]
+
+		#add a bunch of duplicates and some points that only differ on one axis
+		points += points[ :40 ] + [ (0.5, 0.5, z / 10.0) for z in xrange( 10 ) ]
+		queries = [ (rand.random(), rand.random(), rand.random()) for n in xrange( 200 ) ] + points[ :20 ]
+
+		tree = KdTree( points )
+		recursive = RecursiveKdTree( points )
+		closest, sqDistances = tree.queryClosestBatch( queries, True )
+		for query, idx, sd in zip( queries, closest, sqDistances ):
+			best = min( [ sqDist( query, p ) for p in points ] )
+			self.assertAlmostEqual( sd, best )
+			self.assertAlmostEqual( sqDist( query, points[ idx ] ), best )
+			self.assertAlmostEqual( tree.getClosest( query, True )[ 0 ], recursive.getClosest( query, True )[ 0 ] )
+
+		radius = 0.1
+		for query, matches in zip( queries, tree.queryWithinBatch( queries, radius ) ):
+			expected = sorted( [ n for n, p in enumerate( points ) if sqDist( query, p ) <= radius*radius ] )
+			self.assertEqual( sorted( matches ), expected )
+			self.assertEqual( len( tree.getWithin( query, radius ) ), len( recursive.getWithin( query, radius ) ) )
+
+			#the matches should be sorted by distance
+			dists = [ sqDist( query, points[ n ] ) for n in matches ]
+			self.assertEqual( dists, sorted( dists ) )
+
+		#duplicates of the query point should all be found
+		self.assertEqual( sorted( tree.queryWithinBatch( [ points[ 0 ] ], 0 )[ 0 ] ), [ 0, 500 ] )
+
+		#degenerate trees
+		empty = KdTree( [] )
+		self.assertEqual( list( empty.queryClosestBatch( queries[ :3 ] ) ), [ -1, -1, -1 ] )
+		self.assertEqual( empty.getClosest( queries[ 0 ] ), None )
+		self.assertEqual( empty.getWithin( queries[ 0 ], 10 ), [] )
+		self.assertEqual( empty.getDistanceRatioWeightedVector( queries[ 0 ] ), [] )
+
+		single = KdTree( [ (1, 2, 3) ] )
+		self.assertEqual( single.getClosest( (0, 0, 0) ), (1, 2, 3) )
+		self.assertEqual( single.getWithin( (1, 2, 3.5), 1 ), [ (1, 2, 3) ] )
+		self.assertEqual( single.getWithin( (1, 2, 5), 1 ), [] )
+
+		fromArray = KdTree.FromArray( array( 'd', [ 0, 0, 0, 1, 1, 1 ] ) )
+		self.assertEqual( fromArray.getClosest( (0.9, 1, 1) ), (1.0, 1.0, 1.0) )
+
+
+#end
@@ -0,0 +1,110 @@
+
+from unittest import TestCase
+from keyArrays import *
+
+import cPickle
+import copy_reg
+
+__all__ = [ 'TestKeyArrays' ]
+
+
+def buildKeyArrays( times, values ):
+	keyArrays = KeyArrays()
+	for time, value in zip( times, values ):
+		keyArrays.append( time, value, itt='spline', ott='flat' )
+
+	return keyArrays
+
+
+class LegacyPickle(object):
+	'''
+	pickles exactly the way an instance of cls with the given __dict__ did before cls had __slots__ - so pickles
+	written by old code can be built without needing the old code
+	'''
+	def __init__( self, cls, state ):
+		self.cls, self.state = cls, state
+	def __reduce__( self ):
+		return copy_reg._reconstructor, (self.cls, object, None), self.state
+
+
+class TestKeyArrays(TestCase):
+	def runTest( self ):
+		self.testKeyView()
+		self.testSlicing()
+		self.testMerge()
+		self.testTurningPoints()
+		self.testLegacyPickle()
+	def testKeyView( self ):
+		key = KeyView( time=5, value=2.5 )
+		self.assertEqual( (key.time, key.value, key.itt, key.lock, key.idx), (5, 2.5, 'linear', True, None) )
+		self.assertRaises( AttributeError, setattr, key, 'someAttr', 1 )
+
+		key.ott = 'step'
+		key.idx = 3
+		key.offset( 2 )
+		self.assertEqual( (key.time, key.ott, key.idx), (7, 'step', 3) )
+		self.assertEqual( key, 7.00001 )
+		self.assertTrue( key < KeyView( time=8 ) )
+
+		#views should write through to the storage, and copies shouldn't
+		keyArrays = buildKeyArrays( [ 0, 1, 2 ], [ 0, 1, 0 ] )
+		view = KeyView.View( keyArrays, 1 )
+		copy = view.copy()
+		view.value = 10
+		copy.value = 20
+		self.assertEqual( list( keyArrays.values ), [ 0, 10, 0 ] )
+		self.assertEqual( copy.itt, 'spline' )
+
+		unpickled = cPickle.loads( cPickle.dumps( view, True ) )
+		self.assertEqual( (unpickled.time, unpickled.value, unpickled.ott), (1, 10, 'flat') )
+
+		rebuilt = KeyArrays.FromKeys( [ copy, view ] )
+		self.assertEqual( list( rebuilt.values ), [ 20, 10 ] )
+		self.assertEqual( list( rebuilt.otts ), [ TANGENT_CODES[ 'flat' ] ] * 2 )
+	def testSlicing( self ):
+		keyArrays = buildKeyArrays( [ 4, 0, 2, 1, 3 ], [ 4, 0, 2, 1, 3 ] ).sort()
+		self.assertEqual( list( keyArrays.times ), [ 0, 1, 2, 3, 4 ] )
+		self.assertEqual( list( keyArrays.values ), [ 0, 1, 2, 3, 4 ] )
+
+		self.assertEqual( keyArrays.getIndexRange( 1, 3 ), (1, 4) )
+		self.assertEqual( keyArrays.getIndexRange( 0.99999, 3.00001 ), (1, 4) )
+		self.assertEqual( keyArrays.getIndexRange( 1.5, 1.6 ), (2, 2) )
+		self.assertEqual( keyArrays.getIndexRange( None, 1 ), (0, 2) )
+		self.assertEqual( keyArrays.findTime( 2.00001 ), 2 )
+		self.assertEqual( keyArrays.findTime( 2.5 ), None )
+		self.assertEqual( keyArrays.findTime( 10 ), None )
+
+		sliced = keyArrays.slice( 1, 3 )
+		sliced.offset( 10 )
+		self.assertEqual( list( sliced.times ), [ 11, 12 ] )
+		self.assertEqual( list( keyArrays.times ), [ 0, 1, 2, 3, 4 ] )
+	def testMerge( self ):
+		keyArraysA = buildKeyArrays( [ 0, 2, 4 ], [ 1, 1, 1 ] )
+		keyArraysB = KeyArrays()
+		for time in (1, 2.00001, 5, 6):
+			keyArraysB.append( time, 10, itt='step' )
+
+		merged = keyArraysA.merge( keyArraysB )
+		self.assertEqual( list( merged.times ), [ 0, 1, 2, 4, 5, 6 ] )
+		self.assertEqual( list( merged.values ), [ 1, 10, 11, 1, 10, 10 ] )
+		self.assertEqual( [ TANGENT_TYPES[ tt ] for tt in merged.itts ], [ 'spline', 'step', 'spline', 'spline', 'step', 'step' ] )
+		self.assertEqual( len( KeyArrays().merge( keyArraysA ) ), 3 )
+	def testTurningPoints( self ):
+		keyArrays = buildKeyArrays( range( 7 ), [ 0, 1, 2, 1, 1, 3, 0 ] )
+		self.assertEqual( keyArrays.getTurningPointIndices(), [ 2, 5 ] )
+		self.assertEqual( buildKeyArrays( [ 0, 1 ], [ 0, 1 ] ).getTurningPointIndices(), [] )
+	def testLegacyPickle( self ):
+		state = dict( idx=None, obj='thing', attr='tx', time=3.0, value=1.5, iw=2.0, ow=0.5, ia=10.0, oa=-20.0,
+		              itt='spline', ott='step', lock=False )
+		key = cPickle.loads( cPickle.dumps( LegacyPickle( KeyView, state ), True ) )
+		self.assertTrue( isinstance( key, KeyView ) )
+		self.assertEqual( (key.obj, key.attr, key.time, key.value, key.iw, key.ow, key.ia, key.oa),
+		                  ('thing', 'tx', 3.0, 1.5, 2.0, 0.5, 10.0, -20.0) )
+		self.assertEqual( (key.itt, key.ott, key.lock, key.idx), ('spline', 'step', False, None) )
+
+		#the rebuilt key should pickle in the current format
+		repickled = cPickle.loads( cPickle.dumps( key, True ) )
+		self.assertEqual( (repickled.time, repickled.oa, repickled.ott), (3.0, -20.0, 'step') )
+
+
+#end
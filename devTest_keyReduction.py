@@ -0,0 +1,82 @@
+
+from unittest import TestCase
+from keyReduction import *
+from animCurve import AnimCurve, fromMayaTangent
+from math import sin
+
+__all__ = [ 'TestKeyReduction' ]
+
+
+class TestKeyReduction(TestCase):
+	def runTest( self ):
+		self.testErrorBound()
+		self.testSimpleCurves()
+		self.testKeyList()
+		self.testParallel()
+	def assertWithinTolerance( self, times, values, reduction, tolerance ):
+		errors = [ abs( a - b ) for a, b in zip( reduction.evaluate( times ), values ) ]
+		self.assertTrue( max( errors ) <= tolerance + 1e-9 )
+		self.assertAlmostEqual( max( errors ), reduction.maxError )
+	def testErrorBound( self ):
+		for times, values in buildSyntheticMocap( 5, 500, 1 ):
+			for tolerance in (0.001, 0.01, 0.1):
+				reduction = reduceSamples( times, values, tolerance )
+				self.assertWithinTolerance( times, values, reduction, tolerance )
+				self.assertTrue( reduction.compressionRatio > 1 )
+				self.assertEqual( (reduction.times[ 0 ], reduction.times[ -1 ]), (times[ 0 ], times[ -1 ]) )
+	def testSimpleCurves( self ):
+		times = range( 100 )
+		reduction = reduceSamples( times, [ 2*t + 1 for t in times ] )
+		self.assertEqual( list( reduction.times ), [ 0, 99 ] )
+		self.assertEqual( reduction.compressionRatio, 50 )
+
+		#a step in the data should keep keys either side of it
+		values = [ float( t >= 50 ) for t in times ]
+		reduction = reduceSamples( times, values, 0.01 )
+		self.assertWithinTolerance( times, values, reduction, 0.01 )
+		self.assertTrue( 49 in reduction.times and 50 in reduction.times )
+
+		#uneven spacing
+		times = [ t * t / 10.0 for t in xrange( 60 ) ]
+		values = [ sin( t / 20.0 ) for t in times ]
+		self.assertWithinTolerance( times, values, reduceSamples( times, values, 0.001 ), 0.001 )
+
+		self.assertEqual( len( reduceSamples( [ 1, 2 ], [ 3, 4 ] ) ), 2 )
+	def testKeyList( self ):
+		times, values = buildSyntheticMocap( 1, 300, 2 )[ 0 ]
+		reduction = reduceSamples( times, values, 0.01 )
+		expected = reduction.evaluate( times )
+		for weighted in (False, True):
+			curve = AnimCurve( weighted )
+			for keyTime, value, itt, ott, ix, iy, ox, oy, isLocked, isWeighted in reduction.toKeyList( 24, weighted ):
+				ix, iy = fromMayaTangent( ix, iy, 24 )
+				ox, oy = fromMayaTangent( ox, oy, 24 )
+				curve.AddKey( keyTime, value, ix, iy, ox, oy, itt, ott )
+
+			for a, b in zip( curve.evaluateTimes( times ), expected ):
+				self.assertAlmostEqual( a, b, 6 )
+
+		curve = AnimCurve.FromKeyArrays( reduction.toKeyArrays( 24 ), 24 )
+		for a, b in zip( curve.evaluateTimes( times ), expected ):
+			self.assertAlmostEqual( a, b, 6 )
+
+		#the tangents are handed to maya as is - so a ramp of 10 units over 24 frames should come out as maya
+		#reports it at 24fps: 10 units per second
+		ramp = reduceSamples( range( 25 ), [ t * 10 / 24.0 for t in range( 25 ) ], 0.01 )
+		self.assertEqual( len( ramp ), 2 )
+		keyArrays = ramp.toKeyArrays( 24 )
+		self.assertAlmostEqual( keyArrays.ias[ 0 ], 84.2894068625, 7 )
+		self.assertAlmostEqual( keyArrays.oas[ 1 ], 84.2894068625, 7 )
+		for keyTime, value, itt, ott, ix, iy, ox, oy, isLocked, isWeighted in ramp.toKeyList( 24, True ):
+			self.assertAlmostEqual( iy / ix, 10 )
+			self.assertAlmostEqual( oy / ox, 10 )
+		self.assertAlmostEqual( ramp.toKeyList( 24, True )[ 0 ][ 6 ], 1 )
+	def testParallel( self ):
+		sampleLists = buildSyntheticMocap( 8, 200, 3 )
+		serial = reduceSamplesParallel( sampleLists, 0.01, processes=1 )
+		parallel = reduceSamplesParallel( sampleLists, 0.01, processes=2 )
+		self.assertEqual( [ list( r.times ) for r in serial ], [ list( r.times ) for r in parallel ] )
+		self.assertEqual( [ r.maxError for r in serial ], [ r.maxError for r in parallel ] )
+
+
+#end
@@ -0,0 +1,56 @@
+
+from unittest import TestCase
+from devTest_keyArrays import LegacyPickle
+from keyUtils import *
+
+import os
+import cPickle
+import tempfile
+
+__all__ = [ 'TestLegacyPickles' ]
+
+
+def buildLegacyKey( time, value, **kw ):
+	state = dict( idx=None, obj='thing', attr='translateX', time=time, value=value, iw=1.0, ow=1.0, ia=0, oa=0,
+	              itt='linear', ott='linear', lock=True )
+	state.update( kw )
+
+	return LegacyPickle( Key, state )
+
+
+class TestLegacyPickles(TestCase):
+	'''
+	makes sure files written by keyUtils.write before key data was stored in KeyArrays instances still load
+	'''
+	def setUp( self ):
+		handle, self.filepath = tempfile.mkstemp( '.pickle' )
+		os.close( handle )
+	def tearDown( self ):
+		os.remove( self.filepath )
+	def runTest( self ):
+		self.testKey()
+		self.testChannel()
+	def writeLegacy( self, obj ):
+		fileobj = file( self.filepath, 'wb' )
+		cPickle.dump( ({}, obj), fileobj, True )
+		fileobj.close()
+
+		return load( self.filepath )[ 1 ]
+	def testKey( self ):
+		key = self.writeLegacy( buildLegacyKey( 4.0, 2.0, oa=30.0, ott='spline' ) )
+		self.assertTrue( isinstance( key, Key ) )
+		self.assertEqual( (key.attrpath, key.time, key.value, key.oa, key.ott), ('thing.translateX', 4.0, 2.0, 30.0, 'spline') )
+	def testChannel( self ):
+		state = dict( obj='thing', attr='translateX', attrShort='tx', weighted=False,
+		              keys=[ buildLegacyKey( 0.0, 1.0 ), buildLegacyKey( 10.0, 3.0, itt='flat', iw=2.0 ) ] )
+		channel = self.writeLegacy( LegacyPickle( Channel, state ) )
+		self.assertTrue( isinstance( channel, Channel ) )
+		self.assertFalse( 'keys' in channel.__dict__ )
+		self.assertEqual( (channel.attrShort, channel.weighted), ('tx', False) )
+		self.assertEqual( channel.times, [ 0.0, 10.0 ] )
+		self.assertEqual( channel.values, [ 1.0, 3.0 ] )
+		self.assertEqual( [ (key.itt, key.iw) for key in channel.keys ], [ ('linear', 1.0), ('flat', 2.0) ] )
+		self.assertEqual( channel.end, 10.0 )
+
+
+#end
@@ -0,0 +1,42 @@
+
+from unittest import TestCase
+from names import *
+from names import _matchNamesScan
+
+import random
+
+__all__ = [ 'TestNameMatcher' ]
+
+
+class TestNameMatcher(TestCase):
+	def runTest( self ):
+		self.testSameAsScan()
+		self.testOddNames()
+		self.testReuse()
+	def testSameAsScan( self ):
+		rand = random.Random( 0 )
+		srcs = buildSyntheticRigNames( 80, 1 )
+		tgts = [ 'char:' + name for name in rand.sample( srcs, 30 ) ] + buildSyntheticRigNames( 50, 2, 'other|' )
+		rand.shuffle( tgts )
+
+		for threshold in (0, 0.2, 0.5, 0.8, 1):
+			for unique in (False, True):
+				for parity in (False, True):
+					for strip in (False, True):
+						kw = dict( threshold=threshold, unique=unique, parity=parity, strip=strip )
+						self.assertEqual( map( str, matchNames( srcs, tgts, **kw ) ), map( str, _matchNamesScan( srcs, tgts, **kw ) ) )
+	def testOddNames( self ):
+		srcs = [ '', 'ns:', 'a.b c', 'arm_L', 'ARM_l', 'arm01', 'arm1', 'forearmTwist', 'a', 'x_007', 'spine 02' ]
+		tgts = [ 'b:', 'a.b c', 'armL', 'arm_01', 'twist', 'arm', 'x_7', 'spine_2', '1', 'AB.C' ]
+		for threshold in (-1, 0, 0.3, 1):
+			for unique in (False, True):
+				kw = dict( threshold=threshold, unique=unique )
+				self.assertEqual( map( str, matchNames( srcs, tgts, **kw ) ), map( str, _matchNamesScan( srcs, tgts, **kw ) ) )
+	def testReuse( self ):
+		tgts = buildSyntheticRigNames( 100, 3, 'rig:' )
+		matcher = NameMatcher( tgts )
+		for name in tgts[ :10 ]:
+			self.assertEqual( matcher.match( [ name.split( ':' )[ -1 ] ] ), [ name ] )
+
+
+#end
@@ -0,0 +1,254 @@
+from __future__ import with_statement
+
+from unittest import TestCase
+from filesystem import perforce
+from filesystem.perforce import *
+
+import os
+import sys
+import stat
+import time
+import shutil
+import tempfile
+
+__all__ = [ 'TestP4Connection', 'TestP4OperationQueue', 'TestP4ChangeIndex' ]
+
+
+#a fake p4 executable - the files it knows about are read from the json file named by FAKE_P4_DEPOT (changes are
+#stored under the "changes" key), and each
+#command it is run with gets appended to the file named by FAKE_P4_LOG.  FAKE_P4_LATENCY is the number of seconds
+#each command takes
+FAKE_P4 = r"""
+import os, sys, json, time, marshal
+
+time.sleep( float( os.environ.get( 'FAKE_P4_LATENCY', 0 ) ) )
+
+args = sys.argv[ 1: ]
+tagged = '-G' in args
+if tagged:
+	args.remove( '-G' )
+
+if args[ :2 ] == [ '-x', '-' ]:
+	args = args[ 2: ] + [ line.strip() for line in sys.stdin if line.strip() ]
+
+with open( os.environ[ 'FAKE_P4_LOG' ], 'a' ) as log:
+	log.write( ' '.join( args ) + '\n' )
+
+with open( os.environ[ 'FAKE_P4_DEPOT' ] ) as depotFile:
+	depot = json.load( depotFile )
+
+cmd, files = args[ 0 ], args[ 1: ]
+if cmd == 'fstat':
+	for f in files:
+		if f in depot:
+			data = dict( (str( k ), str( v )) for k, v in depot[ f ].iteritems() )
+			data.update( code='stat', clientFile=f )
+		else:
+			data = { 'code': 'error', 'data': '%s - no such file(s).\n' % f, 'severity': '2' }
+
+		marshal.dump( data, sys.stdout )
+elif cmd == 'changes':
+	flags = [ f for f in files if f != '-l' ]
+	options = dict( zip( flags[ ::2 ], flags[ 1::2 ] ) )
+	changes = [ c for c in depot.get( 'changes', [] ) if all( c[ key ] == options[ flag ] for flag, key in (('-u', 'user'), ('-c', 'client'), ('-s', 'status')) if flag in options ) ]
+	changes.sort( key=lambda c: -c[ 'change' ] )
+	for c in changes[ :int( options.get( '-m', len( changes ) ) ) ]:
+		marshal.dump( dict( (str( k ), str( v )) for k, v in c.iteritems() ), sys.stdout )
+elif cmd == 'submit':
+	marshal.dump( { 'code': 'stat', 'submittedChange': args[ 2 ] }, sys.stdout )
+else:
+	for f in files:
+		if not f.startswith( '-' ) and f not in args[ 1:3 ]:
+			marshal.dump( { 'code': 'stat', 'clientFile': f, 'action': cmd }, sys.stdout )
+"""
+
+
+class FakeP4(object):
+	'''
+	sets up a fake p4 in a temp directory - the depot is a dict keyed by file containing the fstat fields
+	'''
+	def __init__( self, depot ):
+		self.dir = tempfile.mkdtemp()
+		self.script = os.path.join( self.dir, 'p4.py' )
+		self.logFile = os.path.join( self.dir, 'log.txt' )
+		self.depotFile = os.path.join( self.dir, 'depot.json' )
+		with open( self.script, 'w' ) as f:
+			f.write( FAKE_P4 )
+
+		open( self.logFile, 'w' ).close()
+		self.setDepot( depot )
+		os.environ[ 'FAKE_P4_LOG' ] = self.logFile
+		os.environ[ 'FAKE_P4_DEPOT' ] = self.depotFile
+		self.setLatency( 0 )
+	def setLatency( self, latency ):
+		os.environ[ 'FAKE_P4_LATENCY' ] = str( latency )
+	def getCmd( self ):
+		return [ sys.executable, self.script ]
+	def setDepot( self, depot ):
+		import json
+		with open( self.depotFile, 'w' ) as f:
+			json.dump( depot, f )
+	def getLog( self ):
+		with open( self.logFile ) as f:
+			return f.read().splitlines()
+	def cleanup( self ):
+		shutil.rmtree( self.dir )
+
+
+class TestP4Connection(TestCase):
+	def runTest( self ):
+		root = os.path.abspath( tempfile.gettempdir() )
+		fileA, fileB, fileC = [ os.path.join( root, name ) for name in ('a.txt', 'b.txt', 'c.txt') ]
+		fake = FakeP4( { fileA: { 'depotFile': '//depot/a.txt', 'headRev': 3, 'haveRev': 3, 'headAction': 'edit' },
+		                 fileB: { 'depotFile': '//depot/b.txt', 'headRev': 5, 'haveRev': 4, 'headAction': 'edit',
+		                          'otherOpen0': 'bob@ws', 'otherOpen1': 'sue@ws', 'otherOpen': 2 } } )
+
+		connection = P4Connection( fake.getCmd() )
+		previousConnection = setConnection( connection )
+		previousUseP4 = P4File.USE_P4
+		P4File.USE_P4 = True
+		try:
+
+			#all three files should be queried in a single call
+			statuses = connection.fstat( [ fileA, fileB, fileC ] )
+			self.assertEqual( connection.runCount, 1 )
+			self.assertEqual( fake.getLog(), [ 'fstat %s %s %s' % (fileA, fileB, fileC) ] )
+			self.assertEqual( statuses[ 0 ][ 'headRev' ], 3 )
+			self.assertEqual( statuses[ 1 ][ 'otherOpen' ], [ 'bob@ws', 'sue@ws' ] )
+			self.assertFalse( statuses[ 2 ] )
+			self.assertTrue( statuses[ 2 ].errors )
+
+			#the status methods should all share the cached statuses
+			p4 = P4File( fileA )
+			self.assertTrue( p4.isManaged() )
+			self.assertTrue( p4.isLatest() )
+			self.assertEqual( p4.getHaveHead(), (3, 3) )
+			self.assertEqual( p4.getAction(), None )
+			self.assertFalse( p4.isLatest( fileB ) )
+			self.assertFalse( p4.isManaged( fileC ) )
+			self.assertEqual( findStaleFiles( [ fileA, fileB ] ), [ fileB ] )
+			self.assertEqual( connection.runCount, 1 )
+
+			#once the status is invalidated it should be queried again
+			fake.setDepot( { fileA: { 'depotFile': '//depot/a.txt', 'headRev': 3, 'haveRev': 3, 'headAction': 'edit', 'action': 'edit' } } )
+			p4.invalidate()
+			self.assertTrue( p4.isEdit() )
+			self.assertEqual( connection.runCount, 2 )
+			self.assertEqual( fake.getLog()[ -1 ], 'fstat %s' % fileA )
+
+			#and stale statuses should expire
+			connection.statusLifetime = -1
+			self.assertFalse( p4.isManaged( fileB ) )
+			self.assertEqual( connection.runCount, 3 )
+		finally:
+			P4File.USE_P4 = previousUseP4
+			setConnection( previousConnection )
+			fake.cleanup()
+
+
+class TestP4OperationQueue(TestCase):
+	def runTest( self ):
+		root = os.path.abspath( tempfile.gettempdir() )
+		fileA, fileB, fileC = [ os.path.join( root, name ) for name in ('a.txt', 'b.txt', 'c.txt') ]
+		fake = FakeP4( {} )
+		fake.setLatency( 0.3 )
+
+		lengthy, returned = [], []
+		previousCallbacks = perforce.P4_LENGTHY_CALLBACK, perforce.P4_RETURNED_CALLBACK, P4File.TIMEOUT_PERIOD
+		perforce.P4_LENGTHY_CALLBACK, perforce.P4_RETURNED_CALLBACK = lengthy.append, returned.append
+		P4File.TIMEOUT_PERIOD = 0.1
+		try:
+			queue = P4OperationQueue( P4Connection( fake.getCmd() ) )
+
+			#while the sync runs the edits are merged - until the revert of fileB, which later edits of fileB can't be merged past
+			done = []
+			queue.sync( [ fileA ] )
+			editB = queue.edit( [ fileB ], 5 )
+			queue.queue( 'revert', [ fileB ] )
+			editC = queue.edit( [ fileC ], 5 )
+			editB2 = queue.edit( [ fileB ], 5 )
+			editB2.addDoneCallback( done.append )
+			queue.finish( 10 )
+
+			self.assertEqual( fake.getLog(), [ 'sync %s' % fileA, 'edit -c 5 %s %s' % (fileB, fileC), 'revert %s' % fileB, 'edit -c 5 %s' % fileB ] )
+			self.assertTrue( editB.result() is editC.result() )
+			self.assertEqual( [ result[ 'action' ] for result in editB.result() ], [ 'edit', 'edit' ] )
+			self.assertEqual( done, [ editB2 ] )
+			self.assertEqual( len( lengthy ), 4 )
+			self.assertEqual( lengthy, returned )
+			self.assertRaises( FinishedP4Operation, queue.edit, [ fileA ] )
+
+			#operations that take too long should get killed
+			fake.setLatency( 2 )
+			queue = P4OperationQueue( P4Connection( fake.getCmd() ), timeout=0.2 )
+			start = time.time()
+			self.assertRaises( TimedOutP4Operation, queue.submit( 7 ).result, 5 )
+			self.assertTrue( time.time() - start < 1.5 )
+			queue.finish()
+		finally:
+			perforce.P4_LENGTHY_CALLBACK, perforce.P4_RETURNED_CALLBACK, P4File.TIMEOUT_PERIOD = previousCallbacks
+			fake.cleanup()
+
+
+class TestP4ChangeIndex(TestCase):
+	def runTest( self ):
+		def change( num, desc, user='bob', status='pending' ):
+			return { 'change': num, 'desc': desc + '\n', 'user': user, 'client': 'ws', 'status': status, 'time': 1300000000 + num }
+
+		fake = FakeP4( { 'changes': [ change( 10, 'Fix the rig' ), change( 12, 'default Auto-Checkout' ), change( 14, 'default auto-checkout' ),
+		                              change( 13, 'default auto-checkout', 'sue' ), change( 9, 'old', status='submitted' ) ] } )
+		connection = P4Connection( fake.getCmd() )
+		previousConnection = setConnection( connection )
+		previousUseP4, previousInfo = P4File.USE_P4, perforce.P4INFO
+		P4File.USE_P4 = True
+		perforce.P4INFO = P4Output( [ 'userName bob', 'clientName ws' ] )
+		perforce.P4_CHANGE_INDICES.clear()
+		previousP4run = perforce.p4run
+		handle, filepath = tempfile.mkstemp()
+		os.close( handle )
+		try:
+
+			#all the pending changes and their descriptions should come from a single query - the newest matching change wins
+			self.assertEqual( P4Change.FetchByDescription( DEFAULT_CHANGE ).change, 14 )
+			self.assertEqual( P4File().getChangeNumFromDesc( 'fix the rig', False ), 10 )
+			self.assertEqual( [ c.change for c in P4Change.IterPending() ], [ 14, 12, 10 ] )
+			self.assertEqual( connection.runCount, 1 )
+			self.assertEqual( fake.getLog(), [ 'changes -l -s pending -u bob -c ws' ] )
+
+			#once invalidated the index is fetched again
+			fake.setDepot( { 'changes': [ change( 14, 'default auto-checkout' ) ] } )
+			invalidateChangeIndices()
+			self.assertEqual( P4Change.FetchByDescription( DEFAULT_CHANGE ).change, 14 )
+			self.assertEqual( connection.runCount, 2 )
+
+			changes = P4Change.FetchChanges( '-m 1', '-s pending' )
+			self.assertEqual( [ (c.change, c.user, c.description) for c in changes ], [ (14, 'bob', 'default auto-checkout\n') ] )
+
+			#if the default change is submitted outside of this module the cached change number is stale - edit should
+			#notice p4 refusing it, refresh the index and use the current default change instead
+			fake.setDepot( { 'changes': [ change( 14, 'default auto-checkout', status='submitted' ), change( 16, 'default auto-checkout' ) ] } )
+			edits = []
+			def p4run( *args ):
+				edits.append( args )
+				if args[ 2 ] == 14:
+					return P4Output( [ 'error: Change 14 is already committed.' ] )
+
+				return P4Output( [ 'depotFile //depot/file.txt' ] )
+
+			perforce.p4run = p4run
+			os.chmod( filepath, stat.S_IREAD )
+			self.assertTrue( P4File( filepath ).edit() )
+			self.assertEqual( [ args[ :3 ] for args in edits ], [ ('edit', '-c', 14), ('edit', '-c', 16) ] )
+			self.assertEqual( P4Change.FetchByDescription( DEFAULT_CHANGE ).change, 16 )
+			self.assertFalse( isStaleChangeError( [ 'error: //depot/file.txt - file(s) not on client.' ] ) )
+		finally:
+			os.chmod( filepath, stat.S_IREAD | stat.S_IWRITE )
+			os.remove( filepath )
+			perforce.p4run = previousP4run
+			P4File.USE_P4, perforce.P4INFO = previousUseP4, previousInfo
+			perforce.P4_CHANGE_INDICES.clear()
+			setConnection( previousConnection )
+			fake.cleanup()
+
+
+#end
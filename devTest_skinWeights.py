@@ -0,0 +1,585 @@
+
+from unittest import TestCase
+from skinWeightsBase import *
+from sparseWeights import SparseWeights
+
+from cStringIO import StringIO
+
+import names
+import skinWeightsBase
+
+import random
+import hashlib
+import tempfile
+import shutil
+import os
+import sys
+
+__all__ = [ 'TestResolveVertWeights', 'TestSparseWeights', 'TestMirroredResolve', 'TestWriteWeightsById', 'TestWeightSaveCache', 'TestWeightFile', 'TestWeightSummary' ]
+
+
+def buildSavedData( count=500, seed=0 ):
+	'''
+	builds a MeshWeightData with random positions where each vert has between 1 and 4 influences
+	'''
+	rand = random.Random( seed )
+	savedData = MeshWeightData( 'savedMesh' )
+	for n in xrange( count ):
+		pos = rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )
+		jointIndices = rand.sample( range( 8 ), rand.randint( 1, 4 ) )
+		weights = [ rand.random() for j in jointIndices ]
+		weightSum = sum( weights )
+		savedData.append( n, pos, jointIndices, [ w / weightSum for w in weights ] )
+
+	return savedData
+
+
+def bruteForceResolve( targetPositions, savedData, tolerance, jointRemap=None ):
+	'''
+	straight forward implementation of fixed tolerance weight resolution to compare against
+	'''
+	savedPositions = [ savedData.positions[ n*3:n*3+3 ] for n in xrange( len( savedData ) ) ]
+	results = []
+	for target in targetPositions:
+		jointWeightDict = {}
+		for n, pos in enumerate( savedPositions ):
+			if (Vector( pos ) - Vector( target )).get_magnitude() > tolerance:
+				continue
+
+			for k in xrange( savedData.offsets[ n ], savedData.offsets[ n+1 ] ):
+				joint = savedData.jointIndices[ k ]
+				if jointRemap is not None:
+					if joint not in jointRemap:
+						continue
+
+					joint = jointRemap[ joint ]
+
+				jointWeightDict[ joint ] = jointWeightDict.get( joint, 0 ) + savedData.weights[ k ]
+
+		weightSum = sum( jointWeightDict.values() )
+		results.append( dict( [ (j, w / weightSum) for j, w in jointWeightDict.iteritems() ] ) )
+
+	return results
+
+
+class TestResolveVertWeights(TestCase):
+	def runTest( self ):
+		self.testExactMatches()
+		self.testTolerance()
+		self.testJointRemap()
+		self.testRatio()
+		self.testParallel()
+		self.testCombine()
+	def assertWeightsEqual( self, resolved, expected ):
+		self.assertEqual( len( resolved ), len( expected ) )
+		for jointsAndWeights, expectedDict in zip( resolved, expected ):
+			resolvedDict = dict( jointsAndWeights )
+			self.assertEqual( sorted( resolvedDict.keys() ), sorted( expectedDict.keys() ) )
+			for joint, weight in expectedDict.iteritems():
+				self.assertAlmostEqual( resolvedDict[ joint ], weight, 5 )
+	def testExactMatches( self ):
+		savedData = buildSavedData()
+		targets = [ savedData.positions[ n*3:n*3+3 ] for n in xrange( len( savedData ) ) ]
+		resolved = resolveVertWeights( targets, savedData, 2, averageVerts=True )
+
+		#an exact position match should return the saved weights unchanged
+		for n, jointsAndWeights in enumerate( resolved ):
+			start, end = savedData.offsets[ n ], savedData.offsets[ n+1 ]
+			expected = dict( zip( savedData.jointIndices[ start:end ], savedData.weights[ start:end ] ) )
+			self.assertWeightsEqual( [ jointsAndWeights ], [ expected ] )
+	def testTolerance( self ):
+		savedData = buildSavedData()
+		rand = random.Random( 1 )
+		targets = [ (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) for n in xrange( 100 ) ]
+
+		resolved = resolveVertWeights( targets, savedData, 3, averageVerts=False )
+		self.assertWeightsEqual( resolved, bruteForceResolve( targets, savedData, 3 ) )
+	def testJointRemap( self ):
+		savedData = buildSavedData()
+		rand = random.Random( 2 )
+		targets = [ (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) for n in xrange( 100 ) ]
+
+		#map pairs of joints to the same name and drop joint 7 entirely
+		jointRemap = dict( [ (n, 'joint%d' % (n / 2)) for n in range( 7 ) ] )
+		resolved = resolveVertWeights( targets, savedData, 3, averageVerts=False, jointRemap=jointRemap )
+		self.assertWeightsEqual( resolved, bruteForceResolve( targets, savedData, 3, jointRemap ) )
+	def testRatio( self ):
+		savedData = MeshWeightData( 'savedMesh' )
+		savedData.append( 0, (0, 0, 0), [0], [1] )
+		savedData.append( 1, (3, 0, 0), [1], [1] )
+		savedData.append( 2, (5, 0, 0), [2], [1] )
+
+		#verts 0 and 1 both fall within the grown tolerance, and vert 2 is outside twice the closest distance
+		resolved = resolveVertWeights( [ (1.55, 0, 0) ], savedData, 2, averageVerts=True )
+		self.assertWeightsEqual( resolved, [ {0: 0.5, 1: 0.5} ] )
+
+		#only vert 1 falls within the grown tolerance, so only it is used
+		resolved = resolveVertWeights( [ (2, 0, 0) ], savedData, 2, averageVerts=True )
+		self.assertWeightsEqual( resolved, [ {1: 1} ] )
+
+		#nothing is within the grown tolerance so nothing should be found
+		resolved = resolveVertWeights( [ (1e6, 0, 0) ], savedData, 2, averageVerts=True )
+		self.assertEqual( resolved, [ [] ] )
+	def testParallel( self ):
+		savedData = buildSavedData()
+		rand = random.Random( 3 )
+		chunks = [ [ (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) for n in xrange( 50 ) ] for c in xrange( 4 ) ]
+
+		serial = resolveVertWeightsParallel( chunks, savedData, 2, True, processes=1 )
+		parallel = resolveVertWeightsParallel( chunks, savedData, 2, True, processes=2 )
+		self.assertEqual( len( parallel ), len( chunks ) )
+		for serialChunk, parallelChunk in zip( serial, parallel ):
+			self.assertWeightsEqual( parallelChunk, [ dict( jw ) for jw in serialChunk ] )
+	def testCombine( self ):
+		meshA = buildSavedData( 20, 4 )
+		meshB = buildSavedData( 30, 5 )
+		combined = MeshWeightData.Combine( [ meshA, meshB ] )
+		self.assertEqual( len( combined ), 50 )
+		self.assertEqual( len( combined.offsets ), 51 )
+		self.assertEqual( combined.offsets[ -1 ], len( combined.jointIndices ) )
+
+		verts = list( combined.iterVerts() )
+		self.assertEqual( list( verts[ 20 ][ 2 ] ), list( meshB.jointIndices[ meshB.offsets[0]:meshB.offsets[1] ] ) )
+
+
+class TestSparseWeights(TestCase):
+	def runTest( self ):
+		self.testOperations()
+		self.testRegather()
+	def testOperations( self ):
+		rows = [ ([0, 1, 0], [0.2, 0.3, 0.1]),
+		         ([2], [0.5]),
+		         ([0, 1, 2, 3, 4], [0.5, 0.2, 0.15, 0.1, 0.05]),
+		         ([3, 4], [0.001, 0.002]) ]
+
+		weights = SparseWeights.FromRows( rows )
+		original = weights.copy()
+		weights.mergeDuplicates().prune( 0.01 ).clampInfluenceCount( 3 ).normalize()
+
+		result = [ dict( row ) for row in weights.toRows() ]
+		expected = [ {0: 0.3 / 0.6, 1: 0.3 / 0.6},
+		             {2: 1},
+		             {0: 0.5 / 0.85, 1: 0.2 / 0.85, 2: 0.15 / 0.85},
+		             {4: 1} ]  #every weight is below the prune value so the largest is kept
+
+		for resultDict, expectedDict in zip( result, expected ):
+			self.assertEqual( sorted( resultDict.keys() ), sorted( expectedDict.keys() ) )
+			for joint, weight in expectedDict.iteritems():
+				self.assertAlmostEqual( resultDict[ joint ], weight )
+
+		self.assertEqual( weights.getChangedRows( original ), [ 0, 1, 2, 3 ] )
+		self.assertEqual( weights.getChangedRows( weights.copy() ), [] )
+	def testRegather( self ):
+		joints, weights = regatherWeights( [ 'spine', 'arm_L', 'spine', 'root' ], [ 0.1, 0.2, 0.3, 0.4 ] )
+		self.assertEqual( joints, [ 'spine', 'arm_L', 'root' ] )
+		for weight, expected in zip( weights, [ 0.4, 0.2, 0.4 ] ):
+			self.assertAlmostEqual( weight, expected )
+
+		#remapping two joints to the same name on a vert should merge their weights
+		vert = VertSkinWeight( (0, 0, 0) )
+		vert.populate( 'mesh', 0, [ 'arm_L', 'hand_L', 'root' ], [ 0.25, 0.25, 0.5 ] )
+		VertSkinWeight.JOINT_NAME_REMAP_DICT = { 'hand_L': 'arm_L' }
+		try:
+			self.assertEqual( vert.joints, [ 'arm_L', 'root' ] )
+			self.assertEqual( vert.weights, [ 0.5, 0.5 ] )
+		finally:
+			VertSkinWeight.JOINT_NAME_REMAP_DICT = None
+
+
+class TestMirroredResolve(TestCase):
+	def runTest( self ):
+		self.testMirroredPositions()
+		self.testParitySwap()
+	def testMirroredPositions( self ):
+		savedData = buildSavedData()
+		rand = random.Random( 6 )
+		targets = [ (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) for n in xrange( 200 ) ]
+
+		for axisMult in ((-1, 1, 1), (1, -1, 1), (-1, 1, -1)):
+
+			#this is what loadWeights used to do - flip the saved positions and then query
+			flipped = MeshWeightData.Combine( [ savedData ] )
+			for n, mult in enumerate( axisMult ):
+				for i in xrange( n, len( flipped.positions ), 3 ): flipped.positions[ i ] *= mult
+
+			for averageVerts in (True, False):
+				expected = resolveVertWeights( targets, flipped, 2, averageVerts )
+				mirrored = resolveVertWeights( targets, savedData, 2, averageVerts, axisMult=axisMult )
+				self.assertEqual( len( mirrored ), len( expected ) )
+				for mirroredRow, expectedRow in zip( mirrored, expected ):
+					self.assertEqual( sorted( dict( mirroredRow ).keys() ), sorted( dict( expectedRow ).keys() ) )
+					for joint, weight in expectedRow:
+						self.assertAlmostEqual( dict( mirroredRow )[ joint ], weight )
+	def testParitySwap( self ):
+		joints = { 0: 'root', 1: 'spine', 2: 'arm_L', 3: 'ns:hand_R', 4: 'leg_left' }
+		jointHierarchies = { 0: [], 1: [ 'root' ], 2: [ 'spine', 'root' ], 3: [ 'arm_R', 'spine', 'root' ], 4: [ 'root' ] }
+
+		swappedJoints, swappedHierarchies = swapJointParity( joints, jointHierarchies )
+		for n, j in joints.iteritems():
+			self.assertEqual( swappedJoints[ n ], str( names.Name( j ).swap_parity() ) )
+			self.assertEqual( swappedHierarchies[ n ], [ str( names.Name( p ).swap_parity() ) for p in jointHierarchies[ n ] ] )
+
+		#make sure the originals weren't modified and the cached results are the same
+		self.assertEqual( joints[ 2 ], 'arm_L' )
+		self.assertEqual( swapJointParity( joints, jointHierarchies ), (swappedJoints, swappedHierarchies) )
+
+
+class FakeSkinCluster(SkinWeightWriter):
+	'''
+	records the calls made by writeWeightsById and stores the written weights per vert
+	'''
+	def __init__( self, influences ):
+		self.influences = list( influences )
+		self.vertWeights = {}
+		self.setWeightsCalls = 0
+	def getInfluences( self ):
+		return list( self.influences )
+	def addInfluences( self, influences ):
+		self.influences += influences
+	def setWeights( self, vertIndices, influenceIndices, weights ):
+		self.setWeightsCalls += 1
+		assert len( weights ) == len( vertIndices ) * len( influenceIndices )
+		for n, vertIdx in enumerate( vertIndices ):
+			values = weights[ n*len( influenceIndices ):(n+1)*len( influenceIndices ) ]
+			self.vertWeights[ vertIdx ] = dict( [ (self.influences[ i ], w) for i, w in zip( influenceIndices, values ) if w ] )
+
+
+class TestWriteWeightsById(TestCase):
+	def runTest( self ):
+		self.testRestore()
+		self.testJointRemap()
+	def testRestore( self ):
+		savedData = buildSavedData( 200 )
+		jointRemap = dict( [ (n, 'joint%d' % n) for n in range( 8 ) ] )
+		skinCluster = FakeSkinCluster( [ 'joint0', 'joint1', 'otherJoint' ] )
+		skinCluster.vertWeights[ 3 ] = { 'otherJoint': 1 }
+
+		#ask for verts that don't exist in the saved data as well
+		missing = writeWeightsById( skinCluster, range( 190, 210 ) + range( 10 ), savedData, jointRemap )
+		self.assertEqual( missing, range( 200, 210 ) )
+		self.assertEqual( skinCluster.setWeightsCalls, 1 )
+
+		#joints that weren't influences should have been added
+		self.assertEqual( sorted( skinCluster.influences ), sorted( jointRemap.values() + [ 'otherJoint' ] ) )
+
+		for vertIdx, pos, jointIndices, weights in savedData.iterVerts():
+			if vertIdx not in range( 190, 200 ) + range( 10 ):
+				self.assertFalse( vertIdx in skinCluster.vertWeights )
+				continue
+
+			written = skinCluster.vertWeights[ vertIdx ]
+			self.assertEqual( sorted( written.keys() ), sorted( [ jointRemap[ j ] for j in jointIndices ] ) )
+			for j, w in zip( jointIndices, weights ):
+				self.assertAlmostEqual( written[ jointRemap[ j ] ], w, 5 )
+	def testJointRemap( self ):
+		savedData = MeshWeightData( 'savedMesh' )
+		savedData.append( 0, (0, 0, 0), [0, 1, 2], [0.5, 0.25, 0.25] )
+		savedData.append( 1, (1, 0, 0), [2], [1] )
+		savedData.append( 2, (2, 0, 0), [1, 0], [0.5, 0.5] )
+
+		#joints 0 and 1 map to the same joint and joint 2 is missing from the scene
+		skinCluster = FakeSkinCluster( [ 'root' ] )
+		missing = writeWeightsById( skinCluster, [ 0, 1, 2 ], savedData, { 0: 'root', 1: 'root' } )
+
+		#vert 1 has no weights left so it can't be restored
+		self.assertEqual( missing, [ 1 ] )
+		self.assertEqual( skinCluster.vertWeights, { 0: { 'root': 1 }, 2: { 'root': 1 } } )
+
+
+class TestWeightSaveCache(TestCase):
+	def runTest( self ):
+		self.testDenseWeights()
+		self.testCache()
+	def testDenseWeights( self ):
+		positions = [ 0, 0, 0, 1, 1, 1 ]
+		weights = [ 0.5, 0.5, 0,
+		            0.00001, 0, 0.00002 ]
+		meshData = MeshWeightData.FromDenseWeights( 'mesh', positions, weights, [ 4, 5, 6 ] )
+		verts = list( meshData.iterVerts() )
+		self.assertEqual( list( verts[ 0 ][ 2 ] ), [ 4, 5 ] )
+
+		#every weight is below the minimum so the largest is kept
+		self.assertEqual( list( verts[ 1 ][ 2 ] ), [ 6 ] )
+	def testCache( self ):
+		rand = random.Random( 7 )
+
+		#each mesh stores its influences, dense weights and positions.  the weight digest is built from the weights
+		#themselves - like skinWeights.getWeightDigest does from the weightList plug - so it persists across saves
+		meshes = {}
+		for mesh, influences in (('meshA', [ 'root', 'spine' ]), ('meshB', [ 'spine', 'arm_L', 'arm_R' ])):
+			positions = [ rand.uniform( -10, 10 ) for n in xrange( 30 ) ]
+			weights = [ rand.random() for n in xrange( 10 * len( influences ) ) ]
+			meshes[ mesh ] = influences, weights, positions
+
+		def getWeightDigest( weights, positions ):
+			return hashlib.md5( array( 'd', weights + positions ).tostring() ).hexdigest()
+
+		gathered = []
+		def save( filepath, meshes ):
+			jointIndices = {}
+			for mesh in sorted( meshes ):
+				for j in meshes[ mesh ][ 0 ]:
+					jointIndices.setdefault( j, len( jointIndices ) )
+
+			fingerprints = dict( [ (mesh, getMeshFingerprint( len( positions ) / 3, influences, getWeightDigest( weights, positions ) )) for mesh, (influences, weights, positions) in meshes.iteritems() ] )
+			cached = getCachedMeshData( filepath, fingerprints, jointIndices )
+			meshDataList = []
+			del gathered[ : ]
+			for mesh in sorted( meshes ):
+				if mesh in cached:
+					meshDataList.append( cached[ mesh ] )
+					continue
+
+				#only meshes that aren't cached should have their dense data looked at
+				gathered.append( mesh )
+				influences, weights, positions = meshes[ mesh ]
+				meshDataList.append( MeshWeightData.FromDenseWeights( mesh, positions, weights, [ jointIndices[ j ] for j in influences ] ) )
+
+			joints = dict( [ (n, j) for j, n in jointIndices.iteritems() ] )
+			writeWeightFile( filepath, {}, joints, dict( [ (n, []) for n in joints ] ), meshDataList, fingerprints=fingerprints )
+
+			return cached
+
+		fd, filepath = tempfile.mkstemp( '.weights' )
+		os.close( fd )
+		os.remove( filepath )
+		try:
+			self.assertEqual( save( filepath, meshes ), {} )
+			self.assertEqual( gathered, [ 'meshA', 'meshB' ] )
+
+			#nothing changed so both meshes should come from the cache
+			self.assertEqual( sorted( save( filepath, meshes ) ), [ 'meshA', 'meshB' ] )
+			self.assertEqual( gathered, [] )
+
+			#change a weight on meshB
+			meshes[ 'meshB' ][ 1 ][ 0 ] += 0.1
+			self.assertEqual( sorted( save( filepath, meshes ) ), [ 'meshA' ] )
+			self.assertEqual( gathered, [ 'meshB' ] )
+
+			#add an influence to meshA - this inserts a zero weight column for every vert, and changes the joint indices
+			#meshB is stored with, so the cached meshB data has to be re-mapped
+			influences, weights, positions = meshes[ 'meshA' ]
+			newWeights = []
+			for n in xrange( len( positions ) / 3 ):
+				root, spine = weights[ n*2:n*2+2 ]
+				newWeights += [ root, 0, spine ]
+
+			meshes[ 'meshA' ] = [ 'root', 'hip', 'spine' ], newWeights, positions
+			self.assertEqual( sorted( save( filepath, meshes ) ), [ 'meshB' ] )
+			self.assertEqual( gathered, [ 'meshA' ] )
+
+			#the re-used meshB data and the re-gathered meshA data should refer to the right joints by name
+			saved = WeightFile( filepath )
+			self.assertEqual( saved.joints, { 0: 'root', 1: 'hip', 2: 'spine', 3: 'arm_L', 4: 'arm_R' } )
+			for mesh in ('meshA', 'meshB'):
+				influences, weights, positions = meshes[ mesh ]
+				expected = MeshWeightData.FromDenseWeights( mesh, positions, weights, range( len( influences ) ) )
+				savedMeshData = saved.getMeshData( mesh )
+				self.assertEqual( [ saved.joints[ j ] for j in savedMeshData.jointIndices ], [ influences[ j ] for j in expected.jointIndices ] )
+				self.assertEqual( list( savedMeshData.weights ), list( expected.weights ) )
+
+			#the zero weight hip column shouldn't have been stored
+			self.assertFalse( 1 in saved.getMeshData( 'meshA' ).jointIndices )
+		finally:
+			if os.path.exists( filepath ):
+				os.remove( filepath )
+
+
+def getTempWeightFilepath():
+	fd, filepath = tempfile.mkstemp( '.weights' )
+	os.close( fd )
+
+	return filepath
+
+
+class TestWeightFile(TestCase):
+	def runTest( self ):
+		self.testRoundTrip()
+		self.testLegacyFile()
+		self.testVersion1File()
+	def assertMeshDataEqual( self, meshData, expected ):
+		for attr, typecode in MeshWeightData.ARRAYS:
+			self.assertEqual( getattr( meshData, attr ).typecode, typecode )
+			self.assertEqual( list( getattr( meshData, attr ) ), list( getattr( expected, attr ) ) )
+	def testRoundTrip( self ):
+		meshA = buildSavedData( 40, 8 )
+		meshA.mesh = 'meshA'
+		meshB = buildSavedData( 25, 9 )
+		meshB.mesh = 'meshB'
+
+		miscData = { 'scene': 'test.ma' }
+		joints = dict( [ (n, 'joint%d' % n) for n in range( 8 ) ] )
+		jointHierarchies = dict( [ (n, [ 'joint%d' % p for p in range( n ) ]) for n in range( 8 ) ] )
+
+		filepath = getTempWeightFilepath()
+		try:
+			writeWeightFile( filepath, miscData, joints, jointHierarchies, [ meshA, meshB ], fingerprints={ 'meshA': 'abc' } )
+			self.assertTrue( isColumnarWeightFile( filepath ) )
+
+			weightFile = loadWeightSaveData( filepath )
+			self.assertTrue( isinstance( weightFile, WeightFile ) )
+			self.assertEqual( weightFile.miscData, miscData )
+			self.assertEqual( weightFile.joints, joints )
+			self.assertEqual( weightFile.jointHierarchies, jointHierarchies )
+			self.assertEqual( weightFile.getMeshNames(), [ 'meshA', 'meshB' ] )
+			self.assertEqual( weightFile.getVertCount(), 65 )
+			self.assertEqual( weightFile.getVertCount( 'meshB' ), 25 )
+			self.assertEqual( weightFile.getFingerprint( 'meshA' ), 'abc' )
+			self.assertEqual( weightFile.getFingerprint( 'meshB' ), None )
+
+			#reading a single mesh shouldn't read any of the others - and the data should come back exactly as it was written
+			self.assertMeshDataEqual( weightFile.getMeshData( 'meshB' ), meshB )
+			self.assertEqual( weightFile._meshDataCache.keys(), [ 'meshB' ] )
+			self.assertMeshDataEqual( weightFile.getMeshData( 'meshA' ), meshA )
+
+			#the old tuple interface should still work
+			storedMisc, storedJoints, storedHierarchies, weightData = weightFile
+			self.assertEqual( len( weightData ), 65 )
+			self.assertEqual( list( weightData[ 0 ] ), list( meshA.positions[ :3 ] ) )
+			self.assertEqual( weightData[ 0 ].weights, tuple( meshA.weights[ :meshA.offsets[ 1 ] ] ) )
+
+			self.assertMeshDataEqual( weightFile.getCombinedMeshData( [ 'meshB' ] ), meshB )
+			self.assertRaises( SkinWeightException, weightFile.getMeshData, 'meshC' )
+		finally:
+			os.remove( filepath )
+	def testLegacyFile( self ):
+		savedData = buildSavedData( 30, 10 )
+		savedData.mesh = 'legacyMesh'
+		joints = dict( [ (n, 'joint%d' % n) for n in range( 8 ) ] )
+		weightData = savedData.getVertSkinWeights( MayaVertSkinWeight )
+
+		filepath = getTempWeightFilepath()
+		try:
+			Path( filepath ).pickle( ({ 'scene': 'old.ma' }, joints, {}, weightData) )
+			self.assertFalse( isColumnarWeightFile( filepath ) )
+
+			loaded = loadWeightSaveData( filepath )
+			self.assertTrue( isinstance( loaded, WeightSaveData ) )
+			self.assertEqual( loaded.miscData, { 'scene': 'old.ma' } )
+			self.assertEqual( loaded.joints, joints )
+			self.assertEqual( loaded.getUsedMeshes(), set( [ 'legacyMesh' ] ) )
+			self.assertEqual( loaded.getWeightData()[ 3 ].getVertName(), 'legacyMesh.vtx[3]' )
+			self.assertMeshDataEqual( loaded.getCombinedMeshData(), savedData )
+		finally:
+			os.remove( filepath )
+	def testVersion1File( self ):
+		savedData = buildSavedData( 30, 11 )
+		savedData.mesh = 'oldMesh'
+
+		#version 1 files stored positions and weights as floats
+		v1Arrays = skinWeightsBase._FILE_ARRAYS[ 1 ]
+		floatData = MeshWeightData( 'oldMesh', *[ array( typecode, getattr( savedData, attr ) ) for attr, typecode in v1Arrays ] )
+
+		filepath = getTempWeightFilepath()
+		try:
+			skinWeightsBase.WEIGHT_FILE_VERSION = 1
+			MeshWeightData.ARRAYS = v1Arrays
+			try:
+				writeWeightFile( filepath, {}, { 0: 'joint0' }, { 0: [] }, [ floatData ] )
+			finally:
+				skinWeightsBase.WEIGHT_FILE_VERSION = 2
+				MeshWeightData.ARRAYS = skinWeightsBase._FILE_ARRAYS[ 2 ]
+
+			weightFile = WeightFile( filepath )
+			self.assertEqual( weightFile.version, 1 )
+
+			#the data should be converted to the current typecodes, and only accurate to float precision
+			meshData = weightFile.getMeshData( 'oldMesh' )
+			for attr, typecode in MeshWeightData.ARRAYS:
+				self.assertEqual( getattr( meshData, attr ).typecode, typecode )
+
+			self.assertEqual( list( meshData.offsets ), list( savedData.offsets ) )
+			for a, b in zip( meshData.positions, savedData.positions ): self.assertAlmostEqual( a, b, 5 )
+			for a, b in zip( meshData.weights, savedData.weights ): self.assertAlmostEqual( a, b, 6 )
+
+			#and the converted data should combine with current data
+			self.assertEqual( len( MeshWeightData.Combine( [ meshData, savedData ] ) ), 60 )
+		finally:
+			os.remove( filepath )
+
+
+class TestWeightSummary(TestCase):
+	def runTest( self ):
+		self.testSummary()
+		self.testMain()
+	def tearDown( self ):
+		shutil.rmtree( self.directory )
+	def setUp( self ):
+		self.directory = tempfile.mkdtemp()
+		joints = dict( [ (n, 'joint%d' % n) for n in range( 10 ) ] )
+		hierarchies = dict( [ (n, []) for n in joints ] )
+
+		#a and b only ever use joints 0-7 - see buildSavedData
+		meshA = buildSavedData( 20, 12 )
+		meshA.mesh = 'meshA'
+		meshB = buildSavedData( 15, 13 )
+		meshB.mesh = 'meshB'
+		self.expectedJoints = sorted( meshA.getUsedJointIndices() | meshB.getUsedJointIndices() )
+
+		self.first = os.path.join( self.directory, 'first.weights' )
+		self.second = os.path.join( self.directory, 'second.weights' )
+		self.nested = os.path.join( self.directory, 'sub', 'nested.weights' )
+		writeWeightFile( self.first, {}, joints, hierarchies, [ meshA, meshB ] )
+		writeWeightFile( self.second, {}, joints, hierarchies, [ meshB ] )
+		writeWeightFile( self.nested, {}, joints, hierarchies, [ meshA ] )
+
+		#files without the weights extension should be ignored, broken weight files reported as unreadable
+		open( os.path.join( self.directory, 'notes.txt' ), 'w' ).write( 'not a weight file' )
+		self.broken = os.path.join( self.directory, 'broken.weights' )
+		open( self.broken, 'w' ).write( 'not a weight file either' )
+	def testSummary( self ):
+		for processes in (1, 2):
+			results = summarizeWeightFiles( self.directory, processes=processes )
+			self.assertEqual( [ os.path.normcase( os.path.abspath( f ) ) for f, s in results ],
+			                  sorted( [ os.path.normcase( os.path.abspath( f ) ) for f in (self.broken, self.first, self.second) ] ) )
+
+			summaries = dict( [ (os.path.basename( f ), s) for f, s in results ] )
+			self.assertEqual( summaries[ 'broken.weights' ], None )
+
+			summary = summaries[ 'first.weights' ]
+			self.assertEqual( summary[ 'meshVertCounts' ], { 'meshA': 20, 'meshB': 15 } )
+			self.assertEqual( summary[ 'vertCount' ], 35 )
+			self.assertEqual( summary[ 'usedJoints' ], self.expectedJoints )
+			self.assertEqual( len( summary[ 'joints' ] ), 10 )
+			self.assertEqual( sum( summary[ 'influenceHistogram' ].values() ), 35 )
+			self.assertEqual( summaries[ 'second.weights' ][ 'meshVertCounts' ], { 'meshB': 15 } )
+
+			recursive = summarizeWeightFiles( self.directory, recursive=True, processes=processes )
+			self.assertEqual( len( recursive ), 4 )
+			self.assertTrue( 'nested.weights' in [ os.path.basename( f ) for f, s in recursive ] )
+
+		#summarizing a single file should match the summary stored in the header
+		self.assertEqual( summarizeWeightFile( self.first )[ 1 ], WeightFile( self.first ).getSummary() )
+	def runMain( self, argv ):
+		stdout = sys.stdout
+		sys.stdout = output = StringIO()
+		try:
+			main( argv )
+		finally:
+			sys.stdout = stdout
+
+		return output.getvalue()
+	def testMain( self ):
+		output = self.runMain( [ self.first ] )
+		self.assertTrue( output.startswith( '%s: 35 verts, 2 meshes, %d of 10 joints used' % (self.first, len( self.expectedJoints )) ) )
+		self.assertTrue( '  mesh meshA: 20 verts' in output )
+		self.assertTrue( '  mesh meshB: 15 verts' in output )
+
+		for argv in ([ self.directory ], [ '-p', '1', self.directory ], [ '--processes', '2', self.directory ]):
+			output = self.runMain( argv )
+			self.assertTrue( 'broken.weights: unreadable' in output )
+			self.assertEqual( output.count( 'verts, ' ), 2 )
+
+		output = self.runMain( [ '-r', '-p', '2', self.directory ] )
+		self.assertEqual( output.count( 'verts, ' ), 3 )
+
+		#no arguments is an error
+		stderr = sys.stderr
+		sys.stderr = StringIO()
+		try:
+			self.assertRaises( SystemExit, self.runMain, [] )
+		finally:
+			sys.stderr = stderr
+
+
+#end
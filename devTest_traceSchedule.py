@@ -0,0 +1,137 @@
+from unittest import TestCase
+from traceSchedule import *
+
+__all__ = [ 'TestTraceSchedule', 'TestMotionKeyTimes' ]
+
+
+class FakeSceneCmds(object):
+	'''
+	a stand in for the parts of maya.cmds the motion key time functions use.  nodes is a list of long node names,
+	connections is a list of (dstPlug, srcPlug) tuples, nodeTypes maps non transform nodes to their type, curveTimes
+	maps curves to their key times and ikJoints maps ikHandles to the joints they drive
+	'''
+	def __init__( self, nodes, connections=(), nodeTypes=None, curveTimes=None, ikJoints=None ):
+		self.nodes = nodes
+		self.connections = list( connections )
+		self.nodeTypes = nodeTypes or {}
+		self.curveTimes = curveTimes or {}
+		self.ikJoints = ikJoints or {}
+	def _longName( self, node ):
+		for longName in self.nodes:
+			if longName == node or longName.endswith( '|' + node ):
+				return longName
+
+		return node
+	def ls( self, nodes=None, l=False, type=None ):
+		if type is not None:
+			return [ n for n, t in self.nodeTypes.iteritems() if t == type ]
+
+		if isinstance( nodes, basestring ):
+			nodes = [ nodes ]
+
+		return [ self._longName( n ) for n in nodes ]
+	def ikHandle( self, handle, q=True, jointList=True ):
+		return self.ikJoints[ handle ]
+	def nodeType( self, node ):
+		return self.nodeTypes.get( node, 'transform' )
+	def listConnections( self, plug, s=True, d=False, c=False, p=False ):
+		results = []
+		for dstPlug, srcPlug in self.connections:
+			if dstPlug.split( '.' )[ 0 ] == plug or dstPlug == plug:
+				results += [ dstPlug, srcPlug ] if c else [ srcPlug if p else srcPlug.split( '.' )[ 0 ] ]
+
+		return results or None
+	def keyframe( self, curves, q=True ):
+		times = []
+		for curve in curves:
+			times += self.curveTimes[ curve ]
+
+		return times or None
+
+
+def buildFakeScene():
+	nodes = [ '|root', '|root|hip', '|root|hip|knee', '|root|spine', '|root|spine|arm', '|root|spine|sdk', '|root|spine|warped',
+	          '|root|spine|custom', '|tgtRoot', '|tgtRoot|tgt', '|rig', '|rig|tgtB', '|still', '|stillTgt' ]
+
+	connections = [ ('|root.translateX', 'root_tx.output'),
+	                ('|root|spine.rotateY', 'spine_ry.output'),
+	                ('|root|spine|arm.rotateX', 'arm_parentConstraint1.constraintRotateX'),
+	                ('|root|spine|sdk.rotateX', 'sdk_rx.output'),
+	                ('|root|spine|warped.translateY', 'warped_ty.output'),
+	                ('warped_ty.input', 'timeWarp.output'),
+	                ('|root|spine|custom.blend', 'custom_blend.output'),
+	                ('|root|spine|custom.translateZ', 'custom_tz.output'),
+	                ('|tgtRoot.rotateZ', 'tgtRoot_rz.output'),
+	                ('|rig.translateX', 'rig_pointConstraint1.constraintTranslateX') ]
+
+	nodeTypes = { 'root_tx': 'animCurveTL', 'spine_ry': 'animCurveTA', 'arm_parentConstraint1': 'parentConstraint',
+	              'sdk_rx': 'animCurveUA', 'warped_ty': 'animCurveTL', 'timeWarp': 'animCurveTT', 'custom_blend': 'animCurveTU',
+	              'custom_tz': 'animCurveTL', 'tgtRoot_rz': 'animCurveTA', 'rig_pointConstraint1': 'pointConstraint',
+	              'legIk': 'ikHandle' }
+
+	curveTimes = { 'root_tx': [ 0, 50 ], 'spine_ry': [ 10, 20 ], 'sdk_rx': [ 0.5, 1.0 ], 'warped_ty': [ 1, 2 ],
+	               'custom_blend': [ 99 ], 'custom_tz': [ 12, 20 ], 'tgtRoot_rz': [ 5, 70 ], 'timeWarp': [ 0, 100 ] }
+
+	return FakeSceneCmds( nodes, connections, nodeTypes, curveTimes, { 'legIk': [ 'hip', 'knee' ] } )
+
+
+class TestTraceSchedule(TestCase):
+	def runTest( self ):
+
+		#fractional skips shouldn't drift and the end is inclusive
+		self.assertEqual( getSampleTimes( 0, 2, 0.5 ), [ 0, 0.5, 1, 1.5, 2 ] )
+		self.assertEqual( len( getSampleTimes( 0, 100, 0.1 ) ), 1001 )
+		self.assertEqual( getSampleTimes( 0, 5, 2 ), [ 0, 2, 4 ] )
+		self.assertRaises( ValueError, getSampleTimes, 0, 5, 0 )
+
+		#keys only - each pair gets its own keys, and the parent (pair 0) gets its child's keys too
+		schedule = FrameSchedule( [ [ 0, 10 ], [ 5 ], [ 20, 30 ] ], None, [ None, 0, None ] )
+		self.assertEqual( schedule.times, [ 0, 5, 10, 20, 30 ] )
+		self.assertEqual( schedule.pairTimes, [ [ 0, 5, 10 ], [ 5 ], [ 20, 30 ] ] )
+		self.assertEqual( schedule.getPairsAtTimes()[ 5 ], [ 0, 1 ] )
+		self.assertEqual( schedule.getEvaluationCount(), 6 )
+		self.assertEqual( schedule.getSavedCount(), 15 - 6 )
+
+		#baking - pairs are sampled over the samples covering their keys, unkeyed pairs once and unknown pairs everywhere
+		samples = getSampleTimes( 0, 10, 2 )
+		schedule = FrameSchedule( [ [ 3, 5 ], [], None ], samples )
+		self.assertEqual( schedule.pairTimes, [ [ 2, 4, 6 ], [ 0 ], samples ] )
+		self.assertEqual( schedule.times, samples )
+
+		#baking - a child moves whenever its traced parent does, so it gets sampled over its parent's keys too
+		schedule = FrameSchedule( [ [ 7 ], [], [ 3 ], None, [] ], samples, [ None, 0, None, None, 3 ] )
+		self.assertEqual( schedule.pairTimes, [ [ 6, 8 ], [ 6, 8 ], [ 2, 4 ], samples, samples ] )
+
+		#and the parents still get their children's times
+		schedule = FrameSchedule( [ [ 7 ], [], [ 3 ] ], samples, [ None, 0, 1 ] )
+		self.assertEqual( schedule.pairTimes, [ [ 2, 4, 6, 8 ] ] * 3 )
+
+
+class TestMotionKeyTimes(TestCase):
+	def runTest( self ):
+		cmds = buildFakeScene()
+		ikJoints = getIkDrivenJoints( cmds )
+		self.assertEqual( ikJoints, set( [ '|root|hip', '|root|hip|knee' ] ) )
+
+		#keys on the src, its parents and the tgt's (untraced) parents are all included
+		self.assertEqual( getMotionKeyTimes( 'spine', 'tgt', cmds, ikJoints ), [ 0, 5, 10, 20, 50, 70 ] )
+		self.assertEqual( getMotionKeyTimes( 'spine', 'stillTgt', cmds, ikJoints ), [ 0, 10, 20, 50 ] )
+		self.assertEqual( getMotionKeyTimes( 'still', 'stillTgt', cmds, ikJoints ), [] )
+
+		#only time based curves on transform attributes count - keys on other attributes don't move the node
+		self.assertEqual( getMotionKeyTimes( 'custom', 'stillTgt', cmds, ikJoints ), [ 0, 10, 12, 20, 50 ] )
+
+		#ik driven joints have no connections but still move - and so does everything below them
+		self.assertEqual( getMotionKeyTimes( 'knee', 'stillTgt', cmds, ikJoints ), None )
+		self.assertEqual( getMotionKeyTimes( 'hip', 'stillTgt', cmds, ikJoints ), None )
+
+		#constrained nodes, set driven keys and curves that aren't driven by time can't be worked out from keys
+		self.assertEqual( getMotionKeyTimes( 'arm', 'stillTgt', cmds, ikJoints ), None )
+		self.assertEqual( getMotionKeyTimes( 'sdk', 'stillTgt', cmds, ikJoints ), None )
+		self.assertEqual( getMotionKeyTimes( 'warped', 'stillTgt', cmds, ikJoints ), None )
+
+		#neither can a tgt whose parent is constrained
+		self.assertEqual( getMotionKeyTimes( 'spine', 'tgtB', cmds, ikJoints ), None )
+
+
+#end
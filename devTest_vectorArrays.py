@@ -0,0 +1,126 @@
+
+from unittest import TestCase
+from vectors import *
+from vectorArrays import *
+
+import random
+
+__all__ = [ 'TestVectorArrays' ]
+
+
+def buildTransforms( count, seed=0, scale=False ):
+	rand = random.Random( seed )
+	matrices = []
+	for n in xrange( count ):
+		matrix = Matrix.FromEulerXYZ( rand.uniform( -3, 3 ), rand.uniform( -1.5, 1.5 ), rand.uniform( -3, 3 ) ).expand( 4 )
+		if scale:
+			for row in matrix[ :3 ]:
+				factor = rand.uniform( 0.5, 2 )
+				row[ :3 ] = [ v * factor for v in row[ :3 ] ]
+
+		matrix.set_position( (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) )
+		matrices.append( matrix )
+
+	return matrices
+
+
+class TestVectorArrays(TestCase):
+	def runTest( self ):
+		self.testVectors()
+		self.testInverse()
+		self.testDecompose()
+		self.testEuler()
+		self.testQuaternions()
+	def assertValuesEqual( self, valuesA, valuesB, places=6 ):
+		self.assertEqual( len( valuesA ), len( valuesB ) )
+		for a, b in zip( valuesA, valuesB ):
+			self.assertAlmostEqual( a, b, places )
+	def testVectors( self ):
+		rand = random.Random( 1 )
+		vectors = [ Vector.Random( 3, (-5, 5) ) for n in xrange( 50 ) ]
+		others = [ Vector.Random( 3, (-5, 5) ) for n in xrange( 50 ) ]
+		matrices = buildTransforms( 50, 2, True )
+		vectorArray, otherArray = VectorArray.FromVectors( vectors ), VectorArray.FromVectors( others )
+
+		self.assertEqual( vectorArray.toVectors(), vectors )
+		self.assertEqual( (vectorArray + otherArray).toVectors(), [ a + b for a, b in zip( vectors, others ) ] )
+		self.assertEqual( (vectorArray - others[ 0 ]).toVectors(), [ a - others[ 0 ] for a in vectors ] )
+		self.assertValuesEqual( vectorArray.dot( otherArray ), [ a.dot( b ) for a, b in zip( vectors, others ) ] )
+		self.assertEqual( vectorArray.cross( otherArray ).toVectors(), [ a.cross( b ) for a, b in zip( vectors, others ) ] )
+		self.assertEqual( vectorArray.normalize().toVectors(), [ v.normalize() for v in vectors ] )
+
+		matrixArray = MatrixArray.FromMatrices( matrices )
+		self.assertEqual( vectorArray.transformVectors( matrixArray ).toVectors(), [ v * m for v, m in zip( vectors, matrices ) ] )
+		self.assertEqual( vectorArray.transformPoints( matrixArray ).toVectors(), [ Vector( (v * m) + m.get_position() ) for v, m in zip( vectors, matrices ) ] )
+	def testInverse( self ):
+		matrices = buildTransforms( 20, 3, True )
+
+		#throw in some non-affine matrices and a singular one
+		rand = random.Random( 4 )
+		matrices += [ Matrix.Random( 4, (-2, 2) ) for n in xrange( 10 ) ]
+		matrices.append( Matrix.Zero( 4 ) )
+
+		matrixArray = MatrixArray.FromMatrices( matrices )
+		inverses = matrixArray.inverse()
+		for matrix, inverse in zip( matrices, inverses ):
+			self.assertTrue( inverse.isEqual( matrix.inverse(), 1e-6 ) )
+
+		self.assertValuesEqual( matrixArray.determinants(), [ m.det() for m in matrices ] )
+	def testDecompose( self ):
+		matrices = buildTransforms( 20, 5, True )
+		translations, rotations, scales = MatrixArray.FromMatrices( matrices ).decompose()
+		for matrix, translation, rotation, scale in zip( matrices, translations, rotations, scales ):
+			R, S = matrix.decompose()
+			self.assertEqual( translation, matrix.get_position() )
+			self.assertEqual( scale, S.getDiag() )
+			self.assertTrue( rotation.crop( 3 ).isEqual( R ) )
+
+		rebuilt = MatrixArray.FromTransforms( translations, rotations, scales )
+		self.assertValuesEqual( rebuilt.values, MatrixArray.FromMatrices( matrices ).values )
+	def testEuler( self ):
+		rand = random.Random( 6 )
+		angles = [ Vector( (rand.uniform( -3, 3 ), rand.uniform( -1.5, 1.5 ), rand.uniform( -3, 3 )) ) for n in xrange( 30 ) ]
+		angleArray = VectorArray.FromVectors( angles )
+		for order in EULER_ORDERS:
+			matrices = [ getattr( Matrix, 'FromEuler%s' % order )( *a ) for a in angles ]
+			matrixArray = MatrixArray.FromEuler( angleArray, order )
+			for matrix, batchMatrix in zip( matrices, matrixArray ):
+				self.assertTrue( batchMatrix.crop( 3 ).isEqual( matrix, 1e-9 ) )
+
+			expected = [ getattr( matrix, 'ToEuler%s' % order )() for matrix in matrices ]
+			self.assertValuesEqual( matrixArray.toEuler( order ).values, [ v for a in expected for v in a ] )
+
+			degreeMatrices = MatrixArray.FromEuler( VectorArray( [ math.degrees( v ) for v in angleArray.values ] ), order, True )
+			self.assertValuesEqual( degreeMatrices.values, matrixArray.values )
+			self.assertValuesEqual( matrixArray.toEuler( order, True ).values, [ math.degrees( v ) for a in expected for v in a ] )
+	def testQuaternions( self ):
+		matrices = buildTransforms( 30, 7 )
+		matrixArray = MatrixArray.FromMatrices( matrices )
+		quats = QuaternionArray.FromMatrices( matrixArray )
+
+		#converting back should give the same rotations, and match what Matrix( quaternion ) does
+		for quat, matrix, batchMatrix in zip( quats, matrices, quats.toMatrices() ):
+			self.assertTrue( Matrix( quat ).isEqual( batchMatrix ) )
+			self.assertTrue( batchMatrix.crop( 3 ).isEqual( matrix.crop( 3 ) ) )
+
+		self.assertValuesEqual( quats.multiply( quats ).values, [ v for q in quats for v in q * q ] )
+
+		#slerp end points should give back the inputs, and the result should always be normalized
+		others = QuaternionArray( quats.values[ 4: ] + quats.values[ :4 ] )
+		for t in (0, 1):
+			expected = (quats, others)[ t ]
+			for a, b in zip( quats.slerp( others, t ), expected ):
+				self.assertTrue( a.within( b ) or a.within( b * -1 ) )
+
+		for q in quats.slerp( others, [ n / 30.0 for n in xrange( 30 ) ] ):
+			self.assertAlmostEqual( q.magnitude(), 1 )
+
+		#half way between the identity and a rotation applied twice should give back the rotation
+		halfway = QuaternionArray.Identity( len( quats ) ).slerp( quats, 0.5 )
+		for half, quat in zip( halfway.multiply( halfway ), quats ):
+			self.assertTrue( half.within( quat ) or half.within( quat * -1 ) )
+
+		self.assertValuesEqual( QuaternionArray( [ 0, 0, 2, 0 ] ).normalize().values, [ 0, 0, 1, 0 ] )
+
+
+#end
@@ -0,0 +1,57 @@
+
+from unittest import TestCase
+from vectors import *
+
+import random
+
+__all__ = [ 'TestMatrixInverse' ]
+
+
+class TestMatrixInverse(TestCase):
+	def runTest( self ):
+		self.testDeterminant()
+		self.testInverse()
+		self.testSingular()
+	def buildMatrices( self, seed=0 ):
+		rand = random.Random( seed )
+		matrices = []
+		for n in xrange( 20 ):
+			rigid = Matrix.FromEulerZXY( rand.uniform( -3, 3 ), rand.uniform( -1.5, 1.5 ), rand.uniform( -3, 3 ) ).expand( 4 )
+			rigid.set_position( (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) )
+
+			scaled = rigid.copy()
+			for row in scaled[ :3 ]:
+				row[ :3 ] = [ v * rand.uniform( 0.1, 5 ) for v in row[ :3 ] ]
+
+			general = Matrix( [ rand.uniform( -2, 2 ) for i in xrange( 16 ) ] )
+
+			matrices += [ rigid, scaled, general, general.crop( 3 ), Matrix( [ rand.uniform( -2, 2 ) for i in xrange( 25 ) ], 5 ) ]
+
+		return matrices
+	def testDeterminant( self ):
+		for matrix in self.buildMatrices( 1 ):
+			self.assertAlmostEqual( matrix.det(), matrix.detRecursive() )
+	def testInverse( self ):
+		for matrix in self.buildMatrices( 2 ):
+			inverse = matrix.inverse()
+			self.assertEqual( inverse.size, matrix.size )
+			self.assertEqual( inverse.isAffine(), matrix.isAffine() )
+			self.assertTrue( inverse.isEqual( matrix.inverseRecursive(), 1e-9 ) )
+			self.assertTrue( (matrix * inverse).isEqual( Matrix.Identity( matrix.size ), 1e-9 ) )
+	def testSingular( self ):
+		matrix = Matrix.Identity()
+		matrix[ 2 ] = [ 0, 0, 0, 0 ]
+		self.assertEqual( matrix.inverse(), matrix )
+		self.assertFalse( matrix.inverse() is matrix )
+
+		matrix = Matrix( [ 1, 2, 3, 2, 4, 6, 0, 1, 1 ], 3 )
+		self.assertEqual( matrix.inverse(), matrix )
+
+		matrix = Matrix.Identity()
+		matrix[ 3 ][ 3 ] = 0
+		matrix[ 1 ] = matrix[ 0 ][:]
+		self.assertFalse( matrix.isAffine() )
+		self.assertEqual( matrix.inverse(), matrix )
+
+
+#end
@@ -1,4 +1,6 @@
 
+import os
+import sys
 import inspect
 
 
@@ -36,6 +38,47 @@ def iterBy( iterable, count ):
 			break
 
 
+def createProcessPool( processes=None, initializer=None, initargs=() ):
+	'''
+	returns a multiprocessing.Pool.  when run inside an interactive maya session sys.executable is the maya
+	binary, which can't be used to run worker processes - so point multiprocessing at mayapy instead
+	'''
+	import multiprocessing
+
+	exeDir, exeName = os.path.split( sys.executable )
+	exeName, exeExt = os.path.splitext( exeName )
+	if exeName.lower() in ('maya', 'mayabatch'):
+		mayapy = os.path.join( exeDir, 'mayapy' + exeExt )
+		if os.path.exists( mayapy ):
+			multiprocessing.set_executable( mayapy )
+
+	return multiprocessing.Pool( processes, initializer, initargs )
+
+
+def mapInProcessPool( function, items, processes=None, minItems=2, chunksize=None, initializer=None, initargs=() ):
+	'''
+	maps function over items using a pool of worker processes and returns the list of results in the same order.
+	function must be a module level function so it can be pickled
+
+	processes is the number of worker processes - defaults to the cpu count.  if it is 1, or there are fewer than
+	minItems items, the items are mapped in this process instead - starting worker processes takes a while, so
+	its not worth doing for small amounts of work.  the initializer is run in this process in that case
+	'''
+	items = list( items )
+	if processes == 1 or len( items ) < minItems:
+		if initializer is not None:
+			initializer( *initargs )
+
+		return map( function, items )
+
+	pool = createProcessPool( processes, initializer, initargs )
+	try:
+		return pool.map( function, items, chunksize )
+	finally:
+		pool.close()
+		pool.join()
+
+
 def findMostRecentDefitionOf( variableName ):
 	'''
 	'''
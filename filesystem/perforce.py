@@ -5,8 +5,10 @@ import os
 import re
 import sys
 import time
+import shlex
 import marshal
 import datetime
+import threading
 import subprocess
 import tempfile
 
@@ -37,15 +39,20 @@ class TimedOutP4Operation(Exception): pass
 class P4Exception(Exception): pass
 
 
-def _p4fast( *args ):
-	p = subprocess.Popen( 'p4 -G '+ ' '.join( args ), cwd=getDefaultWorkingDir(), shell=True, stdout=subprocess.PIPE )
-
-	results = []
+def iterMarshalled( stream ):
+	'''
+	yields the dicts written to the given file by p4 -G one at a time as they're read - so long outputs don't need
+	to be read into memory before being parsed
+	'''
 	try:
 		while True:
-			results.append( marshal.loads( p.stdout.read() ) )
+			yield marshal.load( stream )
 	except EOFError: pass
 
+
+def _p4fast( *args ):
+	p = subprocess.Popen( 'p4 -G '+ ' '.join( map( str, args ) ), cwd=getDefaultWorkingDir(), shell=True, stdout=subprocess.PIPE )
+	results = list( iterMarshalled( p.stdout ) )
 	p.wait()
 
 	return results
@@ -103,7 +110,31 @@ class P4Output(dict):
 
 			self[ prefix ] = data
 
-		#finally, if there are prefixes which have a numeral at the end, strip it and pack the data into a list
+		self._packMultiKeys()
+	@classmethod
+	def FromDict( cls, tagged ):
+		'''
+		builds an instance from one of the dicts returned by p4 -G - the data is packed the same way as the text output
+		'''
+		new = cls( [] )
+		if tagged.get( 'code' ) == 'error':
+			new.errors.append( tagged.get( 'data', '' ).strip() )
+			return new
+
+		for key, data in tagged.iteritems():
+			if key == 'code':
+				continue
+
+			if isinstance( data, basestring ) and data.isdigit():
+				data = int( data )
+
+			new[ key ] = data
+
+		new._packMultiKeys()
+
+		return new
+	def _packMultiKeys( self ):
+		#if there are prefixes which have a numeral at the end, strip it and pack the data into a list
 		multiKeys = {}
 		for k in self.keys():
 			m = self.END_DIGITS.search( k )
@@ -169,6 +200,163 @@ def p4run( *args, **kwargs ):
 	return P4Output( ret, **kwargs )
 
 
+#the command used to run p4 by P4Connection instances - a fake p4 can be swapped in here for testing
+P4_CMD = [ 'p4' ]
+
+
+def getStatusKey( f ):
+	'''
+	returns the key used to cache the status of the given file - depot paths are used as is, disk paths are normalized
+	'''
+	f = str( f )
+	if f.startswith( '//' ):
+		return f
+
+	return os.path.normcase( os.path.abspath( f ) )
+
+
+class P4Connection(object):
+	'''
+	runs p4 commands in tagged mode (ie p4 -G) and parses the output as it streams in.  fstat queries for any number of
+	files are batched into a single p4 call, and the results are kept in a short lived cache that all the P4File status
+	methods share.  commands that change the state of a file should invalidate its status
+	'''
+
+	#the number of seconds a cached status is considered valid for
+	STATUS_LIFETIME = 2
+
+	def __init__( self, cmd=None, statusLifetime=None ):
+		self._cmd = cmd
+		self._statusCache = {}
+		self.statusLifetime = self.STATUS_LIFETIME if statusLifetime is None else statusLifetime
+
+		#the number of p4 processes spawned by this connection
+		self.runCount = 0
+	def getCmd( self ):
+		if self._cmd is None:
+			return list( P4_CMD )
+
+		return list( self._cmd )
+	def run( self, *args, **kwargs ):
+		'''
+		runs the given p4 command and returns the list of dicts it outputs.  if the inputLines kwarg is given, the lines
+		are fed to p4 as extra arguments (using p4 -x) so there is no limit on the number of arguments.  if the timeout
+		kwarg is given, the p4 process is killed if it runs for longer than that many seconds and TimedOutP4Operation
+		is raised
+		'''
+		inputLines = kwargs.get( 'inputLines' )
+		timeout = kwargs.get( 'timeout' )
+		cmd = self.getCmd() + [ '-G' ]
+		if inputLines is not None:
+			cmd += [ '-x', '-' ]
+
+		cmd += map( str, args )
+
+		#the output goes to a temp file rather than a pipe - marshal.load holds the GIL while it blocks on a pipe, which
+		#would stall every other thread (and the timeout) until p4 finished
+		with tempfile.TemporaryFile() as inFile:
+			if inputLines:
+				inFile.write( ''.join( [ '%s\n' % line for line in inputLines ] ) )
+				inFile.seek( 0 )
+
+			outFile = tempfile.TemporaryFile()
+			self.runCount += 1
+			try:
+				p4Proc = subprocess.Popen( cmd, cwd=getDefaultWorkingDir(), stdin=inFile, stdout=outFile )
+			except:
+				outFile.close()
+				raise
+
+			timedOut = []
+			def kill():
+				timedOut.append( True )
+				try:
+					p4Proc.kill()
+				except OSError: pass  #the process has already exited
+
+			timer = None
+			if timeout is not None:
+				timer = threading.Timer( timeout, kill )
+				timer.start()
+
+			with outFile:
+				try:
+					p4Proc.wait()
+				finally:
+					if timer is not None:
+						timer.cancel()
+
+				if timedOut:
+					raise TimedOutP4Operation( "p4 %s took longer than %s seconds" % (' '.join( map( str, args ) ), timeout) )
+
+				outFile.seek( 0 )
+
+				return list( iterMarshalled( outFile ) )
+	def fstat( self, files ):
+		'''
+		returns a list of P4Output instances containing the status of each of the given files.  files without a fresh
+		cached status are queried in a single fstat call.  files that aren't managed get an empty status with the error
+		p4 reported (if any)
+		'''
+		now = time.time()
+		cache = self._statusCache
+		keys = map( getStatusKey, files )
+		toQuery = []
+		for f, key in zip( files, keys ):
+			cached = cache.get( key )
+			if cached is None or now - cached[ 0 ] > self.statusLifetime:
+				toQuery.append( (f, key) )
+
+		if toQuery:
+			statuses = dict( (key, P4Output( [] )) for f, key in toQuery )
+			for tagged in self.run( 'fstat', inputLines=[ f for f, key in toQuery ] ):
+				status = P4Output.FromDict( tagged )
+
+				#figure out which file the status is for - error dicts only contain the path at the start of the error message
+				if status.errors:
+					statusKeys = [ getStatusKey( status.errors[ 0 ].rsplit( ' - ', 1 )[ 0 ] ) ]
+				else:
+					statusKeys = [ getStatusKey( status[ key ] ) for key in ('clientFile', 'depotFile') if key in status ]
+
+				for statusKey in statusKeys:
+					if statusKey in statuses:
+						statuses[ statusKey ] = status
+
+			now = time.time()
+			for key, status in statuses.iteritems():
+				cache[ key ] = now, status
+
+		return [ cache[ key ][ 1 ] for key in keys ]
+	def getStatus( self, f ):
+		return self.fstat( [ f ] )[ 0 ]
+	def invalidate( self, files=None ):
+		'''
+		removes the cached status of the given files - or all cached statuses if files is None
+		'''
+		if files is None:
+			self._statusCache.clear()
+			return
+
+		for f in files:
+			self._statusCache.pop( getStatusKey( f ), None )
+
+
+P4_CONNECTION = P4Connection()
+
+def getConnection():
+	return P4_CONNECTION
+
+
+def setConnection( connection ):
+	'''
+	sets the connection used by P4File instances and returns the previous one
+	'''
+	global P4_CONNECTION
+	previous, P4_CONNECTION = P4_CONNECTION, connection
+
+	return previous
+
+
 P4INFO = None
 def p4Info():
 	global P4INFO
@@ -273,6 +461,8 @@ class P4Change(dict):
 		if files is not None:
 			p4run( 'reopen -c', changeNum, *files )
 
+		invalidateChangeIndices()
+
 		return new
 	@classmethod
 	def FetchByNumber( cls, number ):
@@ -324,15 +514,31 @@ class P4Change(dict):
 
 		return change
 	@classmethod
+	def FromTagged( cls, tagged ):
+		'''
+		builds a change from one of the dicts returned by p4 -G changes.  the files aren't listed by the changes
+		command so they're fetched if they're asked for - see the __getattr__ doc for more info
+		'''
+		new = cls()
+		new.change = int( tagged[ 'change' ] )
+		new.user = tagged.get( 'user', '' )
+		new.description = tagged.get( 'desc', '' )
+		if 'time' in tagged:
+			new.date = datetime.date.fromtimestamp( int( tagged[ 'time' ] ) )
+
+		new.files = populateChange
+		new.actions = populateChange
+		new.revisions = populateChange
+
+		return new
+	@classmethod
 	def FetchByDescription( cls, description, createIfNotFound=False ):
 		'''
 		fetches a changelist based on a given description from the list of pending changelists
 		'''
-		cleanDesc = ''.join( [ s.strip() for s in description.lower().strip().split( '\n' ) ] )
-		for change in cls.IterPending():
-			thisDesc = ''.join( [ s.strip() for s in change.description.lower().strip().split( '\n' ) ] )
-			if thisDesc == cleanDesc:
-				return change
+		change = getChangeIndex().findByDescription( description )
+		if change is not None:
+			return change
 
 		if createIfNotFound:
 			return cls.Create( description )
@@ -342,46 +548,22 @@ class P4Change(dict):
 		effectively runs the command:
 		p4 changes -l *args
 
-		a list of P4Change objects is returned
+		a list of P4Change objects is returned.  the changes are fetched in a single tagged query, and the
+		files in each change are only fetched if they're asked for
 		'''
-		lines = _p4run( 'changes -l %s' % ' '.join( args ) )
-		changes = []
-		if lines:
-			lineIter = iter( lines )
-			curChange = None
-			try:
-				while True:
-					line = lineIter.next()
-					if line.startswith( 'Change' ):
-						curChange = cls()
-						changes.append( curChange )
-						toks = line.split()
-						curChange.change = int( toks[ 1 ] )
-						curChange.user = toks[ -1 ]
-						curChange.date = datetime.date( *list( map( int, toks[ 3 ].split( '/' ) ) ) )
-						curChange.description = ''
-
-						#setup triggers for other data in the changelist that doesn't get returned by the changes command - see the __getattr__ doc for more info
-						curChange.files = populateChange
-						curChange.actions = populateChange
-						curChange.revisions = populateChange
-					elif curChange is not None:
-						curChange.description += line
-			except StopIteration:
-				return changes
+		if not isPerforceEnabled():
+			return []
+
+		args = shlex.split( ' '.join( map( str, args ) ) )
+
+		return [ cls.FromTagged( tagged ) for tagged in getConnection().run( 'changes', '-l', *args ) if tagged.get( 'code' ) != 'error' ]
 	@classmethod
 	def IterPending( cls ):
 		'''
-		iterates over pending changelists
+		iterates over pending changelists - these come from the change index so repeated calls don't query perforce
 		'''
-		info = p4Info()
-		for line in _p4run( 'changes -u %s -s pending -c %s' % (info.userName, info.clientName) ):
-			toks = line.split()
-			try:
-				changeNum = int( toks[ 1 ] )
-			except IndexError: continue
-
-			yield cls.FetchByNumber( changeNum )
+		for change in getChangeIndex().getChanges():
+			yield change
 
 
 #the number of the default changelist
@@ -394,10 +576,104 @@ P4Change.CHANGE_NUM_INVALID = P4Change()
 #all opened perforce files get added to a changelist with this description by default
 DEFAULT_CHANGE = 'default auto-checkout'
 
-#gets called when a perforce command takes too long (defined by P4File.TIMEOUT_PERIOD)
+
+def cleanDescription( description ):
+	'''
+	returns the description in the form used to compare change descriptions - lower case without whitespace
+	around each line
+	'''
+	return ''.join( [ s.strip() for s in description.lower().strip().split( '\n' ) ] )
+
+
+class P4ChangeIndex(object):
+	'''
+	the pending changes of a user and client, fetched along with their descriptions in a single tagged query.  the
+	index is built when first needed, and is thrown away when a change is created or submitted by this module, or
+	when p4 refuses a change from the index because it was submitted or deleted elsewhere
+	'''
+	def __init__( self, user, client ):
+		self.user = user
+		self.client = client
+		self._changes = None
+		self._byDescription = {}
+	def __repr__( self ):
+		return 'P4ChangeIndex( %s, %s )' % (self.user, self.client)
+	def refresh( self ):
+		tagged = getConnection().run( 'changes', '-l', '-s', 'pending', '-u', self.user, '-c', self.client )
+		self._changes = [ P4Change.FromTagged( t ) for t in tagged if t.get( 'code' ) != 'error' ]
+
+		#keep the changes newest first - the order p4 changes lists them in
+		self._changes.sort( reverse=True )
+
+		#if there are changes with the same description the newest wins - same as searching the p4 changes output
+		#in order did
+		self._byDescription = {}
+		for change in self._changes:
+			self._byDescription.setdefault( cleanDescription( change.description ), change )
+	def invalidate( self ):
+		self._changes = None
+	def getChanges( self ):
+		if self._changes is None:
+			self.refresh()
+
+		return list( self._changes )
+	def findByDescription( self, description ):
+		'''
+		returns the pending change with the given description - or None
+		'''
+		if self._changes is None:
+			self.refresh()
+
+		return self._byDescription.get( cleanDescription( description ) )
+
+
+#the change indices keyed by (user, client)
+P4_CHANGE_INDICES = {}
+
+def getChangeIndex( user=None, client=None ):
+	'''
+	returns the P4ChangeIndex for the given user and client - which default to the ones p4 info reports
+	'''
+	if user is None or client is None:
+		info = p4Info()
+		if user is None:
+			user = info.userName
+
+		if client is None:
+			client = info.clientName
+
+	try:
+		return P4_CHANGE_INDICES[ (user, client) ]
+	except KeyError:
+		index = P4_CHANGE_INDICES[ (user, client) ] = P4ChangeIndex( user, client )
+
+		return index
+
+
+def invalidateChangeIndices():
+	for index in P4_CHANGE_INDICES.itervalues():
+		index.invalidate()
+
+
+#matches the errors p4 gives when asked to use a change that has been deleted or submitted
+STALE_CHANGE_ERROR = re.compile( r'change [0-9]+ (unknown|is already committed)', re.IGNORECASE )
+
+def isStaleChangeError( errors ):
+	'''
+	returns whether any of the given p4 errors are because a change no longer exists as a pending change - which
+	happens when the change was submitted or deleted outside of this module, so the change indices are stale
+	'''
+	for error in errors:
+		if STALE_CHANGE_ERROR.search( error ):
+			return True
+
+	return False
+
+#gets called when a perforce command takes too long (defined by P4File.TIMEOUT_PERIOD) - operations run by a
+#P4OperationQueue pass the P4Operation instance to the callback
 P4_LENGTHY_CALLBACK = None
 
-#gets called when a lengthy perforce command finally returns
+#gets called when a lengthy perforce command finally returns - with the same args as P4_LENGTHY_CALLBACK
 P4_RETURNED_CALLBACK = None
 
 class P4File(Path):
@@ -417,6 +693,18 @@ class P4File(Path):
 
 	def run( self, *args, **kwargs ):
 		return p4run( *args, **kwargs )
+	def runInChange( self, cmd, *args ):
+		'''
+		runs the given p4 command in the change returned by getOrCreateChange.  if the change has been submitted or
+		deleted outside of this module the change indices are thrown away and the command is run again in a fresh
+		change - otherwise the stale change number would be used for the rest of the session
+		'''
+		ret = self.run( cmd, '-c', self.getOrCreateChange(), *args )
+		if ret is not False and isStaleChangeError( ret.errors ):
+			invalidateChangeIndices()
+			ret = self.run( cmd, '-c', self.getOrCreateChange(), *args )
+
+		return ret
 	def getFile( self, f=None ):
 		if f is None:
 			return self
@@ -434,15 +722,37 @@ class P4File(Path):
 	def getStatus( self, f=None ):
 		'''
 		returns the status dictionary for the instance.  if the file isn't managed by perforce,
-		None is returned
+		None is returned.  statuses are cached for a short time by the connection - so calling the
+		various status methods one after the other only queries perforce once
 		'''
 		if not self.USE_P4:
 			return None
 
 		f = self.getFile( f )
 		try:
-			return self.run( 'fstat', f )
+			return getConnection().getStatus( f )
+		except OSError:
+			P4File.USE_P4 = False
+			return None
 		except Exception: return None
+	def getStatuses( self, files ):
+		'''
+		returns a list of status dictionaries for the given files using a single fstat query.  the statuses are
+		cached, so calling this before looping over a bunch of files makes the status methods free
+		'''
+		if not self.USE_P4:
+			return [ None ] * len( files )
+
+		try:
+			return getConnection().fstat( map( self.getFile, files ) )
+		except OSError:
+			P4File.USE_P4 = False
+			return [ None ] * len( files )
+	def invalidate( self, f=None ):
+		'''
+		forgets the cached status of the file - call this after doing anything that changes its state in perforce
+		'''
+		getConnection().invalidate( [ self.getFile( f ) ] )
 	def isManaged( self, f=None ):
 		'''
 		returns True if the file is managed by perforce, otherwise False
@@ -470,17 +780,14 @@ class P4File(Path):
 			return False
 
 		f = self.getFile( f )
-		results = _p4fast( 'fstat', f )
-		if results:
-			fstatDict = results[0]
-			if 'code' in fstatDict:
-				if fstatDict[ 'code' ] == 'error':
-					phrases = [ "not in client view", "not under" ]
-
-					dataStr = fstatDict[ 'data' ].lower()
-					for ph in phrases:
-						if ph in dataStr:
-							return False
+		status = self.getStatus( f )
+		if status is not None:
+			phrases = [ "not in client view", "not under" ]
+			for error in status.errors:
+				dataStr = error.lower()
+				for ph in phrases:
+					if ph in dataStr:
+						return False
 
 		return True
 	def getAction( self, f=None ):
@@ -549,18 +856,20 @@ class P4File(Path):
 		if not self.USE_P4:
 			return False
 
-		try:
-			args = [ 'add', '-c', self.getOrCreateChange() ]
-		except:
-			return False
-
 		#if the type has been specified, add it to the add args
+		args = []
 		if type is not None:
 			args += [ '-t', type ]
 
 		args.append( self.getFile( f ) )
 
-		ret = p4run( *args )
+		try:
+			ret = self.runInChange( 'add', *args )
+		except:
+			return False
+		finally:
+			self.invalidate( f )
+
 		if ret.errors:
 			return False
 
@@ -580,9 +889,11 @@ class P4File(Path):
 			return True
 
 		try:
-			ret = p4run( 'edit', '-c', self.getOrCreateChange(), self.getFile( f ) )
+			ret = self.runInChange( 'edit', self.getFile( f ) )
 		except:
 			return False
+		finally:
+			self.invalidate( f )
 
 		if ret.errors:
 			return False
@@ -600,6 +911,8 @@ class P4File(Path):
 		if not self.USE_P4:
 			return False
 
+		self.invalidate( f )
+
 		return self.run( 'revert', self.getFile( f ) )
 	def sync( self, f=None, force=False, rev=None, change=None ):
 		'''
@@ -630,6 +943,7 @@ class P4File(Path):
 		elif change is not None:
 			f += '@%s' % change
 
+		getConnection().invalidate()
 		if force: return self.run( 'sync', '-f', f )
 		else: return self.run( 'sync', f )
 	def delete( self, f=None ):
@@ -639,6 +953,7 @@ class P4File(Path):
 		f = self.getFile( f )
 		action = self.getAction( f )
 		if action is None and self.managed( f ):
+			self.invalidate( f )
 			return self.run( 'delete', '-c', self.getOrCreateChange(), f )
 	def remove( self, f=None ):
 		if not self.USE_P4:
@@ -654,6 +969,7 @@ class P4File(Path):
 		try:
 			action = self.getAction( f )
 			if action is None and self.managed( f ):
+				getConnection().invalidate( [ f, newName ] )
 				self.run( 'integrate', '-c', self.getOrCreateChange(), f, str( newName ) )
 				return self.run( 'delete', '-c', self.getOrCreateChange(), f )
 		except Exception: pass
@@ -667,9 +983,37 @@ class P4File(Path):
 		action = self.getAction( f )
 
 		if self.managed( f ):
+			self.invalidate( newName )
 			return self.run( 'integrate', '-c', self.getOrCreateChange(), f, newName )
 
 		return False
+	def editAsync( self, f=None ):
+		'''
+		queues the file to be opened for edit in the background - returns a P4Future
+		'''
+		f = self.getFile( f )
+		if f.exists():
+			f.setWritable()
+
+		return getOperationQueue().edit( [ f ], self.getOrCreateChange( f ) )
+	def addAsync( self, f=None, type=None ):
+		'''
+		queues the file to be opened for add in the background - returns a P4Future
+		'''
+		return getOperationQueue().add( [ self.getFile( f ) ], self.getOrCreateChange( f ), type )
+	def syncAsync( self, f=None, force=False ):
+		'''
+		queues the file to be synced in the background - returns a P4Future
+		'''
+		return getOperationQueue().sync( [ self.getFile( f ) ], force )
+	def submitAsync( self, change=None ):
+		'''
+		queues the change to be submitted in the background - returns a P4Future
+		'''
+		if change is None:
+			change = self.getChange().change
+
+		return getOperationQueue().submit( change )
 	def submit( self, change=None ):
 		if not self.USE_P4:
 			return
@@ -677,6 +1021,9 @@ class P4File(Path):
 		if change is None:
 			change = self.getChange().change
 
+		#any number of files may be in the change so just forget all statuses
+		getConnection().invalidate()
+		invalidateChangeIndices()
 		self.run( 'submit', '-c', change )
 	def getChange( self, f=None ):
 		if not self.USE_P4:
@@ -705,6 +1052,7 @@ class P4File(Path):
 			change = P4Change.FetchByDescription( newChange, True ).change
 
 		f = self.getFile( f )
+		self.invalidate( f )
 		self.run( 'reopen', '-c', change, f )
 	def getOtherOpen( self, f=None ):
 		f = self.getFile( f )
@@ -764,6 +1112,273 @@ P4Data = P4File  #used to be called P4Data - this is just for any legacy referen
 path.P4File = P4File  #insert the class into the path script...  HACKY!
 
 
+class P4Future(object):
+	'''
+	the result of an operation run by a P4OperationQueue.  the result is the list of P4Output instances p4 returned
+	for the operation - operations merged together share the same result
+	'''
+	def __init__( self ):
+		self._event = threading.Event()
+		self._result = None
+		self._exception = None
+		self._callbacks = []
+		self._lock = threading.Lock()
+	def done( self ):
+		return self._event.isSet()
+	def wait( self, timeout=None ):
+		'''
+		waits for the operation to finish - raises TimedOutP4Operation if it doesn't finish within timeout seconds
+		'''
+		self._event.wait( timeout )
+		if not self._event.isSet():
+			raise TimedOutP4Operation( "the operation didn't finish within %s seconds" % timeout )
+	def result( self, timeout=None ):
+		'''
+		returns the result of the operation, waiting for it to finish if needed.  if the operation failed the
+		exception is raised here
+		'''
+		self.wait( timeout )
+		if self._exception is not None:
+			raise self._exception
+
+		return self._result
+	def exception( self, timeout=None ):
+		self.wait( timeout )
+
+		return self._exception
+	def addDoneCallback( self, callback ):
+		'''
+		the callback gets called with the future once the operation finishes - if it has finished already the
+		callback is called immediately.  NOTE: the callback is generally called from the queue's thread, so anything
+		touching UI needs to be deferred to the main thread
+		'''
+		with self._lock:
+			if not self._event.isSet():
+				self._callbacks.append( callback )
+				return
+
+		callback( self )
+	def _set( self, result=None, exception=None ):
+		with self._lock:
+			self._result = result
+			self._exception = exception
+			self._event.set()
+			callbacks, self._callbacks = self._callbacks, []
+
+		for callback in callbacks:
+			callback( self )
+
+
+class P4Operation(object):
+	'''
+	a p4 command waiting to be run by a P4OperationQueue.  operations with the same cmd, change and args can be
+	merged into a single p4 call
+	'''
+	def __init__( self, cmd, files=(), change=None, args=() ):
+		self.cmd = cmd
+		self.files = list( files )
+		self.change = change
+		self.args = tuple( args )
+		self.futures = []
+	def __repr__( self ):
+		return 'P4Operation( %s, %d files, change=%s )' % (' '.join( (self.cmd,) + self.args ), len( self.files ), self.change)
+	def getKey( self ):
+		return self.cmd, self.change, self.args
+	def getArgs( self ):
+		args = [ self.cmd ]
+		if self.change is not None:
+			args += [ '-c', self.change ]
+
+		return args + list( self.args )
+	def touches( self, files ):
+		'''
+		returns whether the operation affects any of the given files - operations without files (ie submit) affect
+		everything
+		'''
+		if not self.files or not files:
+			return True
+
+		keys = set( map( getStatusKey, self.files ) )
+		for f in files:
+			if getStatusKey( f ) in keys:
+				return True
+
+		return False
+
+
+class P4OperationQueue(object):
+	'''
+	runs p4 operations one after the other on a background thread so the caller doesn't have to wait for the server.
+	operations queued for the same command and changelist while they're waiting to run are merged into a single p4
+	call.  each queued operation gets a P4Future.
+
+	if an operation takes longer than P4File.TIMEOUT_PERIOD seconds P4_LENGTHY_CALLBACK is called, and if it then
+	returns P4_RETURNED_CALLBACK is called.  operations that take longer than the timeout are killed and their
+	futures raise TimedOutP4Operation.  once the queue has been finished, queueing raises FinishedP4Operation
+	'''
+
+	#the number of seconds an operation can run for before it gets killed
+	TIMEOUT = 60
+
+	def __init__( self, connection=None, timeout=None ):
+		self._connection = connection
+		self.timeout = self.TIMEOUT if timeout is None else timeout
+		self._pending = []
+		self._running = None
+		self._condition = threading.Condition()
+		self._thread = None
+		self._finished = False
+	def getConnection( self ):
+		if self._connection is None:
+			return getConnection()
+
+		return self._connection
+	def getPendingCount( self ):
+		'''
+		returns the number of operations waiting to run - including the one running
+		'''
+		with self._condition:
+			return len( self._pending ) + (self._running is not None)
+	def queue( self, cmd, files=(), change=None, args=() ):
+		'''
+		queues the given command and returns a P4Future.  if there is a waiting operation with the same command,
+		change and args it gets the files added to it, unless an operation queued since then affects them
+		'''
+		future = P4Future()
+		with self._condition:
+			if self._finished:
+				raise FinishedP4Operation( "can't queue %s - the queue has been finished" % cmd )
+
+			op = P4Operation( cmd, files, change, args )
+			merged = False
+			for pending in reversed( self._pending ):
+				if pending.getKey() == op.getKey():
+
+					#an operation without files applies to everything, so the merged operation does too
+					if not op.files:
+						pending.files = []
+					elif pending.files:
+						pending.files += [ f for f in op.files if not pending.touches( [ f ] ) ]
+
+					op, merged = pending, True
+					break
+
+				if pending.touches( op.files ):
+					break
+
+			if not merged:
+				self._pending.append( op )
+
+			op.futures.append( future )
+			self._condition.notify()
+			if self._thread is None:
+				self._thread = threading.Thread( target=self._work, name='p4OperationQueue' )
+				self._thread.setDaemon( True )
+				self._thread.start()
+
+		return future
+	def edit( self, files, change=None ):
+		return self.queue( 'edit', files, change )
+	def add( self, files, change=None, type=None ):
+		args = ()
+		if type is not None:
+			args = ('-t', type)
+
+		return self.queue( 'add', files, change, args )
+	def sync( self, files, force=False ):
+		return self.queue( 'sync', files, None, ('-f',) if force else () )
+	def submit( self, change ):
+		return self.queue( 'submit', (), change )
+	def wait( self, timeout=None ):
+		'''
+		waits for all queued operations to finish - raises TimedOutP4Operation if they don't finish in time
+		'''
+		endTime = None if timeout is None else time.time() + timeout
+		with self._condition:
+			while self._pending or self._running is not None:
+				remaining = None if endTime is None else endTime - time.time()
+				if remaining is not None and remaining <= 0:
+					raise TimedOutP4Operation( "the queued operations didn't finish within %s seconds" % timeout )
+
+				self._condition.wait( remaining )
+	def finish( self, timeout=None ):
+		'''
+		stops the queue from accepting operations and waits for the queued ones to finish
+		'''
+		with self._condition:
+			self._finished = True
+			self._condition.notifyAll()
+
+		self.wait( timeout )
+	def _work( self ):
+		while True:
+			with self._condition:
+				while not self._pending:
+					if self._finished:
+						self._thread = None
+						return
+
+					self._condition.wait()
+
+				op = self._running = self._pending.pop( 0 )
+
+			try:
+				self._run( op )
+			finally:
+				with self._condition:
+					self._running = None
+					self._condition.notifyAll()
+	def _run( self, op ):
+		lengthy = []
+		def lengthyCallback():
+			lengthy.append( True )
+			if P4_LENGTHY_CALLBACK is not None:
+				P4_LENGTHY_CALLBACK( op )
+
+		lengthyTimer = threading.Timer( P4File.TIMEOUT_PERIOD, lengthyCallback )
+		lengthyTimer.start()
+
+		connection = self.getConnection()
+		result = exception = None
+		try:
+			inputLines = op.files or None
+			result = map( P4Output.FromDict, connection.run( inputLines=inputLines, timeout=self.timeout, *op.getArgs() ) )
+		except Exception, e:
+			exception = e
+		finally:
+			lengthyTimer.cancel()
+
+		#the state of the files has changed so forget their statuses - sync and submit can affect any number of files
+		if op.cmd in ('sync', 'submit'):
+			connection.invalidate()
+		else:
+			connection.invalidate( op.files )
+
+		#the change an operation was queued in may have been submitted or deleted outside of this module - so the
+		#next change lookup needs to query p4 again
+		if op.cmd in ('submit', 'change') or (result and isStaleChangeError( [ error for r in result for error in r.errors ] )):
+			invalidateChangeIndices()
+
+		if lengthy and P4_RETURNED_CALLBACK is not None:
+			P4_RETURNED_CALLBACK( op )
+
+		for future in op.futures:
+			future._set( result, exception )
+
+
+P4_OPERATION_QUEUE = None
+
+def getOperationQueue():
+	'''
+	returns the queue used by the P4File async methods - it's created when first needed
+	'''
+	global P4_OPERATION_QUEUE
+	if P4_OPERATION_QUEUE is None:
+		P4_OPERATION_QUEUE = P4OperationQueue()
+
+	return P4_OPERATION_QUEUE
+
+
 ###--- Add Perforce Integration To Path Class ---###
 
 def asP4( self ):
@@ -804,6 +1419,27 @@ def asDepot( self ):
 	return self.asP4().toDepotPath()
 
 
+#when True, Path.write and Path.pickle don't wait for p4 - the files are made writable and the edit or add is queued
+#on the operation queue instead
+P4_ASYNC_WRITES = False
+
+
+def _writeAndQueue( filepath, writeFunc, contents, addArgs=() ):
+	'''
+	writes the file and queues the p4 edit or add.  files that don't exist yet or are already writeable get added - if
+	they're managed already the add just fails harmlessly
+	'''
+	if filepath.exists() and not filepath.getWritable():
+		filepath.setWritable()
+		ret = writeFunc( filepath, contents )
+		getOperationQueue().edit( [ filepath ] )
+	else:
+		ret = writeFunc( filepath, contents )
+		getOperationQueue().queue( 'add', [ filepath ], None, addArgs )
+
+	return ret
+
+
 #now wrap existing methods on the Path class - like write, delete, copy etc so that they work nicely with perforce
 pathWrite = Path.write
 def _p4write( filepath, contentsStr, doP4=True ):
@@ -814,6 +1450,8 @@ def _p4write( filepath, contentsStr, doP4=True ):
 
 	assert isinstance( filepath, Path )
 	if doP4 and isPerforceEnabled():
+		if P4_ASYNC_WRITES:
+			return _writeAndQueue( filepath, pathWrite, contentsStr )
 
 		hasBeenHandled = False
 
@@ -832,6 +1470,8 @@ def _p4write( filepath, contentsStr, doP4=True ):
 		if isUnderClient and not hasBeenHandled:
 			_p4fast( 'add', filepath )
 
+		getConnection().invalidate( [ filepath ] )
+
 		return ret
 
 	return pathWrite( filepath, contentsStr )
@@ -841,6 +1481,8 @@ pathPickle = Path.pickle
 def _p4Pickle( filepath, toPickle, doP4=True ):
 	assert isinstance( filepath, Path )
 	if doP4 and isPerforceEnabled():
+		if P4_ASYNC_WRITES:
+			return _writeAndQueue( filepath, pathPickle, toPickle, ('-t', 'binary') )
 
 		hasBeenHandled = False
 
@@ -859,6 +1501,8 @@ def _p4Pickle( filepath, toPickle, doP4=True ):
 			#need to explicitly add pickled files as binary type files, otherwise p4 mangles them
 			_p4fast( 'add -t binary', filepath )
 
+		getConnection().invalidate( [ filepath ] )
+
 		return ret
 
 	return pathPickle( filepath, toPickle )
@@ -921,13 +1565,14 @@ def _p4Rename( filepath, newName, nameIsLeaf=False, doP4=True ):
 			#if the target exists and is managed by p4, make sure its open for edit
 			if tgtExists and asP4.managed( newPath ):
 				_p4fast( 'edit', newPath )
+				asP4.invalidate( newPath )
 
 			#now perform the rename
 			ret = pathRename( filepath, newName, nameIsLeaf )
 
 			if reAdd:
 				_p4fast( 'add', newPath )
-				asP4.setChange( change, newPath )
+				asP4.setChange( change, newPath )  #this invalidates the status of newPath
 
 			return ret
 	elif filepath.isdir():
@@ -1173,6 +1818,7 @@ def findStaleFiles( fileList ):
 	files that aren't at head revision
 	'''
 	p4 = P4File()
+	p4.getStatuses( fileList )  #query all the statuses up front in a single call
 	stale = []
 	for f in fileList:
 		latest = p4.isLatest( f )
@@ -1191,6 +1837,7 @@ def gatherFilesIntoChange( files, change=None ):
 	default change is used
 	'''
 	p4 = P4File()
+	p4.getStatuses( files )
 	filesGathered = []
 	for f in files:
 		if not isinstance( f, Path ): f = Path( f )
@@ -1233,6 +1880,7 @@ def cleanEmptyChanges():
 
 		if deleteIt:
 			p4run( 'change -d', str( change ) )
+			invalidateChangeIndices()
 
 
 def findRedundantPYCs( rootDir=None, recursive=True ):
@@ -1260,6 +1908,7 @@ def findRedundantPYCs( rootDir=None, recursive=True ):
 
 					bytecodeFiles.append( f )
 
+		p4.getStatuses( [ Path( f ).setExtension( 'py' ) for f in bytecodeFiles ] )
 		for f in bytecodeFiles:
 			pyF = Path( f ).setExtension( 'py' )
 
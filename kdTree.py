@@ -1,5 +1,326 @@
 
 from math import sqrt
+from array import array
+
+import time
+import random
+
+
+class KdTree(object):
+	'''
+	array backed kd-tree implementation.  the tree is stored implicitly - the points are re-ordered into
+	flat coordinate arrays so that the node for any index range [lo, hi) lives at the middle of that range.
+	this means there are no node objects to build or walk, and the queries are simple iterative loops
+	instead of recursive closures.
+
+	the batched query methods answer many queries in a single call and return indices into the original
+	data - the getClosest/getWithin/getDistanceRatioWeightedVector methods are thin wrappers around these
+	that return the original point objects
+
+	thanks to:
+	http://en.wikipedia.org/wiki/Kd-tree
+	'''
+	DIMENSION = 3  #dimension of points in the tree
+	LEAF_SIZE = 8  #ranges this size or smaller are brute force searched - in python this is faster than splitting further
+
+	def __init__( self, data=() ):
+		self.performPopulate( data )
+	@classmethod
+	def FromArray( cls, positions, points=None ):
+		'''
+		builds a tree from a flat array of floats - ie: (x0, y0, z0, x1, y1, z1, ...)
+
+		points is an optional list of objects that correspond to each position.  if given, the wrapper
+		query methods return these objects, otherwise they return position tuples
+		'''
+		new = cls.__new__( cls )
+		new._build( positions )
+		new.points = points
+
+		return new
+	def performPopulate( self, data ):
+		self.points = list( data )
+
+		positions = array( 'd' )
+		for point in self.points:
+			positions.extend( point[ :3 ] )
+
+		self._build( positions )
+	def _build( self, positions ):
+		self._positions = positions
+		xs = positions[ 0::3 ]
+		ys = positions[ 1::3 ]
+		zs = positions[ 2::3 ]
+		axisValues = xs, ys, zs
+
+		count = len( xs )
+		leafSize = self.LEAF_SIZE
+		order = range( count )
+		axes = array( 'b', [ 0 ] ) * count
+
+		#split each range on the axis with the largest spread - mesh data is often much flatter along one axis
+		#than the others so this gives a better balanced tree than simply cycling through the axes
+		toSplit = [ (0, count) ]
+		while toSplit:
+			lo, hi = toSplit.pop()
+			if hi - lo <= leafSize:
+				continue
+
+			subOrder = order[ lo:hi ]
+			bestSpread = -1
+			for axis, values in enumerate( axisValues ):
+				subValues = [ values[ i ] for i in subOrder ]
+				spread = max( subValues ) - min( subValues )
+				if spread > bestSpread:
+					bestSpread = spread
+					splitAxis = axis
+
+			subOrder.sort( key=axisValues[ splitAxis ].__getitem__ )
+			order[ lo:hi ] = subOrder
+
+			mid = (lo + hi) >> 1
+			axes[ mid ] = splitAxis
+
+			toSplit.append( (lo, mid) )
+			toSplit.append( (mid+1, hi) )
+
+		self._order = array( 'l', order )
+		self._axes = axes
+		self._xs = array( 'd', [ xs[ i ] for i in order ] )
+		self._ys = array( 'd', [ ys[ i ] for i in order ] )
+		self._zs = array( 'd', [ zs[ i ] for i in order ] )
+	def __len__( self ):
+		return len( self._order )
+	def _getPoint( self, idx ):
+		if self.points is None:
+			return tuple( self._positions[ idx*3:idx*3+3 ] )
+
+		return self.points[ idx ]
+	def queryClosestBatch( self, points, returnDistances=False ):
+		'''
+		returns an array containing the index of the closest point in the tree for each of the given query
+		points.  the indices are indices into the data the tree was built from.  -1 is returned for each query
+		if the tree is empty
+
+		if returnDistances is True, a 2-tuple is returned containing the index array and an array of the
+		squared distances to each of the closest points
+		'''
+		xs, ys, zs = self._xs, self._ys, self._zs
+		axes = self._axes
+		order = self._order
+		leafSize = self.LEAF_SIZE
+		count = len( order )
+
+		indices = array( 'l' )
+		sqDistances = array( 'd' )
+		for queryPoint in points:
+			qx, qy, qz = queryPoint[ 0 ], queryPoint[ 1 ], queryPoint[ 2 ]
+
+			best = 1e300
+			bestN = -1
+			stack = [ (0, count, 0.0) ]
+			while stack:
+				lo, hi, planeSq = stack.pop()
+				if planeSq >= best:
+					continue
+
+				if hi - lo <= leafSize:
+					for n in xrange( lo, hi ):
+						dx = xs[ n ] - qx
+						dy = ys[ n ] - qy
+						dz = zs[ n ] - qz
+						sd = dx*dx + dy*dy + dz*dz
+						if sd < best:
+							best = sd
+							bestN = n
+
+					if not best:
+						break
+
+					continue
+
+				mid = (lo + hi) >> 1
+				dx = xs[ mid ] - qx
+				dy = ys[ mid ] - qy
+				dz = zs[ mid ] - qz
+				sd = dx*dx + dy*dy + dz*dz
+				if sd < best:
+					best = sd
+					bestN = mid
+
+					#if its an exact match, bail
+					if not sd:
+						break
+
+				axis = axes[ mid ]
+				if axis == 0: diff = qx - xs[ mid ]
+				elif axis == 1: diff = qy - ys[ mid ]
+				else: diff = qz - zs[ mid ]
+
+				#push the far side first so the near side gets searched first - the far side is only searched
+				#if the splitting plane is closer than the best match found on the near side
+				if diff < 0:
+					stack.append( (mid+1, hi, diff*diff) )
+					stack.append( (lo, mid, planeSq) )
+				else:
+					stack.append( (lo, mid, diff*diff) )
+					stack.append( (mid+1, hi, planeSq) )
+
+			if bestN == -1:
+				indices.append( -1 )
+			else:
+				indices.append( order[ bestN ] )
+
+			sqDistances.append( best )
+
+		if returnDistances:
+			return indices, sqDistances
+
+		return indices
+	def queryWithinBatch( self, points, radius, returnDistances=False ):
+		'''
+		returns a list containing a list of indices for each query point.  each index list contains the
+		indices of all points in the tree within radius of the query point, sorted by distance.
+
+		NOTE: radius can either be a single value, or a sequence containing a radius per query point
+
+		if returnDistances is True then each list contains (sqDistance, index) 2-tuples instead
+		'''
+		xs, ys, zs = self._xs, self._ys, self._zs
+		axes = self._axes
+		order = self._order
+		leafSize = self.LEAF_SIZE
+		count = len( order )
+
+		if isinstance( radius, (int, float) ):
+			radii = [ radius ] * len( points )
+		else:
+			radii = radius
+
+		results = []
+		for queryPoint, radius in zip( points, radii ):
+			qx, qy, qz = queryPoint[ 0 ], queryPoint[ 1 ], queryPoint[ 2 ]
+			sqRadius = radius * radius
+
+			matches = []
+			stack = [ (0, count, 0.0) ]
+			while stack:
+				lo, hi, planeSq = stack.pop()
+				if planeSq > sqRadius:
+					continue
+
+				if hi - lo <= leafSize:
+					for n in xrange( lo, hi ):
+						dx = xs[ n ] - qx
+						dy = ys[ n ] - qy
+						dz = zs[ n ] - qz
+						sd = dx*dx + dy*dy + dz*dz
+						if sd <= sqRadius:
+							matches.append( (sd, order[ n ]) )
+
+					continue
+
+				mid = (lo + hi) >> 1
+				dx = xs[ mid ] - qx
+				dy = ys[ mid ] - qy
+				dz = zs[ mid ] - qz
+				sd = dx*dx + dy*dy + dz*dz
+				if sd <= sqRadius:
+					matches.append( (sd, order[ mid ]) )
+
+				axis = axes[ mid ]
+				if axis == 0: diff = qx - xs[ mid ]
+				elif axis == 1: diff = qy - ys[ mid ]
+				else: diff = qz - zs[ mid ]
+
+				if diff < 0:
+					stack.append( (mid+1, hi, diff*diff) )
+					stack.append( (lo, mid, planeSq) )
+				else:
+					stack.append( (lo, mid, diff*diff) )
+					stack.append( (mid+1, hi, planeSq) )
+
+			matches.sort()
+			if returnDistances:
+				results.append( matches )
+			else:
+				results.append( [ m[1] for m in matches ] )
+
+		return results
+	def queryDistanceRatioBatch( self, points, ratio=2, returnDistances=False ):
+		'''
+		batched version of getDistanceRatioWeightedVector - for each query point finds the closest point in
+		the tree and returns the indices of all points within ratio*<closest point distance>.  returns a list
+		of index lists in the same form as queryWithinBatch
+		'''
+		assert ratio > 1
+		indices, sqDistances = self.queryClosestBatch( points, True )
+
+		results = [ None ] * len( indices )
+		toSearch = []
+		for n, (idx, sqDist) in enumerate( zip( indices, sqDistances ) ):
+			if idx == -1:
+				results[ n ] = []
+			elif not sqDist:
+				results[ n ] = [ (0, idx) ] if returnDistances else [ idx ]
+			else:
+				toSearch.append( n )
+
+		radii = [ sqrt( sqDistances[ n ] ) * ratio for n in toSearch ]
+		within = self.queryWithinBatch( [ points[ n ] for n in toSearch ], radii, returnDistances )
+		for n, matches in zip( toSearch, within ):
+			results[ n ] = matches
+
+		return results
+	def getClosest( self, queryPoint, returnDistances=False ):
+		'''
+		Returns the closest point in the tree to the given point
+
+		NOTE: see the docs for getWithin for info on the returnDistances arg
+		'''
+		indices, sqDistances = self.queryClosestBatch( [ queryPoint ], True )
+		idx = indices[ 0 ]
+		if idx == -1:
+			return None
+
+		if returnDistances:
+			return sqDistances[ 0 ], self._getPoint( idx )
+
+		return self._getPoint( idx )
+	def getWithin( self, queryPoint, threshold=1e-6, returnDistances=False ):
+		'''
+		Returns all points that fall within the radius of the queryPoint within the tree.
+
+		NOTE: if returnDistances is True then the squared distances between the queryPoint and the points in the
+		return list are returned.  This means the return list looks like this:
+		[ (sqDistToPoint, point), ... ]
+
+		This can be useful if you need to do more work on the results afterwards - just be aware that the distances
+		in the list are squares of the actual distance between the points
+		'''
+		matches = self.queryWithinBatch( [ queryPoint ], threshold, True )[ 0 ]
+		getPoint = self._getPoint
+		if returnDistances:
+			return [ (sd, getPoint( idx )) for sd, idx in matches ]
+
+		return [ getPoint( idx ) for sd, idx in matches ]
+	def getDistanceRatioWeightedVector( self, queryPoint, ratio=2, returnDistances=False ):
+		'''
+		Finds the closest point to the queryPoint in the tree and returns all points within a distance
+		of ratio*<closest point distance>.
+
+		This is generally more useful that using getWithin because getWithin could return an exact
+		match along with a bunch of points at the outer search limit and thus heavily bias the
+		results.
+
+		NOTE: see docs for getWithin for details on the returnDistance arg
+		'''
+		matches = self.queryDistanceRatioBatch( [ queryPoint ], ratio, True )[ 0 ]
+		getPoint = self._getPoint
+		if returnDistances:
+			return [ (sd, getPoint( idx )) for sd, idx in matches ]
+
+		return [ getPoint( idx ) for sd, idx in matches ]
 
 
 class _Node(list):
@@ -24,11 +345,10 @@ class _Node(list):
 class ExactMatch(Exception): pass
 
 
-class KdTree():
+class RecursiveKdTree():
 	'''
-	simple, fast python kd-tree implementation
-	thanks to:
-	http://en.wikipedia.org/wiki/Kd-tree
+	the original node based kd-tree implementation.  its kept around as a reference implementation for
+	benchmarking and testing the array backed KdTree - use KdTree instead
 	'''
 	DIMENSION = 3  #dimension of points in the tree
 
@@ -55,16 +375,11 @@ class KdTree():
 
 			return node
 
-		self.root = populateTree( data, 0 )
+		self.root = populateTree( list( data ), 0 )
 	def getClosest( self, queryPoint, returnDistances=False ):
-		'''
-		Returns the closest point in the tree to the given point
-
-		NOTE: see the docs for getWithin for info on the returnDistances arg
-		'''
 		dimension = self.DIMENSION
 
-		distBest = (self.root[0] - queryPoint).get_magnitude() ** 2
+		distBest = sum( [ (a - b)**2 for a, b in zip( self.root[0], queryPoint ) ] )
 		bestList = [ (distBest, self.root[0]) ]
 
 		def search( node, depth ):
@@ -115,16 +430,6 @@ class KdTree():
 
 		return bestList[0][1]
 	def getWithin( self, queryPoint, threshold=1e-6, returnDistances=False ):
-		'''
-		Returns all points that fall within the radius of the queryPoint within the tree.
-
-		NOTE: if returnDistances is True then the squared distances between the queryPoint and the points in the
-		return list are returned.  This means the return list looks like this:
-		[ (sqDistToPoint, point), ... ]
-
-		This can be useful if you need to do more work on the results afterwards - just be aware that the distances
-		in the list are squares of the actual distance between the points
-		'''
 		dimension = self.DIMENSION
 		axisRanges = axRangeX, axRangeY, axRangeZ = ( (queryPoint[0]-threshold, queryPoint[0]+threshold),
 		                                              (queryPoint[1]-threshold, queryPoint[1]+threshold),
@@ -172,29 +477,46 @@ class KdTree():
 			return matches
 
 		return [ m[1] for m in matches ]
-	def getDistanceRatioWeightedVector( self, queryPoint, ratio=2, returnDistances=False ):
-		'''
-		Finds the closest point to the queryPoint in the tree and returns all points within a distance
-		of ratio*<closest point distance>.
 
-		This is generally more useful that using getWithin because getWithin could return an exact
-		match along with a bunch of points at the outer search limit and thus heavily bias the
-		results.
 
-		NOTE: see docs for getWithin for details on the returnDistance arg
-		'''
-		assert ratio > 1
-		closestDist, closest = self.getClosest( queryPoint, returnDistances=True )
-		if closestDist == 0:
-			if returnDistances:
-				return [ (0, closest) ]
-
-			return [ closest ]
-
-		closestDist = sqrt( closestDist )
-		maxDist = closestDist * ratio
-
-		return self.getWithin( queryPoint, maxDist, returnDistances=returnDistances )
+def benchmark( pointCount=20000, queryCount=5000, radius=0.02 ):
+	'''
+	times tree construction, closest point queries and radius queries for the array backed KdTree against
+	the original RecursiveKdTree using a random point cloud in the unit cube
+	'''
+	points = [ (random.random(), random.random(), random.random()) for n in xrange( pointCount ) ]
+	queries = [ (random.random(), random.random(), random.random()) for n in xrange( queryCount ) ]
+
+	results = {}
+	for treeCls in (RecursiveKdTree, KdTree):
+		start = time.clock()
+		tree = treeCls( points )
+		buildTime = time.clock() - start
+
+		start = time.clock()
+		if treeCls is KdTree:
+			tree.queryClosestBatch( queries )
+		else:
+			for q in queries:
+				tree.getClosest( q )
+		closestTime = time.clock() - start
+
+		start = time.clock()
+		if treeCls is KdTree:
+			tree.queryWithinBatch( queries, radius )
+		else:
+			for q in queries:
+				tree.getWithin( q, radius )
+		withinTime = time.clock() - start
+
+		results[ treeCls.__name__ ] = buildTime, closestTime, withinTime
+		print '%s: build %0.3fs  closest %0.3fs  within %0.3fs  (%d points, %d queries)' % (treeCls.__name__, buildTime, closestTime, withinTime, pointCount, queryCount)
+
+	return results
+
+
+if __name__ == '__main__':
+	benchmark()
 
 
 #end
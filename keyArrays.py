@@ -0,0 +1,269 @@
+'''
+columnar storage for animation keys.  instead of storing a list of key objects, each column of key data
+(times, values, tangent weights etc) is stored in its own typed array - so a channel with thousands of keys
+is a handful of arrays rather than thousands of objects.  KeyView wraps a single row of a KeyArrays instance
+so code that wants to deal with key objects still can
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import izip
+
+
+KEY_TIME_TOLERANCE = 1e-4  #keys closer together in time than this are considered to be at the same time
+
+#tangent types are stored as an index into this tuple
+TANGENT_TYPES = ('spline', 'linear', 'fast', 'slow', 'flat', 'step', 'stepnext', 'fixed', 'clamped', 'plateau', 'auto')
+TANGENT_CODES = dict( (name, n) for n, name in enumerate( TANGENT_TYPES ) )
+
+
+class KeyArrays(object):
+	'''
+	stores the data for a sequence of keys as parallel arrays - row n of each array holds the data for key n.
+	tangent types are stored as indices into TANGENT_TYPES, and key indices of None are stored as -1
+	'''
+	COLUMNS = ('times', 'values', 'iws', 'ows', 'ias', 'oas', 'itts', 'otts', 'locks', 'idxs')
+	TYPECODES = ('d', 'd', 'd', 'd', 'd', 'd', 'b', 'b', 'b', 'i')
+
+	def __init__( self ):
+		for column, typecode in zip( self.COLUMNS, self.TYPECODES ):
+			setattr( self, column, array( typecode ) )
+	@classmethod
+	def FromKeys( cls, keys ):
+		'''
+		builds a new instance from a list of key objects - anything with the attributes of a KeyView will do
+		'''
+		new = cls()
+		for key in keys:
+			new.append( key.time, key.value, key.iw, key.ow, key.ia, key.oa, key.itt, key.ott, key.lock, key.idx )
+
+		return new
+	def __len__( self ):
+		return len( self.times )
+	def __getstate__( self ):
+		return [ (column, getattr( self, column )) for column in self.COLUMNS ]
+	def __setstate__( self, state ):
+		for column, columnArray in state:
+			setattr( self, column, columnArray )
+	def append( self, time, value, iw=1.0, ow=1.0, ia=0, oa=0, itt='linear', ott='linear', lock=True, idx=None ):
+		'''
+		appends a single key.  NOTE: keys are not re-sorted - call sort() if needed
+		'''
+		self.times.append( time or 0 )
+		self.values.append( value or 0 )
+		self.iws.append( iw )
+		self.ows.append( ow )
+		self.ias.append( ia )
+		self.oas.append( oa )
+		self.itts.append( TANGENT_CODES[ itt ] )
+		self.otts.append( TANGENT_CODES[ ott ] )
+		self.locks.append( bool( lock ) )
+		self.idxs.append( -1 if idx is None else idx )
+	def copy( self ):
+		return self.slice( 0, len( self ) )
+	def slice( self, start, end ):
+		'''
+		returns a new instance containing the keys from index start up to but not including end
+		'''
+		new = self.__class__()
+		for column in self.COLUMNS:
+			setattr( new, column, getattr( self, column )[ start:end ] )
+
+		return new
+	def take( self, indices ):
+		'''
+		returns a new instance containing the keys at the given indices, in the given order
+		'''
+		new = self.__class__()
+		for column, typecode in zip( self.COLUMNS, self.TYPECODES ):
+			columnArray = getattr( self, column )
+			setattr( new, column, array( typecode, [ columnArray[ i ] for i in indices ] ) )
+
+		return new
+	def isSorted( self ):
+		times = self.times
+
+		return all( a <= b for a, b in izip( times, times[ 1: ] ) )
+	def sort( self ):
+		'''
+		sorts the keys by time in place
+		'''
+		if self.isSorted():
+			return self
+
+		times = self.times
+		sortedKeys = self.take( sorted( xrange( len( times ) ), key=times.__getitem__ ) )
+		for column in self.COLUMNS:
+			setattr( self, column, getattr( sortedKeys, column ) )
+
+		return self
+	def getIndexRange( self, start=None, end=None, tolerance=KEY_TIME_TOLERANCE ):
+		'''
+		returns the (startIdx, endIdx) range of keys whose times are between start and end inclusive - either
+		bound can be None to mean unbounded.  the keys must be sorted
+		'''
+		times = self.times
+		startIdx = 0 if start is None else bisect_left( times, start - tolerance )
+		endIdx = len( times ) if end is None else bisect_right( times, end + tolerance )
+
+		return startIdx, max( startIdx, endIdx )
+	def findTime( self, time, tolerance=KEY_TIME_TOLERANCE ):
+		'''
+		returns the index of the key at the given time, or None if there isn't one.  the keys must be sorted
+		'''
+		times = self.times
+		idx = bisect_left( times, time - tolerance )
+		if idx < len( times ) and abs( times[ idx ] - time ) <= tolerance:
+			return idx
+	def offset( self, amount ):
+		'''
+		time offsets all keys by the given delta in place
+		'''
+		self.times = array( 'd', [ t + amount for t in self.times ] )
+	def merge( self, other, tolerance=KEY_TIME_TOLERANCE ):
+		'''
+		returns a new instance containing the keys from both this instance and other.  where both have a key at
+		the same time the values are added together and the tangents of the key in this instance are kept.
+		both instances must be sorted
+		'''
+		timesA, timesB = self.times, other.times
+		lenA, lenB = len( timesA ), len( timesB )
+		rows = []  #a list of (keyArrays, index) tuples to build the merged instance from
+		summed = {}  #maps merged row index -> the index in other to add the value of
+		a = b = 0
+		while a < lenA and b < lenB:
+			timeA, timeB = timesA[ a ], timesB[ b ]
+			if abs( timeA - timeB ) <= tolerance:
+				summed[ len( rows ) ] = b
+				rows.append( (self, a) )
+				a += 1
+				b += 1
+			elif timeA < timeB:
+				rows.append( (self, a) )
+				a += 1
+			else:
+				rows.append( (other, b) )
+				b += 1
+
+		rows += [ (self, n) for n in xrange( a, lenA ) ]
+		rows += [ (other, n) for n in xrange( b, lenB ) ]
+
+		new = self.__class__()
+		for column, typecode in zip( self.COLUMNS, self.TYPECODES ):
+			setattr( new, column, array( typecode, [ getattr( keyArrays, column )[ n ] for keyArrays, n in rows ] ) )
+
+		values, otherValues = new.values, other.values
+		for n, b in summed.iteritems():
+			values[ n ] += otherValues[ b ]
+
+		return new
+	def getTurningPointIndices( self ):
+		'''
+		returns the indices of keys whose values are a local minimum or maximum - the first and last keys are
+		never included
+		'''
+		values = self.values
+		indices = []
+		for n, (prevValue, value, nextValue) in enumerate( izip( values, values[ 1: ], values[ 2: ] ) ):
+			prevDelta = prevValue - value
+			nextDelta = nextValue - value
+			if (prevDelta < 0 and nextDelta < 0) or (prevDelta > 0 and nextDelta > 0):
+				indices.append( n + 1 )
+
+		return indices
+
+
+def _columnProperty( column ):
+	def fget( self ):
+		return getattr( self._keyArrays, column )[ self._index ]
+	def fset( self, value ):
+		getattr( self._keyArrays, column )[ self._index ] = value
+
+	return property( fget, fset )
+
+
+def _tangentTypeProperty( column ):
+	def fget( self ):
+		return TANGENT_TYPES[ getattr( self._keyArrays, column )[ self._index ] ]
+	def fset( self, value ):
+		getattr( self._keyArrays, column )[ self._index ] = TANGENT_CODES[ value ]
+
+	return property( fget, fset )
+
+
+class KeyView(object):
+	'''
+	a single key - the key data lives in a row of a KeyArrays instance.  keys created directly get a KeyArrays
+	instance of their own, while View returns a key that reads and writes a row of an existing instance
+	'''
+	__slots__ = ('obj', 'attr', '_keyArrays', '_index')
+
+	def __init__( self, obj=None, attr=None, time=None, value=None, idx=None ):
+		self.obj, self.attr = obj, attr
+		self._keyArrays = KeyArrays()
+		self._keyArrays.append( time, value, idx=idx )
+		self._index = 0
+	@classmethod
+	def View( cls, keyArrays, index, obj=None, attr=None ):
+		new = cls.__new__( cls )
+		new.obj, new.attr = obj, attr
+		new._keyArrays, new._index = keyArrays, index
+
+		return new
+	def copy( self ):
+		'''
+		returns a new key with its own storage
+		'''
+		return self.__class__.View( self._keyArrays.slice( self._index, self._index+1 ), 0, self.obj, self.attr )
+	def __getstate__( self ):
+		return self.obj, self.attr, self._keyArrays.slice( self._index, self._index+1 )
+	def __setstate__( self, state ):
+		#keys pickled before the key data lived in a KeyArrays instance pickled their __dict__ - so build a
+		#single row KeyArrays from it
+		if isinstance( state, dict ):
+			self.obj, self.attr = state.get( 'obj' ), state.get( 'attr' )
+			self._keyArrays = KeyArrays()
+			self._keyArrays.append( state.get( 'time' ), state.get( 'value' ),
+			                        state.get( 'iw', 1.0 ), state.get( 'ow', 1.0 ), state.get( 'ia', 0 ), state.get( 'oa', 0 ),
+			                        state.get( 'itt', 'linear' ), state.get( 'ott', 'linear' ), state.get( 'lock', True ),
+			                        state.get( 'idx' ) )
+		else:
+			self.obj, self.attr, self._keyArrays = state
+
+		self._index = 0
+
+	time = _columnProperty( 'times' )
+	value = _columnProperty( 'values' )
+	iw = _columnProperty( 'iws' )
+	ow = _columnProperty( 'ows' )
+	ia = _columnProperty( 'ias' )
+	oa = _columnProperty( 'oas' )
+	itt = _tangentTypeProperty( 'itts' )
+	ott = _tangentTypeProperty( 'otts' )
+	def get_lock( self ):
+		return bool( self._keyArrays.locks[ self._index ] )
+	def set_lock( self, lock ):
+		self._keyArrays.locks[ self._index ] = bool( lock )
+	lock = property( get_lock, set_lock )
+	def get_idx( self ):
+		idx = self._keyArrays.idxs[ self._index ]
+		if idx >= 0:
+			return idx
+	def set_idx( self, idx ):
+		self._keyArrays.idxs[ self._index ] = -1 if idx is None else idx
+	idx = property( get_idx, set_idx )
+	def __str__( self ):
+		return '%.2f' % (self.time,)
+	def __repr__( self ):
+		return self.__str__()
+	def __cmp__( self, other, tolerance=KEY_TIME_TOLERANCE ):
+		if isinstance( other, KeyView ): other = other.time
+		if abs( self.time - other ) <= tolerance: return 0
+		if self.time - other < 0: return -1
+		return 1
+	def offset( self, amount ):
+		#time offsets the key by a given time delta
+		self.time += amount
+
+
+#end
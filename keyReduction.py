@@ -0,0 +1,236 @@
+'''
+error bounded key reduction for densely keyed channels (ie baked mocap).  the reduction works on plain arrays of
+sample times and values so it doesn't need maya, and many channels can be reduced in parallel using a pool of
+processes.
+
+the reduced keys use unified tangents with slopes estimated from the samples.  a segment between two kept keys
+is a hermite curve (ie a bezier with control points a third of the way along the tangents) and the fitting
+recursively splits any segment that misses a sample by more than the tolerance at the worst sample
+'''
+
+from array import array
+from math import sin, pi
+
+from filesystem import mapInProcessPool
+from keyArrays import KeyArrays
+
+import time
+import random
+
+
+DEFAULT_TOLERANCE = 0.01
+
+
+def estimateSlopes( times, values ):
+	'''
+	returns an array of slopes for the given samples.  interior slopes use the three point estimate which works
+	for uneven time spacing, the end slopes are the slopes of the first and last sample intervals
+	'''
+	count = len( times )
+	slopes = array( 'd', [ 0.0 ] * count )
+	if count < 2:
+		return slopes
+
+	prevSpan = times[ 1 ] - times[ 0 ]
+	prevSlope = (values[ 1 ] - values[ 0 ]) / prevSpan
+	slopes[ 0 ] = prevSlope
+	for n in xrange( 1, count - 1 ):
+		nextSpan = times[ n+1 ] - times[ n ]
+		nextSlope = (values[ n+1 ] - values[ n ]) / nextSpan
+		slopes[ n ] = (prevSpan * nextSlope + nextSpan * prevSlope) / (prevSpan + nextSpan)
+		prevSpan, prevSlope = nextSpan, nextSlope
+
+	slopes[ -1 ] = prevSlope
+
+	return slopes
+
+
+class KeyReduction(object):
+	'''
+	the result of reducing a set of samples - the kept key times, values and tangent slopes along with the
+	max error of the reduced curve at any of the original samples
+	'''
+	def __init__( self, times, values, slopes, maxError=0.0, sourceCount=None ):
+		self.times = times
+		self.values = values
+		self.slopes = slopes
+		self.maxError = maxError
+		self.sourceCount = len( times ) if sourceCount is None else sourceCount
+	def __repr__( self ):
+		return 'KeyReduction( %d -> %d keys, %0.1fx, max error %g )' % (self.sourceCount, self.keyCount, self.compressionRatio, self.maxError)
+	def __len__( self ):
+		return len( self.times )
+	def getKeyCount( self ):
+		return len( self.times )
+	keyCount = property( getKeyCount )
+	def getCompressionRatio( self ):
+		'''
+		returns the number of source samples per kept key
+		'''
+		if not self.times:
+			return 1.0
+
+		return self.sourceCount / float( len( self.times ) )
+	compressionRatio = property( getCompressionRatio )
+	def toKeyArrays( self, fps ):
+		'''
+		returns a KeyArrays instance for the reduced keys - tangent angles are maya tangent angles at the given
+		frame rate and the tangent types are spline, which is what keyUtils.Channel.applyToObj expects before it
+		sets the tangent angles
+		'''
+		from animCurve import toMayaAngle
+
+		keyArrays = KeyArrays()
+		for keyTime, value, slope in zip( self.times, self.values, self.slopes ):
+			angle = toMayaAngle( 1.0, slope, fps )[ 0 ]
+			keyArrays.append( keyTime, value, 1.0, 1.0, angle, angle, 'spline', 'spline' )
+
+		return keyArrays
+	def toKeyList( self, fps, weighted=False ):
+		'''
+		returns a list of (time, value, itt, ott, ix, iy, ox, oy, isLocked, isWeighted) tuples - the form
+		animLib.AnimClip stores keys in.  the tangents are in maya's units at the given frame rate (x in seconds).
+		for weighted curves the tangents are sized so the bezier control points are a third of the way to the
+		neighbouring keys, which matches the hermite segments used for fitting
+		'''
+		from animCurve import toMayaTangent
+
+		times, values, slopes = self.times, self.values, self.slopes
+		count = len( times )
+		keyList = []
+		for n in xrange( count ):
+			inX = outX = 1.0
+			if weighted and count > 1:
+				inX = times[ n ] - times[ n-1 ] if n > 0 else times[ 1 ] - times[ 0 ]
+				outX = times[ n+1 ] - times[ n ] if n < count - 1 else inX
+
+			slope = slopes[ n ]
+			ix, iy = toMayaTangent( inX, inX * slope, fps )
+			ox, oy = toMayaTangent( outX, outX * slope, fps )
+			keyList.append( (times[ n ], values[ n ], 'fixed', 'fixed', ix, iy, ox, oy, True, False) )
+
+		return keyList
+	def evaluate( self, times ):
+		'''
+		returns an array of the reduced curve's values at the given times
+		'''
+		import animCurve
+
+		curve = animCurve.AnimCurve()
+		for keyTime, value, slope in zip( self.times, self.values, self.slopes ):
+			curve.AddKey( keyTime, value, 1.0, slope, 1.0, slope, 'fixed', 'fixed' )
+
+		return curve.evaluateTimes( times )
+
+
+def reduceSamples( times, values, tolerance=DEFAULT_TOLERANCE, slopes=None ):
+	'''
+	reduces the given samples to as few keys as the fitting needs to keep the curve within tolerance of every
+	sample.  the first and last samples are always kept.  returns a KeyReduction instance
+
+	slopes can be given if the tangent slopes at each sample are known - otherwise they're estimated
+	'''
+	count = len( times )
+	if slopes is None:
+		slopes = estimateSlopes( times, values )
+
+	if count < 3:
+		return KeyReduction( array( 'd', times ), array( 'd', values ), array( 'd', slopes ), 0.0, count )
+
+	kept = [ 0, count - 1 ]
+	maxError = 0.0
+	toFit = [ (0, count - 1) ]
+	while toFit:
+		i, j = toFit.pop()
+		if j - i < 2:
+			continue
+
+		#build the hermite polynomial for the segment in the normalized segment parameter
+		t0 = times[ i ]
+		span = float( times[ j ] - t0 )
+		v0, v1 = values[ i ], values[ j ]
+		m0, m1 = slopes[ i ] * span, slopes[ j ] * span
+		a2 = -3*v0 - 2*m0 + 3*v1 - m1
+		a3 = 2*v0 + m0 - 2*v1 + m1
+
+		worstError, worstIdx = 0.0, None
+		for k in xrange( i+1, j ):
+			s = (times[ k ] - t0) / span
+			error = abs( ((a3*s + a2)*s + m0)*s + v0 - values[ k ] )
+			if error > worstError:
+				worstError, worstIdx = error, k
+
+		#if the segment is good enough we're done with it, otherwise split it at the worst sample and fit both halves
+		if worstError <= tolerance:
+			maxError = max( maxError, worstError )
+			continue
+
+		kept.append( worstIdx )
+		toFit.append( (i, worstIdx) )
+		toFit.append( (worstIdx, j) )
+
+	kept.sort()
+
+	return KeyReduction( array( 'd', [ times[ n ] for n in kept ] ),
+	                     array( 'd', [ values[ n ] for n in kept ] ),
+	                     array( 'd', [ slopes[ n ] for n in kept ] ), maxError, count )
+
+
+def _reduceSamplesArgs( args ):
+	return reduceSamples( *args )
+
+
+def reduceSamplesParallel( sampleLists, tolerance=DEFAULT_TOLERANCE, processes=None ):
+	'''
+	reduces a list of (times, values) 2-tuples - one per channel - using a pool of processes.  returns a list
+	of KeyReduction instances in the same order.  see filesystem.mapInProcessPool for details on processes
+	'''
+	args = [ (times, values, tolerance) for times, values in sampleLists ]
+
+	return mapInProcessPool( _reduceSamplesArgs, args, processes, 3, max( 1, len( args ) / 32 ) )
+
+
+def buildSyntheticMocap( channelCount=60, frameCount=2000, seed=0 ):
+	'''
+	returns a list of (times, values) 2-tuples that look roughly like baked mocap - a few overlapping sine
+	waves per channel with a little noise
+	'''
+	rand = random.Random( seed )
+	times = array( 'd', xrange( frameCount ) )
+	sampleLists = []
+	for n in xrange( channelCount ):
+		waves = [ (rand.uniform( 1, 20 ), rand.uniform( 20, 200 ), rand.uniform( 0, 2*pi )) for i in xrange( 3 ) ]
+		values = array( 'd', [ sum( [ amp * sin( 2*pi*t / period + phase ) for amp, period, phase in waves ] ) + rand.gauss( 0, 0.002 ) for t in times ] )
+		sampleLists.append( (times, values) )
+
+	return sampleLists
+
+
+def benchmark( channelCount=360, frameCount=2000, tolerance=DEFAULT_TOLERANCE, seed=0 ):
+	'''
+	reduces a synthetic mocap clip (ie 60 joints with 6 channels each) both in this process and using a pool
+	of processes, and reports the compression and the max error
+	'''
+	sampleLists = buildSyntheticMocap( channelCount, frameCount, seed )
+
+	start = time.clock()
+	reductions = reduceSamplesParallel( sampleLists, tolerance, processes=1 )
+	serialTime = time.clock() - start
+
+	start = time.time()
+	parallelReductions = reduceSamplesParallel( sampleLists, tolerance )
+	parallelTime = time.time() - start
+
+	sourceCount = sum( [ r.sourceCount for r in reductions ] )
+	keyCount = sum( [ r.keyCount for r in reductions ] )
+	print '%d channels x %d frames: %d keys -> %d keys (%0.1fx), max error %g (tolerance %g)' % (channelCount, frameCount, sourceCount, keyCount, sourceCount / float( keyCount ), max( [ r.maxError for r in reductions ] ), tolerance)
+	print '  serial: %0.3fs' % serialTime
+	print '  parallel: %0.3fs' % parallelTime
+	assert [ r.keyCount for r in reductions ] == [ r.keyCount for r in parallelReductions ]
+
+
+if __name__ == '__main__':
+	benchmark()
+
+
+#end
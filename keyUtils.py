@@ -4,6 +4,9 @@ import maya.cmds as cmd
 import maya.OpenMaya as OpenMaya
 import maya.OpenMayaAnim as OpenMayaAnim
 import bisect, os
+import animCurve
+import keyReduction
+from keyArrays import KeyArrays, KeyView, TANGENT_TYPES, TANGENT_CODES
 
 
 g_defaultKeyUtilsPickle = 'd:/temp.pickle'
@@ -51,19 +54,22 @@ def noUpdate(f):
 	return actualFunc
 
 
-class Key(object):
+class Key(KeyView):
 	'''this is simply a convenient abstraction of a key object in maya - which doesn't
 	really exist...  working with key data is a pain in the ass.  you can specify either
 	a key time or a key index when creating an instance.  if both are specifed, index is
 	used.  if time is specified, and there is no key at that time, a phantom key is
 	created using the curve value at that point - the index is set to -1 in this case,
-	and tangent data is guessed'''
-	def __init__( self, obj=None, attr=None, time=None, value=None, idx=None, populateTangents=True ):
+	and tangent data is guessed.  curve is an optional animCurve.AnimCurve for the channel
+	that phantom keys are evaluated against - see Channel.getKeysAtTimes
+
+	NOTE: the key data is stored in a keyArrays.KeyArrays row - keys returned by a Channel are views into
+	the channel's storage, so changing them changes the channel'''
+	__slots__ = ()
+
+	def __init__( self, obj=None, attr=None, time=None, value=None, idx=None, populateTangents=True, curve=None ):
 		#if the attrpath doesn't exist, then just create an empty key instance
-		self.idx = idx
-		self.obj, self.attr, self.time, self.value = obj, attr, time, value
-		self.iw, self.ow, self.ia, self.oa = 1.0, 1.0, 0, 0
-		self.itt, self.ott, self.lock = 'linear', 'linear', True
+		KeyView.__init__( self, obj, attr, time, value, idx )
 
 		if obj is None or attr is None: return
 
@@ -72,21 +78,14 @@ class Key(object):
 		#self.attrShort = cmd.attributeQuery(self.attr,shortName=True,node=self.obj)
 
 		#populating tangents is slow - so only do it when required
-		if populateTangents: self.populateTangents()
-	def copy( self ):
-		new = self.__class__()
-		new.idx = self.idx
-		new.obj, new.attr, new.time, new.value = self.obj, self.attr, self.time, self.value
-		new.iw, new.ow, new.ia, new.oa = self.iw, self.ow, self.ia, self.oa
-		new.itt, new.ott, new.lock = self.itt, self.ott, self.lock
-
-		return new
+		if populateTangents: self.populateTangents(curve)
 	def get_attrpath( self ):
 		return '%s.%s'%(self.obj,self.attr)
 	attrpath = property(get_attrpath)
-	def populateTangents( self ):
+	def populateTangents( self, curve=None ):
 		#is there a key at the time?
 		attrpath = self.attrpath
+		keyTime = self.time
 		if cmd.keyframe(attrpath,time=(keyTime,),query=True,keyframeCount=True):
 			self.value = cmd.keyframe(attrpath,time=(keyTime,),query=True,valueChange=True)[0]
 			self.iw,self.ow,self.ia,self.oa = cmd.keyTangent(attrpath,time=(keyTime,),query=True,inWeight=True,outWeight=True,inAngle=True,outAngle=True)
@@ -97,53 +96,35 @@ class Key(object):
 			if self.itt == 'fixed': self.itt = 'spline'
 			if self.ott == 'fixed': self.ott = 'spline'
 		else:
-			self.idx = self.get_index()
-			self.value = cmd.keyframe(attrpath,time=(self.time,),query=True,eval=True,valueChange=True)
-			index = self.idx
-			previousOutTT = None
-			previousOutTW = None
-			nextInTT = None
-			nextInTW = None
-			if index > 1:
-				previousOutTT = cmd.keyTangent(attrpath,index=(index-1,),query=True,outTangentType=True)
-				previousOutTW = cmd.keyTangent(attrpath,index=(index-1,),query=True,outWeight=True)
-			else:
-				previousOutTT = cmd.keyTangent(attrpath,index=(index,),query=True,outTangentType=True)
-				previousOutTW = cmd.keyTangent(attrpath,index=(index,),query=True,outWeight=True)
-
-			if index < cmd.keyframe(self.attr,query=True,keyframeCount=True):
-				nextInTT = cmd.keyTangent(attrpath,index=(index+1,),query=True,inTangentType=True)
-				nextInTW = cmd.keyTangent(attrpath,index=(index+1,),query=True,inWeight=True)
-			else:
-				nextInTT = cmd.keyTangent(attrpath,index=(index,),query=True,inTangentType=True)
-				nextInTW = cmd.keyTangent(attrpath,index=(index,),query=True,inWeight=True)
-
-			#now average the tangents
-				self.iw = self.ow = (previousOutTW + nextInTW )/2
-	def __str__( self ):
-		return '%.2f'% (self.time,)
-	def __repr__( self ):
-		return self.__str__()
-	def __cmp__( self, other, tolerance=1e-4 ):
-		if isinstance(other,Key): other = other.time
-		if abs(self.time-other) <= tolerance : return 0
-		if self.time - other < 0: return -1
-		return 1
-	def offset( self, amount ):
-		#time offsets the channel by a given time delta
-		self.time += amount
+			#this is a phantom key - so grab all the keys on the curve in one go and evaluate the curve offline
+			#instead of asking maya about the value and the neighbouring tangents
+			if curve is None:
+				curve = Channel(self.obj,self.attr).getAnimCurve()
+
+			self.populatePhantom(curve,self.get_index(),api.getFps())
+	def populatePhantom( self, curve, idx, fps ):
+		'''sets the key data for a phantom key by evaluating the given animCurve.AnimCurve at the key time - idx is
+		the index of the key before the phantom key.  fps is the scene frame rate - maya tangent angles are
+		measured in value per second, while the curve slope is in value per frame'''
+		keyTime = self.time
+		self.idx = idx
+		self.value = curve.evaluate(keyTime)
+		self.iw = self.ow = 1.0
+		self.ia = self.oa = animCurve.toMayaAngle(1.0,curve.evaluateSlope(keyTime),fps)[0]
+		self.itt = self.ott = 'spline'
 	def get_index( self ):
 		'''returns the key object's index'''
-		return cmd.keyframe(self.attr,time=(":%f"+self.time,),query=True,keyframeCount=True)-1
+		return cmd.keyframe(self.attrpath,time=(":%f" % self.time,),query=True,keyframeCount=True)-1
 
 
 class Channel(object):
-	'''a channel is simply a list of key objects with some convenience methods attached'''
+	'''a channel is simply a sequence of keys with some convenience methods attached.  the key data is stored
+	in a keyArrays.KeyArrays instance - the keys property returns Key views into it'''
 	def __init__( self, obj=None, attr=None, start=None, end=None, populateTangents=True ):
 		self.obj = obj
 		self.attr = attr
 		self.weighted = True
-		self.keys = []
+		self.keyArrays = KeyArrays()
 
 		#unless an attrpath has been specified, we're done...
 		if obj is None or attr is None: return
@@ -170,7 +151,11 @@ class Channel(object):
 
 			#if there are no keys - bail
 			if times is None: return
-			self.keys = [Key(obj,attr,time=k,value=v,populateTangents=False) for k,v in zip(times,values)]
+
+			keyArrays = self.keyArrays
+			keyArrays.times.extend( times )
+			keyArrays.values.extend( values )
+			count = len( times )
 			if populateTangents:
 				#querying heaps of tangent data at once is much more efficient than throwing a query for
 				#each key created - so although uglier, its quite significantly faster...
@@ -182,160 +167,206 @@ class Channel(object):
 				otts = cmd.keyTangent(attrpath,time=(start,end),query=True,ott=True)
 				locks = cmd.keyTangent(attrpath,time=(start,end),query=True,lock=True)
 
-				#remove all instances of 'fixed' tangent types.  maya will return a type of fixed, but it throws an exception if
-				#you try to set a tangent type of fixed...  nice...
-				try:
-					while True: itts.remove('fixed')
-				except ValueError: pass
-				try:
-					while True: otts.remove('fixed')
-				except ValueError: pass
-
-				#
-				for key,iw,ow,ia,oa,itt,ott,lock in zip(self.keys,iws,ows,ias,oas,itts,otts,locks):
-					key.iw,key.ow,key.ia,key.oa,key.itt,key.ott,key.lock = iw,ow,ia,oa,itt,ott,lock
-
-			self.keys.sort()
+				#replace all instances of 'fixed' tangent types.  maya will return a type of fixed, but it throws an exception if
+				#you try to set a tangent type of fixed...  nice...  like Key.populateTangents, assume spline
+				itts = [ ('spline' if tt == 'fixed' else tt) for tt in itts ]
+				otts = [ ('spline' if tt == 'fixed' else tt) for tt in otts ]
+
+				keyArrays.iws.extend( iws )
+				keyArrays.ows.extend( ows )
+				keyArrays.ias.extend( ias )
+				keyArrays.oas.extend( oas )
+				keyArrays.itts.extend( [ TANGENT_CODES[ tt ] for tt in itts ] )
+				keyArrays.otts.extend( [ TANGENT_CODES[ tt ] for tt in otts ] )
+				keyArrays.locks.extend( [ bool( lock ) for lock in locks ] )
+			else:
+				keyArrays.iws.extend( [ 1.0 ] * count )
+				keyArrays.ows.extend( [ 1.0 ] * count )
+				keyArrays.ias.extend( [ 0.0 ] * count )
+				keyArrays.oas.extend( [ 0.0 ] * count )
+				keyArrays.itts.extend( [ TANGENT_CODES[ 'linear' ] ] * count )
+				keyArrays.otts.extend( [ TANGENT_CODES[ 'linear' ] ] * count )
+				keyArrays.locks.extend( [ True ] * count )
+
+			keyArrays.idxs.extend( [ -1 ] * count )
+			keyArrays.sort()
 	@classmethod
 	def FromChannel( cls, channel, keys=None ):
+		'''
+		keys can be either a list of Key objects or a KeyArrays instance - if not given, the channel's keys are
+		copied
+		'''
 		new = cls()
 		new.obj = channel.obj
 		new.attr = channel.attr
 		new.attrShort = channel.attrShort
 		new.weighted = channel.weighted
-		if keys is None: new.keys = [key.copy() for key in channel.keys]
-		else: new.keys = [key.copy() for key in keys]
+		if keys is None: new.keyArrays = channel.keyArrays.copy()
+		elif isinstance(keys,KeyArrays): new.keyArrays = keys
+		else: new.keyArrays = KeyArrays.FromKeys(keys)
 
 		return new
 	def copy( self ):
 		return Channel.FromChannel(self)
+	def __setstate__( self, state ):
+		#channels pickled before the keys were stored in a KeyArrays instance hold a list of Key objects
+		state = dict(state)
+		keys = state.pop('keys',None)
+		self.__dict__.update(state)
+		if keys is not None: self.keyArrays = KeyArrays.FromKeys(keys)
+		elif 'keyArrays' not in state: self.keyArrays = KeyArrays()
 	def get_attrpath( self ):
 		return '%s.%s'%(self.obj,self.attr)
 	attrpath = property(get_attrpath)
+	def get_keys( self ):
+		'''returns a list of Key views into this channel's storage.  NOTE: changing the keys changes the channel,
+		but adding or removing items from the list doesn't - assign a new list of keys to do that'''
+		keyArrays, obj, attr = self.keyArrays, self.obj, self.attr
+		view = Key.View
+		return [view(keyArrays,n,obj,attr) for n in xrange(len(keyArrays))]
+	def set_keys( self, keys ):
+		self.keyArrays = KeyArrays.FromKeys(keys)
+	keys = property(get_keys, set_keys)
+	def get_times( self ):
+		return list(self.keyArrays.times)
+	times = property(get_times)
 	def get_start( self ):
-		keyTimes = [key.time for key in self.keys]
+		keyTimes = self.keyArrays.times
 		if len(keyTimes): return min(keyTimes)
 	start = property(get_start)
 	def get_end( self ):
-		keyTimes = [key.time for key in self.keys]
+		keyTimes = self.keyArrays.times
 		if len(keyTimes): return max(keyTimes)
 	end = property(get_end)
 	def get_values( self ):
-		values = []
-		for key in self.keys:
-			values.append(key.value)
-		return values
+		return list(self.keyArrays.values)
 	values = property(get_values)
+	def getAnimCurve( self, explicitTangents=True ):
+		'''returns an animCurve.AnimCurve for this channel so it can be evaluated without maya.  if explicitTangents
+		is False the tangents are derived from the key tangent types instead of the stored tangent angles'''
+		return animCurve.AnimCurve.FromKeyArrays(self.keyArrays,api.getFps(),self.weighted,explicitTangents)
+	def evaluate( self, times ):
+		'''returns an array of the channel's values at the given times - evaluated offline'''
+		return self.getAnimCurve().evaluateTimes(times)
+	def getKeysAtTimes( self, times ):
+		'''returns a list of Key instances for the given times.  keys that exist in the channel are copied, and
+		phantom keys are evaluated against a single AnimCurve built for the whole channel - building a Key for each
+		time would re-query the entire curve for every phantom key'''
+		keyArrays, obj, attr = self.keyArrays, self.obj, self.attr
+		keyTimes = keyArrays.times
+		curve = None
+		keys = []
+		for keyTime in times:
+			n = bisect.bisect_right(keyTimes,keyTime) - 1
+			if n >= 0 and keyTimes[n] == keyTime:
+				keys.append(Key.View(keyArrays,n,obj,attr).copy())
+				continue
+
+			if curve is None:
+				curve = self.getAnimCurve()
+				fps = api.getFps()
+
+			key = Key(obj,attr,keyTime,populateTangents=False)
+			key.populatePhantom(curve,n,fps)
+			keys.append(key)
+
+		return keys
 	def __str__( self ):
 		return '%s %s'%(self.attrpath, str(self.keys))
 	def __repr__( self ):
 		return self.__str__()
 	def __nonzero__( self ):
-		return bool(self.keys)
+		return bool(self.keyArrays)
 	def __add__( self, other ):
 		assert isinstance(other,Channel)
-		newChannel = self.copy()
 
 		#so when adding channels, if there are two keys on the same frame, their values get added together
 		#TODO: if not, then find surrounding keys (if any) and do a value lerp to add to the key value
-		for key in other.keys:
-			keyAtTime = self[key.time]
-			if keyAtTime:
-				keyAtTime.keys[0].value += key.value
-			else:
-				newChannel.keys.append(key)
-
-		newChannel.keys.sort()
-
-		return newChannel
+		return Channel.FromChannel(self,self.keyArrays.merge(other.keyArrays))
 	def __getitem__( self, timeValue ):
 		'''so this returns a slice based on a time value NOT and index.  NOTE: the slice step is ignored - it
 		doesn't really make any sense'''
+		keyArrays = self.keyArrays
 		if isinstance(timeValue,slice):
-			start_idx = bisect.bisect_left(self.keys,timeValue.start)
-			end_idx = bisect.bisect(self.keys,timeValue.stop)
-			keys = self.keys[start_idx:end_idx]
-			newChannel = Channel.FromChannel(self,keys)
-
-			return newChannel
-
-		try:
-			idx = bisect.bisect_left(self.keys,timeValue)
-			key = self.keys[idx]
-			if abs(timeValue-key.time)<=1e-4: return Channel.FromChannel(self,[key])
-		except IndexError:
-			return Channel.FromChannel(self,[])
+			start_idx, end_idx = keyArrays.getIndexRange(timeValue.start,timeValue.stop)
+
+			return Channel.FromChannel(self,keyArrays.slice(start_idx,end_idx))
+
+		idx = keyArrays.findTime(timeValue)
+		if idx is None:
+			return Channel.FromChannel(self,KeyArrays())
+
+		return Channel.FromChannel(self,keyArrays.slice(idx,idx+1))
 	def __len__( self ):
-		return len(self.keys)
+		return len(self.keyArrays)
 	def offset( self, amount ):
 		#time offsets the channel by a given time delta
-		[key.offset(amount) for key in self.keys]
+		self.keyArrays.offset(amount)
 	def transform( self, transformFunction ):
 		#transforms all key values by the given transform function.  the first arg passed to the transform function is the key
 		#the return value should also be a key object
 		self.keys = [transformFunction(key) for key in self.keys]
-	def applyToObj( self, obj, applyAsWorld=False, clearFirst=False ):
-		'''applies the current channel to a given attrpath'''
+	def applyToObj( self, obj, applyAsWorld=False, clearFirst=False, applyTangents=False ):
+		'''applies the current channel to a given attrpath.  if applyTangents is True the stored tangent angles
+		(and weights for weighted channels) are set as well - reduced channels need this to keep their shape'''
 		tgtAttrpath = '.'.join((obj,self.attr))
 		if not cmd.objExists(tgtAttrpath): return
 		if clearFirst:
 			if self.start is not None:
 				cmd.cutKey(tgtAttrpath,t=(self.start,self.end),cl=True)
 
+		keyArrays = self.keyArrays
+		itts = [TANGENT_TYPES[tt] for tt in keyArrays.itts]
+		otts = [TANGENT_TYPES[tt] for tt in keyArrays.otts]
 		if applyAsWorld and self.hasWorld:
 			#apply as world - NOT DONE YET
-			for key in self.keys:
-				cmd.setKeyframe(tgtAttrpath,time=(key.time,),value=key.value,inTangentType=key.itt,outTangentType=key.ott)
-				cmd.keyTangent(tgtAttrpath,time=(key.time,),edit=True,inWeight=key.iw,outWeight=key.ow,inAngle=self.ia,outAngle=self.oa)
+			for time,value,iw,ow,itt,ott in zip(keyArrays.times,keyArrays.values,keyArrays.iws,keyArrays.ows,itts,otts):
+				cmd.setKeyframe(tgtAttrpath,time=(time,),value=value,inTangentType=itt,outTangentType=ott)
+				cmd.keyTangent(tgtAttrpath,time=(time,),edit=True,inWeight=iw,outWeight=ow,inAngle=self.ia,outAngle=self.oa)
 		else:
 			#set this initial dummy keyframe so we can set the curve's (whcih may not exist) weightedness
-			if len( self.keys ):
-				cmd.setKeyframe(tgtAttrpath,time=(self.keys[0].time,))
+			if len( keyArrays ):
+				cmd.setKeyframe(tgtAttrpath,time=(keyArrays.times[0],))
 				cmd.keyTangent(tgtAttrpath,edit=True,weightedTangents=self.weighted)
 
 			#if self.weighted: print "hi i'm weighting ur tangents..."
-			for key in self.keys:
-				cmd.setKeyframe(tgtAttrpath,time=(key.time,),value=key.value,inTangentType=key.itt,outTangentType=key.ott)
+			for time,value,itt,ott in zip(keyArrays.times,keyArrays.values,itts,otts):
+				cmd.setKeyframe(tgtAttrpath,time=(time,),value=value,inTangentType=itt,outTangentType=ott)
+
+			if applyTangents:
+				for time,iw,ow,ia,oa in zip(keyArrays.times,keyArrays.iws,keyArrays.ows,keyArrays.ias,keyArrays.oas):
+					if self.weighted:
+						cmd.keyTangent(tgtAttrpath,time=(time,),edit=True,inAngle=ia,outAngle=oa,inWeight=iw,outWeight=ow)
+					else:
+						cmd.keyTangent(tgtAttrpath,time=(time,),edit=True,inAngle=ia,outAngle=oa)
 				#cmd.keyTangent(tgtAttrpath,time=(key.time,),edit=True,lock=key.lock,inWeight=key.iw,outWeight=key.ow,inAngle=key.ia,outAngle=key.oa)
 	def getTurningPoints( self ):
 		'''returns a list of keys that are turning points'''
-		if len(self.keys) < 3:
-			return []
-
-		turningPoints = []
-		keyIter = iter(self.keys)
-		prevKey = keyIter.next()
-		curKey = keyIter.next()
-		nextKey = keyIter.next()
-		while True:
-			try:
-				prevValue = prevKey.value - curKey.value
-				nextValue = nextKey.value - curKey.value
-				if ( prevValue<0 and nextValue<0 ) or ( prevValue>0 and nextValue>0 ):
-					#in this case nextKey is a turning point
-					turningPoints.append(curKey)
-
-				prevKey = curKey
-				curKey = nextKey
-				nextKey = keyIter.next()
-			except StopIteration:
-				break
-
-		return turningPoints
-	def keyReduce( self ):
-		#get the nodeType of the animCurve driving this channel
-		animCurve = cmd.listConnections('%s.%s'%(self.obj,self.attr),type='animCurve',destination=False)[0]
-		nodeType = cmd.nodeType(animCurve)
-
-		#create an array to hold the "reduced" set of keys to create - start/end and turning points are mandatory
-		newKeys = [self.keys[0]] + self.getTurningPoints() + [self.keys[-1]]
-
-		#create the new animCurve - we do this because asking maya to query the interpolation between keys is way easier than doing it via script
-		reduce = cmd.createNode(nodeType)
-		for key in newKeys: cmd.setKeyframe(reduce,time=(key.time,),value=key.value,inTangentType='linear',outTangentType='linear')
-
-		#
-		return reduce
+		keyArrays, obj, attr = self.keyArrays, self.obj, self.attr
+
+		return [Key.View(keyArrays,n,obj,attr) for n in keyArrays.getTurningPointIndices()]
+	def keyReduce( self, tolerance=keyReduction.DEFAULT_TOLERANCE ):
+		'''returns a (reducedChannel, reduction) tuple - reducedChannel is a new channel with as few keys as are
+		needed to stay within tolerance of every key in this channel, and reduction is the keyReduction.KeyReduction
+		instance which holds the max error and compression ratio.  apply the reduced channel using
+		applyToObj(..., applyTangents=True) to keep its tangents'''
+		reduction = keyReduction.reduceSamples(self.keyArrays.times,self.keyArrays.values,tolerance)
+
+		return Channel.FromReduction(self,reduction), reduction
+	@classmethod
+	def FromReduction( cls, channel, reduction ):
+		new = Channel.FromChannel(channel,reduction.toKeyArrays(api.getFps()))
+		new.weighted = False
+
+		return new
+
+
+def reduceChannels( channels, tolerance=keyReduction.DEFAULT_TOLERANCE, processes=None ):
+	'''reduces a list of channels using a pool of processes - returns a list of (reducedChannel, reduction) tuples.
+	see Channel.keyReduce'''
+	reductions = keyReduction.reduceSamplesParallel([(c.keyArrays.times,c.keyArrays.values) for c in channels],tolerance,processes)
+
+	return [(Channel.FromReduction(channel,reduction),reduction) for channel,reduction in zip(channels,reductions)]
 
 
 class Clip(object):
@@ -784,15 +815,15 @@ def generate( baseStart, baseEnd,\
 
 			#do the actual rotation around Y
 			mats = clip.world
-			translateX = clip.translateX.keys = []
-			translateZ = clip.translateZ.keys = []
+			translateX = clip.translateX.keyArrays = KeyArrays()
+			translateZ = clip.translateZ.keyArrays = KeyArrays()
 			for mat in mats:
 				pos = mat.get_position()
 				pos = pos.rotate(quat)
 				mat[3][:3] = pos
 
-				translateX.append( Key( time=mat.time, value=pos.x ) )
-				translateZ.append( Key( time=mat.time, value=pos.z ) )
+				translateX.append( mat.time, pos.x )
+				translateZ.append( mat.time, pos.z )
 
 			#now do stride length multiplication
 			strideMult = strideLengthMultipliers[n]
@@ -144,8 +144,9 @@ class MappingForm(MelHLayout):
 	def mapSrcItem( self, src ):
 		self._srcToTgtDict[ src ] = names.matchNames( [ src ], self.tgts, self.STRIP_NAMESPACES, self.PARITY_MATCH, self.UNIQUE_MATCHING, self.MATCH_OPPOSITE_PARITY, self.THRESHOLD )
 	def mapAllSrcItems( self ):
+		matcher = names.NameMatcher( self.tgts, self.STRIP_NAMESPACES )
 		for src in self.srcs:
-			self.mapSrcItem( src )
+			self._srcToTgtDict[ src ] = matcher.match( [ src ], self.PARITY_MATCH, self.UNIQUE_MATCHING, self.THRESHOLD )
 	def addSrcItems( self, items ):
 		if items:
 			self.UI_srcs.appendItems( list( sorted( items ) ) )
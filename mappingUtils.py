@@ -22,15 +22,16 @@ def resolveMappingToScene( mapping, threshold=1.0 ):
 	assert isinstance( mapping, Mapping )
 
 	toSearch = cmd.ls( typ='transform' )
+	matcher = NameMatcher( toSearch )  #build the name index once rather than once per lookup
 	existingSrcs = []
 	existingTgts = []
 
 	for src, tgt in mapping.iteritems():
 		if not cmd.objExists( src ):
-			src = matchNames( [ src ], toSearch, **kw )[ 0 ]
+			src = matcher.match( [ src ], threshold=threshold )[ 0 ]
 
 		if not cmd.objExists( tgt ):
-			tgt = matchNames( [ tgt ], toSearch, **kw )[ 0 ]
+			tgt = matcher.match( [ tgt ], threshold=threshold )[ 0 ]
 
 		if cmd.objExists( src ) and cmd.objExists( tgt ):
 			existingSrcs.append( src )
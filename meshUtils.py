@@ -9,6 +9,7 @@ from maya.cmds import *
 from maya.OpenMayaAnim import MFnSkinCluster
 from vectors import Vector, Matrix
 from filesystem import Path, BreakException
+from sparseWeights import SparseWeights, renormalizeRowWithMinimumValue
 
 import maya.cmds as cmd
 import api
@@ -603,41 +604,38 @@ def clampVertInfluenceCount( geos=None ):
 
 		inc = 100.0 / len( verts )
 		progress = 0
+
+		#gather the weights for the verts that need fixing - either they have too many influences or they have
+		#weights below the minimum value.  the joint list is only queried for these verts
 		vertsFixed = []
+		influences = []
+		influenceIdxs = {}
+		rows = []
 		for vert in verts:
 			progress += inc
 			progressWindow(e=True, progress=progress)
 
-			reapplyWeights = False
 			weightList = skinPercent(skin, vert, ib=1e-5, q=True, value=True)
+			if len(weightList) > kMAX_INF_PER_VERT or min( weightList ) <= kMIN_SKIN_WEIGHT_VALUE:
+				jointList = skinPercent(skin, vert, ib=1e-5, q=True, transform=None)
+				for j in jointList:
+					if j not in influenceIdxs:
+						influenceIdxs[ j ] = len( influences )
+						influences.append( j )
+
+				rows.append( ([ influenceIdxs[ j ] for j in jointList ], weightList) )
+				vertsFixed.append( vert )
 
-			if len(weightList) > kMAX_INF_PER_VERT:
-				jointList = skinPercent(skin, vert, ib=halfMin, q=True, transform=None)
-				sorted = zip(weightList, jointList)
-				sorted.sort()
-
-				#now clamp to the highest kMAX_INF_PER_VERT number of weights, and re-normalize
-				sorted = sorted[ -kMAX_INF_PER_VERT: ]
-				weightSum = sum( [ a for a, b in sorted ] )
-
-				t_values = [ (b, a/weightSum) for a, b in sorted ]
-				reapplyWeights = True
-
-			else:
-				for n, v in enumerate( weightList ):
-					if v <= kMIN_SKIN_WEIGHT_VALUE:
-						jointList = skinPercent( skin, vert, ib=halfMin, q=True, transform=None )
-						t_values = [ (a, b) for a, b in zip( jointList, weightList ) if b > halfMin ]
-						reapplyWeights = True
-						break
-
-			if reapplyWeights:
-				js = [ a for a, b in t_values ]
-				vs = renormalizeWithMinimumValue( [ b for a, b in t_values ] )
-				t_values = zip( js, vs )
+		#now clamp to the highest kMAX_INF_PER_VERT number of weights, strip tiny weights from the verts that weren't
+		#clamped and re-normalize - all in bulk
+		weights = SparseWeights.FromRows( rows )
+		unclampedRows = [ n for n, length in enumerate( weights.getRowLengths() ) if length <= kMAX_INF_PER_VERT ]
+		weights.clampInfluenceCount( kMAX_INF_PER_VERT )
+		weights.prune( halfMin, unclampedRows )
+		weights.renormalizeWithMinimumValue( kMIN_SKIN_WEIGHT_VALUE )
 
-				skinPercent( skin, vert, tv=t_values )
-				vertsFixed.append( vert )
+		for vert, jointsAndWeights in zip( vertsFixed, weights.toRows() ):
+			skinPercent( skin, vert, tv=[ (influences[ j ], w) for j, w in jointsAndWeights ] )
 
 		#turn on limiting in the skinCluster
 		cmd.setAttr('%s.maxInfluences' % skin, kMAX_INF_PER_VERT)
@@ -648,19 +646,10 @@ def clampVertInfluenceCount( geos=None ):
 
 
 def renormalizeWithMinimumValue( values, minValue=kMIN_SKIN_WEIGHT_VALUE ):
-	minCount = sum( 1 for v in values if v <= minValue )
-	toAlter = [ n for n, v in enumerate( values ) if v > minValue ]
-	modValues = [ max( minValue, v ) for v in values ]
-
-	toAlterSum = sum( [ values[ n ] for n in toAlter ] )
-	for n in toAlter:
-		modValues[ n ] /= toAlterSum
-
-	modifier = 1.0035 + ( float( minCount ) * minValue )
-	for n in toAlter:
-		modValues[ n ] /= modifier
-
-	return modValues
+	'''
+	NOTE: to renormalize many verts at once use SparseWeights.renormalizeWithMinimumValue
+	'''
+	return renormalizeRowWithMinimumValue( values, minValue )
 
 
 def getBoundsForJoint( joint ):
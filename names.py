@@ -3,6 +3,9 @@ parityTestsL = ["l", "left", "lft", "lf", "lik"]
 parityTestsR = ["r", "right", "rgt", "rt", "rik"]
 DEFAULT_THRESHOLD = 1
 
+#the weighting given to tokens that match exactly when working out name likeness
+EXACT_MATCH_WEIGHT = 1.025
+
 
 class Parity(int):
 	PARITIES = NONE, LEFT, RIGHT = None, 0, 1
@@ -182,89 +185,11 @@ class Name(object):
 		#if the names match exactly, return the highest likeness
 		if str(self) == str(other): return 1
 
-		srcTokens = self.split()[:]
-		tgtTokens = other.split()[:]
-
 		if parityMatters:
 			if self.parity != other.parity:
 				return 0
 
-		#if the split result is exact, early out
-		if srcTokens == tgtTokens: return 1
-
-		exactMatchWeight = 1.025
-		totalWeight = 0
-		numSrcToks, numTgtToks = len(srcTokens), len(tgtTokens)
-
-		for srcTok in srcTokens:
-			bestMatch,bestMatchIdx = 0,-1
-			isSrcDigit = srcTok.isdigit()
-			for n,tgtTok in enumerate(tgtTokens):
-				tokSize = len(tgtTok)
-				isTgtDigit = tgtTok.isdigit()
-
-				#if one is a number token and the other isn't - there is no point proceeding as they're not going to match
-				#letter tokens should not match number tokens - i guess it would be possible to test whether the word token
-				#was a number name, but this would be expensive, and would only help fringe cases
-				if isSrcDigit != isTgtDigit:
-					continue
-
-				#first, check to see if the names are the same
-				if srcTok == tgtTok:
-					bestMatch = tokSize * exactMatchWeight
-					bestMatchIdx = n
-					break
-
-				#are the tokens numeric tokens?  if so, we need to figure out how similar they are numerically - numbers that are closer to one another should result in a better match
-				elif isSrcDigit and isTgtDigit:
-					srcInt,tgtInt = int(srcTok),int(tgtTok)
-					largest = max( abs(srcInt), abs(tgtInt) )
-					closeness = 1
-
-					if srcInt != tgtInt: closeness = ( largest - abs( srcInt-tgtInt ) ) / float(largest)
-					bestMatch = tokSize * closeness
-					bestMatchIdx = n
-					break
-
-				#are the names the same bar case differences?
-				elif srcTok.lower() == tgtTok.lower():
-					bestMatch = tokSize
-					bestMatchIdx = n
-					break
-
-				#so now test to see if any of the tokens are "sub-words" of each other - ie if you have something_otherthing an_other
-				#the second token, "otherthing" and "other", the second is a subset of the first, so this is a rough match
-				else:
-					srcTokSize = len(srcTok)
-					lowSrcTok,lowTgtTok = srcTok.lower(),tgtTok.lower()
-					smallestWordSize = min( srcTokSize, tokSize )
-					subWordWeight = 0
-
-					#the weight is calculated as a percentage of matched letters
-					if srcTokSize > tokSize: subWordWeight = tokSize * tokSize / float(srcTokSize)
-					else: subWordWeight = srcTokSize * srcTokSize / float(tokSize)
-
-					if srcTokSize > 2 and tokSize > 2:
-						#make sure the src and tgt tokens are non-trivial (ie at least 3 letters)
-						if lowSrcTok.find(lowTgtTok) != -1 or lowTgtTok.find(lowSrcTok) != -1:
-							bestMatch = subWordWeight
-							bestMatchIdx = n
-
-			#remove the best match from the list - so it doesn't get matched to any other tokens
-			if bestMatchIdx != -1:
-				tgtTokens.pop(bestMatchIdx)
-				numTgtToks -= 1
-
-			totalWeight += bestMatch
-
-		#get the total number of letters in the "words" of the longest name - we use this for a likeness baseline
-		lenCleanSrc = len(self._string)-self._string.count('_')
-		lenCleanTgt = len(other._string)-other._string.count('_')
-		#lenCleanSrc = len(''.join(self.split()))
-		#lenCleanTgt = len(''.join(other.split()))
-		lenClean = max( lenCleanSrc, lenCleanTgt )
-
-		return totalWeight / ( lenClean*exactMatchWeight )
+		return tokenLikeness( self._string, other._string, self.split(), other.split() )
 	def strip( self, inPlace=True ):
 		'''strips any namespace or path data from the name string - by default the stripping is done
 		"in place", but if the inPlace variable is set to false, then a new Name object is returned'''
@@ -328,6 +253,91 @@ class Name(object):
 		return self.split()
 
 
+def tokenLikeness( srcString, tgtString, srcTokens, tgtTokens ):
+	'''
+	does the token comparison for Name.likeness given the name strings and their pre-split tokens - see
+	Name.likeness for details.  neither token list is modified
+	'''
+	#if the split result is exact, early out
+	if srcTokens == tgtTokens: return 1
+
+	tgtTokens = tgtTokens[:]
+
+	exactMatchWeight = EXACT_MATCH_WEIGHT
+	totalWeight = 0
+	numSrcToks, numTgtToks = len(srcTokens), len(tgtTokens)
+
+	for srcTok in srcTokens:
+		bestMatch,bestMatchIdx = 0,-1
+		isSrcDigit = srcTok.isdigit()
+		for n,tgtTok in enumerate(tgtTokens):
+			tokSize = len(tgtTok)
+			isTgtDigit = tgtTok.isdigit()
+
+			#if one is a number token and the other isn't - there is no point proceeding as they're not going to match
+			#letter tokens should not match number tokens - i guess it would be possible to test whether the word token
+			#was a number name, but this would be expensive, and would only help fringe cases
+			if isSrcDigit != isTgtDigit:
+				continue
+
+			#first, check to see if the names are the same
+			if srcTok == tgtTok:
+				bestMatch = tokSize * exactMatchWeight
+				bestMatchIdx = n
+				break
+
+			#are the tokens numeric tokens?  if so, we need to figure out how similar they are numerically - numbers that are closer to one another should result in a better match
+			elif isSrcDigit and isTgtDigit:
+				srcInt,tgtInt = int(srcTok),int(tgtTok)
+				largest = max( abs(srcInt), abs(tgtInt) )
+				closeness = 1
+
+				if srcInt != tgtInt: closeness = ( largest - abs( srcInt-tgtInt ) ) / float(largest)
+				bestMatch = tokSize * closeness
+				bestMatchIdx = n
+				break
+
+			#are the names the same bar case differences?
+			elif srcTok.lower() == tgtTok.lower():
+				bestMatch = tokSize
+				bestMatchIdx = n
+				break
+
+			#so now test to see if any of the tokens are "sub-words" of each other - ie if you have something_otherthing an_other
+			#the second token, "otherthing" and "other", the second is a subset of the first, so this is a rough match
+			else:
+				srcTokSize = len(srcTok)
+				lowSrcTok,lowTgtTok = srcTok.lower(),tgtTok.lower()
+				smallestWordSize = min( srcTokSize, tokSize )
+				subWordWeight = 0
+
+				#the weight is calculated as a percentage of matched letters
+				if srcTokSize > tokSize: subWordWeight = tokSize * tokSize / float(srcTokSize)
+				else: subWordWeight = srcTokSize * srcTokSize / float(tokSize)
+
+				if srcTokSize > 2 and tokSize > 2:
+					#make sure the src and tgt tokens are non-trivial (ie at least 3 letters)
+					if lowSrcTok.find(lowTgtTok) != -1 or lowTgtTok.find(lowSrcTok) != -1:
+						bestMatch = subWordWeight
+						bestMatchIdx = n
+
+		#remove the best match from the list - so it doesn't get matched to any other tokens
+		if bestMatchIdx != -1:
+			tgtTokens.pop(bestMatchIdx)
+			numTgtToks -= 1
+
+		totalWeight += bestMatch
+
+	#get the total number of letters in the "words" of the longest name - we use this for a likeness baseline
+	lenCleanSrc = len(srcString)-srcString.count('_')
+	lenCleanTgt = len(tgtString)-tgtString.count('_')
+	#lenCleanSrc = len(''.join(self.split()))
+	#lenCleanTgt = len(''.join(other.split()))
+	lenClean = max( lenCleanSrc, lenCleanTgt )
+
+	return totalWeight / ( lenClean*exactMatchWeight )
+
+
 def hasParity( nameToks, popParityToken=True ):
 	'''
 	returns a parity number for a given name.  parity is 0 for none, 1 for left, and 2 for right
@@ -444,6 +454,170 @@ def matchCase( theStr, caseToMatch ):
 	return ''.join( matchedCase )
 
 
+def _iterSubstrings( token, minLength=3 ):
+	'''
+	yields all substrings of the given token that are at least minLength characters long
+	'''
+	tokenLength = len( token )
+	for start in xrange( tokenLength - minLength + 1 ):
+		for end in xrange( start + minLength, tokenLength + 1 ):
+			yield token[ start:end ]
+
+
+class NameMatcher(object):
+	'''
+	matches source names against a list of target names.  the targets are tokenized once and the tokens go
+	into an inverted index, so when matching a source name only the targets that can possibly have a non-zero
+	likeness get scored.  the results are exactly the same as comparing every source against every target
+
+	two names can only have a non-zero likeness if at least one pair of tokens match in one of the ways
+	Name.likeness tests for - the same token bar case, both tokens numeric, or one token is a sub-word of the
+	other.  so the index stores each lower case token, the sub-words of each token and which targets have
+	numeric tokens
+
+	the index also gives an upper bound on the likeness of each candidate - a source token can't contribute
+	more than an exact match would.  candidates whose bound can't reach the match threshold are never scored
+	'''
+	def __init__( self, tgtList, strip=True ):
+		if isinstance( tgtList, basestring ): tgtList = [ tgtList ]
+
+		self.strip = strip
+		self.tgtNames = tgtNames = [ Name( name ) for name in tgtList ]
+		if strip:
+			for a in tgtNames: a.cache_prefix()
+
+		self.tgtTokens = tgtTokens = [ a.split() for a in tgtNames ]
+		self._tgtCleanLengths = [ len( a._string ) - a._string.count( '_' ) for a in tgtNames ]
+
+		self._splitIndex = splitIndex = {}
+		self._tokenIndex = tokenIndex = {}
+		self._subWordIndex = subWordIndex = {}
+		self._numericTgts = numericTgts = {}  #maps targets with numeric tokens to the length of their longest numeric token
+		for n, tokens in enumerate( tgtTokens ):
+			splitIndex.setdefault( tuple( tokens ), set() ).add( n )
+			for tok in tokens:
+				lowTok = tok.lower()
+				tokenIndex.setdefault( lowTok, set() ).add( n )
+				if tok.isdigit():
+					numericTgts[ n ] = max( numericTgts.get( n, 0 ), len( tok ) )
+				elif len( tok ) > 2:
+					for subWord in _iterSubstrings( lowTok ):
+						subWordIndex.setdefault( subWord, set() ).add( n )
+	def getCandidates( self, srcTokens ):
+		'''
+		returns a dict keyed by the index of each target that may have a non-zero likeness with a name with the
+		given tokens.  the values are the most token weight each target could possibly score (see tokenLikeness)
+		'''
+		tokenIndex, subWordIndex = self._tokenIndex, self._subWordIndex
+		candidates = {}
+		for tok in srcTokens:
+			lowTok = tok.lower()
+			if tok.isdigit():
+				#all numeric tokens match each other to some degree - and a token can't score more than an exact match
+				for n, longest in self._numericTgts.iteritems():
+					candidates[ n ] = candidates.get( n, 0 ) + longest * EXACT_MATCH_WEIGHT
+
+				continue
+
+			tokMatches = tokenIndex.get( lowTok, set() )
+			if len( tok ) > 2:
+				#targets with tokens containing this token, and targets with tokens contained in this token
+				tokMatches = tokMatches.union( subWordIndex.get( lowTok, () ) )
+				for subWord in _iterSubstrings( lowTok ):
+					tokMatches.update( tokenIndex.get( subWord, () ) )
+
+			weight = len( tok ) * EXACT_MATCH_WEIGHT
+			for n in tokMatches:
+				candidates[ n ] = candidates.get( n, 0 ) + weight
+
+		return candidates
+	def match( self, srcList, parity=True, unique=False, threshold=DEFAULT_THRESHOLD, nomatch=None ):
+		'''
+		returns a list of the best matching target for each name in srcList - see matchNames for details on
+		the args
+		'''
+		if isinstance( srcList, basestring ): srcList = [ srcList ]
+		if nomatch is None: nomatch = Name()
+
+		srcNames = [ Name( name ) for name in srcList ]
+		if self.strip:
+			for a in srcNames: a.cache_prefix()
+
+		tgtNames, tgtTokens = self.tgtNames, self.tgtTokens
+		removed = set()
+		lastIdx = len( tgtNames ) - 1
+
+		matches = []
+		for name in srcNames:
+			srcString = str( name )
+			srcTokens = name.split()
+
+			#when matching uniquely, matched targets are removed - so find the last target still in the list
+			while lastIdx in removed:
+				lastIdx -= 1
+
+			if lastIdx < 0:
+				matches.append( nomatch )
+				continue
+
+			#work out which candidates could possibly be matched - anything with a likeness bound below both 1 and the
+			#threshold can't be the best match.  targets that split to the same tokens always have a likeness of 1
+			srcCleanLength = len( name._string ) - name._string.count( '_' )
+			tgtCleanLengths = self._tgtCleanLengths
+			cutoff = min( threshold, 1 ) - 1e-9
+			toScore = set( self._splitIndex.get( tuple( srcTokens ), () ) )
+			for n, weight in self.getCandidates( srcTokens ).iteritems():
+				lenClean = max( srcCleanLength, tgtCleanLengths[ n ] )
+				if not lenClean or weight / (lenClean * EXACT_MATCH_WEIGHT) > cutoff:
+					toScore.add( n )
+
+			if removed:
+				toScore -= removed
+
+			#score the candidates in list order - the first with a likeness of 1 wins outright
+			likenessDict = {}
+			exactIdx = None
+			for n in sorted( toScore ):
+				tgt = tgtNames[ n ]
+				if srcString == str( tgt ):
+					likeness = 1
+				elif parity and name.parity != tgt.parity:
+					likeness = 0
+				else:
+					likeness = tokenLikeness( name._string, tgt._string, srcTokens, tgtTokens[ n ] )
+
+				if likeness >= 1:
+					exactIdx = n
+					break
+
+				likenessDict[ n ] = likeness
+
+			if exactIdx is not None:
+				matches.append( tgtNames[ exactIdx ] )
+				if unique: removed.add( exactIdx )
+				continue
+
+			#find the highest likeness.  NOTE: the search is seeded with the likeness of the last target and only
+			#a strictly higher likeness counts as a match - this is how the best match has always been found, so
+			#it is kept for the sake of consistent results.  targets that weren't scored can't be above the threshold
+			#so they can't change the result - if the best is above the threshold it beats them anyway
+			bestIdx = -1
+			bestLikeness = likenessDict.get( lastIdx, 0 )
+			for n in sorted( likenessDict ):
+				if likenessDict[ n ] > bestLikeness:
+					bestIdx, bestLikeness = n, likenessDict[ n ]
+
+			if bestIdx >= 0 and bestLikeness > threshold:
+				matches.append( tgtNames[ bestIdx ] )
+				if unique: removed.add( bestIdx )
+			else: matches.append( nomatch )
+
+		#re-apply any prefixes we stripped
+		if self.strip: matches = [ a.item for a in matches ]
+
+		return matches
+
+
 def matchNames( srcList, tgtList, strip=True, parity=True, unique=False, opposite=False, threshold=DEFAULT_THRESHOLD, **kwargs ):
 	'''
 	given two lists of strings, this method will return a list (the same size as the first - source list)
@@ -462,6 +636,17 @@ def matchNames( srcList, tgtList, strip=True, parity=True, unique=False, opposit
 	threshold: determines the minimum likeness for two names to be matched.  the likeness factor is described in Name.likeness
 
 	nomatch: teh object used when no match occurs - defaults to Name()
+
+	the matching is done by a NameMatcher - if you're matching lots of names against the same target list in
+	separate calls, it is faster to build a NameMatcher once and use it directly
+	'''
+	return NameMatcher( tgtList, strip ).match( srcList, parity, unique, threshold, kwargs.get( 'nomatch', Name() ) )
+
+
+def _matchNamesScan( srcList, tgtList, strip=True, parity=True, unique=False, opposite=False, threshold=DEFAULT_THRESHOLD, **kwargs ):
+	'''
+	the original implementation of matchNames - compares every source name against every target name.  kept
+	to test and benchmark NameMatcher against.  see matchNames for details on the args
 	'''
 	if isinstance(srcList, basestring): srcList = [srcList]
 	if isinstance(tgtList, basestring): tgtList = [tgtList]
@@ -525,6 +710,59 @@ def matchNamesDict( srcList, tgtList, **kwargs ):
 	return matchDict
 
 
+def buildSyntheticRigNames( count, seed=0, namespace='' ):
+	'''
+	builds a list of count unique rig-like names - things like arm_L_ctrl, spine03_jnt, fingerIndex02FK_R etc.
+	used to test and benchmark name matching
+	'''
+	import random
+	rand = random.Random( seed )
+	parts = [ 'arm', 'leg', 'spine', 'neck', 'head', 'hand', 'foot', 'finger', 'thumb', 'index', 'middle', 'ring',
+	          'pinky', 'toe', 'clavicle', 'shoulder', 'elbow', 'wrist', 'hip', 'knee', 'ankle', 'jaw', 'eye', 'brow',
+	          'lip', 'cheek', 'tail', 'wing', 'forearm', 'upperArm', 'root', 'pelvis', 'chest', 'twist' ]
+	kinds = [ 'ctrl', 'jnt', 'IK', 'FK', 'poleVector', 'space', 'orient', 'anim', 'bind', '' ]
+	parities = [ '', '', 'L', 'R', 'left', 'right' ]
+
+	names = set()
+	while len( names ) < count:
+		tokens = [ rand.choice( parts ) ]
+		if rand.random() < 0.5:
+			tokens.append( rand.choice( parts ).capitalize() )
+
+		if rand.random() < 0.6:
+			tokens.append( '%02d' % rand.randint( 1, 40 ) )
+
+		tokens += [ rand.choice( parities ), rand.choice( kinds ) ]
+		names.add( namespace + '_'.join( [ tok for tok in tokens if tok ] ) )
+
+	return sorted( names )
+
+
+def benchmarkMatchNames( counts=(400, 2000, 5000), threshold=0.5, seed=0 ):
+	'''
+	times matchNames against the original every-source-against-every-target scan on synthetic rigs.  the
+	target rig is a namespaced copy of the source rig with some names altered and some extra names thrown in
+	'''
+	import random, time
+	rand = random.Random( seed )
+	for count in counts:
+		srcs = buildSyntheticRigNames( count, seed )
+		tgts = [ 'char:' + (name.replace( '_ctrl', 'Ctrl' ) if rand.random() < 0.3 else name) for name in srcs ]
+		tgts += buildSyntheticRigNames( count / 4, seed + 1, 'char:' )
+		rand.shuffle( tgts )
+
+		start = time.clock()
+		scanned = _matchNamesScan( srcs, tgts, threshold=threshold )
+		scanTime = time.clock() - start
+
+		start = time.clock()
+		matched = matchNames( srcs, tgts, threshold=threshold )
+		matchTime = time.clock() - start
+
+		assert matched == scanned
+		print '%d sources -> %d targets: scan %0.3fs, indexed %0.3fs (%0.1fx faster)' % (len( srcs ), len( tgts ), scanTime, matchTime, scanTime / max( matchTime, 1e-6 ))
+
+
 class Mapping(object):
 	def __init__( self, srcList, tgtList ):
 		self.srcs = srcList[:]
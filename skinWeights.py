@@ -1,11 +1,12 @@
 
 from skinWeightsBase import *
-from filesystem import removeDupes
+from filesystem import removeDupes, iterBy
 from maya.cmds import *
-from binarySearchTree import BinarySearchTree
 from mayaDecorators import d_unifyUndo
+from array import array
 
 import maya.cmds as cmd
+import hashlib
 import api
 import apiExtensions
 
@@ -37,8 +38,20 @@ def getDefaultPath():
 
 kAPPEND = 0
 kREPLACE = 1
+
+#the number of verts handed to a worker process at a time when matching weights by position
+RESOLVE_CHUNK_SIZE = 20000
+
+#the number of verts below which position matching is done in process - worker processes take a while to start up
+PARALLEL_RESOLVE_MIN_VERTS = 50000
+
 @api.d_showWaitCursor
-def saveWeights( geos, filepath=None ):
+def saveWeights( geos, filepath=None, useCache=True ):
+	'''
+	saves weights for the given geo to filepath.  each mesh is fingerprinted using cheap queries - if useCache is
+	True and filepath was previously saved, the data stored for meshes whose fingerprint hasn't changed is re-used.
+	the skin data for the other meshes is gathered with a few bulk queries
+	'''
 	start = time.clock()
 	miscData = api.writeExportDict(TOOL_NAME, TOOL_VERSION)
 
@@ -47,13 +60,18 @@ def saveWeights( geos, filepath=None ):
 		filepath = getDefaultPath()
 	else: filepath = Path(filepath)
 
-	geoAndData = {}
-	skinPercent = cmd.skinPercent
 	xform = cmd.xform
 
-	#define teh data we're gathering
+	#define teh data we're gathering - jointIndices maps joint names to their index in masterJointList
 	masterJointList = []
-	weightData = []
+	jointIndices = {}
+	skinData = []
+	fingerprints = {}
+
+	def addJoint( j ):
+		if j not in jointIndices:
+			jointIndices[ j ] = len( masterJointList )
+			masterJointList.append( j )
 
 	#data gathering time!
 	rigidBindObjects = []
@@ -70,8 +88,7 @@ def saveWeights( geos, filepath=None ):
 			for p in iterParents( geo ):
 				if cmd.nodeType( p ) == 'joint':
 					rigidBindObjects.append( (geo, p) )
-					masterJointList.append( p )
-					masterJointList = removeDupes( masterJointList )
+					addJoint( p )
 					dealtWith = True
 					break
 
@@ -82,37 +99,36 @@ def saveWeights( geos, filepath=None ):
 			continue
 
 		skinCluster = skinClusters[ 0 ]
-		masterJointList += cmd.skinCluster( skinCluster, q=True, inf=True )
-		masterJointList = removeDupes( masterJointList )
+		influences = _getInfluenceNames( MFnSkinCluster( apiExtensions.asMObject( skinCluster ) ) )
+		if not influences:
+			raise SkinWeightException("I can't find any joints - sorry.  do you have any post skin cluster history???")
 
-		verts = cmd.ls(cmd.polyListComponentConversion(geo, toVertex=True), fl=True)
-		for idx, vert in enumerate(verts):
-			jointList = skinPercent(skinCluster, vert, ib=1e-4, q=True, transform=None)
-			weightList = skinPercent(skinCluster, vert, ib=1e-4, q=True, value=True)
-			if jointList is None:
-				raise SkinWeightException("I can't find any joints - sorry.  do you have any post skin cluster history???")
+		for j in influences:
+			addJoint( j )
 
-			pos = xform(vert, q=True, ws=True, t=True)
-			vertData = VertSkinWeight( pos )
-			vertData.populate( geo, idx, [ masterJointList.index( j ) for j in jointList ], weightList )
-			weightData.append( vertData )
+		fingerprints[ geo ] = getMeshFingerprint( cmd.polyEvaluate( geo, vertex=True ), influences, getWeightDigest( geo, skinCluster ) )
+		skinData.append( (geo, skinCluster) )
 
 
-	#deal with rigid bind objects
-	for geo, j in rigidBindObjects:
-
-		verts = cmd.ls( cmd.polyListComponentConversion(geo, toVertex=True), fl=True )
-		for idx, vert in enumerate( verts ):
-			jIdx = masterJointList.index( j )
+	#pull the data for any meshes that haven't changed since the last save out of the existing file
+	cachedMeshData = {}
+	if useCache:
+		cachedMeshData = getCachedMeshData( filepath, fingerprints, jointIndices )
 
-			pos = xform( vert, q=True, ws=True, t=True )
-			vertData = VertSkinWeight( pos )
-			vertData.populate( geo, idx, [jIdx], [1] )
-			weightData.append( vertData )
+	#only meshes that have changed need their weights and positions queried
+	meshDataList = []
+	for geo, skinCluster in skinData:
+		try:
+			meshDataList.append( cachedMeshData[ geo ] )
+		except KeyError:
+			influences, weights, positions = getSkinClusterData( geo, skinCluster )
+			meshDataList.append( MeshWeightData.FromDenseWeights( geo, positions, weights, [ jointIndices[ j ] for j in influences ] ) )
 
 
-	#sort the weightData by ascending x values so we can search faster
-	weightData.sort()
+	#deal with rigid bind objects
+	for geo, j in rigidBindObjects:
+		positions = xform( '%s.vtx[*]' % geo, q=True, ws=True, t=True )
+		meshDataList.append( MeshWeightData.FromDenseWeights( geo, positions, [ 1 ] * (len( positions ) / 3), [ jointIndices[ j ] ] ) )
 
 	#turn the masterJointList into a dict keyed by index
 	joints = {}
@@ -124,20 +140,20 @@ def saveWeights( geos, filepath=None ):
 	for n, j in joints.iteritems():
 		jointHierarchies[ n ] = getAllParents( j )
 
-	toWrite = miscData, joints, jointHierarchies, weightData
-
-	filepath = Path( filepath )
-	filepath.pickle( toWrite, False )
-	print 'Weights Successfully Saved to %s: time taken %.02f seconds' % (filepath, time.clock()-start)
+	filepath = writeWeightFile( filepath, miscData, joints, jointHierarchies, meshDataList, VertSkinWeight, fingerprints )
+	print 'Weights Successfully Saved to %s: time taken %.02f seconds (%d of %d meshes re-used from the previous save)' % (filepath, time.clock()-start, len( cachedMeshData ), len( meshDataList ))
 
 	return filepath
 
 
 @api.d_progress(t='initializing...', status='initializing...', isInterruptable=True)
 @d_unifyUndo
-def loadWeights( objects, filepath=None, usePosition=True, tolerance=TOL, axisMult=None, swapParity=True, averageVerts=True, doPreview=False, meshNameRemapDict=None, jointNameRemapDict=None ):
+def loadWeights( objects, filepath=None, usePosition=True, tolerance=TOL, axisMult=None, swapParity=True, averageVerts=True, doPreview=False, meshNameRemapDict=None, jointNameRemapDict=None, processes=None ):
 	'''
 	loads weights back on to a model given a file
+
+	processes is the number of worker processes used to match positions when usePosition is True.  by default
+	a process per cpu is used if there are enough verts to make it worthwhile
 	'''
 
 	#nothing to do...
@@ -184,18 +200,12 @@ def loadWeights( objects, filepath=None, usePosition=True, tolerance=TOL, axisMu
 	progressWindow(e=True, title='loading weights from file %d items' % numItems)
 
 
-	#load the data from the file
-	miscData, joints, jointHierarchies, weightData = Path( filepath ).unpickle()
-
-
-	#build the search tree
-	tree = BinarySearchTree( weightData )
-	findMethod = tree.getWithin
-	findMethodKw = { 'tolerance': tolerance }
-
-	if averageVerts:
-		findMethod = tree.getWithinRatio
-		findMethodKw = { 'ratio': tolerance }
+	#load the data from the file - when restoring by id only the data for the meshes being loaded is needed, so
+	#for columnar weight files only those meshes get read (see below)
+	weightSaveData = loadWeightSaveData( filepath )
+	miscData, joints, jointHierarchies = weightSaveData.miscData, weightSaveData.joints, weightSaveData.jointHierarchies
+	if usePosition:
+		savedData = weightSaveData.getCombinedMeshData()
 
 
 	#see if the file versions match
@@ -211,6 +221,12 @@ def loadWeights( objects, filepath=None, usePosition=True, tolerance=TOL, axisMu
 		api.melWarning('the file these weights were saved in a different file from the current: "%s"' % origFile)
 
 
+	#apply any explicit joint name remapping
+	if jointNameRemapDict is not None:
+		for n, j in joints.iteritems():
+			joints[n] = jointNameRemapDict.get( j, j )
+
+
 	#remap joint names in the saved file to joint names that are in the scene - they may be namespace differences...
 	missingJoints = set()
 	for n, j in joints.iteritems():
@@ -254,23 +270,28 @@ def loadWeights( objects, filepath=None, usePosition=True, tolerance=TOL, axisMu
 	#axisMults can be used to alter the positions of verts saved in the weightData array - this is mainly useful for applying
 	#weights to a mirrored version of a mesh - so weights can be stored on meshA, meshA duplicated to meshB, and then the
 	#saved weights can be applied to meshB by specifying an axisMult=(-1,1,1) OR axisMult=(-1,)
+	#
+	#axis flips are applied to the target positions at query time rather than to the saved data - the results are the same
+	#but there is no need to touch the saved positions.  other multipliers still need to scale the saved positions
+	queryAxisMult = None
 	if axisMult is not None:
-		for data in weightData:
-			for n, mult in enumerate(axisMult): data[n] *= mult
-
-		#we need to re-sort the weightData as the multiplication could have potentially reversed things...  i could probably
-		#be a bit smarter about when to re-order, but its not a huge hit...  so, meh
-		weightData = sortByIdx(weightData)
+		axisMult = tuple( axisMult ) + (1, 1, 1)[ len( axisMult ): ]
+		if usePosition:
+			if all( [ abs( mult ) == 1 for mult in axisMult ] ):
+				queryAxisMult = axisMult
+			else:
+				positions = savedData.positions
+				for n, mult in enumerate(axisMult):
+					for i in xrange( n, len( positions ), 3 ): positions[i] *= mult
 
 		#using axisMult for mirroring also often means you want to swap parity tokens on joint names - if so, do that now.
 		#parity needs to be swapped in both joints and jointHierarchies
 		if swapParity:
-			for joint, target in joints.iteritems():
-				joints[joint] = str( names.Name(target).swap_parity() )
-			for joint, parents in jointHierarchies.iteritems():
-				jointHierarchies[joint] = [str( names.Name(p).swap_parity() ) for p in parents]
+			joints, jointHierarchies = swapJointParity( joints, jointHierarchies )
 
 
+	#gather the verts and skinCluster for each geo
+	geoData = []
 	for geo, items in objItemsDict.iteritems():
 		#if the geo is None, then check for data in the verts arg - the user may just want weights
 		#loaded on a specific list of verts - we can get the geo name from those verts
@@ -285,80 +306,66 @@ def loadWeights( objects, filepath=None, usePosition=True, tolerance=TOL, axisMu
 			verts = cmd.ls(cmd.polyListComponentConversion(geo, toVertex=True), fl=True)
 		else: skinCluster = skinCluster[0]
 
-
-		#if we're using position, the restore weights path is quite different
-		vertJointWeightData = []
-		if usePosition:
-			progressWindow( e=True, status='searching by position: %s (%d/%d)' % (geo, curItem, numItems), maxValue=len( verts ) )
-
-			vCount = -1
-			for vert in verts:
-				vCount += 1
-				pos = Vector( xform(vert, q=True, ws=True, t=True) )
-				foundVerts = findMethod( pos, **findMethodKw )
+		geoData.append( (geo, skinCluster, verts) )
 
 
-				#accumulate found verts
-				jointWeightDict = {}
-				for v in foundVerts:
-					for joint, weight in zip( v.joints, v.weights ):
-						actualJoint = joints[ joint ]
-						weight += jointWeightDict.get( actualJoint, 0 )
-						jointWeightDict[ actualJoint ] = weight
+	#if we're using position, the restore weights path is quite different.  the vert positions for all geo are queried up
+	#front, and the position matching is done for everything at once - possibly spread across a pool of processes
+	if usePosition:
+		positionChunks = []
+		chunkGeoIdx = []
+		for geoIdx, (geo, skinCluster, verts) in enumerate( geoData ):
+			progressWindow( e=True, status='querying positions: %s (%d/%d)' % (geo, geoIdx+1, numItems) )
+			flatPositions = xform( verts, q=True, ws=True, t=True )
+			positions = [ flatPositions[ n:n+3 ] for n in xrange( 0, len( flatPositions ), 3 ) ]
+			for chunk in iterBy( positions, RESOLVE_CHUNK_SIZE ):
+				positionChunks.append( chunk )
+				chunkGeoIdx.append( geoIdx )
 
+		#only bother with a process pool if there is enough work to justify the startup cost of the worker processes
+		if processes is None and sum( map( len, positionChunks ) ) < PARALLEL_RESOLVE_MIN_VERTS:
+			processes = 1
 
-				#normalize the weights
-				weightSum = float( sum( jointWeightDict.values() ) )
-				if weightSum != 1:
-					for joint, weight in jointWeightDict.iteritems():
-						jointWeightDict[ joint ] = weight / weightSum
+		progressWindow( e=True, status='searching by position...' )
+		chunkResults = resolveVertWeightsParallel( positionChunks, savedData, tolerance, averageVerts, joints, processes, queryAxisMult )
 
+		geoResults = [ [] for g in geoData ]
+		for geoIdx, results in zip( chunkGeoIdx, chunkResults ):
+			geoResults[ geoIdx ] += results
 
-				#append the data
-				vertJointWeightData.append( (vert, jointWeightDict.items()) )
+		for geoIdx, ((geo, skinCluster, verts), results) in enumerate( zip( geoData, geoResults ) ):
+			progressWindow( e=True, status='maya is setting skin weights: %s (%d/%d)' % (geo, geoIdx+1, numItems), maxValue=numItems, progress=geoIdx )
 
+			#bail if we've been asked to cancel
+			if progressWindow( q=True, isCancelled=True ):
+				progressWindow( ep=True )
+				return
 
-				#deal with the progress window - this isn't done EVERY vert because its kinda slow...
-				if vCount % 50 == 0:
-					progressWindow( e=True, progress=vCount )
+			setSkinWeights( skinCluster, zip( verts, results ) )
 
-					#bail if we've been asked to cancel
-					if progressWindow( q=True, isCancelled=True ):
-						progressWindow( ep=True )
-						return
+			#remove unused influences from the skin cluster
+			cmd.skinCluster( skinCluster, edit=True, removeUnusedInfluence=True )
 
-			progressWindow( e=True, status='maya is setting skin weights...' )
-			setSkinWeights( skinCluster, vertJointWeightData )
-
-		#otherwise simply restore by id
-		else:
-			progressWindow( e=True, status='searching by vert name: %s (%d/%d)' % (geo, curItem, numItems), maxValue=len( verts ) )
+	#otherwise simply restore by id - the vert ids are looked up directly in the saved int arrays and all the weights
+	#for each mesh get written with a single undoable MayaSkinClusterWriter.setWeights call
+	else:
+		for geo, skinCluster, verts in geoData:
+			progressWindow( e=True, status='restoring by vert id: %s (%d/%d)' % (geo, curItem, numItems), maxValue=numItems, progress=curItem-1 )
 
-			#rearrange the weightData structure so its ordered by vertex name
-			weightDataById = {}
-			[ weightDataById.setdefault(i.getVertName(), (i.joints, i.weights)) for i in weightData ]
+			#bail if we've been asked to cancel
+			if progressWindow( q=True, isCancelled=True ):
+				progressWindow( ep=True )
+				return
 
-			for vert in verts:
-				#progressWindow(edit=True, progress=cur / num * 100.0)
-				#if progressWindow(q=True, isCancelled=True):
-					#progressWindow(ep=True)
-					#return
-
-				#cur += 1
-				try:
-					jointList, weightList = weightDataById[vert]
-				except KeyError:
-					#in this case, the vert doesn't exist in teh file...
-					print '### no point found for %s' % vert
-					continue
-				else:
-					jointList = [ joints[ j ] for j in jointList ]
-					jointsAndWeights = zip(jointList, weightList)
-					skinPercent(skinCluster, vert, tv=jointsAndWeights)
+			vertIndices = array( 'i', [ int( vert[ vert.rindex( '[' )+1:-1 ] ) for vert in verts ] )
+			savedData = weightSaveData.getCombinedMeshData( [ geo ] )
+			missing = writeWeightsById( MayaSkinClusterWriter( skinCluster ), vertIndices, savedData, joints )
+			for vertIdx in missing:
+				print '### no point found for %s.vtx[%d]' % (geo, vertIdx)
 
-		#remove unused influences from the skin cluster
-		cmd.skinCluster( skinCluster, edit=True, removeUnusedInfluence=True )
-		curItem += 1
+			#remove unused influences from the skin cluster
+			cmd.skinCluster( skinCluster, edit=True, removeUnusedInfluence=True )
+			curItem += 1
 
 	end = time.clock()
 	print 'time for weight load %.02f secs' % (end-start)
@@ -366,7 +373,8 @@ def loadWeights( objects, filepath=None, usePosition=True, tolerance=TOL, axisMu
 
 import profileDecorators
 from maya.OpenMayaAnim import MFnSkinCluster
-from maya.OpenMaya import MIntArray, MDagPathArray
+from maya.OpenMaya import MIntArray, MDoubleArray, MDagPath, MDagPathArray, MFn, MFnSingleIndexedComponent, MScriptUtil, \
+     MPlug, MStringArray
 
 #@profileDecorators.d_profile
 @d_unifyUndo
@@ -428,6 +436,110 @@ def setSkinWeights( skinCluster, vertJointWeightData ):
 				setAttr( weightFmtStr % infIdx, weight )
 
 
+def _getGeometryPath( skinFn ):
+	'''
+	returns the MDagPath for the first output geometry of a skinCluster
+	'''
+	geoPath = MDagPath()
+	skinFn.getPathAtIndex( skinFn.indexForOutputConnection( 0 ), geoPath )
+
+	return geoPath
+
+
+def _getInfluenceNames( skinFn ):
+	dagPaths = MDagPathArray()
+	skinFn.influenceObjects( dagPaths )
+
+	return [ dagPaths[ n ].partialPathName() for n in range( dagPaths.length() ) ]
+
+
+def getWeightDigest( geo, skinCluster ):
+	'''
+	returns an md5 digest of the skinCluster's weightList plug data and the world bounding box of the geo - so it
+	changes whenever a weight changes or the geo gets moved or re-shaped.  the weight data is read with a single
+	MPlug.getSetAttrCmds call - which returns the sparse weights as a setAttr command per vert - rather than
+	querying the dense weights and vert positions like getSkinClusterData does.  see getMeshFingerprint
+	'''
+	skinFn = MFnSkinCluster( apiExtensions.asMObject( skinCluster ) )
+	setAttrCmds = MStringArray()
+	skinFn.findPlug( 'weightList' ).getSetAttrCmds( setAttrCmds, MPlug.kAll, False )
+
+	digest = hashlib.md5()
+	for n in xrange( setAttrCmds.length() ):
+		digest.update( setAttrCmds[ n ] )
+
+	digest.update( repr( cmd.exactWorldBoundingBox( geo ) ) )
+
+	return digest.hexdigest()
+
+
+def getSkinClusterData( geo, skinCluster ):
+	'''
+	returns an (influences, weights, positions) 3-tuple for every vert on the given geo, gathered using a few
+	bulk queries.  weights is a flat list containing a value for every influence for every vert, and positions
+	is a flat list of world space xyz values
+	'''
+	skinFn = MFnSkinCluster( apiExtensions.asMObject( skinCluster ) )
+	influences = _getInfluenceNames( skinFn )
+
+	componentFn = MFnSingleIndexedComponent()
+	components = componentFn.create( MFn.kMeshVertComponent )
+	componentFn.setCompleteData( cmd.polyEvaluate( geo, vertex=True ) )
+
+	influenceIntArray = MIntArray()
+	MScriptUtil.createIntArrayFromList( range( len( influences ) ), influenceIntArray )
+
+	weightArray = MDoubleArray()
+	skinFn.getWeights( _getGeometryPath( skinFn ), components, influenceIntArray, weightArray )
+	weights = [ weightArray[ n ] for n in xrange( weightArray.length() ) ]
+
+	positions = cmd.xform( '%s.vtx[*]' % geo, q=True, ws=True, t=True )
+
+	return influences, weights, positions
+
+
+class MayaSkinClusterWriter(SkinWeightWriter):
+	'''
+	writes weights to a skinCluster - see writeWeightsById.  NOTE: MFnSkinCluster.setWeights doesn't register
+	an undo, so the weights are written using removeMultiInstance/setAttr which are undoable.  the api is only
+	used to query the existing weight indices
+	'''
+	def __init__( self, skinCluster ):
+		self.skinCluster = skinCluster
+		self.skinFn = MFnSkinCluster( apiExtensions.asMObject( skinCluster ) )
+	def getInfluences( self ):
+		return _getInfluenceNames( self.skinFn )
+	def addInfluences( self, influences ):
+		for influence in influences:
+			cmd.skinCluster( self.skinCluster, e=True, addInfluence=influence, weight=0 )
+	def setWeights( self, vertIndices, influenceIndices, weights ):
+		skinFn = self.skinFn
+
+		#influence indices are positions in the influence list - the weight plugs use the logical index of each influence
+		dagPaths = MDagPathArray()
+		skinFn.influenceObjects( dagPaths )
+		logicalIndices = [ skinFn.indexForInfluenceObject( dagPaths[ i ] ) for i in influenceIndices ]
+		influenceCount = len( logicalIndices )
+
+		weightListObj = skinFn.findPlug( 'weightList' ).attribute()
+		weightsP = skinFn.findPlug( 'weights' )
+		existingIndices = MIntArray()
+
+		weightFmtStr = str( self.skinCluster ) +'.weightList[%d].weights[%d]'
+		for n, vertIdx in enumerate( vertIndices ):
+
+			#clear out the existing weights - every influence gets written so nothing should be left behind
+			weightsP.selectAncestorLogicalIndex( vertIdx, weightListObj )
+			weightsP.getExistingArrayAttributeIndices( existingIndices )
+			for k in range( existingIndices.length() ):
+				removeMultiInstance( weightFmtStr % (vertIdx, existingIndices[ k ]) )
+
+			rowStart = n * influenceCount
+			for logicalIdx, weight in zip( logicalIndices, weights[ rowStart:rowStart+influenceCount ] ):
+				if weight:
+					setAttr( weightFmtStr % (vertIdx, logicalIdx), weight )
+
+
 def mirrorWeightsOnSelected( tolerance=TOL ):
 	selObjs = cmd.ls(sl=True, o=True)
 
@@ -1,8 +1,12 @@
 
 from vectors import *
-from filesystem import Path, resolvePath, writeExportDict
+from filesystem import Path, resolvePath, writeExportDict, mapInProcessPool
+from kdTree import KdTree
+from sparseWeights import SparseWeights
 
-import time, datetime, names, filesystem
+from array import array
+
+import sys, time, datetime, names, filesystem, random, struct, mmap, cPickle, hashlib
 
 
 TOOL_NAME = 'weightSaver'
@@ -60,7 +64,7 @@ class VertSkinWeight(Vector):
 
 		joints = [ jointRemap.get( j, j ) for j in self.__joints ]
 
-		if len( joints ) != set( joints ):
+		if len( joints ) != len( set( joints ) ):
 			joints, self.weights = regatherWeights( joints, self.weights )
 
 		return joints
@@ -94,10 +98,932 @@ class WeightSaveData(tuple):
 			allMeshes.add( d.mesh )
 
 		return allMeshes
+	def getWeightData( self, meshes=None ):
+		'''
+		returns the list of VertSkinWeight instances for the given (re-mapped) mesh names - or all of them
+		if meshes is None
+		'''
+		if meshes is None:
+			return self.weightData
+
+		meshes = set( meshes )
+
+		return [ d for d in self.weightData if d.mesh in meshes ]
+	def getCombinedMeshData( self, meshes=None ):
+		'''
+		returns a single MeshWeightData containing the data for the given (re-mapped) mesh names - or all of
+		them if meshes is None
+		'''
+		return MeshWeightData.FromVertSkinWeights( self.getWeightData( meshes ) )
+	def getSummary( self ):
+		'''
+		returns the same summary dict as WeightFile.getSummary - legacy files don't store a summary so it has
+		to be built from the weight data
+		'''
+		meshVertCounts = {}
+		usedJoints = set()
+		influenceHistogram = {}
+		mins, maxs = [ 1e300 ] * 3, [ -1e300 ] * 3
+		for d in self.weightData:
+			meshVertCounts[ d.mesh ] = meshVertCounts.get( d.mesh, 0 ) + 1
+			usedJoints.update( d.joints )
+
+			count = len( d.weights )
+			influenceHistogram[ count ] = influenceHistogram.get( count, 0 ) + 1
+			for n in range( 3 ):
+				mins[ n ] = min( mins[ n ], d[ n ] )
+				maxs[ n ] = max( maxs[ n ], d[ n ] )
+
+		bounds = (tuple( mins ), tuple( maxs )) if self.weightData else None
+
+		return _combineSummary( self.joints, meshVertCounts, usedJoints, [ bounds ], [ influenceHistogram ] )
+
+
+class MeshWeightData(object):
+	'''
+	columnar weight data for a single mesh.  rather than storing an object per vert, the data is stored in
+	contiguous typed arrays:
+		positions - x, y, z doubles for each vert
+		vertIndices - the index of each vert
+		offsets - CSR style offsets into jointIndices/weights.  the influences for the nth vert are
+		          jointIndices[ offsets[n]:offsets[n+1] ]
+		jointIndices - indices into the joint table stored in the file
+		weights - the weight for each entry in jointIndices
+
+	positions and weights are stored as doubles so saving and loading doesn't lose any precision compared to
+	the pickled files
+	'''
+
+	#the typecode for each array, in the order they're stored on disk
+	ARRAYS = ( ('positions', 'd'),
+	           ('vertIndices', 'i'),
+	           ('offsets', 'i'),
+	           ('jointIndices', 'i'),
+	           ('weights', 'd') )
+	ARRAY_TYPECODES = dict( ARRAYS )
+
+	def __init__( self, mesh, positions=None, vertIndices=None, offsets=None, jointIndices=None, weights=None ):
+		self.mesh = mesh
+		self.positions = array( 'd' ) if positions is None else positions
+		self.vertIndices = array( 'i' ) if vertIndices is None else vertIndices
+		self.offsets = array( 'i', [ 0 ] ) if offsets is None else offsets
+		self.jointIndices = array( 'i' ) if jointIndices is None else jointIndices
+		self.weights = array( 'd' ) if weights is None else weights
+	@classmethod
+	def Combine( cls, meshDataList, mesh=None ):
+		'''
+		concatenates the data from a list of MeshWeightData instances into a single new instance
+		'''
+		new = cls( mesh )
+		for meshData in meshDataList:
+			offsetShift = len( new.jointIndices )
+			new.positions.extend( meshData.positions )
+			new.vertIndices.extend( meshData.vertIndices )
+			new.offsets.extend( [ offset + offsetShift for offset in meshData.offsets[ 1: ] ] )
+			new.jointIndices.extend( meshData.jointIndices )
+			new.weights.extend( meshData.weights )
+
+		return new
+	@classmethod
+	def FromVertSkinWeights( cls, weightData, mesh=None ):
+		'''
+		builds a MeshWeightData from a list of VertSkinWeight instances
+		'''
+		new = cls( mesh )
+		for d in weightData:
+			new.append( d.idx, d[ :3 ], d.joints, d.weights )
+
+		return new
+	@classmethod
+	def FromDenseWeights( cls, mesh, positions, weights, influenceJointIndices, minWeight=1e-4 ):
+		'''
+		builds a MeshWeightData from a flat xyz position list and a flat list of weights containing a value for
+		every influence for every vert.  influenceJointIndices maps each influence to its joint index.  weights
+		below minWeight are dropped, but the largest weight for a vert is always kept
+		'''
+		new = cls( mesh, array( 'd', positions ) )
+		influenceCount = len( influenceJointIndices )
+		vertCount = len( positions ) / 3
+		new.vertIndices = array( 'i', range( vertCount ) )
+
+		offsets, jointIndices, newWeights = new.offsets, new.jointIndices, new.weights
+		for n in xrange( vertCount ):
+			rowStart = n * influenceCount
+			row = weights[ rowStart:rowStart+influenceCount ]
+			kept = [ i for i, w in enumerate( row ) if w >= minWeight ]
+			if not kept and influenceCount:
+				kept = [ max( zip( row, range( influenceCount ) ) )[ 1 ] ]
+
+			jointIndices.extend( [ influenceJointIndices[ i ] for i in kept ] )
+			newWeights.extend( [ row[ i ] for i in kept ] )
+			offsets.append( len( jointIndices ) )
+
+		return new
+	def __len__( self ):
+		return len( self.vertIndices )
+	def append( self, vertIdx, pos, jointIndexList, weightList ):
+		self.vertIndices.append( vertIdx )
+		self.positions.extend( pos )
+		self.jointIndices.extend( jointIndexList )
+		self.weights.extend( weightList )
+		self.offsets.append( len( self.jointIndices ) )
+	def getInfluenceCount( self ):
+		return len( self.jointIndices )
+	def getUsedJointIndices( self ):
+		return set( self.jointIndices )
+	def getBounds( self ):
+		'''
+		returns a (minXYZ, maxXYZ) 2-tuple bounding the vert positions - or None if there are no verts
+		'''
+		positions = self.positions
+		if not positions:
+			return None
+
+		axes = positions[ 0::3 ], positions[ 1::3 ], positions[ 2::3 ]
+
+		return tuple( [ min( a ) for a in axes ] ), tuple( [ max( a ) for a in axes ] )
+	def getInfluenceHistogram( self ):
+		'''
+		returns a dict keyed by influence count, with the number of verts that have that many influences
+		'''
+		histogram = {}
+		offsets = self.offsets
+		for start, end in zip( offsets, offsets[ 1: ] ):
+			count = end - start
+			histogram[ count ] = histogram.get( count, 0 ) + 1
+
+		return histogram
+	def iterVerts( self ):
+		'''
+		yields a (vertIdx, position, jointIndices, weights) tuple for each vert
+		'''
+		positions, offsets = self.positions, self.offsets
+		jointIndices, weights = self.jointIndices, self.weights
+		for n, vertIdx in enumerate( self.vertIndices ):
+			start, end = offsets[ n ], offsets[ n+1 ]
+			yield vertIdx, positions[ n*3:n*3+3 ], jointIndices[ start:end ], weights[ start:end ]
+	def remapJoints( self, jointMapping ):
+		'''
+		returns a copy with the joint indices remapped using jointMapping - a dict or list mapping current joint
+		indices to new ones.  the other arrays are shared with this instance
+		'''
+		return self.__class__( self.mesh, self.positions, self.vertIndices, self.offsets,
+		                       array( 'i', [ jointMapping[ j ] for j in self.jointIndices ] ), self.weights )
+	def getVertSkinWeights( self, vertCls=VertSkinWeight ):
+		'''
+		materializes the data as a list of VertSkinWeight instances
+		'''
+		mesh = self.mesh
+		weightData = []
+		for vertIdx, pos, jointIndices, weights in self.iterVerts():
+			vertData = vertCls( pos )
+			vertData.populate( mesh, vertIdx, jointIndices, weights )
+			weightData.append( vertData )
+
+		return weightData
+
+
+WEIGHT_FILE_MAGIC = 'ZOOWGHTS'
+WEIGHT_FILE_VERSION = 2
+
+#the array typecodes used by each version of the file format - version 1 stored positions and weights as floats
+_FILE_ARRAYS = { 1: ( ('positions', 'f'),
+                      ('vertIndices', 'i'),
+                      ('offsets', 'i'),
+                      ('jointIndices', 'i'),
+                      ('weights', 'f') ),
+                 2: MeshWeightData.ARRAYS }
+
+#the magic string, the format version and the size of the pickled header that follows
+_FILE_PREFIX = struct.Struct( '<8sII' )
+
+
+def _getArraySizes( vertCount, influenceCount ):
+	'''
+	returns the item count of each of the MeshWeightData.ARRAYS blocks for a mesh
+	'''
+	return 3 * vertCount, vertCount, vertCount + 1, influenceCount, influenceCount
+
+
+def _combineSummary( joints, meshVertCounts, usedJoints, bounds, histograms ):
+	'''
+	combines per mesh summary data into a single summary dict
+	'''
+	bounds = [ b for b in bounds if b is not None ]
+	if bounds:
+		bounds = tuple( [ min( b[0][n] for b in bounds ) for n in range( 3 ) ] ), \
+		         tuple( [ max( b[1][n] for b in bounds ) for n in range( 3 ) ] )
+	else:
+		bounds = None
+
+	influenceHistogram = {}
+	for histogram in histograms:
+		for influenceCount, vertCount in histogram.iteritems():
+			influenceHistogram[ influenceCount ] = influenceHistogram.get( influenceCount, 0 ) + vertCount
+
+	return { 'joints': joints,
+	         'usedJoints': sorted( usedJoints ),
+	         'meshVertCounts': meshVertCounts,
+	         'vertCount': sum( meshVertCounts.values() ),
+	         'bounds': bounds,
+	         'influenceHistogram': influenceHistogram }
+
+
+def _buildSummary( joints, meshDataList ):
+	usedJoints = set()
+	meshVertCounts = {}
+	for meshData in meshDataList:
+		usedJoints |= meshData.getUsedJointIndices()
+		meshVertCounts[ meshData.mesh ] = meshVertCounts.get( meshData.mesh, 0 ) + len( meshData )
+
+	return _combineSummary( joints, meshVertCounts, usedJoints,
+	                        [ m.getBounds() for m in meshDataList ],
+	                        [ m.getInfluenceHistogram() for m in meshDataList ] )
+
+
+def getMeshFingerprint( vertCount, influences, weightDigest ):
+	'''
+	returns a fingerprint for the skinning state of a mesh built from cheap queries - it changes whenever the
+	vert count, the influence list or the weightDigest change.  weightDigest is a string digest of the weight
+	data - see skinWeights.getWeightDigest.  this means the expensive weight and position queries only need to
+	be done for meshes whose fingerprint has changed
+	'''
+	return hashlib.md5( '%d\0%s\0%s' % (vertCount, '\0'.join( influences ), weightDigest) ).hexdigest()
+
+
+def isColumnarWeightFile( filepath ):
+	with open( filepath, 'rb' ) as f:
+		return f.read( len( WEIGHT_FILE_MAGIC ) ) == WEIGHT_FILE_MAGIC
+
+
+def writeWeightFile( filepath, miscData, joints, jointHierarchies, meshDataList, vertCls=VertSkinWeight, fingerprints=None ):
+	'''
+	writes weight data in the columnar format.  the file looks like this:
+		magic string, format version, header size
+		pickled header dict - contains the misc data, the joint tables and an index of the meshes in the file
+		a block of arrays for each mesh, laid out in the order defined by MeshWeightData.ARRAYS
+
+	all arrays are stored little endian.  the mesh index stores the byte offset of each mesh's block so
+	meshes can be read individually without touching the rest of the file
+
+	fingerprints is an optional dict of mesh fingerprints (see getMeshFingerprint) stored in the header so
+	the next save can re-use the data for meshes that haven't changed - see getCachedMeshData
+	'''
+	filepath = Path( filepath )
+	filepath.up().create()
+
+	meshIndex = []
+	offset = 0
+	for meshData in meshDataList:
+		meshIndex.append( (meshData.mesh, len( meshData ), meshData.getInfluenceCount(), offset) )
+		for attr, typecode in MeshWeightData.ARRAYS:
+			offset += len( getattr( meshData, attr ) ) * array( typecode ).itemsize
+
+	header = { 'miscData': miscData,
+	           'joints': joints,
+	           'jointHierarchies': jointHierarchies,
+	           'meshes': meshIndex,
+	           'vertClass': vertCls.__name__,
+	           'summary': _buildSummary( joints, meshDataList ),
+	           'fingerprints': fingerprints or {} }
+
+	headerStr = cPickle.dumps( header, 2 )
+	with open( filepath, 'wb' ) as f:
+		f.write( _FILE_PREFIX.pack( WEIGHT_FILE_MAGIC, WEIGHT_FILE_VERSION, len( headerStr ) ) )
+		f.write( headerStr )
+		for meshData in meshDataList:
+			for attr, typecode in MeshWeightData.ARRAYS:
+				data = getattr( meshData, attr )
+				if sys.byteorder == 'big':
+					data = array( typecode, data )
+					data.byteswap()
+
+				data.tofile( f )
+
+	return filepath
+
+
+class WeightFile(object):
+	'''
+	reads weight files written by writeWeightFile.  only the header is read on construction - the per mesh
+	arrays are read on demand from a memory map of the file, so only the meshes actually asked for get read.
+
+	provides the same interface as WeightSaveData so code can deal with either file format
+	'''
+	def __init__( self, filepath ):
+		self.filepath = filepath = Path( filepath )
+		with open( filepath, 'rb' ) as f:
+			magic, version, headerSize = _FILE_PREFIX.unpack( f.read( _FILE_PREFIX.size ) )
+			if magic != WEIGHT_FILE_MAGIC:
+				raise SkinWeightException( "%s isn't a columnar weight file" % filepath )
+
+			if version > WEIGHT_FILE_VERSION:
+				raise SkinWeightException( "%s was written with a newer version of the file format (%d) than this tool supports (%d)" % (filepath, version, WEIGHT_FILE_VERSION) )
+
+			header = cPickle.loads( f.read( headerSize ) )
+
+		self.version = version
+		self._dataStart = _FILE_PREFIX.size + headerSize
+		self.miscData = header[ 'miscData' ]
+		self.joints = header[ 'joints' ]
+		self.jointHierarchies = header[ 'jointHierarchies' ]
+		self.vertCls = globals().get( header[ 'vertClass' ], VertSkinWeight )
+		self._meshIndex = header[ 'meshes' ]
+		self._meshDataCache = {}
+		self._summary = header.get( 'summary' )
+		self._fingerprints = header.get( 'fingerprints', {} )
+	def __iter__( self ):
+		'''
+		unpacks like the legacy pickled tuple: miscData, joints, jointHierarchies, weightData
+		'''
+		return iter( (self.miscData, self.joints, self.jointHierarchies, self.weightData) )
+	def getMeshNames( self ):
+		'''
+		returns the names of the meshes as they were stored in the file - ie not re-mapped
+		'''
+		return [ m[0] for m in self._meshIndex ]
+	def getVertCount( self, mesh=None ):
+		return sum( [ m[1] for m in self._meshIndex if mesh is None or m[0] == mesh ] )
+	def getFingerprint( self, mesh ):
+		'''
+		returns the fingerprint stored for the given mesh when the file was saved - or None
+		'''
+		return self._fingerprints.get( mesh )
+	def getMeshData( self, mesh ):
+		'''
+		returns the MeshWeightData for the given stored mesh name
+		'''
+		try:
+			return self._meshDataCache[ mesh ]
+		except KeyError: pass
+
+		for meshName, vertCount, influenceCount, offset in self._meshIndex:
+			if meshName == mesh:
+				break
+		else:
+			raise SkinWeightException( "no data stored for %s in %s" % (mesh, self.filepath) )
+
+		with open( self.filepath, 'rb' ) as f:
+			fileMap = mmap.mmap( f.fileno(), 0, access=mmap.ACCESS_READ )
+			try:
+				pos = self._dataStart + offset
+				arrays = {}
+				for (attr, typecode), count in zip( _FILE_ARRAYS[ self.version ], _getArraySizes( vertCount, influenceCount ) ):
+					data = array( typecode )
+					size = count * data.itemsize
+					data.fromstring( fileMap[ pos:pos+size ] )
+					if sys.byteorder == 'big':
+						data.byteswap()
+
+					#older files may store arrays with a different typecode - convert them so they can be combined
+					if typecode != MeshWeightData.ARRAY_TYPECODES[ attr ]:
+						data = array( MeshWeightData.ARRAY_TYPECODES[ attr ], data )
+
+					arrays[ attr ] = data
+					pos += size
+			finally:
+				fileMap.close()
+
+		meshData = self._meshDataCache[ mesh ] = MeshWeightData( meshName, **arrays )
+
+		return meshData
+	def iterMeshData( self, meshes=None ):
+		'''
+		yields MeshWeightData for the given (re-mapped) mesh names - or all meshes if meshes is None
+		'''
+		remap = VertSkinWeight.MESH_NAME_REMAP_DICT or {}
+		for mesh in self.getMeshNames():
+			if meshes is None or remap.get( mesh, mesh ) in meshes:
+				yield self.getMeshData( mesh )
+	def getSummary( self ):
+		'''
+		returns a dict summarizing the file contents - the joint table, the used joint indices, per mesh vert
+		counts, the bounds of all verts and a histogram of influence counts per vert.  the summary is stored
+		in the header so this doesn't need to read any of the weight data
+		'''
+		if self._summary is None:
+			self._summary = _buildSummary( self.joints, list( self.iterMeshData() ) )
+
+		return self._summary
+	def getUsedJoints( self ):
+		return set( self.getSummary()[ 'usedJoints' ] )
+	def getUsedMeshes( self ):
+		remap = VertSkinWeight.MESH_NAME_REMAP_DICT or {}
+
+		return set( [ remap.get( mesh, mesh ) for mesh in self.getMeshNames() ] )
+	def getWeightData( self, meshes=None ):
+		'''
+		returns a list of VertSkinWeight instances for the given (re-mapped) mesh names - or all of them if
+		meshes is None
+		'''
+		if meshes is not None:
+			meshes = set( meshes )
+
+		weightData = []
+		for meshData in self.iterMeshData( meshes ):
+			weightData += meshData.getVertSkinWeights( self.vertCls )
+
+		return weightData
+	def getCombinedMeshData( self, meshes=None ):
+		'''
+		returns a single MeshWeightData containing the data for the given (re-mapped) mesh names - or all of
+		them if meshes is None
+		'''
+		if meshes is not None:
+			meshes = set( meshes )
+
+		return MeshWeightData.Combine( self.iterMeshData( meshes ) )
+	@property
+	def weightData( self ):
+		return self.getWeightData()
+
+
+def loadWeightSaveData( filepath ):
+	'''
+	returns either a WeightFile or a WeightSaveData instance depending on the format of the given file -
+	files saved before the columnar format was introduced are pickled tuples
+	'''
+	filepath = Path( filepath )
+	if isColumnarWeightFile( filepath ):
+		return WeightFile( filepath )
+
+	return WeightSaveData( filepath.unpickle() )
+
+
+def getCachedMeshData( filepath, fingerprints, jointIndices ):
+	'''
+	returns a dict containing the MeshWeightData stored in a previously saved weight file for each mesh in
+	fingerprints whose fingerprint hasn't changed since the file was saved.  the stored joint indices are
+	re-mapped to the joint indices in the jointIndices dict - which maps joint names to joint indices
+
+	if the file doesn't exist, or is a legacy file, nothing is cached and an empty dict is returned
+	'''
+	filepath = Path( filepath )
+	if not filepath.exists() or not isColumnarWeightFile( filepath ):
+		return {}
+
+	try:
+		weightFile = WeightFile( filepath )
+	except SkinWeightException:
+		return {}
+
+	storedMeshes = set( weightFile.getMeshNames() )
+	cached = {}
+	for mesh, fingerprint in fingerprints.iteritems():
+		if mesh not in storedMeshes or weightFile.getFingerprint( mesh ) != fingerprint:
+			continue
+
+		meshData = weightFile.getMeshData( mesh )
+		try:
+			jointMapping = dict( [ (n, jointIndices[ weightFile.joints[ n ] ]) for n in meshData.getUsedJointIndices() ] )
+		except KeyError:
+			continue
+
+		cached[ mesh ] = meshData.remapJoints( jointMapping )
+
+	return cached
+
+
+class SkinWeightTree(KdTree):
+	'''
+	spatial index over saved vert positions.  the tree is built once per weight file and answers the position
+	lookups for every target vert in a single batched query.  the get* methods return the VertSkinWeight
+	instances the tree was built from, while the query* methods return indices
+	'''
+	def getWithinBatch( self, positions, tolerance=TOL ):
+		'''
+		returns a list of VertSkinWeight lists - one for each position - containing the saved verts within
+		tolerance of the position, sorted by distance
+		'''
+		points = self.points
+		return [ [ points[ idx ] for idx in matches ] for matches in self.queryWithinBatch( positions, tolerance ) ]
+	def getWithinRatioBatch( self, positions, ratio=2 ):
+		'''
+		returns a list of VertSkinWeight lists - one for each position.  see queryWithinRatioBatch for details
+		'''
+		points = self.points
+		return [ [ points[ idx ] for idx in matches ] for matches in self.queryWithinRatioBatch( positions, ratio ) ]
+	def queryWithinRatioBatch( self, positions, ratio=2 ):
+		'''
+		returns a list of index lists - one for each position.  for each position the closest saved vert is
+		found and the indices of all saved verts within ratio times that distance are returned.
+
+		this matches the behaviour of the old search that started with a tolerance of 1 and grew it by 1.25x
+		(up to _MAX_RECURSE times) until something was found - if only a single vert fell within that grown
+		tolerance, only that vert is returned.  positions with nothing within the maximum grown tolerance get
+		an empty list
+		'''
+		closestIndices, sqDistances = self.queryClosestBatch( positions, True )
+
+		results = [ [] ] * len( positions )
+		toSearch = []
+		searchRadii = []
+		searchTolerances = []
+		for n, (idx, sqDist) in enumerate( zip( closestIndices, sqDistances ) ):
+			if idx == -1:
+				continue
+
+			if not sqDist:
+				results[ n ] = [ idx ]
+				continue
+
+			#figure out which tolerance the grow loop would have found the closest vert at
+			closestDist = sqDist ** 0.5
+			tolerance = 1
+			itCount = 0
+			while tolerance < closestDist:
+				tolerance *= 1.25
+				itCount += 1
+
+			if itCount > _MAX_RECURSE:
+				continue
+
+			toSearch.append( n )
+			searchRadii.append( max( tolerance, closestDist * ratio ) )
+			searchTolerances.append( (tolerance ** 2, sqDist * ratio ** 2) )
+
+		within = self.queryWithinBatch( [ positions[ n ] for n in toSearch ], searchRadii, True )
+		for n, matches, (sqTolerance, sqRatioDist) in zip( toSearch, within, searchTolerances ):
+			if len( matches ) < 2 or matches[ 1 ][ 0 ] > sqTolerance:
+				results[ n ] = [ matches[ 0 ][ 1 ] ]
+			else:
+				results[ n ] = [ idx for sd, idx in matches if sd <= sqRatioDist ]
+
+		return results
+
+
+def resolveVertWeights( targetPositions, savedData, tolerance=TOL, averageVerts=True, jointRemap=None, tree=None, axisMult=None ):
+	'''
+	resolves weights for a list of target positions from saved weight data.  this is the position matching
+	and normalization stage of loading weights - it doesn't need maya so it can be run in other processes.
+
+	targetPositions - a list of (x, y, z) positions to find weights for
+	savedData - a MeshWeightData instance holding the saved weights (see MeshWeightData.Combine)
+	tolerance - the search radius, or when averageVerts is True, the distance ratio (see
+	            SkinWeightTree.queryWithinRatioBatch)
+	jointRemap - an optional dict mapping saved joint indices to whatever the results should contain (ie joint
+	             names).  saved joints missing from the dict are dropped
+	tree - a SkinWeightTree built from the savedData positions.  one is built if not given
+	axisMult - an optional (x, y, z) tuple of 1 or -1 values used to mirror the saved data.  rather than
+	           flipping the saved positions, the flip is applied to the target positions before querying -
+	           for axis flips the results are identical, but the saved data and tree can be used as is
+
+	returns a list containing a list of (joint, weight) 2-tuples for each target position.  weights from all
+	matching saved verts are summed per joint and normalized
+	'''
+	if tree is None:
+		tree = SkinWeightTree.FromArray( savedData.positions )
+
+	if axisMult is not None:
+		mx, my, mz = axisMult
+		targetPositions = [ (x*mx, y*my, z*mz) for x, y, z in targetPositions ]
+
+	if averageVerts:
+		allMatches = tree.queryWithinRatioBatch( targetPositions, tolerance )
+	else:
+		allMatches = tree.queryWithinBatch( targetPositions, tolerance )
+
+	offsets = savedData.offsets
+	jointIndices = savedData.jointIndices
+	weights = savedData.weights
+
+	#map the saved joint indices to contiguous ids for the weight engine - joints missing from the remap are dropped
+	if jointRemap is None:
+		jointKeys = sorted( set( jointIndices ) )
+		jointRemap = dict( zip( jointKeys, jointKeys ) )
+	else:
+		jointKeys = jointRemap.values()
+
+	jointIds = dict( [ (key, n) for n, key in enumerate( jointKeys ) ] )
+	savedToId = dict( [ (savedIdx, jointIds[ key ]) for savedIdx, key in jointRemap.iteritems() ] )
+
+	#accumulate the weights of all found verts into a row per target position
+	resolved = SparseWeights()
+	resolvedOffsets, resolvedJoints, resolvedWeights = resolved.offsets, resolved.jointIndices, resolved.weights
+	for matches in allMatches:
+		for idx in matches:
+			for k in xrange( offsets[ idx ], offsets[ idx+1 ] ):
+				jointId = savedToId.get( jointIndices[ k ] )
+				if jointId is not None:
+					resolvedJoints.append( jointId )
+					resolvedWeights.append( weights[ k ] )
+
+		resolvedOffsets.append( len( resolvedJoints ) )
+
+	#sum the weights of joints found on multiple verts and normalize
+	resolved.mergeDuplicates().normalize()
+
+	return [ [ (jointKeys[ j ], w) for j, w in zip( rowJoints, rowWeights ) ] for rowJoints, rowWeights in resolved.iterRows() ]
+
+
+#holds the saved data and tree for worker processes - see _initResolveProcess
+_RESOLVE_PROCESS_STATE = None
+
+def _initResolveProcess( savedData, tolerance, averageVerts, jointRemap, axisMult ):
+	global _RESOLVE_PROCESS_STATE
+	_RESOLVE_PROCESS_STATE = savedData, tolerance, averageVerts, jointRemap, SkinWeightTree.FromArray( savedData.positions ), axisMult
+
+
+def _resolveChunk( targetPositions ):
+	savedData, tolerance, averageVerts, jointRemap, tree, axisMult = _RESOLVE_PROCESS_STATE
+
+	return resolveVertWeights( targetPositions, savedData, tolerance, averageVerts, jointRemap, tree, axisMult )
+
+
+def resolveVertWeightsParallel( positionChunks, savedData, tolerance=TOL, averageVerts=True, jointRemap=None, processes=None, axisMult=None ):
+	'''
+	runs resolveVertWeights over a list of target position chunks (ie one chunk per mesh or per vert range)
+	using a pool of processes.  each worker process builds the search tree once and then resolves whichever
+	chunks it gets handed.  returns a list of results - one per chunk.  see filesystem.mapInProcessPool for
+	details on processes
+	'''
+	global _RESOLVE_PROCESS_STATE
+	try:
+		return mapInProcessPool( _resolveChunk, positionChunks, processes, initializer=_initResolveProcess,
+		                         initargs=(savedData, tolerance, averageVerts, jointRemap, axisMult) )
+	finally:
+		#if the chunks were resolved in this process, don't hang on to the saved data and tree
+		_RESOLVE_PROCESS_STATE = None
+
+
+def resolveWeightsById( targetVertIndices, savedData, jointRemap=None ):
+	'''
+	resolves weights for a list of target vert indices by looking up the saved vert with the same index - this
+	is the restore by id equivalent of resolveVertWeights.  if the saved data contains the same index more than
+	once the first one wins
+
+	jointRemap is an optional dict mapping saved joint indices to whatever the results should contain (ie joint
+	names).  saved joints missing from the dict are dropped
+
+	returns a (vertIndices, jointKeys, weights) 3-tuple:
+		vertIndices - an int array of the target verts that were found
+		jointKeys - the list of joint keys used - SparseWeights joint indices index into this list
+		weights - a normalized SparseWeights instance with a row for each found vert
+	verts that weren't found in the saved data, or that have no weight left after joint remapping, are left out
+	'''
+	offsets = savedData.offsets
+	jointIndices = savedData.jointIndices
+	weights = savedData.weights
+
+	rowForVert = {}
+	for n, vertIdx in enumerate( savedData.vertIndices ):
+		rowForVert.setdefault( vertIdx, n )
+
+	if jointRemap is None:
+		jointKeys = sorted( set( jointIndices ) )
+		jointRemap = dict( zip( jointKeys, jointKeys ) )
+	else:
+		jointKeys = jointRemap.values()
+
+	jointIds = dict( [ (key, n) for n, key in enumerate( jointKeys ) ] )
+	savedToId = dict( [ (savedIdx, jointIds[ key ]) for savedIdx, key in jointRemap.iteritems() ] )
+
+	foundVerts = array( 'i' )
+	resolved = SparseWeights()
+	resolvedOffsets, resolvedJoints, resolvedWeights = resolved.offsets, resolved.jointIndices, resolved.weights
+	for vertIdx in targetVertIndices:
+		row = rowForVert.get( vertIdx )
+		if row is None:
+			continue
+
+		rowStart = len( resolvedJoints )
+		for k in xrange( offsets[ row ], offsets[ row+1 ] ):
+			jointId = savedToId.get( jointIndices[ k ] )
+			if jointId is not None and weights[ k ]:
+				resolvedJoints.append( jointId )
+				resolvedWeights.append( weights[ k ] )
+
+		#if none of the joints survived the remap there is nothing sensible to write for this vert
+		if len( resolvedJoints ) == rowStart:
+			continue
+
+		foundVerts.append( vertIdx )
+		resolvedOffsets.append( len( resolvedJoints ) )
+
+	resolved.mergeDuplicates().normalize()
+
+	return foundVerts, jointKeys, resolved
+
+
+class SkinWeightWriter(object):
+	'''
+	defines the interface writeWeightsById uses to talk to a skinCluster.  the maya implementation lives in
+	skinWeights - keeping it behind this interface means the restore logic can be run against a fake skinCluster
+	'''
+	def getInfluences( self ):
+		'''
+		returns the list of influence names - the position of an influence in the list is the influence index
+		passed to setWeights
+		'''
+		raise NotImplementedError
+	def addInfluences( self, influences ):
+		'''
+		adds the given influences to the skinCluster with zero weight
+		'''
+		raise NotImplementedError
+	def setWeights( self, vertIndices, influenceIndices, weights ):
+		'''
+		replaces the weights of all the given verts in one go.  weights is a flat array of
+		len( vertIndices ) * len( influenceIndices ) values - all the influence weights for the first vert,
+		then the second, and so on
+		'''
+		raise NotImplementedError
+
+
+def writeWeightsById( writer, targetVertIndices, savedData, jointRemap=None ):
+	'''
+	restores weights by vert index using a SkinWeightWriter.  all the weights for the mesh are written with a
+	single setWeights call.  every influence gets a value for every vert so existing weights are completely
+	replaced, and any joints in the saved data that aren't influences yet get added first
+
+	returns the list of target vert indices that couldn't be restored
+	'''
+	vertIndices, jointKeys, resolved = resolveWeightsById( targetVertIndices, savedData, jointRemap )
+	if not vertIndices:
+		return list( targetVertIndices )
+
+	influences = writer.getInfluences()
+	existing = set( influences )
+	usedKeys = [ jointKeys[ j ] for j in sorted( set( resolved.jointIndices ) ) ]
+	toAdd = [ key for key in usedKeys if key not in existing ]
+	if toAdd:
+		writer.addInfluences( toAdd )
+		influences = writer.getInfluences()
+
+	#map joint ids to influence columns - joints that still aren't influences are dropped
+	influenceIdx = dict( [ (inf, n) for n, inf in enumerate( influences ) ] )
+	columnForId = [ influenceIdx.get( key, -1 ) for key in jointKeys ]
+
+	influenceCount = len( influences )
+	dense = array( 'd', [ 0 ] ) * (len( vertIndices ) * influenceCount)
+	offsets, resolvedJoints, resolvedWeights = resolved.offsets, resolved.jointIndices, resolved.weights
+	for n in xrange( len( vertIndices ) ):
+		rowStart = n * influenceCount
+		for k in xrange( offsets[ n ], offsets[ n+1 ] ):
+			column = columnForId[ resolvedJoints[ k ] ]
+			if column != -1:
+				dense[ rowStart + column ] = resolvedWeights[ k ]
+
+	writer.setWeights( vertIndices, array( 'i', range( influenceCount ) ), dense )
+
+	found = set( vertIndices )
+
+	return [ vertIdx for vertIdx in targetVertIndices if vertIdx not in found ]
+
+
+#caches parity swapped names - joint hierarchies share most of their names, and the same skeleton tends to get
+#mirrored over and over, so there is no point working out the swapped name of any joint more than once
+_PARITY_SWAP_CACHE = {}
+
+def getParitySwappedNames( nameList ):
+	'''
+	returns a dict mapping each of the given names to its parity swapped name
+	'''
+	mapping = {}
+	for name in nameList:
+		try:
+			mapping[ name ] = _PARITY_SWAP_CACHE[ name ]
+		except KeyError:
+			mapping[ name ] = _PARITY_SWAP_CACHE[ name ] = str( names.swapParity( name ) )
+
+	return mapping
+
+
+def swapJointParity( joints, jointHierarchies ):
+	'''
+	swaps parity on the joint names in the joint and joint hierarchy tables stored in a weight file.  returns
+	new joints, jointHierarchies dicts
+	'''
+	allNames = set( joints.itervalues() )
+	for parents in jointHierarchies.itervalues():
+		allNames.update( parents )
+
+	swapped = getParitySwappedNames( allNames )
+	joints = dict( [ (n, swapped[ j ]) for n, j in joints.iteritems() ] )
+	jointHierarchies = dict( [ (n, [ swapped[ p ] for p in parents ]) for n, parents in jointHierarchies.iteritems() ] )
+
+	return joints, jointHierarchies
+
+
+def benchmarkSpatialIndex( pointCounts=(10000, 100000, 1000000), queryCount=2000, tolerance=TOL, ratio=2, seed=0 ):
+	'''
+	compares the SkinWeightTree against the BinarySearchTree previously used when loading weights.  the
+	point clouds are random, but seeded so the results are reproducible.  queries are jittered copies of
+	points in the cloud - which is what loading weights onto a slightly modified mesh looks like
+	'''
+	from binarySearchTree import BinarySearchTree
+
+	rand = random.Random( seed )
+	results = {}
+	for pointCount in pointCounts:
+		scale = pointCount ** (1 / 3.0)  #keep the point density roughly constant
+		points = [ Vector( (rand.uniform( 0, scale ), rand.uniform( 0, scale ), rand.uniform( 0, scale )) ) for n in xrange( pointCount ) ]
+		queries = []
+		for n in xrange( queryCount ):
+			x, y, z = rand.choice( points )
+			queries.append( Vector( (x + rand.uniform( -0.05, 0.05 ), y + rand.uniform( -0.05, 0.05 ), z + rand.uniform( -0.05, 0.05 )) ) )
+
+		start = time.clock()
+		bsTree = BinarySearchTree( points )
+		bsBuild = time.clock() - start
+
+		start = time.clock()
+		for q in queries: bsTree.getWithin( q, tolerance )
+		bsWithin = time.clock() - start
+
+		start = time.clock()
+		for q in queries: bsTree.getWithinRatio( q, ratio )
+		bsRatio = time.clock() - start
+
+		start = time.clock()
+		tree = SkinWeightTree( points )
+		build = time.clock() - start
+
+		start = time.clock()
+		tree.getWithinBatch( queries, tolerance )
+		within = time.clock() - start
+
+		start = time.clock()
+		tree.getWithinRatioBatch( queries, ratio )
+		ratioTime = time.clock() - start
+
+		results[ pointCount ] = (bsBuild, bsWithin, bsRatio), (build, within, ratioTime)
+		print '%d points, %d queries' % (pointCount, queryCount)
+		print '  BinarySearchTree: build %0.3fs  within %0.3fs  ratio %0.3fs' % (bsBuild, bsWithin, bsRatio)
+		print '  SkinWeightTree:   build %0.3fs  within %0.3fs  ratio %0.3fs' % (build, within, ratioTime)
+
+	return results
 
 
 def getUsedJoints( filepath ):
-	return WeightSaveData( filepath.unpickle() ).getUsedJoints()
+	return loadWeightSaveData( filepath ).getUsedJoints()
+
+
+def summarizeWeightFile( filepath ):
+	'''
+	returns a (filepath, summary) 2-tuple - the summary is None if the file couldn't be read.  NOTE: this is
+	a module level function so it can be handed to a multiprocessing pool
+	'''
+	try:
+		return filepath, loadWeightSaveData( filepath ).getSummary()
+	except Exception, x:
+		print 'failed to summarize %s: %s' % (filepath, x)
+		return filepath, None
+
+
+def summarizeWeightFiles( directory, recursive=False, processes=None ):
+	'''
+	summarizes all weight files in the given directory in parallel using a pool of processes.  returns a
+	list of (filepath, summary) 2-tuples sorted by filepath.  see filesystem.mapInProcessPool for details
+	on processes
+	'''
+	filepaths = [ str( f ) for f in Path( directory ).files( recursive=recursive ) if f.hasExtension( EXTENSION ) ]
+
+	return sorted( mapInProcessPool( summarizeWeightFile, filepaths, processes ) )
+
+
+def formatWeightSummary( filepath, summary ):
+	if summary is None:
+		return '%s: unreadable' % filepath
+
+	lines = [ '%s: %d verts, %d meshes, %d of %d joints used' % (filepath, summary[ 'vertCount' ], len( summary[ 'meshVertCounts' ] ), len( summary[ 'usedJoints' ] ), len( summary[ 'joints' ] )) ]
+	for mesh, vertCount in sorted( summary[ 'meshVertCounts' ].iteritems() ):
+		lines.append( '  mesh %s: %d verts' % (mesh, vertCount) )
+
+	joints = summary[ 'joints' ]
+	lines.append( '  joints: %s' % ', '.join( [ str( joints.get( j, j ) ) for j in summary[ 'usedJoints' ] ] ) )
+
+	bounds = summary[ 'bounds' ]
+	if bounds is not None:
+		lines.append( '  bounds: (%0.3f, %0.3f, %0.3f) - (%0.3f, %0.3f, %0.3f)' % (bounds[0] + bounds[1]) )
+
+	lines.append( '  influences per vert: %s' % ', '.join( [ '%d: %d' % item for item in sorted( summary[ 'influenceHistogram' ].iteritems() ) ] ) )
+
+	return '\n'.join( lines )
+
+
+def main( argv=None ):
+	'''
+	command line entry point - prints a summary of each weight file in the given directories/files
+	'''
+	from optparse import OptionParser
+
+	parser = OptionParser( usage='%prog [options] <directory or .weights file> ...' )
+	parser.add_option( '-r', '--recursive', action='store_true', default=False, help='search directories recursively' )
+	parser.add_option( '-p', '--processes', type='int', default=None, help='number of worker processes - defaults to the cpu count' )
+	options, args = parser.parse_args( argv )
+	if not args:
+		parser.error( 'no directories or files given' )
+
+	for arg in args:
+		arg = Path( arg )
+		if arg.isDir():
+			results = summarizeWeightFiles( arg, options.recursive, options.processes )
+		else:
+			results = [ summarizeWeightFile( str( arg ) ) ]
+
+		for filepath, summary in results:
+			print formatWeightSummary( filepath, summary )
 
 
 def regatherWeights( actualJointNames, weightList ):
@@ -106,13 +1032,20 @@ def regatherWeights( actualJointNames, weightList ):
 	the potential for joints to be present multiple times in the jointList - in this case, weights
 	need to be summed for the duplicate joints otherwise maya doesn't weight the vert properly (dupes
 	just get ignored)
+
+	the joints are returned in the order they first appear in actualJointNames
 	'''
-	new = {}
-	[ new.setdefault(j, 0) for j in actualJointNames ]
-	for j, w in zip( actualJointNames, weightList ):
-		new[ j ] += w
+	jointIds = {}
+	rowJoints = [ jointIds.setdefault( j, len( jointIds ) ) for j in actualJointNames ]
+	jointNames = sorted( jointIds, key=jointIds.get )
+
+	merged = SparseWeights.FromRows( [ (rowJoints, weightList) ] ).mergeDuplicates()
+
+	return [ jointNames[ j ] for j in merged.jointIndices ], list( merged.weights )
+
 
-	return new.keys(), new.values()
+if __name__ == '__main__':
+	main()
 
 
 #end
@@ -433,7 +433,7 @@ class SkinWeightsLayout(MelColumnLayout):
 			self._UI_meshMap.editor.ALLOW_MULTI_SELECTION = False
 		except AttributeError:
 			filepath = self.getFilepath()
-			data = WeightSaveData( filepath.unpickle() )
+			data = skinWeights.loadWeightSaveData( filepath )
 			meshes = list( data.getUsedMeshes() )
 
 			sceneMeshes = cmd.ls( typ='mesh' )
@@ -456,7 +456,7 @@ class SkinWeightsLayout(MelColumnLayout):
 			self._UI_jointMap.editor.ALLOW_MULTI_SELECTION = False
 		except AttributeError:
 			filepath = self.getFilepath()
-			data = WeightSaveData( filepath.unpickle() )
+			data = skinWeights.loadWeightSaveData( filepath )
 			joints = list( data.getUsedJoints() )
 
 			sceneJoints = cmd.ls( typ='joint' )
@@ -0,0 +1,289 @@
+
+from array import array
+from bisect import bisect_right
+
+import time
+import random
+import operator
+
+
+def renormalizeRowWithMinimumValue( values, minValue ):
+	'''
+	renormalizes a single list of weight values such that no value is below minValue
+	'''
+	minCount = sum( 1 for v in values if v <= minValue )
+	toAlter = [ n for n, v in enumerate( values ) if v > minValue ]
+	modValues = [ max( minValue, v ) for v in values ]
+
+	toAlterSum = sum( [ values[ n ] for n in toAlter ] )
+	for n in toAlter:
+		modValues[ n ] /= toAlterSum
+
+	modifier = 1.0035 + ( float( minCount ) * minValue )
+	for n in toAlter:
+		modValues[ n ] /= modifier
+
+	return modValues
+
+
+class SparseWeights(object):
+	'''
+	stores skin weights for many verts as a compressed sparse row matrix - each row is a vert and each entry
+	in a row is a (joint index, weight) pair.  the rows are stored in three flat arrays:
+		offsets - the entries for row n are in jointIndices/weights[ offsets[n]:offsets[n+1] ]
+		jointIndices - the joint index for each entry
+		weights - the weight for each entry
+
+	the operations work over every row in a single pass and leave the instance in a valid state, so they
+	can be chained:
+	weights.mergeDuplicates().prune( 0.01 ).clampInfluenceCount( 4 ).normalize()
+	'''
+	def __init__( self, offsets=None, jointIndices=None, weights=None ):
+		self.offsets = array( 'i', [ 0 ] ) if offsets is None else offsets
+		self.jointIndices = array( 'i' ) if jointIndices is None else jointIndices
+		self.weights = array( 'd' ) if weights is None else weights
+	@classmethod
+	def FromRows( cls, rows ):
+		'''
+		builds a SparseWeights instance from an iterable of (jointIndexList, weightList) 2-tuples
+		'''
+		new = cls()
+		offsets, jointIndices, weights = new.offsets, new.jointIndices, new.weights
+		for rowJoints, rowWeights in rows:
+			jointIndices.extend( rowJoints )
+			weights.extend( rowWeights )
+			offsets.append( len( jointIndices ) )
+
+		return new
+	def __len__( self ):
+		return len( self.offsets ) - 1
+	def copy( self ):
+		return self.__class__( array( 'i', self.offsets ), array( 'i', self.jointIndices ), array( 'd', self.weights ) )
+	def getRow( self, n ):
+		'''
+		returns a (jointIndices, weights) 2-tuple for the given row
+		'''
+		start, end = self.offsets[ n ], self.offsets[ n+1 ]
+
+		return self.jointIndices[ start:end ], self.weights[ start:end ]
+	def iterRows( self ):
+		jointIndices, weights = self.jointIndices, self.weights
+		offsets = self.offsets
+		for n in xrange( len( offsets ) - 1 ):
+			start, end = offsets[ n ], offsets[ n+1 ]
+			yield jointIndices[ start:end ], weights[ start:end ]
+	def toRows( self ):
+		'''
+		returns a list containing a list of (joint index, weight) 2-tuples for each row
+		'''
+		return [ zip( rowJoints, rowWeights ) for rowJoints, rowWeights in self.iterRows() ]
+	def getChangedRows( self, other, tolerance=1e-6 ):
+		'''
+		returns a list of the indices of rows that differ between this instance and another with the same
+		number of rows
+		'''
+		changed = []
+		for n, (rowA, rowB) in enumerate( zip( self.iterRows(), other.iterRows() ) ):
+			dictA = dict( zip( *rowA ) )
+			dictB = dict( zip( *rowB ) )
+			if len( dictA ) != len( dictB ):
+				changed.append( n )
+				continue
+
+			for joint, weight in dictA.iteritems():
+				if abs( dictB.get( joint, -1 ) - weight ) > tolerance:
+					changed.append( n )
+					break
+
+		return changed
+	def getRowLengths( self ):
+		offsets = self.offsets
+
+		return map( operator.sub, offsets[ 1: ], offsets[ :-1 ] )
+	def _rebuild( self, rowFunc, rows ):
+		'''
+		runs rowFunc over the given rows - rowFunc is passed the joint and weight slices for a row and should
+		return a (jointIndices, weights) 2-tuple, or None if the row is unchanged.  rows should be a sorted
+		sequence of row indices - all other rows are copied across as contiguous blocks which is much faster
+		than visiting them one at a time
+		'''
+		offsets, jointIndices, weights = self.offsets, self.jointIndices, self.weights
+		newOffsets = array( 'i', [ 0 ] )
+		newJointIndices = array( 'i' )
+		newWeights = array( 'd' )
+
+		def copyRows( firstRow, lastRow, delta ):
+			start, end = offsets[ firstRow ], offsets[ lastRow ]
+			newJointIndices.extend( jointIndices[ start:end ] )
+			newWeights.extend( weights[ start:end ] )
+			if delta:
+				newOffsets.extend( array( 'i', [ o + delta for o in offsets[ firstRow+1:lastRow+1 ] ] ) )
+			else:
+				newOffsets.extend( offsets[ firstRow+1:lastRow+1 ] )
+
+		nextRow = 0
+		delta = 0
+		for n in rows:
+			if n > nextRow:
+				copyRows( nextRow, n, delta )
+
+			start, end = offsets[ n ], offsets[ n+1 ]
+			rowJoints, rowWeights = jointIndices[ start:end ], weights[ start:end ]
+			result = rowFunc( rowJoints, rowWeights )
+			if result is not None:
+				rowJoints, rowWeights = result
+
+			newJointIndices.extend( rowJoints )
+			newWeights.extend( rowWeights )
+			newOffsets.append( len( newJointIndices ) )
+			delta = len( newJointIndices ) - end
+			nextRow = n + 1
+
+		if nextRow < len( offsets ) - 1:
+			copyRows( nextRow, len( offsets ) - 1, delta )
+
+		self.offsets, self.jointIndices, self.weights = newOffsets, newJointIndices, newWeights
+
+		return self
+	def _getRowsForEntries( self, entries, rows=None ):
+		'''
+		returns the sorted unique row indices containing the given entry indices - optionally limited to rows
+		'''
+		offsets = self.offsets
+		entryRows = sorted( set( [ bisect_right( offsets, k ) - 1 for k in entries ] ) )
+		if rows is not None:
+			rows = set( rows )
+			entryRows = [ n for n in entryRows if n in rows ]
+
+		return entryRows
+	def mergeDuplicates( self ):
+		'''
+		sums the weights of joints that appear in a row more than once.  this happens when joints get re-mapped
+		and multiple saved joints end up mapping to the same scene joint
+		'''
+		def merge( rowJoints, rowWeights ):
+			merged = {}
+			order = []
+			for joint, weight in zip( rowJoints, rowWeights ):
+				if joint in merged:
+					merged[ joint ] += weight
+				else:
+					merged[ joint ] = weight
+					order.append( joint )
+
+			return order, [ merged[ j ] for j in order ]
+
+		offsets, jointIndices = self.offsets, self.jointIndices
+		rows = [ n for n, length in enumerate( self.getRowLengths() ) if length > 1 and len( set( jointIndices[ offsets[ n ]:offsets[ n+1 ] ] ) ) != length ]
+
+		return self._rebuild( merge, rows )
+	def prune( self, minWeight, rows=None ):
+		'''
+		removes entries with a weight less than or equal to minWeight.  rows are never left empty - if every
+		entry in a row is below minWeight the largest is kept
+		'''
+		def prune( rowJoints, rowWeights ):
+			kept = [ (j, w) for j, w in zip( rowJoints, rowWeights ) if w > minWeight ]
+			if not kept:
+				weight, joint = max( zip( rowWeights, rowJoints ) )
+				kept = [ (joint, weight) ]
+
+			return [ j for j, w in kept ], [ w for j, w in kept ]
+
+		weights = self.weights
+		if not weights or min( weights ) > minWeight:
+			return self
+
+		toPrune = [ k for k, w in enumerate( weights ) if w <= minWeight ]
+
+		return self._rebuild( prune, self._getRowsForEntries( toPrune, rows ) )
+	def clampInfluenceCount( self, maxCount, rows=None ):
+		'''
+		limits each row to its maxCount largest weights
+		'''
+		def clamp( rowJoints, rowWeights ):
+			kept = sorted( zip( rowWeights, rowJoints ), reverse=True )[ :maxCount ]
+
+			return [ j for w, j in kept ], [ w for w, j in kept ]
+
+		toClamp = [ n for n, length in enumerate( self.getRowLengths() ) if length > maxCount ]
+		if rows is not None:
+			rows = set( rows )
+			toClamp = [ n for n in toClamp if n in rows ]
+
+		return self._rebuild( clamp, toClamp )
+	def normalize( self, rows=None ):
+		'''
+		scales the weights in each row so they sum to 1.  rows with a zero weight sum are left alone
+		'''
+		offsets, weights = self.offsets, self.weights
+		if rows is None:
+			rows = xrange( len( offsets ) - 1 )
+
+		for n in rows:
+			start, end = offsets[ n ], offsets[ n+1 ]
+			weightSum = sum( weights[ start:end ] )
+			if weightSum and weightSum != 1:
+				weightSum = float( weightSum )
+				weights[ start:end ] = array( 'd', [ w / weightSum for w in weights[ start:end ] ] )
+
+		return self
+	def renormalizeWithMinimumValue( self, minValue, rows=None ):
+		'''
+		renormalizes rows such that no weight is below minValue - see renormalizeRowWithMinimumValue
+		'''
+		offsets, weights = self.offsets, self.weights
+		if rows is None:
+			rows = xrange( len( offsets ) - 1 )
+
+		for n in rows:
+			start, end = offsets[ n ], offsets[ n+1 ]
+			weights[ start:end ] = array( 'd', renormalizeRowWithMinimumValue( weights[ start:end ], minValue ) )
+
+		return self
+
+
+def benchmark( vertCount=1000000, influenceCount=8, maxInfluences=4, minWeight=0.01, seed=0 ):
+	'''
+	times the bulk operations on vertCount rows of influenceCount weights, and compares them against the
+	equivalent per vert code the SparseWeights operations replace
+	'''
+	rand = random.Random( seed )
+	jointCount = 64
+	rows = []
+	for n in xrange( vertCount ):
+		joints = [ rand.randrange( jointCount ) for i in xrange( influenceCount ) ]  #random joints may contain duplicates
+		rows.append( (joints, [ rand.random() for j in joints ]) )
+
+	start = time.clock()
+	weights = SparseWeights.FromRows( rows )
+	print 'build: %0.3fs (%d verts, %d influences each)' % (time.clock() - start, vertCount, influenceCount)
+
+	for name, op in ( ('mergeDuplicates', lambda: weights.mergeDuplicates()),
+	                  ('prune', lambda: weights.prune( minWeight )),
+	                  ('clampInfluenceCount', lambda: weights.clampInfluenceCount( maxInfluences )),
+	                  ('normalize', lambda: weights.normalize()) ):
+		start = time.clock()
+		op()
+		print '  SparseWeights.%s: %0.3fs' % (name, time.clock() - start)
+
+	#now do the same work a vert at a time using dicts - which is how the weight code used to do it
+	start = time.clock()
+	results = []
+	for joints, values in rows:
+		jointWeightDict = {}
+		for joint, weight in zip( joints, values ):
+			jointWeightDict[ joint ] = jointWeightDict.get( joint, 0 ) + weight
+
+		kept = sorted( [ (w, j) for j, w in jointWeightDict.iteritems() if w > minWeight ] )[ -maxInfluences: ]
+		weightSum = float( sum( [ w for w, j in kept ] ) )
+		results.append( [ (j, w / weightSum) for w, j in kept ] )
+
+	print '  per vert dicts (all operations): %0.3fs' % (time.clock() - start)
+
+
+if __name__ == '__main__':
+	benchmark()
+
+
+#end
@@ -0,0 +1,218 @@
+'''
+works out which times each pair of a trace (see xferAnim.Tracer) needs to be evaluated at.  the tracer used to
+evaluate every pair at every time that any pair had a key, and when baking it sampled whole frames across the
+entire range for every pair.  the FrameSchedule keeps the times of each pair separate so pairs are only evaluated
+where they need to be, and reports how many evaluations that saves
+
+the functions that query the scene take the cmds module as an argument so they can be run against a fake cmds
+module outside of maya
+'''
+
+from bisect import bisect_left, bisect_right
+
+from keyArrays import KEY_TIME_TOLERANCE
+from filesystem import removeDupes
+
+
+#if any of these attributes on a node are driven by something other than a time based animCurve, the node's motion can't be worked out from keys
+DRIVEN_TRANSFORM_ATTRS = set( [ 'translate', 'translateX', 'translateY', 'translateZ', 't', 'tx', 'ty', 'tz',
+                                'rotate', 'rotateX', 'rotateY', 'rotateZ', 'r', 'rx', 'ry', 'rz',
+                                'scale', 'scaleX', 'scaleY', 'scaleZ', 's', 'sx', 'sy', 'sz',
+                                'shear', 'shearXY', 'shearXZ', 'shearYZ', 'sh', 'shxy', 'shxz', 'shyz',
+                                'rotateOrder', 'ro', 'rotateAxis', 'rotateAxisX', 'rotateAxisY', 'rotateAxisZ', 'ra', 'rax', 'ray', 'raz',
+                                'jointOrient', 'jointOrientX', 'jointOrientY', 'jointOrientZ', 'jo', 'jox', 'joy', 'joz',
+                                'rotatePivot', 'rotatePivotX', 'rotatePivotY', 'rotatePivotZ', 'rp', 'rpx', 'rpy', 'rpz',
+                                'scalePivot', 'scalePivotX', 'scalePivotY', 'scalePivotZ', 'sp', 'spx', 'spy', 'spz',
+                                'inheritsTransform', 'it', 'offsetParentMatrix', 'opm' ] )
+
+#the animCurve types driven by time - animCurveU* curves are driven by another attribute (ie set driven keys) so their
+#"key times" are really driver values
+TIME_CURVE_TYPES = set( [ 'animCurveTL', 'animCurveTA', 'animCurveTT', 'animCurveTU' ] )
+
+
+def getIkDrivenJoints( cmds ):
+	'''
+	returns the set of long names of joints driven by ikHandles.  an ik solver sets the joint rotations directly, so
+	there is no connection to tell these joints are moving
+	'''
+	joints = set()
+	for handle in cmds.ls( type='ikHandle' ) or []:
+		handleJoints = cmds.ikHandle( handle, q=True, jointList=True )
+		if handleJoints:
+			joints.update( cmds.ls( handleJoints, l=True ) )
+
+	return joints
+
+
+def getNodeAndParents( node, cmds ):
+	'''
+	returns the long names of the given node and all its parents - the top most parent first
+	'''
+	names = cmds.ls( node, l=True )[ 0 ].split( '|' )
+
+	return [ '|'.join( names[ :n ] ) for n in xrange( 2, len( names ) + 1 ) ]
+
+
+def getNodeMotionKeyTimes( nodes, cmds, ikJoints=() ):
+	'''
+	returns the sorted times of the keys moving the given nodes.  only time based animCurves connected to transform
+	attributes are counted.  if the motion of any of the nodes can't be proven to come only from time based
+	animCurves None is returned - ie if a transform attribute is driven by anything else (a constraint, an expression,
+	a set driven key curve...), a node is a joint driven by an ikHandle (see getIkDrivenJoints) or the input of one of
+	the curves is connected to something other than time
+	'''
+	curves = []
+	for node in nodes:
+		if node in ikJoints:
+			return None
+
+		connections = cmds.listConnections( node, s=True, d=False, c=True, p=True ) or []
+		for dstPlug, srcPlug in zip( connections[ ::2 ], connections[ 1::2 ] ):
+			if dstPlug[ dstPlug.rfind( '.' ) + 1: ] not in DRIVEN_TRANSFORM_ATTRS:
+				continue
+
+			srcNode = srcPlug.split( '.' )[ 0 ]
+			if cmds.nodeType( srcNode ) not in TIME_CURVE_TYPES:
+				return None
+
+			curves.append( srcNode )
+
+	if not curves:
+		return []
+
+	for curve in curves:
+		if cmds.listConnections( '%s.input' % curve, s=True, d=False ):
+			return None
+
+	return sorted( set( cmds.keyframe( curves, q=True ) or [] ) )
+
+
+def getMotionKeyTimes( src, tgt, cmds, ikJoints=() ):
+	'''
+	returns the times of the keys on everything that moves the src relative to the tgt's parent - ie the src, its
+	parents and the tgt's parents.  the tgt's parents are included because the tgt is keyed in their space, so if
+	they move the tgt's values change even if the src doesn't.  returns None if the motion isn't known - see
+	getNodeMotionKeyTimes
+	'''
+	nodes = getNodeAndParents( src, cmds ) + getNodeAndParents( tgt, cmds )[ :-1 ]
+
+	return getNodeMotionKeyTimes( removeDupes( nodes ), cmds, ikJoints )
+
+
+def getSampleTimes( start, end, skip=1, tolerance=KEY_TIME_TOLERANCE ):
+	'''
+	returns the list of times from start to end inclusive, skip apart.  skip can be fractional to sample sub frames
+	'''
+	if skip <= 0:
+		raise ValueError( "skip must be positive - got %s" % skip )
+
+	if end < start:
+		return []
+
+	#work out the count up front instead of accumulating skip, so fractional skips don't drift
+	count = int( (end - start) / float( skip ) + tolerance ) + 1
+
+	return [ round( start + n * skip, 6 ) for n in xrange( count ) ]
+
+
+class FrameSchedule(object):
+	'''
+	the times each pair of a trace needs to be evaluated at.  pairKeyTimes is a list containing the key times of
+	each pair.
+
+	when tracing keys only (ie sampleTimes is None) each pair is evaluated at its own key times.  when baking,
+	sampleTimes is the list of times to bake at, and pairKeyTimes should contain the times of the keys on everything
+	that moves each source (ie the source and its parents).  each pair is then evaluated at the samples covering
+	its keys - from the sample at or before its first key to the sample at or after its last key.  outside that
+	range the source doesn't move so the target curve holds the right value anyway.  a pair with no keys is
+	evaluated once, at the first sample.  if a pair's entry is None its motion isn't known (it may be constrained
+	or driven by an expression) so it gets evaluated at every sample
+
+	parentIndices optionally gives the index of the pair whose target is the parent of each pair's target (or
+	None).  a parent gets evaluated at all the times its children are, as the children are solved in its space.
+	when baking, a child's target moves whenever its parent's does, so each pair also gets the key times of the
+	pairs above it
+	'''
+	def __init__( self, pairKeyTimes, sampleTimes=None, parentIndices=None ):
+		if sampleTimes is None:
+			pairTimes = [ set( keyTimes ) for keyTimes in pairKeyTimes ]
+		else:
+			if parentIndices:
+				pairKeyTimes = self._addParentKeyTimes( pairKeyTimes, parentIndices )
+
+			sampleTimes = sorted( sampleTimes )
+			pairTimes = []
+			for keyTimes in pairKeyTimes:
+				if keyTimes is None:
+					pairTimes.append( set( sampleTimes ) )
+				elif keyTimes:
+					first = max( bisect_right( sampleTimes, min( keyTimes ) ) - 1, 0 )
+					last = bisect_left( sampleTimes, max( keyTimes ) ) + 1
+					pairTimes.append( set( sampleTimes[ first:last ] ) )
+				else:
+					pairTimes.append( set( sampleTimes[ :1 ] ) )
+
+		#walk up from each pair adding its times to all of its parents
+		if parentIndices:
+			for n, parentIndex in enumerate( parentIndices ):
+				visited = set( [ n ] )
+				while parentIndex is not None and parentIndex not in visited:
+					pairTimes[ parentIndex ].update( pairTimes[ n ] )
+					visited.add( parentIndex )
+					parentIndex = parentIndices[ parentIndex ]
+
+		self.pairTimes = [ sorted( times ) for times in pairTimes ]
+		self.times = sorted( set().union( *pairTimes ) )
+	@staticmethod
+	def _addParentKeyTimes( pairKeyTimes, parentIndices ):
+		'''
+		returns a new list of key times for each pair that include the key times of all the pairs above it.  if
+		the motion of any of them is unknown (None) so is the pair's
+		'''
+		newKeyTimes = []
+		for n, keyTimes in enumerate( pairKeyTimes ):
+			visited = set( [ n ] )
+			parentIndex = parentIndices[ n ]
+			keyTimes = None if keyTimes is None else set( keyTimes )
+			while keyTimes is not None and parentIndex is not None and parentIndex not in visited:
+				parentKeyTimes = pairKeyTimes[ parentIndex ]
+				if parentKeyTimes is None:
+					keyTimes = None
+				else:
+					keyTimes.update( parentKeyTimes )
+
+				visited.add( parentIndex )
+				parentIndex = parentIndices[ parentIndex ]
+
+			newKeyTimes.append( None if keyTimes is None else sorted( keyTimes ) )
+
+		return newKeyTimes
+	def __repr__( self ):
+		return 'FrameSchedule( %d pairs, %d times, %d of %d evaluations - %d saved )' % (len( self.pairTimes ), len( self.times ), self.getEvaluationCount(), self.getDenseEvaluationCount(), self.getSavedCount())
+	def __len__( self ):
+		return len( self.times )
+	def getPairsAtTimes( self ):
+		'''
+		returns a dict keyed by time containing the sorted list of indices of the pairs evaluated at that time
+		'''
+		pairsAtTimes = dict( (t, []) for t in self.times )
+		for n, times in enumerate( self.pairTimes ):
+			for t in times:
+				pairsAtTimes[ t ].append( n )
+
+		return pairsAtTimes
+	def getEvaluationCount( self ):
+		'''
+		returns the total number of pair evaluations in the schedule
+		'''
+		return sum( [ len( times ) for times in self.pairTimes ] )
+	def getDenseEvaluationCount( self ):
+		'''
+		returns the number of pair evaluations if every pair was evaluated at every time in the schedule
+		'''
+		return len( self.times ) * len( self.pairTimes )
+	def getSavedCount( self ):
+		return self.getDenseEvaluationCount() - self.getEvaluationCount()
+
+
+#end
@@ -0,0 +1,756 @@
+'''
+batched versions of the Vector, Matrix and Quaternion classes in the vectors module.  rather than an object
+per item, the items are stored in a single flat array of doubles - so working on thousands of vectors or
+matrices doesn't allocate thousands of lists, and each operation is a single tight loop over the array.
+
+the conventions are the same as the vectors module:
+	matrices are row major with the translation in the 4th row - points are transformed as row vectors, ie
+	the same as Vector( p ) * matrix (but including translation - see VectorArray.transformPoints)
+	quaternions are stored x, y, z, w and convert to matrices the same way Matrix( quaternion ) does
+	euler rotations are (x, y, z) and each order matches the Matrix.FromEuler*/ToEuler* methods
+'''
+
+from array import array
+from vectors import Vector, Matrix, Quaternion, MatrixException
+from math import cos, sin, acos, asin, atan2, sqrt, degrees as _degrees, radians as _radians
+
+import math
+import time
+import random
+import operator
+
+
+#the order names for euler rotations - see the FromEuler*/ToEuler* methods on vectors.Matrix
+EULER_ORDERS = 'XYZ', 'XZY', 'YXZ', 'YZX', 'ZXY', 'ZYX'
+
+#matrices with an absolute determinant below this are treated as singular - same as Matrix.isSingular
+SINGULAR_THRESHOLD = 1e-6
+
+_IDENTITY = (1.0, 0.0, 0.0, 0.0,
+             0.0, 1.0, 0.0, 0.0,
+             0.0, 0.0, 1.0, 0.0,
+             0.0, 0.0, 0.0, 1.0)
+
+
+def _broadcast( other, count, stride ):
+	'''
+	returns a function that gives the array offset of the nth item in other.  other can either contain count
+	items, or a single item which is used for every n
+	'''
+	otherCount = len( other )
+	if otherCount == count:
+		return lambda n: n * stride
+	elif otherCount == 1:
+		return lambda n: 0
+
+	raise MatrixException( "can't combine %d items with %d items" % (count, otherCount) )
+
+
+#euler rotation matrix builders - each is given the cos/sin of each angle and returns the 3x3 rotation rows
+def _rowsXYZ( cx, sx, cy, sy, cz, sz ):
+	return (cy*cz, cy*sz, -sy,
+	        sx*sy*cz - cx*sz, sx*sy*sz + cx*cz, sx*cy,
+	        cx*sy*cz + sx*sz, cx*sy*sz - sx*cz, cx*cy)
+
+def _rowsXZY( cx, sx, cy, sy, cz, sz ):
+	return (cy*cz, sz, -cz*sy,
+	        sx*sy - cx*cy*sz, cz*cx, cx*sy*sz + cy*sx,
+	        cy*sx*sz + cx*sy, -cz*sx, cx*cy - sx*sy*sz)
+
+def _rowsYXZ( cx, sx, cy, sy, cz, sz ):
+	return (cy*cz - sx*sy*sz, cy*sz + cz*sx*sy, -cx*sy,
+	        -cx*sz, cx*cz, sx,
+	        cy*sx*sz + cz*sy, sy*sz - cy*cz*sx, cx*cy)
+
+def _rowsYZX( cx, sx, cy, sy, cz, sz ):
+	return (cy*cz, cx*cy*sz + sx*sy, cy*sx*sz - cx*sy,
+	        -sz, cx*cz, cz*sx,
+	        cz*sy, cx*sy*sz - cy*sx, sx*sy*sz + cx*cy)
+
+def _rowsZXY( cx, sx, cy, sy, cz, sz ):
+	return (sx*sy*sz + cy*cz, cx*sz, cy*sx*sz - cz*sy,
+	        cz*sx*sy - cy*sz, cx*cz, sy*sz + cy*cz*sx,
+	        cx*sy, -sx, cx*cy)
+
+def _rowsZYX( cx, sx, cy, sy, cz, sz ):
+	return (cy*cz, cx*sz + cz*sx*sy, sx*sz - cx*cz*sy,
+	        -cy*sz, cx*cz - sx*sy*sz, cx*sy*sz + cz*sx,
+	        sy, -cy*sx, cx*cy)
+
+
+#euler angle extractors - each is given the first 11 values of a 4x4 matrix and returns x, y, z angles in radians
+def _anglesXYZ( m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22 ):
+	if m02 == 1:
+		z = math.pi
+		return -z + atan2( -m10, -m20 ), -math.pi / 2.0, z
+	elif m02 == -1:
+		z = math.pi
+		return z + atan2( m10, m20 ), math.pi / 2.0, z
+
+	y = -asin( m02 )
+	cosY = cos( y )
+
+	return atan2( m12 * cosY, m22 * cosY ), y, atan2( m01 * cosY, m00 * cosY )
+
+def _anglesXZY( m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22 ):
+	z = asin( m01 )
+	cosZ = cos( z )
+
+	return atan2( -m21 * cosZ, m11 * cosZ ), atan2( -m02 * cosZ, m00 * cosZ ), z
+
+def _anglesYXZ( m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22 ):
+	x = asin( m12 )
+	cosX = cos( x )
+
+	return x, atan2( -m02 * cosX, m22 * cosX ), atan2( -m10 * cosX, m11 * cosX )
+
+def _anglesYZX( m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22 ):
+	z = -asin( m10 )
+	cosZ = cos( z )
+
+	return atan2( m12 * cosZ, m11 * cosZ ), atan2( m20 * cosZ, m00 * cosZ ), z
+
+def _anglesZXY( m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22 ):
+	x = -asin( m21 )
+	cosX = cos( x )
+
+	return x, atan2( m20 * cosX, m22 * cosX ), atan2( m01 * cosX, m11 * cosX )
+
+def _anglesZYX( m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22 ):
+	y = asin( m20 )
+	cosY = cos( y )
+
+	return atan2( -m21 * cosY, m22 * cosY ), y, atan2( -m10 * cosY, m00 * cosY )
+
+
+_EULER_ROWS = dict( zip( EULER_ORDERS, (_rowsXYZ, _rowsXZY, _rowsYXZ, _rowsYZX, _rowsZXY, _rowsZYX) ) )
+_EULER_ANGLES = dict( zip( EULER_ORDERS, (_anglesXYZ, _anglesXZY, _anglesYXZ, _anglesYZX, _anglesZXY, _anglesZYX) ) )
+
+
+def _getEulerFunction( functionDict, order ):
+	try:
+		return functionDict[ order.upper() ]
+	except KeyError:
+		raise MatrixException( "unknown rotation order %s - valid orders are %s" % (order, ', '.join( EULER_ORDERS )) )
+
+
+class VectorArray(object):
+	'''
+	stores many 3-vectors in a single flat array: x0, y0, z0, x1, y1, z1, ...
+	'''
+	STRIDE = 3
+
+	def __init__( self, values=None ):
+		self.values = array( 'd' ) if values is None else array( 'd', values )
+	@classmethod
+	def FromVectors( cls, vectors ):
+		new = cls()
+		values = new.values
+		for v in vectors:
+			values.extend( v[ :3 ] )
+
+		return new
+	@classmethod
+	def Zero( cls, count ):
+		return cls( array( 'd', [ 0.0 ] ) * (count * 3) )
+	def toVectors( self, vectorCls=Vector ):
+		values = self.values
+		return [ vectorCls( values[ n:n+3 ].tolist() ) for n in xrange( 0, len( values ), 3 ) ]
+	def __len__( self ):
+		return len( self.values ) / 3
+	def __getitem__( self, n ):
+		return Vector( self.values[ n*3:n*3+3 ].tolist() )
+	def __setitem__( self, n, vector ):
+		self.values[ n*3:n*3+3 ] = array( 'd', vector[ :3 ] )
+	def __iter__( self ):
+		values = self.values
+		for n in xrange( 0, len( values ), 3 ):
+			yield Vector( values[ n:n+3 ].tolist() )
+	def copy( self ):
+		return self.__class__( self.values )
+	def _combine( self, other, op ):
+		'''
+		applies op to each component of each vector and the corresponding vector in other - other can either
+		be a VectorArray of the same length or a single vector
+		'''
+		if not isinstance( other, VectorArray ):
+			other = VectorArray( other[ :3 ] )
+
+		a, b = self.values, other.values
+		if len( b ) == len( a ):
+			return self.__class__( map( op, a, b ) )
+
+		_broadcast( other, len( self ), 3 )  #make sure other is a single vector
+		bx, by, bz = b
+
+		new = array( 'd' )
+		for n in xrange( 0, len( a ), 3 ):
+			new.extend( (op( a[ n ], bx ), op( a[ n+1 ], by ), op( a[ n+2 ], bz )) )
+
+		return self.__class__( new )
+	def __add__( self, other ):
+		return self._combine( other, operator.add )
+	def __sub__( self, other ):
+		return self._combine( other, operator.sub )
+	def __mul__( self, factor ):
+		'''
+		scales every vector by factor
+		'''
+		return self.__class__( [ v * factor for v in self.values ] )
+	def __neg__( self ):
+		return self.__class__( [ -v for v in self.values ] )
+	def dot( self, other ):
+		'''
+		returns an array containing the dot product of each vector with the corresponding vector in other
+		'''
+		a, b = self.values, other.values
+		offset = _broadcast( other, len( self ), 3 )
+		dots = array( 'd' )
+		for n in xrange( len( self ) ):
+			i, j = n * 3, offset( n )
+			dots.append( a[ i ]*b[ j ] + a[ i+1 ]*b[ j+1 ] + a[ i+2 ]*b[ j+2 ] )
+
+		return dots
+	def cross( self, other ):
+		a, b = self.values, other.values
+		offset = _broadcast( other, len( self ), 3 )
+		new = array( 'd' )
+		for n in xrange( len( self ) ):
+			i, j = n * 3, offset( n )
+			ax, ay, az = a[ i ], a[ i+1 ], a[ i+2 ]
+			bx, by, bz = b[ j ], b[ j+1 ], b[ j+2 ]
+			new.extend( (ay*bz - az*by, az*bx - ax*bz, ax*by - ay*bx) )
+
+		return self.__class__( new )
+	def lengths( self ):
+		values = self.values
+		return array( 'd', [ sqrt( values[ n ]**2 + values[ n+1 ]**2 + values[ n+2 ]**2 ) for n in xrange( 0, len( values ), 3 ) ] )
+	def normalize( self ):
+		'''
+		returns a new VectorArray with every vector normalized.  zero length vectors are left as they are
+		'''
+		values = self.values
+		new = array( 'd' )
+		for n in xrange( 0, len( values ), 3 ):
+			x, y, z = values[ n ], values[ n+1 ], values[ n+2 ]
+			length = sqrt( x*x + y*y + z*z )
+			if length:
+				new.extend( (x / length, y / length, z / length) )
+			else:
+				new.extend( (x, y, z) )
+
+		return self.__class__( new )
+	def _transform( self, matrices, translate ):
+		a, m = self.values, matrices.values
+		offset = _broadcast( matrices, len( self ), 16 )
+		new = array( 'd' )
+		for n in xrange( len( self ) ):
+			i, j = n * 3, offset( n )
+			x, y, z = a[ i ], a[ i+1 ], a[ i+2 ]
+			m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22, m23, m30, m31, m32, m33 = m[ j:j+16 ]
+			if translate:
+				new.extend( (x*m00 + y*m10 + z*m20 + m30, x*m01 + y*m11 + z*m21 + m31, x*m02 + y*m12 + z*m22 + m32) )
+			else:
+				new.extend( (x*m00 + y*m10 + z*m20, x*m01 + y*m11 + z*m21, x*m02 + y*m12 + z*m22) )
+
+		return self.__class__( new )
+	def transformPoints( self, matrices ):
+		'''
+		transforms each vector as a point (ie including translation) by the corresponding matrix in matrices.
+		matrices is a MatrixArray with either a matrix per vector or a single matrix used for all vectors
+		'''
+		return self._transform( matrices, True )
+	def transformVectors( self, matrices ):
+		'''
+		transforms each vector as a direction (ie without translation) - this is the same as Vector * Matrix
+		'''
+		return self._transform( matrices, False )
+	def rotate( self, quats ):
+		'''
+		rotates each vector by the corresponding quaternion in quats - see Vector.rotate.  quats should contain
+		unit quaternions
+		'''
+		a, q = self.values, quats.values
+		offset = _broadcast( quats, len( self ), 4 )
+		new = array( 'd' )
+		for n in xrange( len( self ) ):
+			i, j = n * 3, offset( n )
+			vx, vy, vz = a[ i ], a[ i+1 ], a[ i+2 ]
+			x, y, z, w = q[ j ], q[ j+1 ], q[ j+2 ], q[ j+3 ]
+			ww, xx, yy, zz = w*w, x*x, y*y, z*z
+			wx, wy, wz = w*x, w*y, w*z
+			xy, xz, yz = x*y, x*z, y*z
+			new.extend( (ww*vx + xx*vx - yy*vx - zz*vx + 2*((xy-wz)*vy + (xz+wy)*vz),
+			             ww*vy - xx*vy + yy*vy - zz*vy + 2*((xy+wz)*vx + (yz-wx)*vz),
+			             ww*vz - xx*vz - yy*vz + zz*vz + 2*((xz-wy)*vx + (yz+wx)*vy)) )
+
+		return self.__class__( new )
+
+
+class MatrixArray(object):
+	'''
+	stores many 4x4 matrices in a single flat array - 16 row major values per matrix.  3x3 matrices are
+	expanded to 4x4 when added, the same way Matrix.expand does
+	'''
+	STRIDE = 16
+
+	def __init__( self, values=None ):
+		self.values = array( 'd' ) if values is None else array( 'd', values )
+	@classmethod
+	def FromMatrices( cls, matrices ):
+		new = cls()
+		values = new.values
+		for matrix in matrices:
+			size = matrix.size
+			if size == 4:
+				for row in matrix:
+					values.extend( row )
+			elif size == 3:
+				r0, r1, r2 = matrix
+				values.extend( r0 )
+				values.append( 0 )
+				values.extend( r1 )
+				values.append( 0 )
+				values.extend( r2 )
+				values.extend( (0, 0, 0, 0, 1) )
+			else:
+				raise MatrixException( "only 3x3 and 4x4 matrices can be stored in a MatrixArray" )
+
+		return new
+	@classmethod
+	def Identity( cls, count ):
+		return cls( array( 'd', _IDENTITY ) * count )
+	@classmethod
+	def FromEuler( cls, angles, order='XYZ', degrees=False ):
+		'''
+		builds rotation matrices from a VectorArray of (x, y, z) euler angles.  the order is any of the
+		EULER_ORDERS - each matches the corresponding Matrix.FromEuler* method
+		'''
+		rowFunc = _getEulerFunction( _EULER_ROWS, order )
+		a = angles.values
+		if degrees:
+			a = [ _radians( v ) for v in a ]
+
+		values = array( 'd' )
+		for n in xrange( 0, len( a ), 3 ):
+			x, y, z = a[ n ], a[ n+1 ], a[ n+2 ]
+			m00, m01, m02, m10, m11, m12, m20, m21, m22 = rowFunc( cos( x ), sin( x ), cos( y ), sin( y ), cos( z ), sin( z ) )
+			values.extend( (m00, m01, m02, 0, m10, m11, m12, 0, m20, m21, m22, 0, 0, 0, 0, 1) )
+
+		return cls( values )
+	@classmethod
+	def FromTransforms( cls, translations, rotations, scales=None ):
+		'''
+		builds matrices from a VectorArray of translations, a MatrixArray of rotations and an optional
+		VectorArray of scales - this is the inverse of decompose
+		'''
+		t, r = translations.values, rotations.values
+		s = scales.values if scales is not None else None
+		values = array( 'd' )
+		for n in xrange( len( translations ) ):
+			i, j = n * 3, n * 16
+			sx, sy, sz = s[ i:i+3 ] if s is not None else (1, 1, 1)
+			values.extend( (r[ j ]*sx, r[ j+1 ]*sx, r[ j+2 ]*sx, 0,
+			                r[ j+4 ]*sy, r[ j+5 ]*sy, r[ j+6 ]*sy, 0,
+			                r[ j+8 ]*sz, r[ j+9 ]*sz, r[ j+10 ]*sz, 0,
+			                t[ i ], t[ i+1 ], t[ i+2 ], 1) )
+
+		return cls( values )
+	def toMatrices( self, matrixCls=Matrix ):
+		values = self.values
+		return [ matrixCls( values[ n:n+16 ].tolist(), 4 ) for n in xrange( 0, len( values ), 16 ) ]
+	def __len__( self ):
+		return len( self.values ) / 16
+	def __getitem__( self, n ):
+		return Matrix( self.values[ n*16:n*16+16 ].tolist(), 4 )
+	def __setitem__( self, n, matrix ):
+		self.values[ n*16:n*16+16 ] = MatrixArray.FromMatrices( [ matrix ] ).values
+	def __iter__( self ):
+		values = self.values
+		for n in xrange( 0, len( values ), 16 ):
+			yield Matrix( values[ n:n+16 ].tolist(), 4 )
+	def copy( self ):
+		return self.__class__( self.values )
+	def multiply( self, other ):
+		'''
+		returns self[n] * other[n] for each matrix.  other can also contain a single matrix which is then
+		used for every matrix in this array
+		'''
+		a, b = self.values, other.values
+		offset = _broadcast( other, len( self ), 16 )
+		new = array( 'd' )
+		for n in xrange( len( self ) ):
+			i, j = n * 16, offset( n )
+			b00, b01, b02, b03, b10, b11, b12, b13, b20, b21, b22, b23, b30, b31, b32, b33 = b[ j:j+16 ]
+			for r in xrange( i, i+16, 4 ):
+				a0, a1, a2, a3 = a[ r ], a[ r+1 ], a[ r+2 ], a[ r+3 ]
+				new.extend( (a0*b00 + a1*b10 + a2*b20 + a3*b30,
+				             a0*b01 + a1*b11 + a2*b21 + a3*b31,
+				             a0*b02 + a1*b12 + a2*b22 + a3*b32,
+				             a0*b03 + a1*b13 + a2*b23 + a3*b33) )
+
+		return self.__class__( new )
+	__mul__ = multiply
+	def transpose( self ):
+		a = self.values
+		new = array( 'd' )
+		for i in xrange( 0, len( a ), 16 ):
+			new.extend( a[ i:i+16:4 ] )
+			new.extend( a[ i+1:i+16:4 ] )
+			new.extend( a[ i+2:i+16:4 ] )
+			new.extend( a[ i+3:i+16:4 ] )
+
+		return self.__class__( new )
+	def determinants( self ):
+		a = self.values
+		dets = array( 'd' )
+		for i in xrange( 0, len( a ), 16 ):
+			m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22, m23, m30, m31, m32, m33 = a[ i:i+16 ]
+			s0 = m00*m11 - m10*m01
+			s1 = m00*m12 - m10*m02
+			s2 = m00*m13 - m10*m03
+			s3 = m01*m12 - m11*m02
+			s4 = m01*m13 - m11*m03
+			s5 = m02*m13 - m12*m03
+			c5 = m22*m33 - m32*m23
+			c4 = m21*m33 - m31*m23
+			c3 = m21*m32 - m31*m22
+			c2 = m20*m33 - m30*m23
+			c1 = m20*m32 - m30*m22
+			c0 = m20*m31 - m30*m21
+			dets.append( s0*c5 - s1*c4 + s2*c3 + s3*c2 - s4*c1 + s5*c0 )
+
+		return dets
+	def inverse( self ):
+		'''
+		returns the inverse of each matrix.  affine matrices (ie the last column is 0, 0, 0, 1 - which is
+		almost always the case for transforms) only need the upper 3x3 inverted, everything else uses the
+		full 4x4 adjugate.  like Matrix.inverse, singular matrices are returned unchanged
+		'''
+		a = self.values
+		new = array( 'd' )
+		for i in xrange( 0, len( a ), 16 ):
+			m = a[ i:i+16 ]
+			m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22, m23, m30, m31, m32, m33 = m
+			if m03 == 0 and m13 == 0 and m23 == 0 and m33 == 1:
+				c00 = m11*m22 - m12*m21
+				c01 = m02*m21 - m01*m22
+				c02 = m01*m12 - m02*m11
+				det = m00*c00 + m10*c01 + m20*c02
+				if abs( det ) < SINGULAR_THRESHOLD:
+					new.extend( m )
+					continue
+
+				inv = 1.0 / det
+				i00, i01, i02 = c00*inv, c01*inv, c02*inv
+				i10 = (m12*m20 - m10*m22)*inv
+				i11 = (m00*m22 - m02*m20)*inv
+				i12 = (m02*m10 - m00*m12)*inv
+				i20 = (m10*m21 - m11*m20)*inv
+				i21 = (m01*m20 - m00*m21)*inv
+				i22 = (m00*m11 - m01*m10)*inv
+				new.extend( (i00, i01, i02, 0,
+				             i10, i11, i12, 0,
+				             i20, i21, i22, 0,
+				             -(m30*i00 + m31*i10 + m32*i20), -(m30*i01 + m31*i11 + m32*i21), -(m30*i02 + m31*i12 + m32*i22), 1) )
+				continue
+
+			s0 = m00*m11 - m10*m01
+			s1 = m00*m12 - m10*m02
+			s2 = m00*m13 - m10*m03
+			s3 = m01*m12 - m11*m02
+			s4 = m01*m13 - m11*m03
+			s5 = m02*m13 - m12*m03
+			c5 = m22*m33 - m32*m23
+			c4 = m21*m33 - m31*m23
+			c3 = m21*m32 - m31*m22
+			c2 = m20*m33 - m30*m23
+			c1 = m20*m32 - m30*m22
+			c0 = m20*m31 - m30*m21
+			det = s0*c5 - s1*c4 + s2*c3 + s3*c2 - s4*c1 + s5*c0
+			if abs( det ) < SINGULAR_THRESHOLD:
+				new.extend( m )
+				continue
+
+			inv = 1.0 / det
+			new.extend( (( m11*c5 - m12*c4 + m13*c3)*inv,
+			             (-m01*c5 + m02*c4 - m03*c3)*inv,
+			             ( m31*s5 - m32*s4 + m33*s3)*inv,
+			             (-m21*s5 + m22*s4 - m23*s3)*inv,
+			             (-m10*c5 + m12*c2 - m13*c1)*inv,
+			             ( m00*c5 - m02*c2 + m03*c1)*inv,
+			             (-m30*s5 + m32*s2 - m33*s1)*inv,
+			             ( m20*s5 - m22*s2 + m23*s1)*inv,
+			             ( m10*c4 - m11*c2 + m13*c0)*inv,
+			             (-m00*c4 + m01*c2 - m03*c0)*inv,
+			             ( m30*s4 - m31*s2 + m33*s0)*inv,
+			             (-m20*s4 + m21*s2 - m23*s0)*inv,
+			             (-m10*c3 + m11*c1 - m12*c0)*inv,
+			             ( m00*c3 - m01*c1 + m02*c0)*inv,
+			             (-m30*s3 + m31*s1 - m32*s0)*inv,
+			             ( m20*s3 - m21*s1 + m22*s0)*inv) )
+
+		return self.__class__( new )
+	def getPositions( self ):
+		a = self.values
+		positions = array( 'd' )
+		for i in xrange( 12, len( a ), 16 ):
+			positions.extend( a[ i:i+3 ] )
+
+		return VectorArray( positions )
+	def decompose( self ):
+		'''
+		returns a (translations, rotations, scales) 3-tuple.  translations and scales are VectorArrays and
+		rotations is a MatrixArray of pure rotation matrices.  like Matrix.decompose, the scale of each axis is
+		the length of the corresponding row
+		'''
+		a = self.values
+		translations, rotations, scales = array( 'd' ), array( 'd' ), array( 'd' )
+		for i in xrange( 0, len( a ), 16 ):
+			m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22, m23, m30, m31, m32, m33 = a[ i:i+16 ]
+			sx = sqrt( m00*m00 + m01*m01 + m02*m02 )
+			sy = sqrt( m10*m10 + m11*m11 + m12*m12 )
+			sz = sqrt( m20*m20 + m21*m21 + m22*m22 )
+			ix = 1.0 / sx if sx else 0.0
+			iy = 1.0 / sy if sy else 0.0
+			iz = 1.0 / sz if sz else 0.0
+
+			translations.extend( (m30, m31, m32) )
+			scales.extend( (sx, sy, sz) )
+			rotations.extend( (m00*ix, m01*ix, m02*ix, 0,
+			                   m10*iy, m11*iy, m12*iy, 0,
+			                   m20*iz, m21*iz, m22*iz, 0,
+			                   0, 0, 0, 1) )
+
+		return VectorArray( translations ), MatrixArray( rotations ), VectorArray( scales )
+	def toEuler( self, order='XYZ', degrees=False ):
+		'''
+		returns a VectorArray of (x, y, z) euler angles for the rotation part of each matrix.  the order is any of
+		the EULER_ORDERS - each matches the corresponding Matrix.ToEuler* method
+		'''
+		angleFunc = _getEulerFunction( _EULER_ANGLES, order )
+		a = self.values
+		angles = array( 'd' )
+		for i in xrange( 0, len( a ), 16 ):
+			angles.extend( angleFunc( *a[ i:i+11 ] ) )
+
+		if degrees:
+			angles = array( 'd', [ _degrees( v ) for v in angles ] )
+
+		return VectorArray( angles )
+
+
+class QuaternionArray(object):
+	'''
+	stores many quaternions in a single flat array - x, y, z, w for each
+	'''
+	STRIDE = 4
+
+	def __init__( self, values=None ):
+		self.values = array( 'd' ) if values is None else array( 'd', values )
+	@classmethod
+	def FromQuaternions( cls, quats ):
+		new = cls()
+		for q in quats:
+			new.values.extend( q[ :4 ] )
+
+		return new
+	@classmethod
+	def Identity( cls, count ):
+		return cls( array( 'd', (0, 0, 0, 1) ) * count )
+	@classmethod
+	def FromMatrices( cls, matrices ):
+		'''
+		builds quaternions from the rotation part of each matrix in a MatrixArray - the inverse of toMatrices
+		'''
+		a = matrices.values
+		values = array( 'd' )
+		for i in xrange( 0, len( a ), 16 ):
+			m00, m01, m02, m03, m10, m11, m12, m13, m20, m21, m22 = a[ i:i+11 ]
+			trace = m00 + m11 + m22
+			if trace > 0:
+				s = 0.5 / sqrt( trace + 1.0 )
+				values.extend( ((m21 - m12)*s, (m02 - m20)*s, (m10 - m01)*s, 0.25 / s) )
+			elif m00 > m11 and m00 > m22:
+				s = 2.0 * sqrt( 1.0 + m00 - m11 - m22 )
+				values.extend( (0.25 * s, (m01 + m10) / s, (m02 + m20) / s, (m21 - m12) / s) )
+			elif m11 > m22:
+				s = 2.0 * sqrt( 1.0 + m11 - m00 - m22 )
+				values.extend( ((m01 + m10) / s, 0.25 * s, (m12 + m21) / s, (m02 - m20) / s) )
+			else:
+				s = 2.0 * sqrt( 1.0 + m22 - m00 - m11 )
+				values.extend( ((m02 + m20) / s, (m12 + m21) / s, 0.25 * s, (m10 - m01) / s) )
+
+		return cls( values )
+	@classmethod
+	def FromEuler( cls, angles, order='XYZ', degrees=False ):
+		return cls.FromMatrices( MatrixArray.FromEuler( angles, order, degrees ) )
+	def toQuaternions( self, quatCls=Quaternion ):
+		values = self.values
+		return [ quatCls( values[ n:n+4 ].tolist() ) for n in xrange( 0, len( values ), 4 ) ]
+	def toMatrices( self ):
+		'''
+		returns a MatrixArray of rotation matrices - the same as Matrix( quaternion ) for each quaternion
+		'''
+		q = self.values
+		values = array( 'd' )
+		for i in xrange( 0, len( q ), 4 ):
+			x, y, z, w = q[ i ], q[ i+1 ], q[ i+2 ], q[ i+3 ]
+			xx, yy, zz = 2.0*x*x, 2.0*y*y, 2.0*z*z
+			xy, zw, xz = 2.0*x*y, 2.0*z*w, 2.0*x*z
+			yw, yz, xw = 2.0*y*w, 2.0*y*z, 2.0*x*w
+			values.extend( (1.0-yy-zz, xy-zw, xz+yw, 0,
+			                xy+zw, 1.0-xx-zz, yz-xw, 0,
+			                xz-yw, yz+xw, 1.0-xx-yy, 0,
+			                0, 0, 0, 1) )
+
+		return MatrixArray( values )
+	def toEuler( self, order='XYZ', degrees=False ):
+		return self.toMatrices().toEuler( order, degrees )
+	def __len__( self ):
+		return len( self.values ) / 4
+	def __getitem__( self, n ):
+		return Quaternion( self.values[ n*4:n*4+4 ].tolist() )
+	def __iter__( self ):
+		values = self.values
+		for n in xrange( 0, len( values ), 4 ):
+			yield Quaternion( values[ n:n+4 ].tolist() )
+	def copy( self ):
+		return self.__class__( self.values )
+	def multiply( self, other ):
+		'''
+		returns self[n] * other[n] for each quaternion - see Quaternion.__mul__.  other can also contain a
+		single quaternion which is then used for every quaternion in this array
+		'''
+		a, b = self.values, other.values
+		offset = _broadcast( other, len( self ), 4 )
+		new = array( 'd' )
+		for n in xrange( len( self ) ):
+			i, j = n * 4, offset( n )
+			x1, y1, z1, w1 = a[ i ], a[ i+1 ], a[ i+2 ], a[ i+3 ]
+			x2, y2, z2, w2 = b[ j ], b[ j+1 ], b[ j+2 ], b[ j+3 ]
+			new.extend( (w1*x2 + x1*w2 + y1*z2 - z1*y2,
+			             w1*y2 - x1*z2 + y1*w2 + z1*x2,
+			             w1*z2 + x1*y2 - y1*x2 + z1*w2,
+			             w1*w2 - x1*x2 - y1*y2 - z1*z2) )
+
+		return self.__class__( new )
+	__mul__ = multiply
+	def normalize( self ):
+		q = self.values
+		new = array( 'd' )
+		for i in xrange( 0, len( q ), 4 ):
+			x, y, z, w = q[ i ], q[ i+1 ], q[ i+2 ], q[ i+3 ]
+			length = sqrt( x*x + y*y + z*z + w*w )
+			if length:
+				new.extend( (x / length, y / length, z / length, w / length) )
+			else:
+				new.extend( (x, y, z, w) )
+
+		return self.__class__( new )
+	def slerp( self, other, t ):
+		'''
+		spherically interpolates between each quaternion and the corresponding quaternion in other.  t can
+		either be a single weight or a sequence with a weight per quaternion.  interpolation always takes the
+		shortest path, and quaternions that are almost the same are interpolated linearly
+		'''
+		a, b = self.values, other.values
+		offset = _broadcast( other, len( self ), 4 )
+		if isinstance( t, (int, float) ):
+			weights = [ t ] * len( self )
+		else:
+			weights = t
+
+		new = array( 'd' )
+		for n in xrange( len( self ) ):
+			i, j = n * 4, offset( n )
+			x1, y1, z1, w1 = a[ i ], a[ i+1 ], a[ i+2 ], a[ i+3 ]
+			x2, y2, z2, w2 = b[ j ], b[ j+1 ], b[ j+2 ], b[ j+3 ]
+			weight = weights[ n ]
+
+			cosTheta = x1*x2 + y1*y2 + z1*z2 + w1*w2
+			if cosTheta < 0:
+				cosTheta = -cosTheta
+				x2, y2, z2, w2 = -x2, -y2, -z2, -w2
+
+			if cosTheta > 0.9995:
+				wA, wB = 1.0 - weight, weight
+				x, y, z, w = wA*x1 + wB*x2, wA*y1 + wB*y2, wA*z1 + wB*z2, wA*w1 + wB*w2
+				length = sqrt( x*x + y*y + z*z + w*w )
+				new.extend( (x / length, y / length, z / length, w / length) )
+				continue
+
+			theta = acos( cosTheta )
+			sinTheta = sin( theta )
+			wA = sin( (1.0 - weight) * theta ) / sinTheta
+			wB = sin( weight * theta ) / sinTheta
+			new.extend( (wA*x1 + wB*x2, wA*y1 + wB*y2, wA*z1 + wB*z2, wA*w1 + wB*w2) )
+
+		return self.__class__( new )
+
+
+def _timeIt( func, repeats=1 ):
+	start = time.clock()
+	for n in xrange( repeats ):
+		result = func()
+
+	return (time.clock() - start) / repeats, result
+
+
+def benchmark( count=20000, seed=0 ):
+	'''
+	times the batch operations against doing the same work with the scalar Vector/Matrix classes
+	'''
+	rand = random.Random( seed )
+	vectors = [ Vector( (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) ) for n in xrange( count ) ]
+	angles = [ Vector( (rand.uniform( -math.pi, math.pi ), rand.uniform( -1.5, 1.5 ), rand.uniform( -math.pi, math.pi )) ) for n in xrange( count ) ]
+	matrices = []
+	for angle, pos in zip( angles, vectors ):
+		matrix = Matrix( Matrix.FromEulerXYZ( *angle ).expand( 4 ) )
+		matrix.set_position( pos )
+		matrices.append( matrix )
+
+	vectorArray = VectorArray.FromVectors( vectors )
+	angleArray = VectorArray.FromVectors( angles )
+	matrixArray = MatrixArray.FromMatrices( matrices )
+	quatArray = QuaternionArray.FromMatrices( matrixArray )
+	otherQuatArray = QuaternionArray( quatArray.values[ 4: ] + quatArray.values[ :4 ] )
+
+	def slerpScalar():
+		results = []
+		for qA, qB in zip( quatArray.toQuaternions(), otherQuatArray.toQuaternions() ):
+			cosTheta = qA.dot( qB )
+			if cosTheta < 0:
+				cosTheta, qB = -cosTheta, qB * -1
+
+			theta = acos( min( cosTheta, 1 ) )
+			if theta < 1e-6:
+				results.append( qA.copy() )
+				continue
+
+			results.append( qA * (sin( 0.5 * theta ) / sin( theta )) + qB * (sin( 0.5 * theta ) / sin( theta )) )
+
+		return results
+
+	#each test is a name, the scalar version and the batch version
+	tests = ( ('normalize', lambda: [ v.normalize() for v in vectors ], vectorArray.normalize),
+	          ('transform vectors', lambda: [ v * m for v, m in zip( vectors, matrices ) ], lambda: vectorArray.transformVectors( matrixArray )),
+	          ('matrix multiply', lambda: [ m * m for m in matrices[ :count / 10 ] ], lambda: MatrixArray( matrixArray.values[ :len( matrixArray.values ) / 10 ] ).multiply( MatrixArray( matrixArray.values[ :len( matrixArray.values ) / 10 ] ) )),
+	          ('inverse', lambda: [ m.inverse() for m in matrices[ :count / 10 ] ], lambda: MatrixArray( matrixArray.values[ :len( matrixArray.values ) / 10 ] ).inverse()),
+	          ('decompose', lambda: [ m.decompose() for m in matrices[ :count / 10 ] ], lambda: MatrixArray( matrixArray.values[ :len( matrixArray.values ) / 10 ] ).decompose()),
+	          ('euler to matrix', lambda: [ Matrix.FromEulerZXY( *a ) for a in angles ], lambda: MatrixArray.FromEuler( angleArray, 'ZXY' )),
+	          ('matrix to euler', lambda: [ m.ToEulerZXY() for m in matrices ], lambda: matrixArray.toEuler( 'ZXY' )),
+	          ('slerp', slerpScalar, lambda: quatArray.slerp( otherQuatArray, 0.5 )) )
+
+	print 'batch vs scalar timings for %d items (matrix multiply, inverse and decompose use %d items)' % (count, count / 10)
+	for name, scalarFunc, batchFunc in tests:
+		scalarTime, scalarResult = _timeIt( scalarFunc )
+		batchTime, batchResult = _timeIt( batchFunc )
+		print '  %s: scalar %0.3fs, batch %0.3fs (%0.1fx faster)' % (name, scalarTime, batchTime, scalarTime / max( batchTime, 1e-6 ))
+
+
+if __name__ == '__main__':
+	benchmark()
+
+
+#end
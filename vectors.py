@@ -5,6 +5,7 @@ comprehensive/mature is found
 '''
 
 import re
+import time
 import math
 import random
 from math import cos, sin, tan, acos, asin, atan2
@@ -12,6 +13,8 @@ from math import cos, sin, tan, acos, asin, atan2
 
 sqrt = math.sqrt
 zeroThreshold = 1e-8
+singularThreshold = 1e-6  #matrices with an absolute determinant below this are treated as singular
+orthonormalThreshold = 1e-9  #max deviation from a unit dot product for a 3x3 to be treated as a pure rotation
 
 class MatrixException(Exception):
 	pass
@@ -928,7 +931,8 @@ class Matrix(list):
 		return new
 	def det( self ):
 		'''
-		calculates the determinant
+		calculates the determinant.  3x3 and 4x4 matrices are done in closed form, other sizes use recursive
+		cofactor expansion
 		'''
 		d = 0
 		if self.size <= 0:
@@ -939,6 +943,26 @@ class Matrix(list):
 			a, b, c, d = self.as_list()
 			return (a*d) - (b*c)
 
+		if self.size == 3:
+			return det3( self )
+
+		if self.size == 4:
+			return det4( self )
+
+		return self.detRecursive()
+	def detRecursive( self ):
+		'''
+		calculates the determinant using cofactor expansion - this works for any size but is very slow, so
+		det() only uses it for matrices bigger than 4x4
+		'''
+		d = 0
+		if self.size <= 0:
+			return 1
+
+		if self.size == 2:
+			a, b, c, d = self.as_list()
+			return (a*d) - (b*c)
+
 		for i in range( self.size ):
 			sign = (1,-1)[ i % 2 ]
 			cofactor = self.cofactor( i, 0 )
@@ -966,12 +990,44 @@ class Matrix(list):
 	minor = cofactor
 	def isSingular( self ):
 		det = self.det()
-		if abs(det) < 1e-6: return True,0
+		if abs(det) < singularThreshold: return True,0
 		return False,det
+	def isAffine( self ):
+		'''
+		returns whether this is a 4x4 affine transform - ie the last column is 0, 0, 0, 1
+		'''
+		if self.size != 4:
+			return False
+
+		return self[0][3] == 0 and self[1][3] == 0 and self[2][3] == 0 and self[3][3] == 1
 	def isRotation( self ):
 		'''rotation matricies have a determinant of 1'''
 		return ( abs(self.det()) - 1 < 1e-6 )
 	def inverse( self ):
+		'''
+		returns the inverse of this matrix, or a copy of it if its singular.  affine 4x4 transforms only need
+		their upper 3x3 inverted (which is just a transpose if there is no scale or shear), other 3x3 and 4x4
+		matrices use the closed form adjugate, and all other sizes fall back to inverseRecursive
+		'''
+		size = self.size
+		if size == 4:
+			if self.isAffine():
+				values = inverseAffine( self )
+			else:
+				values = inverse4( self )
+		elif size == 3:
+			values = inverse3( self )
+		else:
+			return self.inverseRecursive()
+
+		if values is None:
+			return self.copy()
+
+		new = self.__class__( size=size )
+		new[:] = values
+
+		return new
+	def inverseRecursive( self ):
 		'''Each element of the inverse is the determinant of its minor
 		divided by the determinant of the whole'''
 		isSingular,det = self.isSingular()
@@ -1186,6 +1242,118 @@ RY = Matrix( (cz,sz,0,  -sz,cz,0,  0,0,1) )
 '''
 
 
+def det3( rows ):
+	'''
+	closed form determinant of a 3x3 matrix given as a sequence of rows
+	'''
+	(m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = rows
+
+	return m00*(m11*m22 - m12*m21) + m01*(m12*m20 - m10*m22) + m02*(m10*m21 - m11*m20)
+
+
+def det4( rows ):
+	'''
+	closed form determinant of a 4x4 matrix given as a sequence of rows
+	'''
+	(m00, m01, m02, m03), (m10, m11, m12, m13), (m20, m21, m22, m23), (m30, m31, m32, m33) = rows
+	s0 = m00*m11 - m10*m01
+	s1 = m00*m12 - m10*m02
+	s2 = m00*m13 - m10*m03
+	s3 = m01*m12 - m11*m02
+	s4 = m01*m13 - m11*m03
+	s5 = m02*m13 - m12*m03
+	c5 = m22*m33 - m32*m23
+	c4 = m21*m33 - m31*m23
+	c3 = m21*m32 - m31*m22
+	c2 = m20*m33 - m30*m23
+	c1 = m20*m32 - m30*m22
+	c0 = m20*m31 - m30*m21
+
+	return s0*c5 - s1*c4 + s2*c3 + s3*c2 - s4*c1 + s5*c0
+
+
+def inverse3( rows ):
+	'''
+	returns the inverse of a 3x3 matrix as a list of rows using the adjugate, or None if the matrix is
+	singular
+	'''
+	(m00, m01, m02), (m10, m11, m12), (m20, m21, m22) = rows
+	c00 = m11*m22 - m12*m21
+	c01 = m02*m21 - m01*m22
+	c02 = m01*m12 - m02*m11
+	det = m00*c00 + m10*c01 + m20*c02
+	if abs( det ) < singularThreshold:
+		return None
+
+	inv = 1.0 / det
+
+	return [ [c00*inv, c01*inv, c02*inv],
+	         [(m12*m20 - m10*m22)*inv, (m00*m22 - m02*m20)*inv, (m02*m10 - m00*m12)*inv],
+	         [(m10*m21 - m11*m20)*inv, (m01*m20 - m00*m21)*inv, (m00*m11 - m01*m10)*inv] ]
+
+
+def inverseAffine( rows ):
+	'''
+	returns the inverse of a 4x4 affine transform (translation in the last row) as a list of rows, or None if
+	the matrix is singular.  if the upper 3x3 is orthonormal its inverse is just its transpose, otherwise its
+	inverted using inverse3
+	'''
+	(m00, m01, m02, m03), (m10, m11, m12, m13), (m20, m21, m22, m23), (tx, ty, tz, m33) = rows
+
+	#check whether the upper 3x3 is a pure rotation
+	t = orthonormalThreshold
+	if abs( m00*m00 + m01*m01 + m02*m02 - 1 ) < t and \
+	   abs( m10*m10 + m11*m11 + m12*m12 - 1 ) < t and \
+	   abs( m20*m20 + m21*m21 + m22*m22 - 1 ) < t and \
+	   abs( m00*m10 + m01*m11 + m02*m12 ) < t and \
+	   abs( m00*m20 + m01*m21 + m02*m22 ) < t and \
+	   abs( m10*m20 + m11*m21 + m12*m22 ) < t:
+		i00, i01, i02 = m00, m10, m20
+		i10, i11, i12 = m01, m11, m21
+		i20, i21, i22 = m02, m12, m22
+	else:
+		inv = inverse3( (rows[0][:3], rows[1][:3], rows[2][:3]) )
+		if inv is None:
+			return None
+
+		(i00, i01, i02), (i10, i11, i12), (i20, i21, i22) = inv
+
+	return [ [i00, i01, i02, 0],
+	         [i10, i11, i12, 0],
+	         [i20, i21, i22, 0],
+	         [-(tx*i00 + ty*i10 + tz*i20), -(tx*i01 + ty*i11 + tz*i21), -(tx*i02 + ty*i12 + tz*i22), 1] ]
+
+
+def inverse4( rows ):
+	'''
+	returns the inverse of a general 4x4 matrix as a list of rows using the adjugate, or None if the matrix is
+	singular
+	'''
+	(m00, m01, m02, m03), (m10, m11, m12, m13), (m20, m21, m22, m23), (m30, m31, m32, m33) = rows
+	s0 = m00*m11 - m10*m01
+	s1 = m00*m12 - m10*m02
+	s2 = m00*m13 - m10*m03
+	s3 = m01*m12 - m11*m02
+	s4 = m01*m13 - m11*m03
+	s5 = m02*m13 - m12*m03
+	c5 = m22*m33 - m32*m23
+	c4 = m21*m33 - m31*m23
+	c3 = m21*m32 - m31*m22
+	c2 = m20*m33 - m30*m23
+	c1 = m20*m32 - m30*m22
+	c0 = m20*m31 - m30*m21
+	det = s0*c5 - s1*c4 + s2*c3 + s3*c2 - s4*c1 + s5*c0
+	if abs( det ) < singularThreshold:
+		return None
+
+	inv = 1.0 / det
+
+	return [ [( m11*c5 - m12*c4 + m13*c3)*inv, (-m01*c5 + m02*c4 - m03*c3)*inv, ( m31*s5 - m32*s4 + m33*s3)*inv, (-m21*s5 + m22*s4 - m23*s3)*inv],
+	         [(-m10*c5 + m12*c2 - m13*c1)*inv, ( m00*c5 - m02*c2 + m03*c1)*inv, (-m30*s5 + m32*s2 - m33*s1)*inv, ( m20*s5 - m22*s2 + m23*s1)*inv],
+	         [( m10*c4 - m11*c2 + m13*c0)*inv, (-m00*c4 + m01*c2 - m03*c0)*inv, ( m30*s4 - m31*s2 + m33*s0)*inv, (-m20*s4 + m21*s2 - m23*s0)*inv],
+	         [(-m10*c3 + m11*c1 - m12*c0)*inv, ( m00*c3 - m01*c1 + m02*c0)*inv, (-m30*s3 + m31*s1 - m32*s0)*inv, ( m20*s3 - m21*s1 + m22*s0)*inv] ]
+
+
 def multMatrixVector( theMatrix, theVector ):
 	'''
 	multiplies a matrix by a vector - returns a Vector
@@ -1264,4 +1432,39 @@ def cardanoCubicRoots( flA, flB, flC, flD ):
 	return False, eigenValues
 
 
+def benchmark( count=2000, seed=0 ):
+	'''
+	times the closed form determinant and inverse against the recursive cofactor versions they replace
+	'''
+	rand = random.Random( seed )
+	rigid, scaled, general = [], [], []
+	for n in xrange( count ):
+		matrix = Matrix.FromEulerXYZ( rand.uniform( -3, 3 ), rand.uniform( -1.5, 1.5 ), rand.uniform( -3, 3 ) ).expand( 4 )
+		matrix.set_position( (rand.uniform( -10, 10 ), rand.uniform( -10, 10 ), rand.uniform( -10, 10 )) )
+		rigid.append( matrix )
+
+		matrix = matrix.copy()
+		for row in matrix[ :3 ]:
+			row[ :3 ] = [ v * rand.uniform( 0.5, 2 ) for v in row[ :3 ] ]
+
+		scaled.append( matrix )
+		general.append( Matrix( [ rand.uniform( -2, 2 ) for i in xrange( 16 ) ] ) )
+
+	for name, matrices in (('rigid', rigid), ('scaled', scaled), ('general', general)):
+		for opName, closed, recursive in (('det', Matrix.det, Matrix.detRecursive), ('inverse', Matrix.inverse, Matrix.inverseRecursive)):
+			start = time.clock()
+			for matrix in matrices: closed( matrix )
+			closedTime = time.clock() - start
+
+			start = time.clock()
+			for matrix in matrices: recursive( matrix )
+			recursiveTime = time.clock() - start
+
+			print '%s %s: closed form %0.3fs, recursive %0.3fs (%0.1fx faster)' % (name, opName, closedTime, recursiveTime, recursiveTime / max( closedTime, 1e-6 ))
+
+
+if __name__ == '__main__':
+	benchmark()
+
+
 #end
@@ -5,15 +5,19 @@ from maya import OpenMaya
 from filesystem import Path, Preset, GLOBAL, LOCAL, removeDupes
 from names import *
 from vectors import *
+from vectorArrays import MatrixArray
 
 from melUtils import mel
 from picker import resolveCmdStr
 from mappingUtils import *
-from common import printWarningStr, printErrorStr
+from common import printInfoStr, printWarningStr, printErrorStr
 from mayaDecorators import d_noAutoKey, d_unifyUndo, d_disableViews, d_restoreTime
 
 import api
 import maya
+import animCapture
+import batchTrace
+import traceSchedule
 
 
 TOOL_NAME = 'xferAnim'
@@ -26,6 +30,7 @@ kROOS = "xyz", "yzx", "zxy", "xzy", "yxz", "zyx"
 kM_ROOS = [eul.kXYZ, eul.kYZX, eul.kZXY, eul.kXZY, eul.kYXZ, eul.kZYX]
 
 POST_TRACE_ATTR_NAME = 'xferPostTraceCmd'
+
 MATRIX_ROTATION_ORDER_CONVERSIONS_TO = Matrix.ToEulerXYZ, Matrix.ToEulerYZX, Matrix.ToEulerZXY, Matrix.ToEulerXZY, Matrix.ToEulerYXZ, Matrix.ToEulerZYX
 
 
@@ -265,6 +270,7 @@ class TracePair(object):
 		self._constraint = None
 		self._parentCount = getParentCount( tgt )
 		self._attrsWeightedTangentsDealtWith = []
+		self._tracedAttrpaths = []
 	def __repr__( self ):
 		return '%s( "%s", "%s" )' % (type( self ).__name__, self._src, self._tgt)
 	__str__ = __repr__
@@ -276,6 +282,63 @@ class TracePair(object):
 		return self._parentCount
 	def getKeyTimes( self ):
 		return self._keyTimeData.keys()
+	def hasPostTraceCmd( self ):
+		return bool( self._postTraceCmd )
+	def getMotionKeyTimes( self, ikJoints=() ):
+		'''
+		returns the times of the keys moving the src relative to the tgt's parent - or None if there is no telling
+		when it moves (it may be constrained, driven by ik or set driven keys for instance).  see
+		traceSchedule.getMotionKeyTimes
+		'''
+		return traceSchedule.getMotionKeyTimes( self._src, self._tgt, maya.cmds, ikJoints )
+	def addSampleTimes( self, times ):
+		'''
+		adds keys at the given times for each attribute being traced - this is used when baking instead of tracing
+		keys only.  the keys get the default tangent types
+		'''
+		itt = keyTangent( q=True, g=True, itt=True )[0]
+		ott = keyTangent( q=True, g=True, ott=True )[0]
+		for keyTime in times:
+			attrDataList = self._keyTimeData.setdefault( keyTime, [] )
+			keyedAttrpaths = set( [ attrData[1] for attrData in attrDataList ] )
+			for srcAttrpath, tgtAttrpath in self._tracedAttrpaths:
+				if tgtAttrpath not in keyedAttrpaths:
+					attrDataList.append( (srcAttrpath, tgtAttrpath, itt, ott, None, None, None, None) )
+	def getKeyedAttrs( self ):
+		'''
+		returns a dict keyed by target attrpath containing (attr, srcAttrpath, keys) tuples where keys is a list
+		of (keyTime, itt, ott) tuples sorted by time.  srcAttrpath is always the attribute on the source node
+		'''
+		keyedAttrs = {}
+		for keyTime, attrDataList in self._keyTimeData.iteritems():
+			for srcAttrpath, tgtAttrpath, keyItt, keyOtt, ix, iy, ox, oy in attrDataList:
+				if tgtAttrpath not in keyedAttrs:
+					attr = tgtAttrpath[ tgtAttrpath.find( '.' ) + 1: ]
+					keyedAttrs[ tgtAttrpath ] = attr, '%s.%s' % (self._src, attr), []
+
+				keyedAttrs[ tgtAttrpath ][ 2 ].append( (keyTime, keyItt, keyOtt) )
+
+		for attr, srcAttrpath, keys in keyedAttrs.itervalues():
+			keys.sort()
+
+		return keyedAttrs
+	def getTraceTarget( self, parentIndex=None ):
+		'''
+		returns a batchTrace.TraceTarget instance describing the tgt node
+		'''
+		src, tgt = self._src, self._tgt
+		jointOrient = (0, 0, 0)
+		if objectType( tgt, isAType='joint' ):
+			jointOrient = getAttr( '%s.jointOrient' % tgt )[0]
+
+		return batchTrace.TraceTarget( getAttr( '%s.ro' % tgt ),
+		                               getAttr( '%s.rotatePivot' % tgt )[0],
+		                               getAttr( '%s.rotatePivotTranslate' % tgt )[0],
+		                               getAttr( '%s.s' % tgt )[0],
+		                               getAttr( '%s.rotateAxis' % tgt )[0],
+		                               jointOrient,
+		                               getAttr( '%s.rotatePivot' % src )[0],
+		                               parentIndex )
 	def dealWithWeightedTangents( self, tgtAttrpath ):
 		'''
 		this is annoying - so maya has two types of curves - weighted and non-weighted tangent curves, and they've not compatible.
@@ -293,8 +356,12 @@ class TracePair(object):
 				keyTangent( tgtAttrpath, e=True, weightedTangents=srcWeightedTangentState )
 
 			self._attrsWeightedTangentsDealtWith.append( tgtAttrpath )
-	def preTrace( self ):
-		if self._isTransform:
+	def preTrace( self, constrain=True ):
+		'''
+		gathers the key data for the trace.  if constrain is False the dummy constraint used to trace transform
+		attributes isn't built - the batched trace doesn't need it
+		'''
+		if self._isTransform and constrain:
 			if self._constraint is None:
 				self._constraint = constructDummyParentConstraint( self._src, self._tgt )
 
@@ -322,9 +389,11 @@ class TracePair(object):
 				srcKeysOutY = keyTangent( srcAttrpath, q=True, oy=True )
 
 				#if the attr is a transform attr - set the srcAttrpath to the appropriate attribute on the constraint
-				if attr in self.SHORT_TRANSFORM_ATTRS:
+				if attr in self.SHORT_TRANSFORM_ATTRS and self._constraint:
 					srcAttrpath = '%s.c%s' % (self._constraint, attr)
 
+				self._tracedAttrpaths.append( (srcAttrpath, tgtAttrpath) )
+
 				for keyTime, keyItt, keyOtt, ix, iy, ox, oy in zip( srcKeysTimes, srcKeysInTangents, srcKeysOutTangents, srcKeysInX, srcKeysInY, srcKeysOutX, srcKeysOutY ):
 					self._keyTimeData.setdefault( keyTime, [] )
 					self._keyTimeData[ keyTime ].append( (srcAttrpath, tgtAttrpath, keyItt, keyOtt, ix, iy, ox, oy) )
@@ -379,7 +448,15 @@ class TracePair(object):
 
 
 class Tracer(object):
-	def __init__( self, keysOnly=True, matchRotationOrder=True, processPostCmds=True, sortByHeirarchy=True, start=None, end=None, skip=1 ):
+	'''
+	traces animation from source nodes onto target nodes.  by default the trace steps through each key time and
+	sets keys on the targets a frame at a time.  in batch mode the source data for every frame is sampled in a
+	single pass, the transform attributes are solved for all frames at once (optionally using a pool of
+	processes - see batchTrace) and each target attribute is written out as a whole curve.  pairs with post
+	trace commands need the scene to be stepped through frame by frame, so the batch mode isn't used if there
+	are post trace commands to process
+	'''
+	def __init__( self, keysOnly=True, matchRotationOrder=True, processPostCmds=True, sortByHeirarchy=True, start=None, end=None, skip=1, batch=False, processes=None ):
 		self._tracePairs = []
 
 		self._keysOnly = keysOnly
@@ -389,6 +466,9 @@ class Tracer(object):
 		self._start = start
 		self._end = end
 		self._skipFrames = skip
+
+		self._batch = batch
+		self._processes = processes
 	def setKeysOnly( self, state ):
 		self._keysOnly = state
 	def setMatchRotationOrder( self, state ):
@@ -401,6 +481,10 @@ class Tracer(object):
 		self._end = frame
 	def setSkip( self, count ):
 		self._skipFrames = cound
+	def setBatch( self, state ):
+		self._batch = state
+	def setProcesses( self, processes ):
+		self._processes = processes
 	def _sortTransformNodes( self ):
 		'''
 		ensures all nodes in the _keysTransformAttrpathDict are sorted hierarchically
@@ -423,29 +507,44 @@ class Tracer(object):
 	def setSrcsAndTgts( self, srcList, tgtList ):
 		for src, tgt in zip( srcList, tgtList ):
 			self.appendPair( src, tgt )
-	def getKeyTimes( self ):
+	def _getTracedParentIndices( self ):
 		'''
-		returns a list of key times
+		returns a list containing the index of the trace pair whose tgt is the parent of each trace pair's tgt - or
+		None if the tgt's parent isn't being traced
 		'''
+		tgtIndices = dict( (ls( tracePair.getSrcTgt()[1], l=True )[0], n) for n, tracePair in enumerate( self._tracePairs ) )
+		parentIndices = []
+		for tracePair in self._tracePairs:
+			tgtParent = listRelatives( tracePair.getSrcTgt()[1], p=True, f=True )
+			parentIndices.append( tgtIndices.get( tgtParent[0] ) if tgtParent else None )
+
+		return parentIndices
+	def getSchedule( self ):
+		'''
+		returns a traceSchedule.FrameSchedule containing the times each trace pair needs tracing at.  the trace
+		pairs need to be pre-traced first
+		'''
+		parentIndices = self._getTracedParentIndices()
 		if self._keysOnly:
-			keyTimes = []
-			for tracePair in self._tracePairs:
-				keyTimes += tracePair.getKeyTimes()
+			return traceSchedule.FrameSchedule( [ tracePair.getKeyTimes() for tracePair in self._tracePairs ], None, parentIndices )
 
-			keyTimes = list( set( keyTimes ) )  #this removes duplicates
-			keyTimes.sort()
+		start = self._start
+		if start is None:
+			start = playbackOptions( q=True, min=True )
 
-			return keyTimes
-		else:
-			start = self._start
-			if start is None:
-				start = playbackOptions( q=True, min=True )
+		end = self._end
+		if end is None:
+			end = playbackOptions( q=True, max=True )
 
-			end = self._end
-			if end is None:
-				end = playbackOptions( q=True, max=True )
+		sampleTimes = traceSchedule.getSampleTimes( start, end, self._skipFrames )
+		ikJoints = traceSchedule.getIkDrivenJoints( maya.cmds )
 
-			keyTimes = range( start, end, self._skipFrames )
+		return traceSchedule.FrameSchedule( [ tracePair.getMotionKeyTimes( ikJoints ) for tracePair in self._tracePairs ], sampleTimes, parentIndices )
+	def getKeyTimes( self ):
+		'''
+		returns a list of key times
+		'''
+		return self.getSchedule().times
 	def getTransformNodePairs( self ):
 		transformNodePairs = []
 		for tracePair in self._tracePairs:
@@ -453,6 +552,103 @@ class Tracer(object):
 				transformNodePairs.append( tracePair )
 
 		return transformNodePairs
+	def isBatched( self ):
+		'''
+		returns whether the trace will be done in batch mode
+		'''
+		if not self._batch:
+			return False
+
+		if self._processPostCmds:
+			for tracePair in self._tracePairs:
+				if tracePair.hasPostTraceCmd():
+					return False
+
+		return True
+	def _traceBatched( self, schedule ):
+		'''
+		samples the source data for all the scheduled times in a single pass, solves the transform attributes for
+		every frame at once and then writes the keys for each target attribute in one go
+		'''
+		tracePairs = self._tracePairs
+		pairTimes = dict( zip( tracePairs, schedule.pairTimes ) )
+		transformPairs = self.getTransformNodePairs()
+		transformIndices = dict( (tracePair, n) for n, tracePair in enumerate( transformPairs ) )
+
+		#the pairs are sorted hierarchically so a target's parent comes before it - figure out which targets are parented to other targets
+		parentPairs = [ tracePairs[ n ] if n is not None else None for n in self._getTracedParentIndices() ]
+		parentPairs = dict( zip( tracePairs, parentPairs ) )
+		targets = [ tracePair.getTraceTarget( transformIndices.get( parentPairs[ tracePair ] ) ) for tracePair in transformPairs ]
+
+		#figure out which of the other attributes need sampling at each time - the keys are only traced at the scheduled times
+		keyedAttrs = []
+		srcAttrpathsAtTime = {}
+		for tracePair in tracePairs:
+			times = set( pairTimes[ tracePair ] )
+			attrDict = tracePair.getKeyedAttrs()
+			for tgtAttrpath, (attr, srcAttrpath, keys) in attrDict.items():
+				keys = [ key for key in keys if key[ 0 ] in times ]
+				attrDict[ tgtAttrpath ] = attr, srcAttrpath, keys
+				if tracePair.isTransform() and attr in TracePair.SHORT_TRANSFORM_ATTRS:
+					continue
+
+				for keyTime, keyItt, keyOtt in keys:
+					srcAttrpathsAtTime.setdefault( keyTime, [] ).append( srcAttrpath )
+
+			keyedAttrs.append( attrDict )
+
+		#now sample everything in a single pass over the scheduled times
+		srcWorldValues = [ [] for tracePair in transformPairs ]
+		parentWorldValues = [ [] for tracePair in transformPairs ]
+		sampledValues = {}
+		pairsAtTimes = schedule.getPairsAtTimes()
+		for keyTime in schedule.times:
+			currentTime( keyTime )
+			for tracePair in [ tracePairs[ n ] for n in pairsAtTimes[ keyTime ] ]:
+				n = transformIndices.get( tracePair )
+				if n is None:
+					continue
+
+				src, tgt = tracePair.getSrcTgt()
+				srcWorldValues[ n ] += getAttr( '%s.worldMatrix' % src )
+				if targets[ n ].parentIndex is None:
+					parentWorldValues[ n ] += getAttr( '%s.parentMatrix' % tgt )
+
+			for srcAttrpath in srcAttrpathsAtTime.get( keyTime, () ):
+				sampledValues[ (srcAttrpath, keyTime) ] = getAttr( srcAttrpath )
+
+		solved = batchTrace.solveTargetsParallel( targets,
+		                                          [ MatrixArray( values ) for values in srcWorldValues ],
+		                                          [ MatrixArray( values ) for values in parentWorldValues ],
+		                                          [ pairTimes[ tracePair ] for tracePair in transformPairs ],
+		                                          self._processes )
+		solvedByPair = dict( zip( transformPairs, solved ) )
+
+		#finally write out the keys
+		for tracePair, attrDict in zip( tracePairs, keyedAttrs ):
+			solvedPair = solvedByPair.get( tracePair )
+			timeIndices = dict( (keyTime, n) for n, keyTime in enumerate( pairTimes[ tracePair ] ) )
+			for tgtAttrpath, (attr, srcAttrpath, keys) in attrDict.iteritems():
+				if not keys:
+					continue
+
+				if solvedPair is not None and attr in TracePair.SHORT_TRANSFORM_ATTRS:
+					attrIdx = TracePair.SHORT_TRANSFORM_ATTRS.index( attr )
+					solvedValues, axis = solvedPair[ attrIdx / 3 ].values, attrIdx % 3
+					values = [ solvedValues[ timeIndices[ keyTime ] * 3 + axis ] for keyTime, keyItt, keyOtt in keys ]
+				else:
+					values = [ sampledValues[ (srcAttrpath, keyTime) ] for keyTime, keyItt, keyOtt in keys ]
+
+				#if the target still has keys outside the trace range they need to be merged key by key, otherwise the whole curve can be created at once
+				if keyframe( tgtAttrpath, q=True, kc=True ):
+					for (keyTime, keyItt, keyOtt), value in zip( keys, values ):
+						setKeyframe( tgtAttrpath, t=(keyTime,), v=value )
+						keyTangent( tgtAttrpath, e=True, t=(keyTime,), itt=keyItt, ott=keyOtt )
+				else:
+					weighted = keyTangent( srcAttrpath, q=True, weightedTangents=True ) or [ False ]
+					keyList = [ (keyTime, value, keyItt, keyOtt, 1.0, 0.0, 1.0, 0.0, True, False) for (keyTime, keyItt, keyOtt), value in zip( keys, values ) ]
+					if animCapture.createCurve( tgtAttrpath, weighted[0], keyList, maya.cmds ) is None:
+						animCapture.setKeysPerKey( tgtAttrpath, weighted[0], keyList, maya.cmds )
 	@d_unifyUndo
 	@d_noAutoKey
 	@d_disableViews
@@ -469,15 +665,19 @@ class Tracer(object):
 			self._sortTransformNodes()
 
 			#run the pre-trace method on all tracePair instances
+			batched = self.isBatched()
 			for tracePair in self._tracePairs:
-				tracePair.preTrace()
+				tracePair.preTrace( not batched )
 
-			#early out if there are no keyframes
-			keyTimes = self.getKeyTimes()
+			#work out the times each pair needs tracing at - early out if there are no keyframes
+			schedule = self.getSchedule()
+			keyTimes = schedule.times
 			if not keyTimes:
 				printWarningStr( "No keys to trace!" )
 				return
 
+			printInfoStr( "tracing %d pair evaluations - %d fewer than tracing every pair at all %d times" % (schedule.getEvaluationCount(), schedule.getSavedCount(), len( keyTimes )) )
+
 			#match rotation orders if required
 			transformTracePairs = list( self.getTransformNodePairs() )
 			if self._matchRotationOrder:
@@ -491,11 +691,21 @@ class Tracer(object):
 				src, tgt = tracePair.getSrcTgt()
 				cutKey( tgt, t=(keyTimes[0], keyTimes[-1]), clear=True )
 
-			#execute the traceFrame method for each tracePair instance
+			#when baking, add keys at the sample times
+			if not self._keysOnly:
+				for tracePair, times in zip( self._tracePairs, schedule.pairTimes ):
+					tracePair.addSampleTimes( times )
+
+			if batched:
+				self._traceBatched( schedule )
+				return
+
+			#execute the traceFrame method for each tracePair instance scheduled at each time
+			pairsAtTimes = schedule.getPairsAtTimes()
 			for keyTime in keyTimes:
 				currentTime( keyTime )
-				for tracePair in self._tracePairs:
-					tracePair.traceFrame( keyTime )
+				for n in pairsAtTimes[ keyTime ]:
+					self._tracePairs[ n ].traceFrame( keyTime )
 
 		#make sure the postTrace method gets executed once the trace finishes
 		finally:
@@ -503,8 +713,8 @@ class Tracer(object):
 				tracePair.postTrace()
 
 
-def trace( srcs, tgts, keysOnly=True, matchRotationOrder=True, processPostCmds=True, sortByHeirarchy=True, start=None, end=None, skip=1 ):
-	tracer = Tracer( keysOnly, matchRotationOrder, processPostCmds, sortByHeirarchy, start, end, skip )
+def trace( srcs, tgts, keysOnly=True, matchRotationOrder=True, processPostCmds=True, sortByHeirarchy=True, start=None, end=None, skip=1, batch=False, processes=None ):
+	tracer = Tracer( keysOnly, matchRotationOrder, processPostCmds, sortByHeirarchy, start, end, skip, batch, processes )
 	tracer.setSrcsAndTgts( srcs, tgts )
 	tracer.trace()
 